@@ -1,46 +1,152 @@
-from flask import Flask, request, jsonify
-from services.api_cep_service import buscar_localizacao_por_cep
-from services.api_weather_service import obter_previsao_por_coordenadas_json
-from services.model_service import predict_condition
+import hmac
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from flask import Flask, Response, g, request, jsonify, stream_with_context
+from api.resposta import FORMATOS, corpo_consulta, corpo_linha_do_tempo, corpo_regiao, formato_aceito, serializar
+from services.api_cep_service import CepInvalido, buscar_localizacao_por_cep
+from services.geocoding_scheduler import GeocodificacaoIndisponivel
+from services.inference_batcher import FilaInferenciaCheia
+from services.api_weather_service import (obter_linha_do_tempo, obter_linhas_do_tempo,
+                                          obter_previsao_por_coordenadas_json,
+                                          obter_previsoes_por_coordenadas_json)
+from services.forecast_tiles import iniciar_previsoes_monitoradas, previsao_monitorada, previsao_monitorada_por_cep
+from services.log_config import configurar_logs
+from services.metrics import (DURACAO_REQUISICOES, REQUISICOES, encerrar_server_timing, exportar_prometheus,
+                              iniciar_server_timing, medir)
+from services.model_service import (PREDICTION_MODE, ModeloIndisponivel, activate_model_version, classify_condition,
+                                    classify_many, model_status, model_versions, retrain_model, retrain_status,
+                                    rollback_model_version, set_shadow_model, shadow_stats, start_model_loading)
+from services.risk_raster import RESOLUCAO_PADRAO, varredura_npz, varrer_regiao
+from services.risk_timeline import pontuar_linhas_do_tempo
+from services.upstream import degradacoes, encerrar_degradacoes, iniciar_degradacoes
+
+configurar_logs()
 
 app = Flask(__name__)
 
+# Carrega o modelo conforme MODELO_CARREGAMENTO (em segundo plano por padrão: a API sobe na hora)
+start_model_loading()
+# Previsões pré-computadas das regiões em PREVISOES_MONITORADAS_PATH (desligadas sem o arquivo)
+iniciar_previsoes_monitoradas()
+
+# Configurações do endpoint em lote (/consulta/lote)
+MAX_CEPS_POR_LOTE = 50000      # limite de CEPs distintos por chamada
+MAX_WORKERS_LOTE = 16          # buscas de CEP/geocodificação simultâneas
+TAMANHO_GRUPO_LOTE = 100       # CEPs resolvidos agrupados por chamada Open-Meteo + predição
+
+# Token dos endpoints /admin (cabeçalho X-Admin-Token); sem ele configurado, /admin fica desligado
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN")
+
+
+def _montar_features(weather_info: dict) -> dict:
+    """
+    Monta o dict de features do modelo a partir das chaves "current" e "general"
+    devolvidas por obter_previsao_por_coordenadas_json (exceto timezone e afins).
+    """
+    current = weather_info["current"]
+    general = weather_info["general"]
+
+    return {
+        # campos “current”
+        "apparent_temperature": current["apparent_temperature"],
+        "cloud_cover": current["cloud_cover"],
+        "is_day": current["is_day"],
+        "precipitation": current["precipitation"],
+        "pressure_msl": current["pressure_msl"],
+        "rain": current["rain"],
+        "relative_humidity_2m": current["relative_humidity_2m"],
+        "showers": current["showers"],
+        "snowfall": current["snowfall"],
+        "surface_pressure": current["surface_pressure"],
+        "temperature_2m": current["temperature_2m"],
+        "weather_code": current["weather_code"],
+        "wind_direction_10m": current["wind_direction_10m"],
+        "wind_gusts_10m": current["wind_gusts_10m"],
+        "wind_speed_10m": current["wind_speed_10m"],
+        # campos “general”
+        "elevation": general["elevation"],
+        "latitude": general["latitude"],
+        "longitude": general["longitude"]
+    }
+
+
+def _estado_saude() -> tuple:
+    """
+    Corpo e status HTTP do /health: 200 quando o modelo está carregado (ou o modo de predição
+    é "regras", que não usa o modelo); 503 enquanto ele carrega ou se o carregamento falhou.
+    """
+    modelo = model_status()
+    if modelo["estado"] == "pronto" or PREDICTION_MODE == "regras":
+        return {"status": "ok", "modelo": modelo}, 200
+    return {"status": "erro" if modelo["estado"] == "erro" else "carregando", "modelo": modelo}, 503
+
+
+@app.before_request
+def _iniciar_medicao():
+    g.inicio_requisicao = time.perf_counter()
+    g.server_timing = iniciar_server_timing()
+    g.degradacoes = iniciar_degradacoes()
+
+
+@app.after_request
+def _registrar_medicao(response):
+    """
+    Conta a requisição por rota e status, guarda a duração e, com SERVER_TIMING=1, devolve os
+    tempos das etapas no cabeçalho Server-Timing. Nas respostas em stream (/consulta/lote) a
+    duração vai só até o início do stream.
+    """
+    encerrar_degradacoes(g.pop("degradacoes", None))
+    inicio = g.get("inicio_requisicao")
+    if inicio is None:
+        return response
+    duracao = time.perf_counter() - inicio
+    rota = request.url_rule.rule if request.url_rule is not None else "desconhecida"
+    REQUISICOES.incrementar(rota, str(response.status_code))
+    DURACAO_REQUISICOES.observar(duracao, rota)
+    cabecalho = encerrar_server_timing(g.pop("server_timing", None), duracao)
+    if cabecalho is not None:
+        response.headers["Server-Timing"] = cabecalho
+    return response
+
 
-def _bytes_to_str_recursive(obj):
+@app.route("/metrics", methods=["GET"])
+def metricas():
     """
-    Percorre profundamente 'obj' (que pode ser dict, list, tuple ou bytes)
-    e converte qualquer instância de bytes para string utf-8.
-    Retorna uma nova estrutura com todos os bytes decodificados.
+    Métricas do processo no formato de texto do Prometheus: tempo de cada etapa (cep,
+    brazilcep, nominatim_n1..n3, open_meteo, predicao...), requisições por rota e status,
+    erros e retentativas dos upstreams e hits/misses dos caches.
     """
-    if isinstance(obj, bytes):
-        return obj.decode('utf-8', errors='ignore')
-    elif isinstance(obj, dict):
-        return {_bytes_to_str_recursive(k): _bytes_to_str_recursive(v)
-                for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [_bytes_to_str_recursive(item) for item in obj]
-    elif isinstance(obj, tuple):
-        return tuple(_bytes_to_str_recursive(item) for item in obj)
-    else:
-        return obj
+    return Response(exportar_prometheus(), mimetype="text/plain; version=0.0.4")
 
 
 @app.route("/health", methods=["GET"])
 def health_check():
     """
-    Endpoint simples só para checar se a API está rodando.
+    Checa se a API está rodando e pronta para atender (ver _estado_saude).
     """
-    return jsonify({"status": "ok"}), 200
+    corpo, status = _estado_saude()
+    return jsonify(corpo), status
 
 
 @app.route("/consulta", methods=["POST"])
 def consulta_por_cep():
     """
-    Recebe JSON com { "cep": "00000000" }
+    Recebe JSON com { "cep": "00000000" } (opcional: "preciso": true, para ignorar o índice
+    offline de CEP e geocodificar o endereço completo; "linha_do_tempo": true, para pontuar
+    também as previsões hora a hora — ver _consulta_linha_do_tempo)
+    0) CEPs e células monitorados (services/forecast_tiles.py) saem da tabela pré-computada,
+       sem os passos 2 e a predição, enquanto a entrada estiver fresca
     1) chama buscar_localizacao_por_cep(cep)
+       • CEP sem 8 dígitos → HTTP 400, sem ir ao cache nem aos upstreams
        • se retornar None → CEP inválido ou não encontrado → HTTP 400
+       • fila do Nominatim cheia ou prazo esgotado, sem centroide no índice offline → HTTP 503
+       • se os upstreams de CEP falharem (ou o disjuntor estiver aberto) sem centroide no
+         índice offline → HTTP 502
        • caso contrário → pega latitude/longitude
-    2) chama obter_previsao_por_coordenadas_json(lat, lon)
+    2) chama obter_previsao_por_coordenadas_json(lat, lon) e prediz a categoria
+       • fila de micro-lotes da inferência cheia (INFERENCIA_MICROLOTES=1) → HTTP 503
     3) devolve um JSON contendo:
        {
          "cep": "...",
@@ -49,26 +155,57 @@ def consulta_por_cep():
              "latitude": ...,
              "longitude": ...
          },
-         "weather": { ... }   # dicionário montado por obter_previsao_por_coordenadas_json
+         "weather": { ... },  # dicionário montado por obter_previsao_por_coordenadas_json
+         "degradado": [...]   # só quando a resposta usou dados degradados: "clima_desatualizado"
+                              # (previsão expirada do cache da grade, atualizada em segundo plano)
+                              # ou "localizacao_aproximada" (centroide do índice offline)
        }
+       (floats do clima com RESPOSTA_CASAS_DECIMAIS casas; em MessagePack se o cabeçalho
+       Accept pedir application/msgpack — ver api/resposta.py)
     """
     data = request.get_json(force=True)
     if not data or "cep" not in data:
         return jsonify({"error": "Envie um JSON com o campo 'cep'."}), 400
 
     cep = data["cep"]
+    preciso = bool(data.get("preciso", False))
+    linha_do_tempo = bool(data.get("linha_do_tempo", False))
+    # 0) CEP monitorado com previsão pré-computada e fresca: responde direto da tabela
+    if not preciso and not linha_do_tempo:
+        with medir("previsao_monitorada"):
+            monitorada = previsao_monitorada_por_cep(cep)
+        if monitorada is not None:
+            location, entrada = monitorada
+            return _responder_consulta(cep, location, entrada.previsao, entrada.categoria), 200
+
     # 1) tenta obter coords
-    location = buscar_localizacao_por_cep(cep)
+    try:
+        with medir("cep"):
+            location = buscar_localizacao_por_cep(cep, preciso=preciso)
+    except CepInvalido as e:
+        return jsonify({"error": f"CEP inválido: '{cep}'.", "details": str(e)}), 400
+    except GeocodificacaoIndisponivel as e:
+        return jsonify({"error": "Geocodificação sobrecarregada; tente de novo.", "details": str(e)}), 503
+    except Exception as e:
+        return jsonify({"error": "Falha ao obter a localização do CEP.", "details": str(e)}), 502
     if location is None:
         return jsonify({"error": f"Não foi possível encontrar coordenadas para o CEP '{cep}'."}), 400
 
     lat = location.latitude
     lon = location.longitude
-    address_str = location.address
+
+    if linha_do_tempo:
+        return _consulta_linha_do_tempo(cep, location)
+
+    # O CEP não é monitorado, mas a célula dele pode ser
+    entrada = previsao_monitorada(lat, lon)
+    if entrada is not None:
+        return _responder_consulta(cep, location, entrada.previsao, entrada.categoria), 200
 
     # 2) chama serviço de previsão climática
     try:
-        weather_info = obter_previsao_por_coordenadas_json(lat, lon)
+        with medir("clima"):
+            weather_info = obter_previsao_por_coordenadas_json(lat, lon)
     except Exception as e:
         # se der erro ao chamar Open-Meteo, devolve 502 (bad gateway)
         return jsonify({"error": "Falha ao obter dados meteorológicos.",
@@ -79,60 +216,396 @@ def consulta_por_cep():
     # Monta o dicionário completo de entrada para o modelo, usando
     # dados das chaves "current" e "general" (exceto timezone e afins).
     # -------------------------------------------------------------
-    current = weather_info["current"]
-    general = weather_info["general"]
-
     # Construir um único dict de features para o modelo:
-    features = {
-        # campos “current”
-        "apparent_temperature": current["apparent_temperature"],
-        "cloud_cover": current["cloud_cover"],
-        "is_day": current["is_day"],
-        "precipitation": current["precipitation"],
-        "pressure_msl": current["pressure_msl"],
-        "rain": current["rain"],
-        "relative_humidity_2m": current["relative_humidity_2m"],
-        "showers": current["showers"],
-        "snowfall": current["snowfall"],
-        "surface_pressure": current["surface_pressure"],
-        "temperature_2m": current["temperature_2m"],
-        "weather_code": current["weather_code"],
-        "wind_direction_10m": current["wind_direction_10m"],
-        "wind_gusts_10m": current["wind_gusts_10m"],
-        "wind_speed_10m": current["wind_speed_10m"],
-        # campos “general”
-        "elevation": general["elevation"],
-        "latitude": general["latitude"],
-        "longitude": general["longitude"]
-    }
+    with medir("features"):
+        features = _montar_features(weather_info)
 
-    # Chamar o modelo para predizer a categoria
+    # Chamar o modelo (ou as regras, conforme MODO_PREDICAO) para predizer a categoria
     try:
-        categoria_predita = predict_condition(features)
+        categoria_predita = classify_condition(features)
+    except FilaInferenciaCheia as e:
+        return jsonify({"error": "Fila de inferência cheia; tente de novo.", "details": str(e)}), 503
+    except ModeloIndisponivel as e:
+        return jsonify({"error": "Modelo indisponível.", "details": str(e)}), 503
     except Exception as e:
         return jsonify({
             "error": "Falha na predição do modelo.",
             "details": str(e)
         }), 500
 
-    # Inserir "previsao_condicao_climatica" dentro de weather_info
-    weather_info["previsao_condicao_climatica"] = categoria_predita
-
-    # Montar resposta final
-    response_body = {
-        "cep": cep,
-        "location": {
-            "address": address_str,
-            "latitude": lat,
-            "longitude": lon
-        },
-        "weather": weather_info
-    }
+    return _responder_consulta(cep, location, weather_info, categoria_predita), 200
+
+
+def _responder_consulta(cep: str, location, weather_info: dict, categoria) -> Response:
+    """
+    Resposta final de /consulta (JSON, ou MessagePack com "Accept: application/msgpack"),
+    com "previsao_condicao_climatica" dentro de "weather".
+    """
+    with medir("resposta"):
+        formato = formato_aceito(request.headers.get("Accept"))
+        corpo = corpo_consulta(cep, location, weather_info, categoria, degradado=degradacoes())
+        resposta = Response(serializar(corpo, formato), mimetype=FORMATOS[formato])
+        resposta.vary.add("Accept")
+    return resposta
+
+
+def _consulta_linha_do_tempo(cep: str, location):
+    """
+    /consulta com "linha_do_tempo": true. Uma única requisição à Open-Meteo traz o "current" e
+    as séries horárias das variáveis do modelo (ontem e hoje, 48 h por padrão), pontuados numa
+    única chamada vetorizada. A resposta tem o corpo de /consulta mais:
+       "linha_do_tempo": {
+         "versao_modelo": "...",
+         "time_local": [...], "categoria": [...], "probabilidade": [...],   # uma posição por hora
+         "proxima_mudanca": {"time_local", "horas", "de", "para"} ou null
+       }
+    """
+    try:
+        with medir("clima"):
+            previsao = obter_linha_do_tempo(location.latitude, location.longitude)
+    except Exception as e:
+        return jsonify({"error": "Falha ao obter dados meteorológicos.", "details": str(e)}), 502
+
+    try:
+        categoria, linha_do_tempo = pontuar_linhas_do_tempo([previsao])[0]
+    except ModeloIndisponivel as e:
+        return jsonify({"error": "Modelo indisponível.", "details": str(e)}), 503
+    except Exception as e:
+        return jsonify({"error": "Falha na predição do modelo.", "details": str(e)}), 500
+
+    with medir("resposta"):
+        formato = formato_aceito(request.headers.get("Accept"))
+        corpo = corpo_linha_do_tempo(cep, location, previsao, categoria, linha_do_tempo, degradado=degradacoes())
+        resposta = Response(serializar(corpo, formato), mimetype=FORMATOS[formato])
+        resposta.vary.add("Accept")
+    return resposta, 200
+
+
+def _linha_ndjson(obj: dict) -> bytes:
+    """
+    Serializa um resultado do lote como uma linha NDJSON.
+    """
+    return serializar(obj) + b"\n"
+
+
+def _evento_sse(obj: dict) -> bytes:
+    """
+    Serializa um resultado do lote como um evento SSE ("linha_do_tempo", ou "erro" nas falhas).
+    """
+    evento = b"linha_do_tempo" if obj.get("status") == 200 else b"erro"
+    return b"event: " + evento + b"\ndata: " + serializar(obj) + b"\n\n"
 
-    # Garante que não haja bytes em response_body
-    response_body = _bytes_to_str_recursive(response_body)
 
-    return jsonify(response_body), 200
+def _erro_lote(cep: str, status: int, error: str, details: str = None) -> dict:
+    """
+    Resultado de falha para um CEP do lote; 'status' segue os códigos HTTP de /consulta.
+    """
+    corpo = {"cep": cep, "status": status, "error": error}
+    if details is not None:
+        corpo["details"] = details
+    return corpo
+
+
+def _degradacoes_do_grupo(grupo: list, desatualizadas: list) -> list:
+    """
+    Degradações de cada CEP do grupo: as da geocodificação mais "clima_desatualizado" nos
+    índices que o cache serviu com a previsão expirada.
+    """
+    desatualizadas = set(desatualizadas)
+    return [degradado + ["clima_desatualizado"] if i in desatualizadas else degradado
+            for i, (_, _, degradado) in enumerate(grupo)]
+
+
+def _pontuar_grupo_lote(grupo: list):
+    """
+    Recebe uma lista de (cep, location, degradado) já geocodificados, busca o clima de todas
+    as coordenadas em requisições multi-localização e faz uma única predição vetorizada.
+    Gera um resultado por CEP, com as degradações daquele CEP.
+    """
+    coordenadas = [(location.latitude, location.longitude) for _, location, _ in grupo]
+
+    desatualizadas = []
+    try:
+        weather_infos = obter_previsoes_por_coordenadas_json(coordenadas, desatualizadas)
+    except Exception as e:
+        for cep, _, _ in grupo:
+            yield _erro_lote(cep, 502, "Falha ao obter dados meteorológicos.", str(e))
+        return
+
+    try:
+        categorias = classify_many([_montar_features(info) for info in weather_infos])
+    except ModeloIndisponivel as e:
+        for cep, _, _ in grupo:
+            yield _erro_lote(cep, 503, "Modelo indisponível.", str(e))
+        return
+    except Exception as e:
+        for cep, _, _ in grupo:
+            yield _erro_lote(cep, 500, "Falha na predição do modelo.", str(e))
+        return
+
+    for (cep, location, _), weather_info, categoria, degradado in zip(
+            grupo, weather_infos, categorias, _degradacoes_do_grupo(grupo, desatualizadas)):
+        yield corpo_consulta(cep, location, weather_info, categoria, status=200, degradado=degradado)
+
+
+def _pontuar_grupo_linha_do_tempo(grupo: list):
+    """
+    Como _pontuar_grupo_lote, mas com as linhas do tempo: as séries horárias de todo o grupo
+    vêm em requisições multi-localização e todas as horas são pontuadas numa única chamada.
+    """
+    coordenadas = [(location.latitude, location.longitude) for _, location, _ in grupo]
+
+    desatualizadas = []
+    try:
+        previsoes = obter_linhas_do_tempo(coordenadas, desatualizadas)
+    except Exception as e:
+        for cep, _, _ in grupo:
+            yield _erro_lote(cep, 502, "Falha ao obter dados meteorológicos.", str(e))
+        return
+
+    try:
+        pontuadas = pontuar_linhas_do_tempo(previsoes)
+    except ModeloIndisponivel as e:
+        for cep, _, _ in grupo:
+            yield _erro_lote(cep, 503, "Modelo indisponível.", str(e))
+        return
+    except Exception as e:
+        for cep, _, _ in grupo:
+            yield _erro_lote(cep, 500, "Falha na predição do modelo.", str(e))
+        return
+
+    for (cep, location, _), previsao, (categoria, linha_do_tempo), degradado in zip(
+            grupo, previsoes, pontuadas, _degradacoes_do_grupo(grupo, desatualizadas)):
+        yield corpo_linha_do_tempo(cep, location, previsao, categoria, linha_do_tempo, status=200,
+                                   degradado=degradado)
+
+
+def _geocodificar_lote(cep: str, preciso: bool) -> tuple:
+    """
+    (LocalizacaoCep ou None, degradações) de um CEP do lote. Roda numa thread do executor,
+    que não herda o contexto da requisição: as degradações são anotadas num contexto próprio.
+    """
+    token = iniciar_degradacoes()
+    try:
+        return buscar_localizacao_por_cep(cep, preciso), degradacoes()
+    finally:
+        encerrar_degradacoes(token)
+
+
+def _processar_lote(ceps: list, preciso: bool = False, pontuar_grupo=_pontuar_grupo_lote):
+    """
+    Geocodifica os CEPs em paralelo e, conforme as buscas terminam, agrupa os resolvidos
+    em blocos de TAMANHO_GRUPO_LOTE para a Open-Meteo e o modelo (pontuar_grupo). Os
+    resultados (dicts) são gerados à medida que ficam prontos, sem acumular o lote inteiro
+    em memória. Cada resultado traz as degradações do próprio CEP ("degradado").
+    """
+    executor = ThreadPoolExecutor(max_workers=MAX_WORKERS_LOTE)
+    try:
+        futuros = {executor.submit(_geocodificar_lote, cep, preciso): cep for cep in ceps}
+        pendentes = []
+
+        for futuro in as_completed(futuros):
+            cep = futuros.pop(futuro)
+            try:
+                location, degradado = futuro.result()
+            except CepInvalido as e:
+                yield _erro_lote(cep, 400, f"CEP inválido: '{cep}'.", str(e))
+                continue
+            except GeocodificacaoIndisponivel as e:
+                yield _erro_lote(cep, 503, "Geocodificação sobrecarregada; tente de novo.", str(e))
+                continue
+            except Exception as e:
+                yield _erro_lote(cep, 502, f"Falha ao buscar o CEP '{cep}'.", str(e))
+                continue
+
+            if location is None:
+                yield _erro_lote(cep, 400, f"Não foi possível encontrar coordenadas para o CEP '{cep}'.")
+                continue
+
+            pendentes.append((cep, location, degradado))
+            if len(pendentes) >= TAMANHO_GRUPO_LOTE:
+                yield from pontuar_grupo(pendentes)
+                pendentes = []
+
+        if pendentes:
+            yield from pontuar_grupo(pendentes)
+    finally:
+        # Se o cliente desconectar no meio do stream, cancela as buscas que ainda não começaram
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+@app.route("/consulta/lote", methods=["POST"])
+def consulta_lote():
+    """
+    Recebe JSON com { "ceps": ["00000000", "11111111", ...] } (opcional: "preciso", como em /consulta)
+    1) remove CEPs duplicados (mantendo a ordem da primeira ocorrência)
+    2) geocodifica os CEPs em paralelo (buscar_localizacao_por_cep)
+    3) agrupa as coordenadas resolvidas em requisições multi-localização da Open-Meteo
+    4) pontua cada grupo com uma única predição vetorizada (classify_many, segundo MODO_PREDICAO)
+    5) devolve um stream NDJSON (application/x-ndjson), uma linha por CEP, na ordem em
+       que os resultados ficam prontos. Cada linha tem "status" (200, 400, 500, 502 ou 503);
+       falhas trazem "error"/"details" em vez de "location"/"weather".
+    """
+    data = request.get_json(force=True, silent=True)
+    ceps, erro = _ceps_do_lote(data)
+    if erro is not None:
+        return erro
+
+    linhas = map(_linha_ndjson, _processar_lote(ceps, bool(data.get("preciso", False))))
+    return Response(stream_with_context(linhas), mimetype="application/x-ndjson")
+
+
+def _ceps_do_lote(data) -> tuple:
+    """
+    (CEPs distintos na ordem da primeira ocorrência, None) ou (None, resposta de erro 400).
+    """
+    if not isinstance(data, dict) or not isinstance(data.get("ceps"), list):
+        return None, (jsonify({"error": "Envie um JSON com o campo 'ceps' (lista de CEPs)."}), 400)
+
+    ceps = list(dict.fromkeys(str(cep).strip() for cep in data["ceps"]))
+    if len(ceps) > MAX_CEPS_POR_LOTE:
+        return None, (jsonify({"error": f"Máximo de {MAX_CEPS_POR_LOTE} CEPs distintos por lote."}), 400)
+    return ceps, None
+
+
+@app.route("/consulta/linha_do_tempo", methods=["POST"])
+def consulta_linha_do_tempo():
+    """
+    Recebe JSON como o de /consulta/lote e devolve, em Server-Sent Events (text/event-stream),
+    um evento por CEP à medida que ficam prontos: "linha_do_tempo" com o corpo de /consulta
+    com "linha_do_tempo": true (e "status": 200), ou "erro" com "status"/"error"/"details".
+    As séries horárias vêm em requisições multi-localização e cada grupo de TAMANHO_GRUPO_LOTE
+    CEPs é pontuado numa única chamada ao modelo. O stream termina com o evento "fim".
+    """
+    data = request.get_json(force=True, silent=True)
+    ceps, erro = _ceps_do_lote(data)
+    if erro is not None:
+        return erro
+
+    def eventos():
+        resultados = _processar_lote(ceps, bool(data.get("preciso", False)), _pontuar_grupo_linha_do_tempo)
+        yield from map(_evento_sse, resultados)
+        yield b"event: fim\ndata: {}\n\n"
+
+    resposta = Response(stream_with_context(eventos()), mimetype="text/event-stream")
+    # Sem cache e sem buffer em proxies (nginx), para os eventos chegarem assim que ficam prontos
+    resposta.headers["Cache-Control"] = "no-cache"
+    resposta.headers["X-Accel-Buffering"] = "no"
+    return resposta
+
+
+@app.route("/risco/regiao", methods=["POST"])
+def risco_regiao():
+    """
+    Recebe JSON com { "lat_min": -25.4, "lat_max": -19.7, "lon_min": -53.2, "lon_max": -44.1 }
+    (opcionais: "resolucao" em graus, padrão 0.1; "probabilidades": true) e devolve a categoria
+    de risco de cada célula da grade que cobre a caixa (ver services/risk_raster.py): o clima
+    das células vem em lotes multi-localização da Open-Meteo e a grade é pontuada numa única
+    chamada ao modelo. Pedir a mesma região de novo só busca as células com dados vencidos e
+    só repontua as que mudaram. Com "Accept: application/x-npz" a resposta é o .npz da
+    varredura (categorias, probabilidades, features...), em vez do JSON.
+    """
+    data = request.get_json(force=True, silent=True) or {}
+    try:
+        caixa = [float(data[campo]) for campo in ("lat_min", "lat_max", "lon_min", "lon_max")]
+        resolucao = float(data.get("resolucao", RESOLUCAO_PADRAO))
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"error": "Envie um JSON com 'lat_min', 'lat_max', 'lon_min' e 'lon_max' numéricos "
+                                 "(e, opcionalmente, 'resolucao')."}), 400
+    try:
+        varredura, resumo = varrer_regiao(*caixa, resolucao=resolucao)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except ModeloIndisponivel as e:
+        return jsonify({"error": "Modelo indisponível.", "details": str(e)}), 503
+    except Exception as e:
+        return jsonify({"error": "Falha na predição do modelo.", "details": str(e)}), 500
+    if resumo["sem_dados"] == resumo["celulas"]:
+        return jsonify({"error": "Falha ao obter dados meteorológicos.", "resumo": resumo}), 502
+
+    with medir("resposta"):
+        if "application/x-npz" in (request.headers.get("Accept") or ""):
+            resposta = Response(varredura_npz(varredura), mimetype="application/x-npz")
+        else:
+            formato = formato_aceito(request.headers.get("Accept"))
+            corpo = corpo_regiao(varredura, resumo, bool(data.get("probabilidades", False)))
+            resposta = Response(serializar(corpo, formato), mimetype=FORMATOS[formato])
+        resposta.vary.add("Accept")
+    return resposta
+
+
+def _admin_autorizado() -> bool:
+    """
+    Confere o cabeçalho X-Admin-Token contra ADMIN_TOKEN (sempre falso se ADMIN_TOKEN não existe).
+    """
+    token = request.headers.get("X-Admin-Token", "")
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+
+@app.before_request
+def _proteger_admin():
+    if request.path.startswith("/admin/") and not _admin_autorizado():
+        return jsonify({"error": "Acesso negado."}), 403
+
+
+@app.route("/admin/modelos", methods=["GET"])
+def admin_modelos():
+    """
+    Versões publicadas do modelo (com métricas), o ponteiro (ativa / anterior / sombra), o
+    estado deste processo, a concordância da sombra e o estado do último retreino.
+    """
+    return jsonify({**model_versions(), "sombra": shadow_stats(), "retreino": retrain_status()}), 200
+
+
+@app.route("/admin/modelos/ativar", methods=["POST"])
+def admin_ativar_modelo():
+    """
+    Recebe { "versao": "v0002" }: carrega a versão em segundo plano e passa a servi-la quando
+    estiver pronta (as requisições seguem com a versão atual até lá) → HTTP 202.
+    """
+    data = request.get_json(force=True, silent=True) or {}
+    try:
+        activate_model_version(str(data.get("versao")))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 404
+    return jsonify({"status": "carregando", "versao": data["versao"]}), 202
+
+
+@app.route("/admin/modelos/rollback", methods=["POST"])
+def admin_rollback_modelo():
+    """
+    Volta para a versão ativa anterior (em segundo plano, como /ativar) → HTTP 202.
+    """
+    try:
+        versao = rollback_model_version()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 409
+    return jsonify({"status": "carregando", "versao": versao}), 202
+
+
+@app.route("/admin/modelos/sombra", methods=["POST"])
+def admin_sombra_modelo():
+    """
+    Recebe { "versao": "v0003", "fracao": 0.1 }: pontua em sombra essa fração das requisições
+    com a versão candidata (a resposta continua vindo da ativa). "versao": null desliga.
+    """
+    data = request.get_json(force=True, silent=True) or {}
+    versao = data.get("versao")
+    try:
+        set_shadow_model(None if versao is None else str(versao), float(data.get("fracao", 1.0)))
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"status": "ok", "versao": versao}), 202
+
+
+@app.route("/admin/modelos/treinar", methods=["POST"])
+def admin_treinar_modelo():
+    """
+    Recebe { "ativar": false }: retreina o modelo num processo separado e o publica como versão
+    nova (ativando-a ao terminar, se "ativar" for true). Acompanhe em GET /admin/modelos.
+    """
+    data = request.get_json(force=True, silent=True) or {}
+    return jsonify(retrain_model(activate=bool(data.get("ativar", False)))), 202
 
 
 if __name__ == "__main__":
@@ -0,0 +1,225 @@
+"""
+Modo de serviço assíncrono (asyncio + aiohttp) da API.
+
+Mesmos endpoints e mesmo formato de resposta de api/app.py, mas a busca do CEP, a
+geocodificação e a previsão do tempo rodam como corotinas: uma chamada lenta ao Nominatim
+não prende uma thread inteira. Cada upstream tem limite de concorrência e timeout próprios
+(ver services/upstream.py) e a predição do modelo roda num pool de threads dedicado (ou, com
+INFERENCIA_MICROLOTES=1, na fila de micro-lotes, aguardada sem ocupar thread).
+
+Uso (a partir da raiz do projeto):
+    python -m api.app_async --porta 8000
+"""
+import argparse
+import asyncio
+import contextvars
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+
+from api.app import _estado_saude, _montar_features
+from api.resposta import FORMATOS, corpo_consulta, corpo_linha_do_tempo, formato_aceito, serializar
+from services.api_cep_service import CepInvalido, buscar_localizacao_por_cep_async
+from services.geocoding_scheduler import GeocodificacaoIndisponivel
+from services.inference_batcher import FilaInferenciaCheia
+from services.api_weather_service import (fechar_sessao_async, obter_linha_do_tempo_async,
+                                          obter_previsao_por_coordenadas_json_async)
+from services.forecast_tiles import previsao_monitorada, previsao_monitorada_por_cep
+from services.metrics import (DURACAO_REQUISICOES, REQUISICOES, encerrar_server_timing, exportar_prometheus,
+                              iniciar_server_timing, medir)
+from services.model_service import ModeloIndisponivel, classify_condition, submit_condition
+from services.risk_timeline import pontuar_linhas_do_tempo
+from services.upstream import degradacoes, encerrar_degradacoes, iniciar_degradacoes
+
+# Threads dedicadas à inferência do modelo (não disputam com o event loop)
+MODELO_THREADS = int(os.environ.get("MODELO_THREADS", 4))
+
+_executor_modelo = ThreadPoolExecutor(max_workers=MODELO_THREADS, thread_name_prefix="modelo")
+
+
+@web.middleware
+async def _medir_requisicao(request: web.Request, handler):
+    """
+    Conta a requisição por rota e status, guarda a duração e, com SERVER_TIMING=1, devolve os
+    tempos das etapas no cabeçalho Server-Timing (como no app síncrono). Também anota as
+    degradações da requisição (ver services/upstream.py).
+    """
+    inicio = time.perf_counter()
+    token = iniciar_server_timing()
+    token_degradacoes = iniciar_degradacoes()
+    status = 500
+    try:
+        resposta = await handler(request)
+        status = resposta.status
+    except web.HTTPException as e:
+        status = e.status
+        raise
+    finally:
+        duracao = time.perf_counter() - inicio
+        recurso = request.match_info.route.resource
+        rota = recurso.canonical if recurso is not None else "desconhecida"
+        REQUISICOES.incrementar(rota, str(status))
+        DURACAO_REQUISICOES.observar(duracao, rota)
+        cabecalho = encerrar_server_timing(token, duracao)
+        encerrar_degradacoes(token_degradacoes)
+    if cabecalho is not None:
+        resposta.headers["Server-Timing"] = cabecalho
+    return resposta
+
+
+async def metricas(request: web.Request) -> web.Response:
+    """
+    Métricas do processo no formato de texto do Prometheus (mesmo conteúdo do /metrics síncrono).
+    """
+    return web.Response(text=exportar_prometheus(), content_type="text/plain")
+
+
+async def health_check(request: web.Request) -> web.Response:
+    """
+    Checa se a API está rodando e pronta para atender (mesma resposta do /health síncrono).
+    """
+    corpo, status = _estado_saude()
+    return web.json_response(corpo, status=status)
+
+
+async def consulta_por_cep(request: web.Request) -> web.Response:
+    """
+    Versão assíncrona de POST /consulta (mesmo corpo de entrada e de saída).
+    Falhas/timeouts nos upstreams de CEP e de clima devolvem 502; se o cliente desconectar,
+    a corotina é cancelada e as chamadas em andamento também.
+    """
+    try:
+        data = await request.json()
+    except ValueError:
+        data = None
+    if not data or "cep" not in data:
+        return web.json_response({"error": "Envie um JSON com o campo 'cep'."}, status=400)
+
+    cep = data["cep"]
+    preciso = bool(data.get("preciso", False))
+    linha_do_tempo = bool(data.get("linha_do_tempo", False))
+    # 0) CEP monitorado com previsão pré-computada e fresca (a tabela é atualizada pela thread
+    #    iniciada em api/app.py)
+    if not preciso and not linha_do_tempo:
+        with medir("previsao_monitorada"):
+            monitorada = previsao_monitorada_por_cep(cep)
+        if monitorada is not None:
+            location, entrada = monitorada
+            return _responder_consulta(request, cep, location, entrada.previsao, entrada.categoria)
+
+    # 1) tenta obter coords
+    try:
+        with medir("cep"):
+            location = await buscar_localizacao_por_cep_async(cep, preciso=preciso)
+    except CepInvalido as e:
+        return web.json_response({"error": f"CEP inválido: '{cep}'.", "details": str(e)}, status=400)
+    except GeocodificacaoIndisponivel as e:
+        return web.json_response({"error": "Geocodificação sobrecarregada; tente de novo.", "details": str(e)},
+                                 status=503)
+    except Exception as e:
+        return web.json_response({"error": f"Falha ao buscar o CEP '{cep}'.",
+                                  "details": str(e) or type(e).__name__}, status=502)
+    if location is None:
+        return web.json_response({"error": f"Não foi possível encontrar coordenadas para o CEP '{cep}'."},
+                                 status=400)
+
+    if linha_do_tempo:
+        return await _consulta_linha_do_tempo(request, cep, location)
+
+    entrada = previsao_monitorada(location.latitude, location.longitude)
+    if entrada is not None:
+        return _responder_consulta(request, cep, location, entrada.previsao, entrada.categoria)
+
+    # 2) chama serviço de previsão climática
+    try:
+        with medir("clima"):
+            weather_info = await obter_previsao_por_coordenadas_json_async(location.latitude, location.longitude)
+    except Exception as e:
+        return web.json_response({"error": "Falha ao obter dados meteorológicos.",
+                                  "details": str(e) or type(e).__name__}, status=502)
+
+    # 3) predição no pool de threads do modelo (com o contexto da requisição, para o Server-Timing)
+    with medir("features"):
+        features = _montar_features(weather_info)
+    try:
+        futuro = submit_condition(features)
+        if futuro is not None:
+            # Micro-lotes (INFERENCIA_MICROLOTES=1): aguarda a linha na fila sem ocupar uma thread
+            with medir("predicao"):
+                categoria_predita = await asyncio.wrap_future(futuro)
+        else:
+            loop = asyncio.get_running_loop()
+            contexto = contextvars.copy_context()
+            categoria_predita = await loop.run_in_executor(_executor_modelo, contexto.run, classify_condition,
+                                                           features)
+    except FilaInferenciaCheia as e:
+        return web.json_response({"error": "Fila de inferência cheia; tente de novo.", "details": str(e)},
+                                 status=503)
+    except ModeloIndisponivel as e:
+        return web.json_response({"error": "Modelo indisponível.", "details": str(e)}, status=503)
+    except Exception as e:
+        return web.json_response({"error": "Falha na predição do modelo.", "details": str(e)}, status=500)
+
+    return _responder_consulta(request, cep, location, weather_info, categoria_predita)
+
+
+async def _consulta_linha_do_tempo(request: web.Request, cep: str, location) -> web.Response:
+    """
+    /consulta com "linha_do_tempo": true (mesma resposta de api/app.py): as séries horárias vêm
+    na mesma requisição do "current" e todas as horas são pontuadas no pool de threads do modelo.
+    """
+    try:
+        with medir("clima"):
+            previsao = await obter_linha_do_tempo_async(location.latitude, location.longitude)
+    except Exception as e:
+        return web.json_response({"error": "Falha ao obter dados meteorológicos.",
+                                  "details": str(e) or type(e).__name__}, status=502)
+
+    try:
+        loop = asyncio.get_running_loop()
+        contexto = contextvars.copy_context()
+        pontuadas = await loop.run_in_executor(_executor_modelo, contexto.run, pontuar_linhas_do_tempo, [previsao])
+    except ModeloIndisponivel as e:
+        return web.json_response({"error": "Modelo indisponível.", "details": str(e)}, status=503)
+    except Exception as e:
+        return web.json_response({"error": "Falha na predição do modelo.", "details": str(e)}, status=500)
+
+    categoria, linha = pontuadas[0]
+    with medir("resposta"):
+        formato = formato_aceito(request.headers.get("Accept"))
+        corpo = serializar(corpo_linha_do_tempo(cep, location, previsao, categoria, linha, degradado=degradacoes()),
+                           formato)
+    return web.Response(body=corpo, content_type=FORMATOS[formato], headers={"Vary": "Accept"})
+
+
+def _responder_consulta(request: web.Request, cep: str, location, weather_info: dict, categoria) -> web.Response:
+    with medir("resposta"):
+        formato = formato_aceito(request.headers.get("Accept"))
+        corpo = serializar(corpo_consulta(cep, location, weather_info, categoria, degradado=degradacoes()), formato)
+    return web.Response(body=corpo, content_type=FORMATOS[formato], headers={"Vary": "Accept"})
+
+
+async def _fechar_sessoes(app: web.Application):
+    await fechar_sessao_async()
+
+
+def criar_app() -> web.Application:
+    """
+    Monta a aplicação aiohttp com as rotas e o fechamento das sessões HTTP no shutdown.
+    """
+    app = web.Application(middlewares=[_medir_requisicao])
+    app.router.add_get("/health", health_check)
+    app.router.add_get("/metrics", metricas)
+    app.router.add_post("/consulta", consulta_por_cep)
+    app.on_cleanup.append(_fechar_sessoes)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="API Supernova_ML em modo assíncrono (aiohttp).")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--porta", type=int, default=8000)
+    args = parser.parse_args()
+    web.run_app(criar_app(), host=args.host, port=args.porta)
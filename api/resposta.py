@@ -0,0 +1,210 @@
+"""
+Montagem e serialização das respostas de /consulta, /consulta/lote, /consulta/linha_do_tempo
+e /risco/regiao (apps síncrono e assíncrono).
+
+O corpo é montado uma única vez (corpo_consulta), já com os floats do clima arredondados em
+RESPOSTA_CASAS_DECIMAIS casas: os valores da Open-Meteo são float32 e, convertidos para float,
+viram decimais longos como 18.366695404052734. Os textos (timezone...) já chegam decodificados
+de services/api_weather_service.py, então não há uma segunda passada pelo dict.
+
+serializar() codifica o corpo em:
+  - JSON, com orjson quando ele está instalado (pip install orjson) ou com o json da stdlib;
+    nos dois, NaN e infinito viram null (o json da stdlib escreveria NaN, que não é JSON válido);
+  - MessagePack (pip install msgpack), quando o cliente pede com "Accept: application/msgpack":
+    corpo binário e menor, para os consumidores IoT. Sem o msgpack instalado, responde em JSON.
+"""
+import json
+import math
+import os
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Casas decimais dos valores do clima nas respostas (negativo = sem arredondar)
+RESPOSTA_CASAS_DECIMAIS = int(os.environ.get("RESPOSTA_CASAS_DECIMAIS", 4))
+
+# As coordenadas do local (geocodificação ou centroide do índice de CEP) ficam com 6 casas (~0,1 m)
+CASAS_COORDENADAS = 6
+
+FORMATOS = {"json": "application/json", "msgpack": "application/msgpack"}
+_ACCEPT_MSGPACK = ("application/msgpack", "application/x-msgpack")
+
+
+def _arredondar(valores: dict, casas: int) -> dict:
+    """
+    Cópia de 'valores' com os floats (e as séries float em arrays NumPy) arredondados em
+    'casas' casas decimais.
+    """
+    if casas < 0:
+        return dict(valores)
+    return {chave: _arredondar_valor(valor, casas) for chave, valor in valores.items()}
+
+
+def _arredondar_valor(valor, casas: int):
+    if type(valor) is float:
+        return round(valor, casas)
+    if isinstance(valor, np.ndarray) and valor.dtype.kind == "f":
+        return np.round(valor.astype(np.float64), casas)
+    return valor
+
+
+def _arredondar_coordenada(valor, casas: int):
+    return round(valor, CASAS_COORDENADAS) if casas >= 0 and valor is not None else valor
+
+
+def corpo_consulta(cep: str, location, weather_info: dict, categoria, status: int = None,
+                   casas: int = RESPOSTA_CASAS_DECIMAIS, degradado: list = None) -> dict:
+    """
+    Corpo de resposta de um CEP: {"cep", ["status",] "location", "weather"[, "degradado"]}, com a
+    categoria prevista em weather["previsao_condicao_climatica"]. 'location' é qualquer objeto com
+    address/latitude/longitude; 'weather_info' não é alterado. "degradado" lista os dados
+    degradados usados na resposta ("clima_desatualizado", "localizacao_aproximada"), se houver.
+    """
+    corpo = {"cep": cep}
+    if status is not None:
+        corpo["status"] = status
+    corpo["location"] = {
+        "address": location.address,
+        "latitude": _arredondar_coordenada(location.latitude, casas),
+        "longitude": _arredondar_coordenada(location.longitude, casas)
+    }
+    weather = {chave: _arredondar(valor, casas) if isinstance(valor, dict) else valor
+               for chave, valor in weather_info.items()}
+    weather["previsao_condicao_climatica"] = str(categoria)
+    corpo["weather"] = weather
+    if degradado:
+        corpo["degradado"] = list(degradado)
+    return corpo
+
+
+def corpo_linha_do_tempo(cep: str, location, previsao: dict, categoria, linha_do_tempo: dict, status: int = None,
+                         casas: int = RESPOSTA_CASAS_DECIMAIS, degradado: list = None) -> dict:
+    """
+    Corpo de corpo_consulta (com "general" e "current" de 'previsao', sem as séries horárias
+    brutas) mais "linha_do_tempo" (ver services/risk_timeline.py), com as probabilidades
+    arredondadas como os valores do clima.
+    """
+    weather_info = {"general": previsao["general"], "current": previsao["current"]}
+    corpo = corpo_consulta(cep, location, weather_info, categoria, status=status, casas=casas, degradado=degradado)
+    corpo["linha_do_tempo"] = _arredondar(linha_do_tempo, casas)
+    return corpo
+
+
+def corpo_regiao(varredura, resumo: dict, probabilidades: bool = False,
+                 casas: int = RESPOSTA_CASAS_DECIMAIS) -> dict:
+    """
+    Corpo de /risco/regiao a partir de uma Varredura (services/risk_raster.py): a grade
+    ("latitudes" de norte para sul, "longitudes" de oeste para leste), "categorias" como matriz
+    de índices em "classes" (-1 = sem dados), o resumo da varredura e, com probabilidades=True,
+    as probabilidades de cada célula (null sem dados). "atualizado_em" é a busca mais recente
+    entre as células com dados (null se nenhuma tem). "degradado" traz "clima_desatualizado"
+    quando parte das células ficou com os dados da varredura anterior.
+    """
+    # buscado_em é 0 nas células sem dados
+    buscadas = varredura.buscado_em[np.isfinite(varredura.buscado_em) & (varredura.buscado_em > 0)]
+    corpo = {
+        "latitudes": varredura.latitudes,
+        "longitudes": varredura.longitudes,
+        "classes": varredura.classes.tolist(),
+        "categorias": varredura.categorias,
+        "versao": varredura.versao,
+        "modo": varredura.modo,
+        "atualizado_em": float(np.nanmax(buscadas)) if buscadas.size else None,
+        "resumo": resumo,
+    }
+    if probabilidades and varredura.probabilidades is not None:
+        valores = varredura.probabilidades.astype(np.float64)
+        if casas >= 0:
+            valores = np.round(valores, casas)
+        corpo["probabilidades"] = np.where(np.isnan(valores), None, valores).tolist()
+    if resumo["falhas"] and resumo["falhas"] > resumo["sem_dados"]:
+        corpo["degradado"] = ["clima_desatualizado"]
+    return corpo
+
+
+def formato_aceito(accept: str) -> str:
+    """
+    "msgpack" se o cabeçalho Accept dá ao MessagePack qualidade (q) maior que zero e pelo menos
+    igual à do JSON (application/json, application/* ou */*), e o msgpack está instalado;
+    senão "json".
+    """
+    if msgpack is None or not accept:
+        return "json"
+    q_msgpack = q_json = 0.0
+    for item in accept.split(","):
+        tipo, _, parametros = item.partition(";")
+        tipo = tipo.strip().lower()
+        if tipo in _ACCEPT_MSGPACK:
+            q_msgpack = max(q_msgpack, _qualidade(parametros))
+        elif tipo in ("application/json", "application/*", "*/*"):
+            q_json = max(q_json, _qualidade(parametros))
+    return "msgpack" if q_msgpack > 0 and q_msgpack >= q_json else "json"
+
+
+def _qualidade(parametros: str) -> float:
+    # Parâmetro q de um item do Accept ("q=0.5"); sem ele vale 1, e um q inválido vale 0
+    for parametro in parametros.split(";"):
+        nome, _, valor = parametro.partition("=")
+        if nome.strip().lower() == "q":
+            try:
+                q = float(valor)
+            except ValueError:
+                return 0.0
+            return q if 0 <= q <= 1 else 0.0
+    return 1.0
+
+
+def _converter_numpy(valor):
+    """
+    Arrays e escalares NumPy (séries "hourly") para tipos nativos, no json da stdlib e no msgpack.
+    """
+    if isinstance(valor, (np.ndarray, np.generic)):
+        return valor.tolist()
+    raise TypeError(f"Tipo não serializável: {type(valor).__name__}")
+
+
+def _converter_numpy_json(valor):
+    # No json da stdlib, os NaN dos arrays também viram None (como no orjson)
+    return _sem_nan(_converter_numpy(valor))
+
+
+def _sem_nan(valor):
+    """
+    Cópia de 'valor' com NaN e infinito trocados por None, em dicts, listas e tuplas aninhados.
+    """
+    if type(valor) is float:
+        return valor if math.isfinite(valor) else None
+    if isinstance(valor, dict):
+        return {chave: _sem_nan(item) for chave, item in valor.items()}
+    if isinstance(valor, (list, tuple)):
+        return [_sem_nan(item) for item in valor]
+    if isinstance(valor, (np.ndarray, np.generic)):
+        return _converter_numpy_json(valor)
+    return valor
+
+
+def serializar(corpo, formato: str = "json") -> bytes:
+    """
+    Codifica o corpo no formato pedido ("json" ou "msgpack").
+    """
+    if formato == "msgpack":
+        return msgpack.packb(corpo, use_bin_type=True, default=_converter_numpy)
+    if orjson is not None:
+        return orjson.dumps(corpo, option=orjson.OPT_SERIALIZE_NUMPY)
+    try:
+        texto = json.dumps(corpo, ensure_ascii=False, separators=(",", ":"), allow_nan=False,
+                           default=_converter_numpy_json)
+    except ValueError:
+        # Algum float do corpo é NaN ou infinito: só então percorre o corpo inteiro
+        texto = json.dumps(_sem_nan(corpo), ensure_ascii=False, separators=(",", ":"), allow_nan=False,
+                           default=_converter_numpy_json)
+    return texto.encode("utf-8")
@@ -0,0 +1,170 @@
+"""
+Teste de carga de POST /consulta: API síncrona (Flask, número fixo de workers) contra o modo
+assíncrono (api/app_async.py), com os três upstreams simulados localmente.
+
+Cada requisição usa um CEP novo (miss no cache de CEP), então todo o caminho
+brazilcep → Nominatim → Open-Meteo → modelo é exercitado. Reporta req/s sustentado e
+latências p50/p95/p99 de cada modo.
+
+Uso (a partir da raiz do projeto):
+    python -m benchmarks.bench_async_vs_sync --concorrencia 64 --duracao 20 --workers-sync 8
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import logging
+import multiprocessing
+import os
+import socket
+import tempfile
+import threading
+import time
+
+import aiohttp
+import numpy as np
+
+
+def _porta_livre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _preparar_ambiente(env: dict, pasta: str):
+    os.environ.update(env)
+    os.environ["CEP_CACHE_PATH"] = os.path.join(pasta, f"cep_{os.getpid()}.sqlite")
+    os.environ["OPEN_METEO_CACHE_PATH"] = os.path.join(pasta, f"http_{os.getpid()}")
+
+
+def _servir_sync(env: dict, pasta: str, porta: int, workers: int):
+    """
+    Sobe o Flask com no máximo 'workers' requisições simultâneas (como um gunicorn gthread).
+    """
+    _preparar_ambiente(env, pasta)
+    from werkzeug.serving import make_server
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        from api.app import app
+
+    vagas = threading.BoundedSemaphore(workers)
+
+    def app_limitado(environ, start_response):
+        with vagas:
+            return app(environ, start_response)
+
+    # Os prints do caminho síncrono e o log de acesso não devem poluir a saída do benchmark
+    os.dup2(os.open(os.devnull, os.O_WRONLY), 1)
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    make_server("127.0.0.1", porta, app_limitado, threaded=True).serve_forever()
+
+
+def _servir_async(env: dict, pasta: str, porta: int):
+    _preparar_ambiente(env, pasta)
+    from aiohttp import web
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        from api.app_async import criar_app
+    web.run_app(criar_app(), host="127.0.0.1", port=porta, print=None)
+
+
+async def _aguardar_servidor(url: str, timeout: float = 60.0):
+    limite = time.time() + timeout
+    async with aiohttp.ClientSession() as sessao:
+        while time.time() < limite:
+            try:
+                async with sessao.get(f"{url}/health") as resposta:
+                    if resposta.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"Servidor {url} não respondeu.")
+
+
+async def _gerar_carga(url: str, concorrencia: int, duracao: float, cep_inicial: int) -> dict:
+    """
+    'concorrencia' clientes fechados (cada um espera a resposta antes da próxima requisição)
+    durante 'duracao' segundos, cada requisição com um CEP diferente.
+    """
+    await _aguardar_servidor(url)
+    latencias, erros = [], 0
+    proximo_cep = iter(range(cep_inicial, cep_inicial + 10_000_000))
+    fim = time.perf_counter() + duracao
+
+    async def cliente(sessao):
+        nonlocal erros
+        while time.perf_counter() < fim:
+            cep = f"{next(proximo_cep):08d}"
+            inicio = time.perf_counter()
+            try:
+                async with sessao.post(f"{url}/consulta", json={"cep": cep}) as resposta:
+                    await resposta.read()
+                    if resposta.status != 200:
+                        erros += 1
+            except aiohttp.ClientError:
+                erros += 1
+            latencias.append(time.perf_counter() - inicio)
+
+    conector = aiohttp.TCPConnector(limit=concorrencia)
+    timeout = aiohttp.ClientTimeout(total=120)
+    async with aiohttp.ClientSession(connector=conector, timeout=timeout) as sessao:
+        inicio = time.perf_counter()
+        await asyncio.gather(*(cliente(sessao) for _ in range(concorrencia)))
+        decorrido = time.perf_counter() - inicio
+
+    ms = np.asarray(latencias) * 1000
+    return {
+        "requisicoes": len(latencias),
+        "erros": erros,
+        "req_s": len(latencias) / decorrido,
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Carga em /consulta: Flask síncrono vs modo assíncrono.")
+    parser.add_argument("--concorrencia", type=int, default=64)
+    parser.add_argument("--duracao", type=float, default=20.0, help="Segundos de carga por modo.")
+    parser.add_argument("--workers-sync", type=int, default=8, help="Requisições simultâneas no Flask.")
+    parser.add_argument("--latencia-cep-ms", type=float, default=20.0)
+    parser.add_argument("--latencia-nominatim-ms", type=float, default=50.0)
+    parser.add_argument("--latencia-open-meteo-ms", type=float, default=20.0)
+    args = parser.parse_args()
+
+    from benchmarks.stub_upstreams import iniciar_upstreams
+
+    upstreams = iniciar_upstreams(args.latencia_cep_ms / 1000, args.latencia_nominatim_ms / 1000,
+                                  args.latencia_open_meteo_ms / 1000)
+    pasta = tempfile.mkdtemp(prefix="bench_async_")
+    # O Nominatim simulado não tem o limite de 1 req/s do público: libera a fila do agendador
+    env = dict(upstreams["env"], NOMINATIM_TAXA="100000", NOMINATIM_RAJADA=str(args.concorrencia),
+               NOMINATIM_WORKERS=str(args.concorrencia))
+
+    modos = {
+        "sync (Flask)": (_servir_sync, lambda porta: (env, pasta, porta, args.workers_sync)),
+        "async (aiohttp)": (_servir_async, lambda porta: (env, pasta, porta)),
+    }
+
+    print(f"Concorrência {args.concorrencia}, {args.duracao:.0f} s por modo, "
+          f"{args.workers_sync} workers no Flask\n")
+    print(f"{'modo':<17} | {'req':>6} | {'erros':>5} | {'req/s':>7} | {'p50 ms':>8} | {'p95 ms':>8} | {'p99 ms':>8}")
+    print("-" * 78)
+    for i, (nome, (alvo, argumentos)) in enumerate(modos.items()):
+        porta = _porta_livre()
+        processo = multiprocessing.Process(target=alvo, args=argumentos(porta), daemon=True)
+        processo.start()
+        try:
+            r = asyncio.run(_gerar_carga(f"http://127.0.0.1:{porta}", args.concorrencia, args.duracao,
+                                         cep_inicial=10_000_000 * (i + 1) + 1))
+        finally:
+            processo.terminate()
+            processo.join()
+        print(f"{nome:<17} | {r['requisicoes']:>6} | {r['erros']:>5} | {r['req_s']:>7.1f} | "
+              f"{r['p50_ms']:>8.1f} | {r['p95_ms']:>8.1f} | {r['p99_ms']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
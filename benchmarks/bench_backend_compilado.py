@@ -0,0 +1,115 @@
+"""
+Backend compilado (services/compiled_trees.py) contra lgb.Booster.predict.
+
+1) Paridade: probabilidades do ensemble compilado contra Booster.predict em todas as linhas
+   de data/weather_dataset_with_rules.csv — em lote, linha a linha (caminho de uma linha) e
+   com valores ausentes (NaN) injetados. Sai com código 1 se a diferença passar da tolerância.
+2) Latência/vazão nos tamanhos de lote 1, 100, 10k, 100k e 1M (linhas amostradas do CSV);
+   no lote de 1, também o p50/p99 de chamadas repetidas.
+
+Uso (a partir da raiz do projeto):
+    python -m benchmarks.bench_backend_compilado
+    python -m benchmarks.bench_backend_compilado --tamanhos 1 100 10000 --tolerancia 1e-9
+"""
+import argparse
+import sys
+import time
+
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+
+from services.compiled_trees import CompiledTreeEnsemble
+from services.model_service import CSV_PATH, FEATURE_COLS, MODEL_NATIVE_PATH
+
+TAMANHOS_PADRAO = [1, 100, 10_000, 100_000, 1_000_000]
+
+# Chamadas de uma linha usadas no p50/p99
+CHAMADAS_LINHA_UNICA = 2_000
+
+
+def _cronometrar(func, repeticoes: int) -> float:
+    """
+    Executa func 'repeticoes' vezes e devolve o melhor tempo (segundos).
+    """
+    melhor = float("inf")
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        func()
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor
+
+
+def _verificar_paridade(booster, compilado: CompiledTreeEnsemble, base: np.ndarray, tolerancia: float) -> bool:
+    """
+    Compara as probabilidades dos dois backends e imprime a maior diferença de cada cenário.
+    """
+    rng = np.random.default_rng(7)
+    com_nan = base.copy()
+    com_nan[rng.random(com_nan.shape) < 0.1] = np.nan
+    amostra = base[rng.integers(0, len(base), size=500)]
+
+    cenarios = {
+        "lote (CSV inteiro)": (booster.predict(base), compilado.predict(base)),
+        "lote com NaN": (booster.predict(com_nan), compilado.predict(com_nan)),
+        "linha a linha": (booster.predict(amostra), np.vstack([compilado.predict(linha[None, :]) for linha in amostra])),
+    }
+    ok = True
+    for nome, (esperado, obtido) in cenarios.items():
+        diferenca = float(np.abs(esperado - obtido).max())
+        mesma_classe = float((esperado.argmax(axis=1) == obtido.argmax(axis=1)).mean())
+        passou = diferenca <= tolerancia and mesma_classe == 1.0
+        ok &= passou
+        print(f"{nome:>20}: diferença máx. {diferenca:.2e} | mesma classe {mesma_classe:.2%} | "
+              f"{'OK' if passou else 'FALHOU'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Paridade e desempenho do backend compilado vs LightGBM.")
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=TAMANHOS_PADRAO,
+                        help="Tamanhos de lote a medir (padrão: 1 100 10000 100000 1000000).")
+    parser.add_argument("--repeticoes", type=int, default=3, help="Repetições por medida (usa a melhor).")
+    parser.add_argument("--tolerancia", type=float, default=1e-9,
+                        help="Maior diferença aceita entre as probabilidades (padrão: 1e-9).")
+    args = parser.parse_args()
+
+    booster = lgb.Booster(model_file=MODEL_NATIVE_PATH)
+    inicio = time.perf_counter()
+    compilado = CompiledTreeEnsemble.from_booster(booster)
+    print(f"Compilação: {time.perf_counter() - inicio:.2f} s "
+          f"({len(compilado.roots)} árvores, {len(compilado.feature)} splits, "
+          f"profundidade máx. {len(compilado.active_trees)})\n")
+
+    base = pd.read_csv(CSV_PATH)[FEATURE_COLS].to_numpy(dtype=np.float64)
+    print("=== Paridade com Booster.predict ===")
+    paridade_ok = _verificar_paridade(booster, compilado, base, args.tolerancia)
+
+    print("\n=== Desempenho ===")
+    print(f"{'lote':>10} | {'lightgbm (linhas/s)':>20} | {'compilado (linhas/s)':>21} | {'ganho':>7}")
+    print("-" * 68)
+    rng = np.random.default_rng(42)
+    for tamanho in args.tamanhos:
+        matriz = base[rng.integers(0, len(base), size=tamanho)]
+        t_lgb = _cronometrar(lambda: booster.predict(matriz), args.repeticoes)
+        t_comp = _cronometrar(lambda: compilado.predict(matriz), args.repeticoes)
+        print(f"{tamanho:>10} | {tamanho / t_lgb:>20,.0f} | {tamanho / t_comp:>21,.0f} | {t_lgb / t_comp:>6.2f}x")
+
+    # Latência de uma linha por chamada (o caso do /consulta)
+    linhas = base[rng.integers(0, len(base), size=CHAMADAS_LINHA_UNICA)]
+    print(f"\nUma linha por chamada ({CHAMADAS_LINHA_UNICA} chamadas):")
+    for nome, predizer in (("lightgbm", booster.predict), ("compilado", compilado.predict)):
+        tempos = []
+        for linha in linhas:
+            inicio = time.perf_counter()
+            predizer(linha[None, :])
+            tempos.append(time.perf_counter() - inicio)
+        p50, p99 = np.percentile(tempos, [50, 99]) * 1e6
+        print(f"{nome:>10}: p50 {p50:7.1f} µs | p99 {p99:7.1f} µs")
+
+    if not paridade_ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
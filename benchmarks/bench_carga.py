@@ -0,0 +1,241 @@
+"""
+Teste de carga offline de POST /consulta (Flask), em níveis fixos de concorrência, com os
+três upstreams simulados localmente (benchmarks/stub_upstreams.py).
+
+Carga de trabalho:
+  - gerada: lista de CEPs com uma fração de repetidos (hits no cache de CEP) e de
+    inexistentes (o OpenCEP simulado devolve 404 para CEPs terminados em "000000");
+  - ou um arquivo (--carga): JSON Lines com o corpo de cada requisição ({"cep": ...,
+    "preciso": ...}) ou um CEP por linha. Linhas sem "cep" são ignoradas.
+
+Cada nível de concorrência roda contra um servidor novo (caches frios, mesmas condições) com
+SERVER_TIMING=1; o cabeçalho Server-Timing de cada resposta dá a quebra por etapa (cep,
+brazilcep, nominatim_n1, clima, open_meteo, features, predicao...). Reporta req/s, p50/p95/p99,
+status das respostas, erros/retentativas dos upstreams (lidos do /metrics) e p50/p95 de cada
+etapa. Com --saida grava o resultado em JSON; com --comparar aponta regressões contra um
+resultado anterior (sai com código 1).
+
+Uso (a partir da raiz do projeto):
+    python -m benchmarks.bench_carga --concorrencias 1 8 32 --duracao 15 --saida resultados/carga.json
+    python -m benchmarks.bench_carga --carga ceps.jsonl --taxa-erro 0.05 --comparar resultados/carga.json
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import re
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+import aiohttp
+import numpy as np
+
+from benchmarks.bench_async_vs_sync import _aguardar_servidor, _porta_livre, _servir_sync
+from benchmarks.resultados import carregar_resultado, comparar, imprimir_comparacao, salvar_resultado
+
+CONCORRENCIAS_PADRAO = [1, 8, 32]
+
+_RE_METRICA_UPSTREAM = re.compile(
+    r'^supernova_upstream_(erros|retentativas)_total\{upstream="([^"]+)"\} ([0-9.e+]+)$', re.M)
+
+
+def carregar_carga(caminho: str) -> list:
+    """
+    Lê a carga de um arquivo: JSON Lines com o corpo da requisição ou um CEP por linha.
+    """
+    corpos = []
+    with open(caminho, encoding="utf-8") as f:
+        for linha in f:
+            linha = linha.strip()
+            if not linha:
+                continue
+            if linha.startswith("{"):
+                corpo = json.loads(linha)
+                if "cep" in corpo:
+                    corpos.append({chave: corpo[chave] for chave in ("cep", "preciso") if chave in corpo})
+            else:
+                corpos.append({"cep": linha})
+    if not corpos:
+        raise SystemExit(f"Nenhuma requisição com 'cep' em {caminho}.")
+    return corpos
+
+
+def gerar_carga(n: int, repetidos: float, inexistentes: float, seed: int) -> list:
+    """
+    'n' corpos de requisição: uma fração 'repetidos' repete um CEP já visto, uma fração
+    'inexistentes' é de CEPs que o OpenCEP simulado não encontra e o resto é de CEPs novos.
+    """
+    rng = np.random.default_rng(seed)
+    vistos, corpos = [], []
+    for sorteio in rng.random(n):
+        if sorteio < repetidos and vistos:
+            cep = vistos[rng.integers(len(vistos))]
+        elif sorteio < repetidos + inexistentes:
+            cep = f"{rng.integers(10, 100):02d}000000"
+        else:
+            cep = f"{rng.integers(1_000_000, 100_000_000):08d}"
+            vistos.append(cep)
+        corpos.append({"cep": cep})
+    return corpos
+
+
+def _ler_server_timing(valor: str) -> list:
+    """
+    "cep;dur=12.3, clima;dur=80.1" → [("cep", 12.3), ("clima", 80.1)] (ms).
+    """
+    etapas = []
+    for parte in valor.split(","):
+        nome, _, parametros = parte.strip().partition(";")
+        if parametros.startswith("dur="):
+            etapas.append((nome, float(parametros[4:])))
+    return etapas
+
+
+async def _rodar_nivel(url: str, corpos: list, concorrencia: int, duracao: float, aquecimento: float) -> dict:
+    """
+    'concorrencia' clientes fechados percorrendo 'corpos' em ciclo por 'aquecimento' + 'duracao'
+    segundos; só as requisições iniciadas depois do aquecimento entram nas medidas.
+    """
+    await _aguardar_servidor(url)
+    latencias, status, etapas = [], Counter(), defaultdict(list)
+    proximo = iter(range(10 ** 12))
+    inicio_medicao = time.perf_counter() + aquecimento
+    fim = inicio_medicao + duracao
+
+    async def cliente(sessao):
+        while time.perf_counter() < fim:
+            corpo = corpos[next(proximo) % len(corpos)]
+            inicio = time.perf_counter()
+            try:
+                async with sessao.post(f"{url}/consulta", json=corpo) as resposta:
+                    await resposta.read()
+                    codigo, timing = str(resposta.status), resposta.headers.get("Server-Timing")
+            except aiohttp.ClientError:
+                codigo, timing = "falha", None
+            if inicio < inicio_medicao:
+                continue
+            latencias.append(time.perf_counter() - inicio)
+            status[codigo] += 1
+            for nome, ms in _ler_server_timing(timing or ""):
+                etapas[nome].append(ms)
+
+    conector = aiohttp.TCPConnector(limit=concorrencia)
+    timeout = aiohttp.ClientTimeout(total=120)
+    async with aiohttp.ClientSession(connector=conector, timeout=timeout) as sessao:
+        await asyncio.gather(*(cliente(sessao) for _ in range(concorrencia)))
+        async with sessao.get(f"{url}/metrics") as resposta:
+            metricas = await resposta.text()
+
+    upstreams = defaultdict(dict)
+    for tipo, upstream, valor in _RE_METRICA_UPSTREAM.findall(metricas):
+        upstreams[upstream][tipo] = float(valor)
+
+    ms = np.asarray(latencias) * 1000 if latencias else np.zeros(1)
+    return {
+        "requisicoes": len(latencias),
+        "req_s": len(latencias) / duracao,
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "status": dict(status),
+        "upstreams": dict(upstreams),
+        "etapas": {
+            nome: {"chamadas": len(valores), "p50_ms": float(np.percentile(valores, 50)),
+                   "p95_ms": float(np.percentile(valores, 95)), "media_ms": float(np.mean(valores))}
+            for nome, valores in sorted(etapas.items())
+        },
+    }
+
+
+def _medidas(concorrencia: int, r: dict) -> dict:
+    """
+    Achata o resultado de um nível nas medidas do JSON ("c8/req_s", "c8/etapa/cep/p95_ms"...).
+    """
+    prefixo = f"c{concorrencia}"
+    medidas = {f"{prefixo}/{chave}": r[chave] for chave in ("requisicoes", "req_s", "p50_ms", "p95_ms", "p99_ms")}
+    medidas.update({f"{prefixo}/status/{codigo}": n for codigo, n in r["status"].items()})
+    for upstream, valores in r["upstreams"].items():
+        medidas.update({f"{prefixo}/upstream/{upstream}/{tipo}": n for tipo, n in valores.items()})
+    for etapa, valores in r["etapas"].items():
+        medidas.update({f"{prefixo}/etapa/{etapa}/{chave}": v for chave, v in valores.items()})
+    return medidas
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga offline de /consulta (Flask) por nível de concorrência.")
+    parser.add_argument("--concorrencias", type=int, nargs="+", default=CONCORRENCIAS_PADRAO,
+                        help="Níveis de concorrência (clientes simultâneos; padrão: 1 8 32).")
+    parser.add_argument("--duracao", type=float, default=15.0, help="Segundos medidos por nível.")
+    parser.add_argument("--aquecimento", type=float, default=2.0,
+                        help="Segundos iniciais de cada nível fora das medidas.")
+    parser.add_argument("--workers", type=int, default=8, help="Requisições simultâneas no Flask.")
+    parser.add_argument("--carga", default=None, help="Arquivo com a carga (JSON Lines ou um CEP por linha).")
+    parser.add_argument("--ceps", type=int, default=5_000, help="Tamanho da carga gerada.")
+    parser.add_argument("--repetidos", type=float, default=0.3, help="Fração de CEPs repetidos na carga gerada.")
+    parser.add_argument("--inexistentes", type=float, default=0.05,
+                        help="Fração de CEPs inexistentes na carga gerada.")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--latencia-cep-ms", type=float, default=20.0)
+    parser.add_argument("--latencia-nominatim-ms", type=float, default=50.0)
+    parser.add_argument("--latencia-open-meteo-ms", type=float, default=20.0)
+    parser.add_argument("--taxa-erro", type=float, default=0.0,
+                        help="Fração das chamadas aos upstreams simulados que devolve 500.")
+    parser.add_argument("--saida", default=None, help="Grava o resultado neste arquivo JSON.")
+    parser.add_argument("--comparar", default=None, help="Resultado anterior (JSON) para comparar.")
+    parser.add_argument("--tolerancia", type=float, default=0.10,
+                        help="Piora relativa aceita na comparação (padrão: 0.10).")
+    args = parser.parse_args()
+
+    from benchmarks.stub_upstreams import iniciar_upstreams
+
+    corpos = carregar_carga(args.carga) if args.carga else gerar_carga(args.ceps, args.repetidos,
+                                                                       args.inexistentes, args.seed)
+    upstreams = iniciar_upstreams(args.latencia_cep_ms / 1000, args.latencia_nominatim_ms / 1000,
+                                  args.latencia_open_meteo_ms / 1000, args.taxa_erro)
+    # O Nominatim simulado não tem o limite de 1 req/s do público: libera a fila do agendador
+    maior = max(args.concorrencias)
+    env = dict(upstreams["env"], SERVER_TIMING="1", NOMINATIM_TAXA="100000", NOMINATIM_RAJADA=str(maior),
+               NOMINATIM_WORKERS=str(maior))
+
+    print(f"{len(corpos)} requisições na carga, {args.duracao:.0f} s por nível, {args.workers} workers no Flask\n")
+    medidas = {}
+    for concorrencia in args.concorrencias:
+        porta = _porta_livre()
+        pasta = tempfile.mkdtemp(prefix=f"bench_carga_c{concorrencia}_")
+        processo = multiprocessing.Process(target=_servir_sync, args=(env, pasta, porta, args.workers), daemon=True)
+        processo.start()
+        try:
+            r = asyncio.run(_rodar_nivel(f"http://127.0.0.1:{porta}", corpos, concorrencia,
+                                         args.duracao, args.aquecimento))
+        finally:
+            processo.terminate()
+            processo.join()
+        medidas.update(_medidas(concorrencia, r))
+
+        status = ", ".join(f"{codigo}: {n}" for codigo, n in sorted(r["status"].items()))
+        print(f"=== concorrência {concorrencia}: {r['req_s']:.1f} req/s | p50 {r['p50_ms']:.1f} ms | "
+              f"p95 {r['p95_ms']:.1f} ms | p99 {r['p99_ms']:.1f} ms | {status}")
+        for upstream, valores in sorted(r["upstreams"].items()):
+            print(f"    upstream {upstream}: " + ", ".join(f"{tipo} {n:.0f}" for tipo, n in sorted(valores.items())))
+        print(f"    {'etapa':<16} | {'chamadas':>8} | {'p50 ms':>8} | {'p95 ms':>8} | {'média ms':>8}")
+        for etapa, valores in r["etapas"].items():
+            print(f"    {etapa:<16} | {valores['chamadas']:>8} | {valores['p50_ms']:>8.1f} | "
+                  f"{valores['p95_ms']:>8.1f} | {valores['media_ms']:>8.1f}")
+        print()
+
+    parametros = {chave: valor for chave, valor in vars(args).items() if chave not in ("saida", "comparar")}
+    resultado = {"benchmark": "carga", "meta": {}, "medidas": medidas}
+    if args.saida:
+        resultado = salvar_resultado(args.saida, "carga", parametros, medidas)
+        print(f"Resultado gravado em {args.saida}")
+    if args.comparar:
+        print(f"\n=== Comparação com {args.comparar} ===")
+        if not imprimir_comparacao(comparar(carregar_resultado(args.comparar), resultado, args.tolerancia),
+                                   args.tolerancia):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
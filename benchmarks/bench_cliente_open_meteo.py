@@ -0,0 +1,104 @@
+"""
+Benchmark de latência (p50/p99) de chamadas repetidas à Open-Meteo contra um servidor local.
+
+Compara o caminho antigo (CachedSession + retry + Client novos a cada chamada, reabrindo o
+SQLite e descartando as conexões keep-alive) com o client compartilhado de
+services/api_weather_service.py, em dois cenários:
+  - coordenadas distintas a cada chamada (miss no cache HTTP, vai ao servidor)
+  - a mesma coordenada repetida (hit no cache HTTP)
+
+Uso (a partir da raiz do projeto):
+    python -m benchmarks.bench_cliente_open_meteo --chamadas 300 --threads 8 --latencia-ms 5
+"""
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmarks.stub_open_meteo import StubOpenMeteo
+
+
+def _percentis(latencias: list) -> str:
+    ms = np.asarray(latencias) * 1000
+    return f"p50 {np.percentile(ms, 50):7.2f} ms | p99 {np.percentile(ms, 99):7.2f} ms"
+
+
+def _medir(funcao, coordenadas: list, threads: int) -> tuple:
+    """
+    Chama funcao(lat, lon) para cada coordenada com 'threads' workers.
+    Devolve (latências individuais, vazão em chamadas/s).
+    """
+    def cronometrar(coordenada):
+        inicio = time.perf_counter()
+        funcao(*coordenada)
+        return time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        latencias = list(executor.map(cronometrar, coordenadas))
+    return latencias, len(coordenadas) / (time.perf_counter() - inicio)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="p50/p99 do client Open-Meteo antigo vs compartilhado.")
+    parser.add_argument("--chamadas", type=int, default=300)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--latencia-ms", type=float, default=5.0, help="Latência simulada do servidor local.")
+    args = parser.parse_args()
+
+    pasta = tempfile.mkdtemp(prefix="bench_open_meteo_")
+    stub = StubOpenMeteo(latencia=args.latencia_ms / 1000).iniciar()
+
+    # O serviço lê URL/cache das variáveis de ambiente na importação
+    os.environ["OPEN_METEO_URL"] = stub.url
+    os.environ["OPEN_METEO_CACHE_PATH"] = os.path.join(pasta, "compartilhado")
+    import openmeteo_requests
+    import requests_cache
+    from requests.adapters import HTTPAdapter
+    from urllib3 import Retry
+
+    from services import api_weather_service
+
+    def previsao_antiga(lat, lon):
+        # Reprodução do caminho antigo: tudo recriado a cada chamada
+        sessao = requests_cache.CachedSession(os.path.join(pasta, "antigo"), expire_after=3600)
+        adapter = HTTPAdapter(max_retries=Retry(total=5, backoff_factor=0.2, status_forcelist=(500, 502, 504)))
+        sessao.mount("http://", adapter)
+        cliente = openmeteo_requests.Client(session=sessao)
+        params = {"latitude": lat, "longitude": lon, "current": api_weather_service.VARIAVEIS_ATUAIS}
+        resposta = cliente.weather_api(stub.url, params=params)[0]
+        sessao.close()
+        return api_weather_service._extrair_info_atual(resposta)
+
+    def previsao_compartilhada(lat, lon):
+        cliente = api_weather_service.obter_cliente_open_meteo()
+        params = {"latitude": lat, "longitude": lon, "current": api_weather_service.VARIAVEIS_ATUAIS}
+        resposta = cliente.weather_api(stub.url, params=params)[0]
+        return api_weather_service._extrair_info_atual(resposta)
+
+    cenarios = {
+        "coordenadas distintas": [(-23.0 - i * 0.001, -46.0 - i * 0.001) for i in range(args.chamadas)],
+        "mesma coordenada": [(-23.568, -46.648)] * args.chamadas,
+    }
+
+    print(f"{args.chamadas} chamadas, {args.threads} threads, servidor local com {args.latencia_ms} ms\n")
+    for nome, coordenadas in cenarios.items():
+        print(f"== {nome} ==")
+        for rotulo, funcao in (("antigo", previsao_antiga), ("compartilhado", previsao_compartilhada)):
+            # Deslocamento por caminho para que um não aproveite o cache HTTP do outro
+            deslocamento = 0.5 if rotulo == "antigo" and nome == "coordenadas distintas" else 0.0
+            entrada = [(lat + deslocamento, lon) for lat, lon in coordenadas]
+            latencias, vazao = _medir(funcao, entrada, args.threads)
+            print(f"  {rotulo:<14} {_percentis(latencias)} | {vazao:8.1f} chamadas/s")
+        print()
+
+    print(f"Requisições que chegaram ao servidor local: {stub.requisicoes}")
+    print(f"Estatísticas do client compartilhado: {api_weather_service.estatisticas_cliente_open_meteo()}")
+    stub.shutdown()
+
+
+if __name__ == "__main__":
+    main()
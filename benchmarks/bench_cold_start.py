@@ -0,0 +1,185 @@
+"""
+Benchmark de partida a frio da API.
+
+Cada medida roda num processo Python novo (nada em cache de import):
+  - tempo de import de api.app e tempo até a primeira predição em cada MODELO_CARREGAMENTO
+    ("lazy", "background", "eager") e com o backend compilado (MODELO_BACKEND=compilado, cache
+    .npz já gerado: o lightgbm nem é importado);
+  - tempo de import do lightgbm e de carregamento do modelo no formato nativo vs pickle;
+  - memória de workers pré-forkados depois do modelo carregado no processo pai
+    (Pss/Private de /proc/<pid>/smaps_rollup, só no Linux): o que não é privado está
+    compartilhado por copy-on-write.
+
+Uso (a partir da raiz do projeto):
+    python -m benchmarks.bench_cold_start
+    python -m benchmarks.bench_cold_start --repeticoes 5 --workers 4
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+MODOS_CARREGAMENTO = ["lazy", "background", "eager"]
+
+# Linha usada na primeira predição
+LINHA_EXEMPLO = {
+    "apparent_temperature": 25.0, "cloud_cover": 40.0, "is_day": 1, "precipitation": 2.0,
+    "pressure_msl": 1013.0, "rain": 2.0, "relative_humidity_2m": 70.0, "showers": 0.0,
+    "snowfall": 0.0, "surface_pressure": 1000.0, "temperature_2m": 24.0, "weather_code": 3,
+    "wind_direction_10m": 180.0, "wind_gusts_10m": 5.0, "wind_speed_10m": 3.0,
+    "elevation": 760.0, "latitude": -23.55, "longitude": -46.63,
+}
+
+
+def _medir_partida():
+    """
+    (Processo filho) Import de api.app + primeira predição no modo de MODELO_CARREGAMENTO.
+    """
+    inicio = time.perf_counter()
+    import api.app  # noqa: F401
+    t_import = time.perf_counter() - inicio
+
+    from services.model_service import classify_condition
+    classify_condition(LINHA_EXEMPLO, mode="modelo")
+    t_primeira = time.perf_counter() - inicio
+    return {"import_s": t_import, "primeira_predicao_s": t_primeira}
+
+
+def _medir_formatos():
+    """
+    (Processo filho) Import do lightgbm e carregamento do modelo nativo vs pickle.
+    """
+    inicio = time.perf_counter()
+    import lightgbm as lgb
+    t_import = time.perf_counter() - inicio
+
+    import joblib
+    from services.model_service import MODEL_NATIVE_PATH, MODEL_PATH
+
+    inicio = time.perf_counter()
+    lgb.Booster(model_file=MODEL_NATIVE_PATH)
+    t_nativo = time.perf_counter() - inicio
+
+    t_pickle = None
+    if os.path.exists(MODEL_PATH):
+        inicio = time.perf_counter()
+        joblib.load(MODEL_PATH)
+        t_pickle = time.perf_counter() - inicio
+    return {"import_lightgbm_s": t_import, "nativo_s": t_nativo, "pickle_s": t_pickle}
+
+
+def _memoria(pid) -> dict:
+    """
+    Rss, Pss e Private (KiB) do processo, de /proc/<pid>/smaps_rollup.
+    """
+    campos = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for linha in f:
+            nome, _, valor = linha.partition(":")
+            if nome in ("Rss", "Pss", "Private_Clean", "Private_Dirty"):
+                campos[nome] = int(valor.split()[0])
+    return {"rss_kib": campos["Rss"], "pss_kib": campos["Pss"],
+            "privado_kib": campos["Private_Clean"] + campos["Private_Dirty"]}
+
+
+def _medir_workers(n_workers: int):
+    """
+    (Processo filho) Carrega o modelo (modo "eager"), faz fork de n_workers que predizem
+    algumas vezes e mede a memória de cada um enquanto todos estão vivos.
+    """
+    from services.model_service import classify_many, start_model_loading
+
+    start_model_loading()
+    pai = _memoria(os.getpid())
+    filhos = []
+    for _ in range(n_workers):
+        leitura, escrita = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(leitura)
+            for _ in range(20):
+                classify_many([LINHA_EXEMPLO] * 100, mode="modelo")
+            os.write(escrita, b"1")
+            os.close(escrita)
+            time.sleep(60)  # fica vivo até o pai medir
+            os._exit(0)
+        os.close(escrita)
+        filhos.append((pid, leitura))
+
+    memorias = []
+    for pid, leitura in filhos:
+        os.read(leitura, 1)
+        os.close(leitura)
+    for pid, _ in filhos:
+        memorias.append(_memoria(pid))
+        os.kill(pid, 9)
+        os.waitpid(pid, 0)
+    return {"pai": pai, "workers": memorias}
+
+
+def _rodar_filho(medida: str, env: dict = None, args: list = None) -> dict:
+    """
+    Roda uma medida num processo Python novo e devolve o JSON que ele imprime.
+    """
+    saida = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_cold_start", "--medida", medida] + (args or []),
+        env={**os.environ, **(env or {})}, capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(saida.strip().splitlines()[-1])
+
+
+def _mediana(resultados: list, chave: str) -> float:
+    valores = [r[chave] for r in resultados if r[chave] is not None]
+    return statistics.median(valores) if valores else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Partida a frio: import da API e primeira predição.")
+    parser.add_argument("--repeticoes", type=int, default=3, help="Processos por medida (usa a mediana).")
+    parser.add_argument("--workers", type=int, default=4, help="Workers pré-forkados na medida de memória.")
+    parser.add_argument("--medida", choices=["partida", "formatos", "workers"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # Modo filho: mede uma coisa e imprime o resultado em JSON
+    if args.medida == "partida":
+        print(json.dumps(_medir_partida()))
+        return
+    if args.medida == "formatos":
+        print(json.dumps(_medir_formatos()))
+        return
+    if args.medida == "workers":
+        print(json.dumps(_medir_workers(args.workers)))
+        return
+
+    configuracoes = [(modo, {"MODELO_CARREGAMENTO": modo}) for modo in MODOS_CARREGAMENTO]
+    # Gera o cache .npz antes, para medir só a leitura dele
+    _rodar_filho("partida", {"MODELO_CARREGAMENTO": "lazy", "MODELO_BACKEND": "compilado"})
+    configuracoes.append(("compilado", {"MODELO_CARREGAMENTO": "lazy", "MODELO_BACKEND": "compilado"}))
+
+    print(f"{'carregamento':>12} | {'import api.app':>14} | {'1ª predição':>12}")
+    for nome, env in configuracoes:
+        resultados = [_rodar_filho("partida", {**env, "MODO_PREDICAO": "modelo"}) for _ in range(args.repeticoes)]
+        print(f"{nome:>12} | {_mediana(resultados, 'import_s') * 1000:11.0f} ms | "
+              f"{_mediana(resultados, 'primeira_predicao_s') * 1000:9.0f} ms")
+
+    resultados = [_rodar_filho("formatos") for _ in range(args.repeticoes)]
+    print(f"\nimport lightgbm: {_mediana(resultados, 'import_lightgbm_s') * 1000:.0f} ms")
+    print(f"modelo nativo (.txt): {_mediana(resultados, 'nativo_s') * 1000:.1f} ms")
+    if _mediana(resultados, "pickle_s") is not None:
+        print(f"modelo pickle (.pkl): {_mediana(resultados, 'pickle_s') * 1000:.1f} ms")
+
+    if sys.platform.startswith("linux"):
+        memoria = _rodar_filho("workers", {"MODELO_CARREGAMENTO": "eager", "MODO_PREDICAO": "modelo"},
+                               ["--workers", str(args.workers)])
+        print(f"\nprocesso pai (modelo carregado): Rss {memoria['pai']['rss_kib'] / 1024:.1f} MiB")
+        print(f"{'worker':>6} | {'Rss':>9} | {'Pss':>9} | {'privado':>9}")
+        for i, m in enumerate(memoria["workers"]):
+            print(f"{i:>6} | {m['rss_kib'] / 1024:5.1f} MiB | {m['pss_kib'] / 1024:5.1f} MiB | "
+                  f"{m['privado_kib'] / 1024:5.1f} MiB")
+
+
+if __name__ == "__main__":
+    main()
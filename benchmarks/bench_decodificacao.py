@@ -0,0 +1,118 @@
+"""
+Decodificação das respostas FlatBuffers da Open-Meteo: caminho antigo contra
+services/weather_decoding.py.
+
+  - uma coordenada: extração antiga (Variables(i).Value() por posição + pd.to_datetime) contra
+    a leitura pelo nome (_extrair_info_atual);
+  - séries horárias: um float Python por valor (Values(j)) contra ValuesAsNumpy();
+  - lote multi-localização: um dict por coordenada contra um único array estruturado
+    (decodificar_lote), que segue direto para build_feature_matrix;
+  - valores "current" do lote: acessores do openmeteo_sdk contra o caminho rápido (leitura
+    direta do buffer), com a conferência de que os dois dão os mesmos valores;
+  - tamanho do corpo da resposta de uma coordenada pedindo hourly/daily (como antes) e só "current".
+
+As respostas são codificadas pelo servidor simulado (benchmarks/stub_open_meteo.py).
+
+Uso (a partir da raiz do projeto):
+    python -m benchmarks.bench_decodificacao --coordenadas 100 --repeticoes 200
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.stub_open_meteo import codificar_resposta
+from services.api_weather_service import (VARIAVEIS_ATUAIS, _decodificar_respostas, _extrair_info_atual,
+                                          _extrair_info_geral)
+from services.model_service import build_feature_matrix
+from services.weather_decoding import _valores_atuais_rapido, _valores_atuais_sdk, decodificar_lote, ler_horarias
+
+# Variáveis "hourly" e número de horas que o caminho antigo pedia (past_days=1 + forecast_days=1)
+HORARIAS_ANTIGAS = ["temperature_2m", "weather_code", "rain", "visibility", "precipitation_probability",
+                    "precipitation", "snowfall"]
+HORAS_ANTIGAS = 48
+
+
+def _extrair_info_atual_antigo(response) -> dict:
+    """
+    Reprodução do _extrair_info_atual original (por posição, com pandas para o horário local).
+    """
+    current = response.Current()
+    hora_local = pd.to_datetime(current.Time(), unit='s').tz_localize('UTC').tz_convert('America/Sao_Paulo')
+    nomes = ["temperature_2m", "precipitation", "wind_speed_10m", "wind_direction_10m", "is_day", "rain",
+             "snowfall", "surface_pressure", "weather_code", "cloud_cover", "pressure_msl", "showers",
+             "relative_humidity_2m", "apparent_temperature", "wind_gusts_10m"]
+    info = {"time_local": hora_local.isoformat()}
+    for i, nome in enumerate(nomes):
+        info[nome] = current.Variables(i).Value()
+    return info
+
+
+def _horarias_por_valor(bloco) -> dict:
+    series = {}
+    for i in range(bloco.VariablesLength()):
+        variavel = bloco.Variables(i)
+        series[i] = [variavel.Values(j) for j in range(variavel.ValuesLength())]
+    return series
+
+
+def _cronometrar(func, repeticoes: int) -> float:
+    """
+    Melhor tempo (µs) de 'repeticoes' execuções de func.
+    """
+    melhor = float("inf")
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        func()
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Decodificação das respostas da Open-Meteo: antigo vs novo.")
+    parser.add_argument("--coordenadas", type=int, default=100, help="Coordenadas no lote multi-localização.")
+    parser.add_argument("--repeticoes", type=int, default=200, help="Repetições por medida (usa a melhor).")
+    args = parser.parse_args()
+
+    corpo_antigo = codificar_resposta(-23.55, -46.63, VARIAVEIS_ATUAIS, HORARIAS_ANTIGAS, horas=HORAS_ANTIGAS)
+    corpo_novo = codificar_resposta(-23.55, -46.63, VARIAVEIS_ATUAIS)
+    print(f"Corpo de uma coordenada: {len(corpo_antigo)} bytes com hourly/daily, {len(corpo_novo)} só com current\n")
+
+    resposta = _decodificar_respostas(corpo_antigo)[0]
+    rng = np.random.default_rng(1)
+    coordenadas = zip(rng.uniform(-33, -3, args.coordenadas), rng.uniform(-73, -35, args.coordenadas))
+    lote = _decodificar_respostas(b"".join(codificar_resposta(lat, lon, VARIAVEIS_ATUAIS) for lat, lon in coordenadas))
+
+    def lote_dicts():
+        linhas = [{**_extrair_info_geral(r), **_extrair_info_atual_antigo(r)} for r in lote]
+        return build_feature_matrix(linhas)
+
+    def lote_estruturado():
+        return build_feature_matrix(decodificar_lote(lote, VARIAVEIS_ATUAIS))
+
+    cenarios = {
+        "current (1 coordenada)": (lambda: _extrair_info_atual_antigo(resposta), lambda: _extrair_info_atual(resposta)),
+        f"hourly ({len(HORARIAS_ANTIGAS)} x {HORAS_ANTIGAS} h)": (lambda: _horarias_por_valor(resposta.Hourly()),
+                                                           lambda: ler_horarias(resposta.Hourly(), HORARIAS_ANTIGAS)),
+        f"lote ({args.coordenadas}) → matriz": (lote_dicts, lote_estruturado),
+    }
+    print(f"{'cenário':<26} | {'antigo µs':>10} | {'novo µs':>10} | {'ganho':>7}")
+    print("-" * 63)
+    for nome, (antigo, novo) in cenarios.items():
+        t_antigo, t_novo = _cronometrar(antigo, args.repeticoes), _cronometrar(novo, args.repeticoes)
+        print(f"{nome:<26} | {t_antigo:>10.1f} | {t_novo:>10.1f} | {t_antigo / t_novo:>6.1f}x")
+
+    iguais = np.array_equal(lote_dicts(), lote_estruturado())
+    print(f"\nMatriz de features idêntica nos dois caminhos: {'sim' if iguais else 'NÃO'}")
+
+    blocos = [r.Current() for r in lote]
+    t_sdk = _cronometrar(lambda: [_valores_atuais_sdk(b, VARIAVEIS_ATUAIS) for b in blocos], args.repeticoes)
+    t_rapido = _cronometrar(lambda: [_valores_atuais_rapido(b, VARIAVEIS_ATUAIS) for b in blocos], args.repeticoes)
+    iguais = all(_valores_atuais_sdk(b, VARIAVEIS_ATUAIS) == _valores_atuais_rapido(b, VARIAVEIS_ATUAIS) for b in blocos)
+    print(f"\ncurrent do lote ({args.coordenadas}): SDK {t_sdk:.1f} µs | leitura direta {t_rapido:.1f} µs | "
+          f"ganho {t_sdk / t_rapido:.1f}x | mesmos valores: {'sim' if iguais else 'NÃO'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Incidente na Open-Meteo durante a carga: p50/p99 de POST /consulta (Flask) antes, durante e
+depois de um período em que a Open-Meteo simulada fica lenta e passa a falhar, com e sem as
+proteções de services/upstream.py (disjuntores, hedge) e o stale-while-revalidate do cache
+da grade.
+
+"sem proteção" sobe a API com limiares de disjuntor inatingíveis, HEDGE_ATIVO=0 e
+GRADE_STALE_SEGUNDOS=0 — o comportamento de antes: cada requisição espera o timeout e as
+retentativas do upstream. A cadência do cache da grade é encurtada (--cadencia) para que as
+células expirem durante o incidente, e o modo "regras" dispensa o carregamento do modelo.
+
+Para cada fase reporta req/s, p50/p99, status das respostas e a fração de respostas com
+"degradado".
+
+Uso (a partir da raiz do projeto):
+    python -m benchmarks.bench_incidente --fase 10 --latencia-incidente-ms 3000 --taxa-erro-incidente 0.3
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import tempfile
+import time
+from collections import Counter
+
+import aiohttp
+import numpy as np
+
+from benchmarks.bench_async_vs_sync import _aguardar_servidor, _porta_livre, _servir_sync
+from benchmarks.bench_carga import gerar_carga
+
+FASES = ("normal", "incidente", "recuperacao")
+
+SEM_PROTECAO = {"CIRCUITO_TAXA_FALHAS": "2", "CIRCUITO_TAXA_LENTAS": "2", "HEDGE_ATIVO": "0",
+                "GRADE_STALE_SEGUNDOS": "0"}
+
+
+async def _rodar(url: str, corpos: list, concorrencia: int, fase: float, incidente, fim_incidente) -> dict:
+    """
+    'concorrencia' clientes fechados por 3 fases de 'fase' segundos; incidente() e
+    fim_incidente() mudam a Open-Meteo simulada nas viradas. Devolve as medidas por fase.
+    """
+    await _aguardar_servidor(url)
+    medidas = {nome: {"latencias": [], "status": Counter(), "degradadas": 0} for nome in FASES}
+    proximo = iter(range(10 ** 12))
+    inicio = time.perf_counter()
+    fim = inicio + 3 * fase
+
+    async def cliente(sessao):
+        while time.perf_counter() < fim:
+            corpo = corpos[next(proximo) % len(corpos)]
+            enviada = time.perf_counter()
+            try:
+                async with sessao.post(f"{url}/consulta", json=corpo) as resposta:
+                    dados = await resposta.read()
+                    codigo = str(resposta.status)
+            except aiohttp.ClientError:
+                codigo, dados = "falha", b""
+            medida = medidas[FASES[min(int((enviada - inicio) // fase), 2)]]
+            medida["latencias"].append(time.perf_counter() - enviada)
+            medida["status"][codigo] += 1
+            medida["degradadas"] += codigo == "200" and b'"degradado"' in dados
+
+    async def controlar():
+        await asyncio.sleep(fase)
+        incidente()
+        await asyncio.sleep(fase)
+        fim_incidente()
+
+    timeout = aiohttp.ClientTimeout(total=120)
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=concorrencia), timeout=timeout) as sessao:
+        await asyncio.gather(controlar(), *(cliente(sessao) for _ in range(concorrencia)))
+
+    resultado = {}
+    for nome, medida in medidas.items():
+        ms = np.asarray(medida["latencias"]) * 1000 if medida["latencias"] else np.zeros(1)
+        resultado[nome] = {
+            "req_s": len(medida["latencias"]) / fase,
+            "p50_ms": float(np.percentile(ms, 50)),
+            "p99_ms": float(np.percentile(ms, 99)),
+            "status": dict(medida["status"]),
+            "degradadas": medida["degradadas"] / max(len(medida["latencias"]), 1),
+        }
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description="p99 de /consulta durante um incidente na Open-Meteo.")
+    parser.add_argument("--fase", type=float, default=10.0, help="Segundos de cada fase (normal, incidente, recuperação).")
+    parser.add_argument("--concorrencia", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=8, help="Requisições simultâneas no Flask.")
+    parser.add_argument("--ceps", type=int, default=200, help="CEPs distintos da carga (percorridos em ciclo).")
+    parser.add_argument("--cadencia", type=int, default=5, help="Cadência do cache da grade (s) durante o teste.")
+    parser.add_argument("--latencia-open-meteo-ms", type=float, default=20.0)
+    parser.add_argument("--latencia-incidente-ms", type=float, default=3000.0)
+    parser.add_argument("--taxa-erro-incidente", type=float, default=0.3)
+    args = parser.parse_args()
+
+    from benchmarks.stub_upstreams import iniciar_upstreams
+
+    corpos = gerar_carga(args.ceps, 0.0, 0.0, seed=42)
+    env_base = {"SERVER_TIMING": "0", "PREDICTION_MODE": "regras", "NOMINATIM_TAXA": "100000",
+                "NOMINATIM_RAJADA": str(args.concorrencia), "NOMINATIM_WORKERS": str(args.concorrencia),
+                "OPEN_METEO_CADENCIA_SEGUNDOS": str(args.cadencia), "OPEN_METEO_CACHE_EXPIRA_SEGUNDOS": "0",
+                "OPEN_METEO_TIMEOUT": "5"}
+
+    print(f"{args.ceps} CEPs, concorrência {args.concorrencia}, {args.fase:.0f} s por fase; incidente: "
+          f"{args.latencia_incidente_ms:.0f} ms e {args.taxa_erro_incidente:.0%} de erros na Open-Meteo\n")
+    print(f"{'configuração':<14} | {'fase':<12} | {'req/s':>7} | {'p50 ms':>8} | {'p99 ms':>8} | "
+          f"{'degradadas':>10} | status")
+    print("-" * 90)
+    for nome, extra in (("sem proteção", SEM_PROTECAO), ("com proteção", {})):
+        upstreams = iniciar_upstreams(0.005, 0.005, args.latencia_open_meteo_ms / 1000)
+        open_meteo = upstreams["servidores"]["open_meteo"]
+
+        def incidente():
+            open_meteo.latencia = args.latencia_incidente_ms / 1000
+            open_meteo.taxa_erro = args.taxa_erro_incidente
+
+        def fim_incidente():
+            open_meteo.latencia = args.latencia_open_meteo_ms / 1000
+            open_meteo.taxa_erro = 0.0
+
+        porta = _porta_livre()
+        pasta = tempfile.mkdtemp(prefix="bench_incidente_")
+        env = dict(upstreams["env"], **env_base, **extra)
+        processo = multiprocessing.Process(target=_servir_sync, args=(env, pasta, porta, args.workers), daemon=True)
+        processo.start()
+        try:
+            url = f"http://127.0.0.1:{porta}"
+            # Aquece os caches de CEP e da grade antes de medir
+            asyncio.run(_rodar(url, corpos, args.concorrencia, 2.0, lambda: None, lambda: None))
+            resultado = asyncio.run(_rodar(url, corpos, args.concorrencia, args.fase, incidente, fim_incidente))
+        finally:
+            processo.terminate()
+            processo.join()
+            for servidor in upstreams["servidores"].values():
+                servidor.shutdown()
+
+        for fase, r in resultado.items():
+            status = json.dumps(dict(sorted(r["status"].items())))
+            print(f"{nome:<14} | {fase:<12} | {r['req_s']:>7.1f} | {r['p50_ms']:>8.1f} | {r['p99_ms']:>8.1f} | "
+                  f"{r['degradadas']:>10.1%} | {status}")
+
+
+if __name__ == "__main__":
+    main()
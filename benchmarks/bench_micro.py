@@ -0,0 +1,128 @@
+"""
+Microbenchmarks do caminho de predição e da geração do dataset, com resultado em JSON para
+comparar execuções (ver benchmarks/resultados.py).
+
+  - inferência: linhas/s de WeatherModelService.classify_many nos backends "lightgbm" e
+    "compilado" em lotes de 1, 100 e 10k, e p50/p99 de classify_condition (uma linha por
+    chamada, o caso do /consulta);
+  - features: linhas/s de build_feature_matrix a partir de uma lista de dicts;
+  - dataset: linhas/s de utils.gerador_csv.gerar_chunk (geração em memória, sem gravar).
+
+Uso (a partir da raiz do projeto):
+    python -m benchmarks.bench_micro --saida resultados/micro.json
+    python -m benchmarks.bench_micro --comparar resultados/micro.json --tolerancia 0.15
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.resultados import carregar_resultado, comparar, imprimir_comparacao, salvar_resultado
+from services.model_service import CSV_PATH, FEATURE_COLS, WeatherModelService, build_feature_matrix
+
+TAMANHOS_PADRAO = [1, 100, 10_000]
+
+# Chamadas de uma linha usadas no p50/p99
+CHAMADAS_LINHA_UNICA = 2_000
+
+
+def _cronometrar(func, repeticoes: int) -> float:
+    """
+    Executa func 'repeticoes' vezes e devolve o melhor tempo (segundos).
+    """
+    melhor = float("inf")
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        func()
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor
+
+
+def _servicos() -> dict:
+    """
+    O modelo nativo carregado uma vez em cada backend.
+    """
+    lightgbm = WeatherModelService()
+    compilado = WeatherModelService()
+    compilado.model = compilado._load_compiled_model()
+    return {"lightgbm": lightgbm, "compilado": compilado}
+
+
+def medir_inferencia(base: np.ndarray, tamanhos: list, repeticoes: int) -> dict:
+    medidas = {}
+    rng = np.random.default_rng(42)
+    dicts = [dict(zip(FEATURE_COLS, linha)) for linha in base[rng.integers(0, len(base), size=CHAMADAS_LINHA_UNICA)]]
+    for backend, servico in _servicos().items():
+        for tamanho in tamanhos:
+            matriz = base[rng.integers(0, len(base), size=tamanho)]
+            tempo = _cronometrar(lambda: servico.classify_many(matriz, mode="modelo"), repeticoes)
+            medidas[f"inferencia/{backend}/lote_{tamanho}/linhas_s"] = tamanho / tempo
+
+        tempos = []
+        for linha in dicts:
+            inicio = time.perf_counter()
+            servico.classify_condition(linha, mode="modelo")
+            tempos.append(time.perf_counter() - inicio)
+        p50, p99 = np.percentile(tempos, [50, 99]) * 1e6
+        medidas[f"inferencia/{backend}/linha_unica/p50_us"] = p50
+        medidas[f"inferencia/{backend}/linha_unica/p99_us"] = p99
+    return medidas
+
+
+def medir_features(base: np.ndarray, tamanhos: list, repeticoes: int) -> dict:
+    medidas = {}
+    rng = np.random.default_rng(7)
+    for tamanho in tamanhos:
+        linhas = [dict(zip(FEATURE_COLS, linha)) for linha in base[rng.integers(0, len(base), size=tamanho)]]
+        tempo = _cronometrar(lambda: build_feature_matrix(linhas), repeticoes)
+        medidas[f"features/dicts_{tamanho}/linhas_s"] = tamanho / tempo
+    return medidas
+
+
+def medir_dataset(linhas_por_classe: int, repeticoes: int) -> dict:
+    from utils.gerador_csv import CATEGORIAS, gerar_chunk
+
+    rng = np.random.default_rng(123)
+    tempo = _cronometrar(lambda: gerar_chunk(rng, linhas_por_classe), repeticoes)
+    return {f"dataset/chunk_{linhas_por_classe}/linhas_s": linhas_por_classe * len(CATEGORIAS) / tempo}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks de inferência, features e geração do dataset.")
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=TAMANHOS_PADRAO,
+                        help="Tamanhos de lote a medir (padrão: 1 100 10000).")
+    parser.add_argument("--repeticoes", type=int, default=5, help="Repetições por medida (usa a melhor).")
+    parser.add_argument("--linhas-por-classe", type=int, default=20_000,
+                        help="Linhas de cada categoria no bloco do gerador do dataset.")
+    parser.add_argument("--saida", default=None, help="Grava o resultado neste arquivo JSON.")
+    parser.add_argument("--comparar", default=None, help="Resultado anterior (JSON) para comparar.")
+    parser.add_argument("--tolerancia", type=float, default=0.10,
+                        help="Piora relativa aceita na comparação (padrão: 0.10).")
+    args = parser.parse_args()
+
+    base = pd.read_csv(CSV_PATH)[FEATURE_COLS].to_numpy(dtype=np.float64)
+    medidas = {}
+    medidas.update(medir_inferencia(base, args.tamanhos, args.repeticoes))
+    medidas.update(medir_features(base, args.tamanhos, args.repeticoes))
+    medidas.update(medir_dataset(args.linhas_por_classe, args.repeticoes))
+
+    largura = max(map(len, medidas))
+    for nome, valor in medidas.items():
+        print(f"{nome:<{largura}} | {valor:>14,.1f}")
+
+    parametros = {chave: valor for chave, valor in vars(args).items() if chave not in ("saida", "comparar")}
+    resultado = {"benchmark": "micro", "meta": {}, "medidas": medidas}
+    if args.saida:
+        resultado = salvar_resultado(args.saida, "micro", parametros, medidas)
+        print(f"\nResultado gravado em {args.saida}")
+    if args.comparar:
+        print(f"\n=== Comparação com {args.comparar} ===")
+        if not imprimir_comparacao(comparar(carregar_resultado(args.comparar), resultado, args.tolerancia),
+                                   args.tolerancia):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Micro-lotes de inferência (services/inference_batcher.py): predições de uma linha concorrentes,
+cada uma com a sua chamada ao modelo, contra a fila que as junta em lotes.
+
+Cada cliente (thread) pontua linhas do dataset de treino em sequência durante --duracao
+segundos, como várias /consulta chegando ao mesmo tempo em predict/classify_condition.
+Reporta predições/s, p50/p99 da latência por predição e, com micro-lotes, as linhas por lote,
+para cada nível de concorrência e cada combinação de --lote-max / --espera-us.
+
+Uso (a partir da raiz do projeto):
+    python -m benchmarks.bench_microlotes --clientes 1 8 32 --lote-max 16 64 --espera-us 250 1000
+"""
+import argparse
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from services.inference_batcher import AgrupadorInferencia
+from services.model_service import CSV_PATH, FEATURE_COLS, WeatherModelService
+
+
+def _rodar(clientes: int, duracao: float, linhas: list, pontuar) -> dict:
+    """
+    'clientes' threads chamando pontuar(linha) até o fim da duração. Devolve req/s e p50/p99 (µs).
+    """
+    tempos = [[] for _ in range(clientes)]
+    fim = time.perf_counter() + duracao
+    barreira = threading.Barrier(clientes)
+
+    def cliente(i: int):
+        rng = np.random.default_rng(i)
+        barreira.wait()
+        while time.perf_counter() < fim:
+            linha = linhas[rng.integers(len(linhas))]
+            inicio = time.perf_counter()
+            pontuar(linha)
+            tempos[i].append(time.perf_counter() - inicio)
+
+    threads = [threading.Thread(target=cliente, args=(i,)) for i in range(clientes)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    todos = np.concatenate([np.array(t) for t in tempos])
+    p50, p99 = np.percentile(todos, [50, 99]) * 1e6
+    return {"req_s": len(todos) / duracao, "p50_us": p50, "p99_us": p99}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Predições concorrentes de uma linha: diretas vs micro-lotes.")
+    parser.add_argument("--clientes", type=int, nargs="+", default=[1, 8, 32], help="Níveis de concorrência.")
+    parser.add_argument("--lote-max", type=int, nargs="+", default=[32], help="Linhas máximas por micro-lote.")
+    parser.add_argument("--espera-us", type=float, nargs="+", default=[1000], help="Espera máxima para completar o lote (µs).")
+    parser.add_argument("--duracao", type=float, default=3.0, help="Segundos por medida.")
+    args = parser.parse_args()
+
+    base = pd.read_csv(CSV_PATH, nrows=20_000)[FEATURE_COLS].to_numpy(dtype=np.float64)
+    linhas = [dict(zip(FEATURE_COLS, linha)) for linha in base]
+    servico = WeatherModelService()
+
+    print(f"{'caminho':<24} | {'clientes':>8} | {'req/s':>9} | {'p50 µs':>9} | {'p99 µs':>9} | {'linhas/lote':>11}")
+    print("-" * 86)
+    for clientes in args.clientes:
+        r = _rodar(clientes, args.duracao, linhas, lambda linha: servico.classify_condition(linha, mode="modelo"))
+        print(f"{'direto':<24} | {clientes:>8} | {r['req_s']:>9,.0f} | {r['p50_us']:>9,.0f} | {r['p99_us']:>9,.0f} |")
+        for lote_max in args.lote_max:
+            for espera_us in args.espera_us:
+                agrupador = AgrupadorInferencia(lambda itens: servico.classify_many(itens, mode="modelo"),
+                                                lote_max, espera_us / 1e6, nome="bench")
+                r = _rodar(clientes, args.duracao, linhas, lambda linha: agrupador.submeter(linha).result())
+                stats = agrupador.stats()
+                nome = f"microlotes {lote_max}/{espera_us:g}µs"
+                print(f"{nome:<24} | {clientes:>8} | {r['req_s']:>9,.0f} | {r['p50_us']:>9,.0f} | "
+                      f"{r['p99_us']:>9,.0f} | {stats['linhas_por_lote']:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Benchmark de inferência do WeatherModelService.
+
+Compara linhas/segundo do caminho antigo (um DataFrame de uma linha + inverse_transform
+por predição) com a API vetorizada predict_many / predict_proba_many, nos tamanhos de lote
+1, 100, 10k e 1M. As linhas são amostradas de data/weather_dataset_with_rules.csv.
+
+Uso (a partir da raiz do projeto):
+    python -m benchmarks.bench_modelo
+    python -m benchmarks.bench_modelo --tamanhos 1 100 10000 --float32
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from sklearn.preprocessing import LabelEncoder
+
+from services.model_service import CSV_PATH, FEATURE_COLS, WeatherModelService
+
+TAMANHOS_PADRAO = [1, 100, 10_000, 1_000_000]
+
+# O caminho antigo leva ~1 ms por linha; acima disso medimos só uma amostra e extrapolamos
+MAX_LINHAS_CAMINHO_ANTIGO = 2_000
+
+
+def _predict_condition_antigo(service: WeatherModelService, label_encoder: LabelEncoder, weather_dict: dict) -> str:
+    """
+    Reprodução do predict_condition original (DataFrame de uma linha + inverse_transform).
+    """
+    x_new = pd.DataFrame([weather_dict])[FEATURE_COLS].copy()
+    proba = service.model.predict(x_new)
+    idx_pred = np.argmax(proba, axis=1)[0]
+    return label_encoder.inverse_transform([idx_pred])[0]
+
+
+def _cronometrar(func, repeticoes: int) -> float:
+    """
+    Executa func 'repeticoes' vezes e devolve o melhor tempo (segundos).
+    """
+    melhor = float("inf")
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        func()
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de inferência do modelo (linhas/s).")
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=TAMANHOS_PADRAO,
+                        help="Tamanhos de lote a medir (padrão: 1 100 10000 1000000).")
+    parser.add_argument("--repeticoes", type=int, default=3, help="Repetições por medida (usa a melhor).")
+    parser.add_argument("--float32", action="store_true", help="Monta a matriz de features em float32.")
+    args = parser.parse_args()
+
+    dtype = np.float32 if args.float32 else np.float64
+    service = WeatherModelService()
+    # O modelo nativo não traz o LabelEncoder: remonta um com as mesmas classes
+    label_encoder = LabelEncoder()
+    label_encoder.classes_ = service.classes
+    base = pd.read_csv(CSV_PATH)[FEATURE_COLS].to_numpy(dtype=np.float64)
+    rng = np.random.default_rng(42)
+
+    print(f"{'lote':>10} | {'antigo (linhas/s)':>18} | {'dicts (linhas/s)':>17} | "
+          f"{'array (linhas/s)':>17} | {'ganho dicts':>11}")
+    print("-" * 88)
+
+    for tamanho in args.tamanhos:
+        matriz = base[rng.integers(0, len(base), size=tamanho)]
+        colunas = {col: matriz[:, j] for j, col in enumerate(FEATURE_COLS)}
+
+        # Caminho antigo: uma chamada por linha, sobre uma amostra limitada
+        n_antigo = min(tamanho, MAX_LINHAS_CAMINHO_ANTIGO)
+        dicts_antigo = [dict(zip(FEATURE_COLS, linha)) for linha in matriz[:n_antigo]]
+        t_antigo = _cronometrar(lambda: [_predict_condition_antigo(service, label_encoder, d) for d in dicts_antigo], 1)
+        rps_antigo = n_antigo / t_antigo
+
+        # Novo caminho a partir de dicts (inclui montar a matriz) e a partir de array/colunas
+        dicts = [dict(zip(FEATURE_COLS, linha)) for linha in matriz] if tamanho <= 100_000 else None
+        if dicts is not None:
+            t_dicts = _cronometrar(lambda: service.predict_proba_many(dicts, dtype=dtype), args.repeticoes)
+            rps_dicts = tamanho / t_dicts
+        else:
+            t_dicts = _cronometrar(lambda: service.predict_proba_many(colunas, dtype=dtype), args.repeticoes)
+            rps_dicts = tamanho / t_dicts
+        t_array = _cronometrar(lambda: service.predict_proba_many(matriz, dtype=dtype), args.repeticoes)
+        rps_array = tamanho / t_array
+
+        print(f"{tamanho:>10} | {rps_antigo:>18,.0f} | {rps_dicts:>17,.0f} | "
+              f"{rps_array:>17,.0f} | {rps_dicts / rps_antigo:>10.1f}x")
+
+    print("\nObs.: acima de 100k linhas a coluna 'dicts' usa o mapping orientado a colunas;"
+          f" o caminho antigo é medido em até {MAX_LINHAS_CAMINHO_ANTIGO} linhas e extrapolado.")
+
+
+if __name__ == "__main__":
+    main()
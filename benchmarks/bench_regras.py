@@ -0,0 +1,59 @@
+"""
+Motor de regras (services/rules_service.py) contra o modelo LightGBM: tempo por lote nos modos
+de serviço "regras", "hibrido" e "modelo", fração de linhas ambíguas e concordância entre
+regras e modelo sobre o dataset de treino.
+
+Uso (a partir da raiz do projeto):
+    python -m benchmarks.bench_regras
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+from services.model_service import CSV_PATH, FEATURE_COLS, TARGET_COL, WeatherModelService, build_feature_matrix
+from services.rules_service import categorize_many, evaluate_rules
+
+TAMANHOS = [1, 100, 10_000, 1_000_000]
+
+
+def _medir(funcao, repeticoes: int) -> float:
+    funcao()  # aquecimento
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        funcao()
+    return (time.perf_counter() - inicio) / repeticoes
+
+
+def main():
+    servico = WeatherModelService()
+    df = pd.read_csv(CSV_PATH)
+    x = build_feature_matrix({col: df[col].to_numpy() for col in FEATURE_COLS})
+
+    # 1) concordância no dataset de treino (os rótulos vêm das regras)
+    colunas = {col: x[:, j] for j, col in enumerate(FEATURE_COLS)}
+    regras = categorize_many(colunas)
+    modelo = servico.predict_many(x)
+    _, ambiguas = evaluate_rules(colunas)
+    print(f"Regras = rótulo do CSV: {np.mean(regras == df[TARGET_COL].to_numpy()):.4%}")
+    print(f"Regras = modelo:        {np.mean(regras == modelo):.4%}")
+    print(f"Linhas ambíguas:        {ambiguas.mean():.2%} "
+          f"(regras = modelo nelas: {np.mean(regras[ambiguas] == modelo[ambiguas]):.2%})\n")
+
+    # 2) tempo por lote em cada modo (linhas sorteadas do dataset)
+    rng = np.random.default_rng(42)
+    print(f"{'linhas':>9} | {'regras µs':>11} | {'hibrido µs':>11} | {'modelo µs':>11} | {'regras linhas/s':>15}")
+    print("-" * 70)
+    for n in TAMANHOS:
+        lote = x[rng.integers(0, len(x), n)]
+        repeticoes = max(1, 20_000 // n)
+        tempos = [_medir(lambda: servico.classify_many(lote, mode=modo), repeticoes)
+                  for modo in ("regras", "hibrido", "modelo")]
+        print(f"{n:>9} | {tempos[0] * 1e6:>11.1f} | {tempos[1] * 1e6:>11.1f} | {tempos[2] * 1e6:>11.1f} | "
+              f"{n / tempos[0]:>15,.0f}")
+
+    print(f"\nConcordância acumulada durante o benchmark: {servico.agreement.stats()['concordancia']:.4%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Reprodução de um arquivo de tráfego contra a API inteira, com os upstreams servidos do log
+gravado por utils/trafego_upstreams.py (sem rede).
+
+O arquivo de tráfego é JSON Lines com o corpo de cada /consulta ({"cep": ..., "preciso": ...,
+"linha_do_tempo": ...}) e, opcionalmente, "ts" (instante da requisição em segundos Unix, ex.:
+tirado do log de acesso). As requisições são disparadas em malha aberta no instante gravado
+dividido por --velocidade (sem "ts", espaçadas em 1 / --taxa segundos antes da aceleração), com
+no máximo --max-em-voo em andamento. As respostas dos upstreams também esperam a duração
+gravada dividida por --velocidade.
+
+Reporta req/s alcançado vs pedido, p50/p95/p99, status das respostas, o atraso do disparo em
+relação ao agendado (se passa de alguns ms, o cliente do benchmark virou o gargalo) e as
+requisições aos upstreams que não estavam no log.
+
+Uso (a partir da raiz do projeto):
+    python -m utils.trafego_upstreams gravar --log trafego/upstreams.log    # e rode a API apontada para ele
+    python -m benchmarks.bench_replay --log trafego/upstreams.log --carga trafego/consultas.jsonl --velocidade 10 50 100
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import tempfile
+import time
+from collections import Counter
+
+import aiohttp
+import numpy as np
+
+from benchmarks.bench_async_vs_sync import _aguardar_servidor, _porta_livre, _servir_async, _servir_sync
+from utils.trafego_upstreams import iniciar_reproducao
+
+_CAMPOS = ("cep", "preciso", "linha_do_tempo")
+
+
+def carregar_trafego(caminho: str, taxa: float) -> list:
+    """
+    [(segundos desde a primeira requisição, corpo), ...] em ordem de tempo.
+    """
+    requisicoes = []
+    with open(caminho, encoding="utf-8") as f:
+        for linha in f:
+            linha = linha.strip()
+            if not linha:
+                continue
+            dados = json.loads(linha) if linha.startswith("{") else {"cep": linha}
+            if "cep" not in dados:
+                continue
+            instante = float(dados["ts"]) if "ts" in dados else len(requisicoes) / taxa
+            requisicoes.append((instante, {campo: dados[campo] for campo in _CAMPOS if campo in dados}))
+    if not requisicoes:
+        raise SystemExit(f"Nenhuma requisição com 'cep' em {caminho}.")
+    requisicoes.sort(key=lambda requisicao: requisicao[0])
+    inicio = requisicoes[0][0]
+    return [(instante - inicio, corpo) for instante, corpo in requisicoes]
+
+
+async def _reproduzir(url: str, requisicoes: list, velocidade: float, max_em_voo: int) -> dict:
+    await _aguardar_servidor(url)
+    latencias, atrasos, status = [], [], Counter()
+    vagas = asyncio.Semaphore(max_em_voo)
+
+    async def enviar(sessao, corpo: dict, agendado: float):
+        async with vagas:
+            inicio = time.perf_counter()
+            atrasos.append(inicio - agendado)
+            try:
+                async with sessao.post(f"{url}/consulta", json=corpo) as resposta:
+                    await resposta.read()
+                    codigo = str(resposta.status)
+            except aiohttp.ClientError:
+                codigo = "falha"
+            latencias.append(time.perf_counter() - inicio)
+            status[codigo] += 1
+
+    conector = aiohttp.TCPConnector(limit=max_em_voo)
+    async with aiohttp.ClientSession(connector=conector, timeout=aiohttp.ClientTimeout(total=120)) as sessao:
+        tarefas = []
+        inicio = time.perf_counter()
+        for instante, corpo in requisicoes:
+            agendado = inicio + instante / velocidade
+            espera = agendado - time.perf_counter()
+            if espera > 0:
+                await asyncio.sleep(espera)
+            tarefas.append(asyncio.ensure_future(enviar(sessao, corpo, agendado)))
+        await asyncio.gather(*tarefas)
+        duracao = time.perf_counter() - inicio
+
+    ms = np.asarray(latencias) * 1000
+    return {
+        "requisicoes": len(latencias),
+        "duracao_s": duracao,
+        "req_s": len(latencias) / duracao,
+        "req_s_pedido": len(requisicoes) / max(requisicoes[-1][0] / velocidade, 1e-9),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "atraso_p99_ms": float(np.percentile(np.asarray(atrasos) * 1000, 99)),
+        "status": dict(status),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reproduz um arquivo de tráfego contra a API com upstreams gravados.")
+    parser.add_argument("--log", required=True, help="Log de tráfego dos upstreams (utils/trafego_upstreams.py).")
+    parser.add_argument("--carga", required=True, help="Tráfego de /consulta (JSON Lines, com \"ts\" opcional).")
+    parser.add_argument("--velocidade", type=float, nargs="+", default=[10.0],
+                        help="Acelerações da reprodução (ex.: 10 50 100).")
+    parser.add_argument("--taxa", type=float, default=10.0,
+                        help="Requisições/s antes da aceleração, para linhas sem \"ts\".")
+    parser.add_argument("--max-em-voo", type=int, default=256, help="Requisições simultâneas no máximo.")
+    parser.add_argument("--workers", type=int, default=8, help="Requisições simultâneas no Flask.")
+    parser.add_argument("--async", dest="modo_async", action="store_true", help="Usa o app assíncrono (aiohttp).")
+    args = parser.parse_args()
+
+    requisicoes = carregar_trafego(args.carga, args.taxa)
+    print(f"{len(requisicoes)} requisições em {requisicoes[-1][0]:.1f} s de tráfego gravado "
+          f"({'assíncrono' if args.modo_async else f'Flask, {args.workers} workers'})\n")
+    print(f"{'velocidade':>10} | {'req/s pedido':>12} | {'req/s':>8} | {'p50 ms':>8} | {'p95 ms':>8} | "
+          f"{'p99 ms':>8} | {'atraso p99':>10} | {'faltas':>6} | status")
+    print("-" * 110)
+    for velocidade in args.velocidade:
+        # Servidores e app novos a cada velocidade: caches frios, as mesmas chamadas da gravação
+        reproducao = iniciar_reproducao(args.log, velocidade)
+        env = dict(reproducao["env"], SERVER_TIMING="0", NOMINATIM_TAXA="100000",
+                   NOMINATIM_RAJADA=str(args.max_em_voo), NOMINATIM_WORKERS=str(min(args.max_em_voo, 64)))
+        porta = _porta_livre()
+        pasta = tempfile.mkdtemp(prefix="bench_replay_")
+        alvo, extra = (_servir_async, ()) if args.modo_async else (_servir_sync, (args.workers,))
+        processo = multiprocessing.Process(target=alvo, args=(env, pasta, porta, *extra), daemon=True)
+        processo.start()
+        try:
+            r = asyncio.run(_reproduzir(f"http://127.0.0.1:{porta}", requisicoes, velocidade, args.max_em_voo))
+        finally:
+            processo.terminate()
+            processo.join()
+            for servidor in reproducao["servidores"].values():
+                servidor.shutdown()
+        faltas = sum(servidor.stats["faltas"] for servidor in reproducao["servidores"].values())
+        print(f"{velocidade:>10g} | {r['req_s_pedido']:>12.1f} | {r['req_s']:>8.1f} | {r['p50_ms']:>8.1f} | "
+              f"{r['p95_ms']:>8.1f} | {r['p99_ms']:>8.1f} | {r['atraso_p99_ms']:>10.1f} | {faltas:>6} | "
+              f"{json.dumps(dict(sorted(r['status'].items())))}")
+
+
+if __name__ == "__main__":
+    main()
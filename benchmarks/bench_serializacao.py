@@ -0,0 +1,111 @@
+"""
+Serialização da resposta de /consulta: caminho antigo contra api/resposta.py.
+
+  - antigo: weather_info com as strings do FlatBuffers ainda em bytes, cópia profunda por
+    _bytes_to_str_recursive e jsonify do Flask (json da stdlib, floats float32 com todos os dígitos);
+  - corpo_consulta + JSON (orjson, ou o json da stdlib como fallback) com RESPOSTA_CASAS_DECIMAIS;
+  - corpo_consulta + MessagePack (Accept: application/msgpack).
+
+A resposta da Open-Meteo é codificada pelo servidor simulado (benchmarks/stub_open_meteo.py) e
+extraída pelas mesmas funções do serviço. Reporta o tamanho do corpo (bytes, também com gzip)
+e o p50/p99 do tempo de montagem + serialização por resposta.
+
+Uso (a partir da raiz do projeto):
+    python -m benchmarks.bench_serializacao --chamadas 20000
+"""
+import argparse
+import gzip
+import json
+import time
+
+import numpy as np
+from flask import Flask
+
+from api.resposta import RESPOSTA_CASAS_DECIMAIS, corpo_consulta, msgpack, orjson, serializar
+from benchmarks.stub_open_meteo import codificar_resposta
+from services.api_weather_service import (VARIAVEIS_ATUAIS, _decodificar_respostas, _extrair_info_atual,
+                                          _extrair_info_geral)
+from services.cep_cache import LocalizacaoCep
+
+
+def _bytes_to_str_recursive(obj):
+    """
+    Reprodução do _bytes_to_str_recursive original de api/app.py.
+    """
+    if isinstance(obj, bytes):
+        return obj.decode('utf-8', errors='ignore')
+    elif isinstance(obj, dict):
+        return {_bytes_to_str_recursive(k): _bytes_to_str_recursive(v)
+                for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [_bytes_to_str_recursive(item) for item in obj]
+    elif isinstance(obj, tuple):
+        return tuple(_bytes_to_str_recursive(item) for item in obj)
+    else:
+        return obj
+
+
+def _cronometrar(func, chamadas: int) -> tuple:
+    """
+    p50 e p99 (µs) de 'chamadas' execuções de func.
+    """
+    tempos = np.empty(chamadas)
+    for i in range(chamadas):
+        inicio = time.perf_counter()
+        func()
+        tempos[i] = time.perf_counter() - inicio
+    p50, p99 = np.percentile(tempos, [50, 99]) * 1e6
+    return p50, p99
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tamanho e tempo de serialização da resposta de /consulta.")
+    parser.add_argument("--chamadas", type=int, default=20_000, help="Respostas serializadas por caminho.")
+    args = parser.parse_args()
+
+    resposta = _decodificar_respostas(codificar_resposta(-23.5505, -46.6333, VARIAVEIS_ATUAIS))[0]
+    weather_info = {"general": _extrair_info_geral(resposta), "current": _extrair_info_atual(resposta)}
+    location = LocalizacaoCep("Praça da Sé, Sé, São Paulo - SP, Brasil", -23.550519943237305, -46.63330841064453, 1)
+    categoria = "chuva_forte"
+
+    # O caminho antigo recebia timezone/timezone_abbreviation em bytes, direto do FlatBuffers
+    weather_antigo = {"general": dict(weather_info["general"]), "current": weather_info["current"]}
+    for chave in ("timezone", "timezone_abbreviation"):
+        weather_antigo["general"][chave] = weather_antigo["general"][chave].encode()
+
+    app = Flask("bench_serializacao")
+
+    def antigo():
+        corpo = dict(weather_antigo, previsao_condicao_climatica=categoria)
+        corpo = {"cep": "01001000", "location": {"address": location.address, "latitude": location.latitude,
+                                                 "longitude": location.longitude}, "weather": corpo}
+        return app.json.response(_bytes_to_str_recursive(corpo)).get_data()
+
+    def novo_stdlib():
+        corpo = corpo_consulta("01001000", location, weather_info, categoria)
+        return json.dumps(corpo, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    caminhos = {"antigo (jsonify)": antigo, "novo, json stdlib": novo_stdlib}
+    if orjson is not None:
+        caminhos["novo, orjson"] = lambda: serializar(corpo_consulta("01001000", location, weather_info, categoria))
+    if msgpack is not None:
+        caminhos["novo, msgpack"] = lambda: serializar(corpo_consulta("01001000", location, weather_info, categoria),
+                                                       "msgpack")
+
+    with app.app_context():
+        print(f"RESPOSTA_CASAS_DECIMAIS={RESPOSTA_CASAS_DECIMAIS}, {args.chamadas} respostas por caminho")
+        if orjson is None or msgpack is None:
+            print("(orjson e/ou msgpack não instalados: caminhos correspondentes omitidos)")
+        print(f"\n{'caminho':<18} | {'bytes':>6} | {'gzip':>6} | {'p50 µs':>8} | {'p99 µs':>8}")
+        print("-" * 58)
+        for nome, func in caminhos.items():
+            corpo = func()
+            p50, p99 = _cronometrar(func, args.chamadas)
+            print(f"{nome:<18} | {len(corpo):>6} | {len(gzip.compress(corpo)):>6} | {p50:>8.1f} | {p99:>8.1f}")
+
+        print("\nExemplo (novo, JSON):")
+        print(serializar(corpo_consulta("01001000", location, weather_info, categoria)).decode())
+
+
+if __name__ == "__main__":
+    main()
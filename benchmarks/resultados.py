@@ -0,0 +1,133 @@
+"""
+Resultados dos benchmarks em JSON, para comparar execuções e pegar regressões.
+
+Cada arquivo tem o nome do benchmark, metadados da execução (data, commit, Python, CPUs e
+parâmetros usados) e um dict plano de medidas ("c8/req_s", "c8/etapa/open_meteo/p95_ms",
+"inferencia/compilado/lote_100/linhas_s"...). O sufixo da medida diz a direção:
+  - *_req_s, *_linhas_s (e req_s / linhas_s): vazão, maior é melhor;
+  - *_ms, *_us: tempo, menor é melhor;
+  - o resto (contagens, erros) é só informativo e não entra na comparação.
+
+Uso (a partir da raiz do projeto):
+    python -m benchmarks.resultados base.json atual.json --tolerancia 0.10
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SUFIXOS_VAZAO = ("req_s", "linhas_s")
+SUFIXOS_TEMPO = ("_ms", "_us")
+
+
+def _commit_atual() -> str:
+    try:
+        saida = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BASE_DIR,
+                               capture_output=True, text=True, timeout=10)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return saida.stdout.strip() or None
+
+
+def salvar_resultado(caminho: str, benchmark: str, parametros: dict, medidas: dict) -> dict:
+    """
+    Grava o resultado de uma execução em 'caminho' (JSON) e o devolve.
+    """
+    resultado = {
+        "benchmark": benchmark,
+        "meta": {
+            "data": datetime.datetime.now().isoformat(timespec="seconds"),
+            "commit": _commit_atual(),
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "cpus": os.cpu_count(),
+            "parametros": parametros,
+        },
+        "medidas": {nome: float(valor) for nome, valor in medidas.items() if valor is not None},
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+    temporario = caminho + ".tmp"
+    with open(temporario, "w", encoding="utf-8") as f:
+        json.dump(resultado, f, ensure_ascii=False, indent=2)
+    os.replace(temporario, caminho)
+    return resultado
+
+
+def carregar_resultado(caminho: str) -> dict:
+    with open(caminho, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _direcao(medida: str) -> int:
+    """
+    +1 se maior é melhor, -1 se menor é melhor, 0 se a medida não é comparada.
+    """
+    if medida.endswith(SUFIXOS_VAZAO):
+        return 1
+    if medida.endswith(SUFIXOS_TEMPO):
+        return -1
+    return 0
+
+
+def comparar(base: dict, atual: dict, tolerancia: float = 0.10) -> list:
+    """
+    Compara as medidas presentes nos dois resultados. Devolve uma lista de dicts
+    {medida, base, atual, variacao, regressao}, onde 'variacao' é a mudança relativa
+    (positiva = melhorou) e 'regressao' indica piora acima de 'tolerancia'.
+    """
+    linhas = []
+    medidas_base, medidas_atual = base["medidas"], atual["medidas"]
+    for medida in sorted(medidas_base.keys() & medidas_atual.keys()):
+        direcao = _direcao(medida)
+        valor_base, valor_atual = medidas_base[medida], medidas_atual[medida]
+        if direcao == 0 or valor_base <= 0:
+            continue
+        variacao = direcao * (valor_atual - valor_base) / valor_base
+        linhas.append({"medida": medida, "base": valor_base, "atual": valor_atual,
+                       "variacao": variacao, "regressao": variacao < -tolerancia})
+    return linhas
+
+
+def imprimir_comparacao(linhas: list, tolerancia: float) -> bool:
+    """
+    Imprime a tabela da comparação e devolve True se não houve regressão.
+    """
+    if not linhas:
+        print("Nenhuma medida em comum para comparar.")
+        return True
+    largura = max(len(linha["medida"]) for linha in linhas)
+    print(f"{'medida':<{largura}} | {'base':>12} | {'atual':>12} | {'variação':>9}")
+    print("-" * (largura + 43))
+    for linha in linhas:
+        marca = "  REGRESSÃO" if linha["regressao"] else ""
+        print(f"{linha['medida']:<{largura}} | {linha['base']:>12,.2f} | {linha['atual']:>12,.2f} | "
+              f"{linha['variacao']:>+8.1%}{marca}")
+    regressoes = sum(linha["regressao"] for linha in linhas)
+    print(f"\n{regressoes} regressão(ões) acima de {tolerancia:.0%} em {len(linhas)} medidas.")
+    return regressoes == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara dois resultados de benchmark (JSON).")
+    parser.add_argument("base", help="Resultado de referência.")
+    parser.add_argument("atual", help="Resultado a avaliar.")
+    parser.add_argument("--tolerancia", type=float, default=0.10,
+                        help="Piora relativa aceita antes de acusar regressão (padrão: 0.10).")
+    args = parser.parse_args()
+
+    base, atual = carregar_resultado(args.base), carregar_resultado(args.atual)
+    if base.get("benchmark") != atual.get("benchmark"):
+        print(f"Aviso: benchmarks diferentes ({base.get('benchmark')} x {atual.get('benchmark')}).")
+    print(f"base: {base['meta'].get('commit')} ({base['meta'].get('data')}) | "
+          f"atual: {atual['meta'].get('commit')} ({atual['meta'].get('data')})\n")
+    if not imprimir_comparacao(comparar(base, atual, args.tolerancia), args.tolerancia):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
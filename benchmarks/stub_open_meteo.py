@@ -0,0 +1,202 @@
+"""
+Servidor local que imita a Open-Meteo (/v1/forecast) para benchmarks offline.
+
+Responde no mesmo formato FlatBuffers que o openmeteo_requests decodifica (uma mensagem por
+coordenada, cada uma prefixada pelo tamanho), com valores determinísticos derivados da
+coordenada. Aceita latência e taxa de erro configuráveis.
+
+Uso isolado (a partir da raiz do projeto):
+    python -m benchmarks.stub_open_meteo --porta 8081 --latencia-ms 20
+    OPEN_METEO_URL=http://127.0.0.1:8081/v1/forecast python api/app.py
+"""
+import argparse
+import random
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlparse
+
+import flatbuffers
+import numpy as np
+
+from services.weather_decoding import variavel_open_meteo
+from utils.servidor_local import ServidorLocal
+
+# Resolução da grade simulada (graus); a Open-Meteo real devolve a coordenada da célula
+PASSO_GRADE = 0.1
+
+# Faixa de valores simulados por variável (o resto cai em 0..100)
+_FAIXAS = {
+    "temperature": (-5, 40), "apparent_temperature": (-5, 42), "precipitation": (0, 40), "rain": (0, 40),
+    "showers": (0, 30), "snowfall": (0, 5), "surface_pressure": (900, 1030), "pressure_msl": (980, 1040),
+    "wind_speed": (0, 40), "wind_gusts": (0, 60), "wind_direction": (0, 360), "is_day": (0, 1),
+    "weather_code": (0, 99), "visibility": (0, 50000),
+}
+
+
+def _valor_simulado(nome: str, semente: int, deslocamento: int = 0) -> float:
+    chave = next((k for k in _FAIXAS if nome.startswith(k)), None)
+    minimo, maximo = _FAIXAS.get(chave, (0, 100))
+    if chave == "is_day":
+        return float((semente + deslocamento) % 2)
+    fracao = (zlib.crc32(f"{nome}:{semente}:{deslocamento}".encode()) % 10_000) / 10_000
+    return float(minimo + fracao * (maximo - minimo))
+
+
+def _criar_variaveis(builder, nomes, semente: int, n_valores: int = 0):
+    offsets = []
+    for nome in nomes:
+        variavel, altitude = variavel_open_meteo(nome)
+        vetor = None
+        if n_valores:
+            valores = np.array([_valor_simulado(nome, semente, h) for h in range(n_valores)], dtype=np.float32)
+            vetor = builder.CreateNumpyVector(valores)
+        builder.StartObject(13)
+        builder.PrependUint8Slot(0, int(variavel), 0)
+        if vetor is None:
+            builder.PrependFloat32Slot(2, _valor_simulado(nome, semente), 0.0)
+        else:
+            builder.PrependUOffsetTRelativeSlot(3, vetor, 0)
+        builder.PrependInt16Slot(5, altitude, 0)
+        offsets.append(builder.EndObject())
+
+    builder.StartVector(4, len(offsets), 4)
+    for offset in reversed(offsets):
+        builder.PrependUOffsetTRelative(offset)
+    return builder.EndVector()
+
+
+def _criar_bloco(builder, nomes, semente: int, inicio: int, intervalo: int, n_valores: int):
+    variaveis = _criar_variaveis(builder, nomes, semente, n_valores)
+    builder.StartObject(4)
+    builder.PrependInt64Slot(0, inicio, 0)
+    builder.PrependInt64Slot(1, inicio + intervalo * max(n_valores, 1), 0)
+    builder.PrependInt32Slot(2, intervalo, 0)
+    builder.PrependUOffsetTRelativeSlot(3, variaveis, 0)
+    return builder.EndObject()
+
+
+def codificar_resposta(latitude: float, longitude: float, atuais: list, horarias: list = (),
+                       horas: int = 48, agora: int = None) -> bytes:
+    """
+    Codifica a resposta de uma coordenada (já com o prefixo de tamanho de 4 bytes).
+    """
+    agora = int(time.time()) if agora is None else agora
+    lat_grade = round(round(latitude / PASSO_GRADE) * PASSO_GRADE, 4)
+    lon_grade = round(round(longitude / PASSO_GRADE) * PASSO_GRADE, 4)
+    semente = zlib.crc32(f"{lat_grade}:{lon_grade}".encode())
+
+    builder = flatbuffers.Builder(1024)
+    timezone = builder.CreateString("America/Sao_Paulo")
+    abreviacao = builder.CreateString("GMT-3")
+    atual = _criar_bloco(builder, atuais, semente, agora - agora % 900, 900, 0) if atuais else None
+    inicio_horario = agora - agora % 86400 - 86400
+    horario = _criar_bloco(builder, horarias, semente, inicio_horario, 3600, horas) if horarias else None
+
+    builder.StartObject(15)
+    builder.PrependFloat32Slot(0, lat_grade, 0.0)
+    builder.PrependFloat32Slot(1, lon_grade, 0.0)
+    builder.PrependFloat32Slot(2, float(semente % 1200), 0.0)
+    builder.PrependInt32Slot(6, -10800, 0)
+    builder.PrependUOffsetTRelativeSlot(7, timezone, 0)
+    builder.PrependUOffsetTRelativeSlot(8, abreviacao, 0)
+    if atual is not None:
+        builder.PrependUOffsetTRelativeSlot(9, atual, 0)
+    if horario is not None:
+        builder.PrependUOffsetTRelativeSlot(11, horario, 0)
+    builder.Finish(builder.EndObject())
+
+    mensagem = bytes(builder.Output())
+    return len(mensagem).to_bytes(4, "little") + mensagem
+
+
+def _lista_parametro(query: dict, nome: str) -> list:
+    valores = []
+    for valor in query.get(nome, []):
+        valores.extend(v for v in valor.split(",") if v)
+    return valores
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # mantém keep-alive, como a API real
+
+    def do_GET(self):
+        servidor = self.server
+        servidor.contar("requisicoes")
+        if servidor.latencia > 0:
+            time.sleep(servidor.latencia)
+
+        if servidor.taxa_erro and random.random() < servidor.taxa_erro:
+            corpo = b'{"error": true, "reason": "erro simulado"}'
+            self._responder(503, corpo, "application/json")
+            return
+
+        query = parse_qs(urlparse(self.path).query)
+        latitudes = [float(v) for v in _lista_parametro(query, "latitude")]
+        longitudes = [float(v) for v in _lista_parametro(query, "longitude")]
+        if not latitudes or len(latitudes) != len(longitudes):
+            self._responder(400, b'{"error": true, "reason": "latitude/longitude"}', "application/json")
+            return
+
+        atuais = _lista_parametro(query, "current")
+        horarias = _lista_parametro(query, "hourly")
+        dias = int(query.get("past_days", ["0"])[0]) + int(query.get("forecast_days", ["1"])[0])
+        horas = int(query["forecast_hours"][0]) if "forecast_hours" in query else 24 * max(dias, 1)
+        corpo = b"".join(codificar_resposta(lat, lon, atuais, horarias, horas=horas)
+                         for lat, lon in zip(latitudes, longitudes))
+        self._responder(200, corpo, "application/octet-stream")
+
+    def _responder(self, status: int, corpo: bytes, tipo: str):
+        self.send_response(status)
+        self.send_header("Content-Type", tipo)
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, *args):
+        pass
+
+
+class ServidorSimulado(ServidorLocal):
+    """
+    Upstream simulado: 'latencia' em segundos antes de cada resposta e 'taxa_erro' (entre 0 e 1)
+    de respostas 503, aplicadas pelo handler, que também conta as requisições.
+    """
+
+    def __init__(self, handler, porta: int = 0, latencia: float = 0.0, taxa_erro: float = 0.0):
+        super().__init__(handler, porta)
+        self.latencia = latencia
+        self.taxa_erro = taxa_erro
+
+    @property
+    def requisicoes(self) -> int:
+        return self.stats["requisicoes"]
+
+
+class StubOpenMeteo(ServidorSimulado):
+    """
+    Servidor HTTP local da Open-Meteo simulada. 'latencia' em segundos, 'taxa_erro' entre 0 e 1.
+    """
+
+    def __init__(self, porta: int = 0, latencia: float = 0.0, taxa_erro: float = 0.0):
+        super().__init__(_StubHandler, porta, latencia, taxa_erro)
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.endereco}/v1/forecast"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Open-Meteo simulada para benchmarks offline.")
+    parser.add_argument("--porta", type=int, default=8081)
+    parser.add_argument("--latencia-ms", type=float, default=0.0)
+    parser.add_argument("--taxa-erro", type=float, default=0.0)
+    args = parser.parse_args()
+
+    servidor = StubOpenMeteo(args.porta, args.latencia_ms / 1000, args.taxa_erro)
+    print(f"Open-Meteo simulada em {servidor.url}")
+    servidor.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+"""
+Servidores locais que imitam os upstreams da API (OpenCEP/brazilcep, Nominatim e Open-Meteo)
+para testes de carga offline, com latência e taxa de erro configuráveis.
+
+Uso isolado (a partir da raiz do projeto):
+    python -m benchmarks.stub_upstreams --latencia-cep-ms 20 --latencia-nominatim-ms 50
+e aponte a API para eles com as variáveis de ambiente impressas na saída.
+"""
+import argparse
+import json
+import random
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qs, unquote, urlparse
+
+from benchmarks.stub_open_meteo import ServidorSimulado, StubOpenMeteo
+
+# Fração das consultas de endereço completo que o Nominatim simulado "não encontra",
+# para exercitar o fallback sem bairro / apenas cidade
+FRACAO_FALHA_ENDERECO_COMPLETO = 0.3
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        servidor = self.server
+        servidor.contar("requisicoes")
+        if servidor.latencia > 0:
+            time.sleep(servidor.latencia)
+        if servidor.taxa_erro and random.random() < servidor.taxa_erro:
+            self._responder(503, {"erro": "erro simulado"})
+            return
+        status, corpo = servidor.responder(urlparse(self.path))
+        self._responder(status, corpo)
+
+    def _responder(self, status: int, corpo):
+        dados = json.dumps(corpo).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(dados)))
+        self.end_headers()
+        self.wfile.write(dados)
+
+    def log_message(self, *args):
+        pass
+
+
+class _StubJson(ServidorSimulado):
+
+    def __init__(self, porta: int = 0, latencia: float = 0.0, taxa_erro: float = 0.0):
+        super().__init__(_StubHandler, porta, latencia, taxa_erro)
+
+    def responder(self, url) -> tuple:
+        raise NotImplementedError
+
+
+class StubOpenCep(_StubJson):
+    """
+    OpenCEP simulado (GET /v1/<cep>). CEPs terminados em "000000" devolvem 404 (não encontrado);
+    os demais devolvem um endereço determinístico derivado do próprio CEP.
+    """
+
+    @property
+    def url(self) -> str:
+        # Formato esperado por brazilcep.opencep.URL
+        return f"http://{self.endereco}/v1/{{}}"
+
+    def responder(self, url) -> tuple:
+        cep = url.path.rstrip("/").rsplit("/", 1)[-1]
+        if cep.endswith("000000"):
+            return 404, {"erro": True}
+        semente = int(cep) if cep.isdigit() else zlib.crc32(cep.encode())
+        return 200, {
+            "cep": f"{cep[:5]}-{cep[5:]}",
+            "logradouro": f"Rua Simulada {semente % 997}",
+            "complemento": "",
+            "bairro": f"Bairro {semente % 53}",
+            "localidade": f"Cidade {semente % 211}",
+            "uf": "SP",
+        }
+
+
+class StubNominatim(_StubJson):
+    """
+    Nominatim simulado (GET /search?q=...&format=json). Devolve coordenadas determinísticas
+    dentro do Brasil; parte das consultas de endereço completo volta vazia (fallback).
+    """
+
+    def responder(self, url) -> tuple:
+        consulta = unquote(parse_qs(url.query).get("q", [""])[0])
+        semente = zlib.crc32(consulta.encode())
+        if consulta.count(",") >= 3 and (semente % 1000) / 1000 < FRACAO_FALHA_ENDERECO_COMPLETO:
+            return 200, []
+        latitude = -33.0 + (semente % 28000) / 1000
+        longitude = -73.0 + ((semente // 28000) % 38000) / 1000
+        return 200, [{
+            "place_id": semente,
+            "lat": f"{latitude:.6f}",
+            "lon": f"{longitude:.6f}",
+            "display_name": f"{consulta} (simulado)",
+            "boundingbox": [str(latitude - 0.01), str(latitude + 0.01), str(longitude - 0.01), str(longitude + 0.01)],
+        }]
+
+
+def iniciar_upstreams(latencia_cep: float = 0.02, latencia_nominatim: float = 0.05,
+                      latencia_open_meteo: float = 0.02, taxa_erro: float = 0.0) -> dict:
+    """
+    Sobe os três upstreams simulados (latências em segundos) e devolve os servidores e as
+    variáveis de ambiente que apontam a API para eles.
+    """
+    opencep = StubOpenCep(latencia=latencia_cep, taxa_erro=taxa_erro).iniciar()
+    nominatim = StubNominatim(latencia=latencia_nominatim, taxa_erro=taxa_erro).iniciar()
+    open_meteo = StubOpenMeteo(latencia=latencia_open_meteo, taxa_erro=taxa_erro).iniciar()
+    return {
+        "servidores": {"brazilcep": opencep, "nominatim": nominatim, "open_meteo": open_meteo},
+        "env": {
+            "OPENCEP_URL": opencep.url,
+            "NOMINATIM_DOMAIN": nominatim.endereco,
+            "NOMINATIM_SCHEME": "http",
+            "OPEN_METEO_URL": open_meteo.url,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Upstreams simulados (OpenCEP, Nominatim, Open-Meteo).")
+    parser.add_argument("--latencia-cep-ms", type=float, default=20.0)
+    parser.add_argument("--latencia-nominatim-ms", type=float, default=50.0)
+    parser.add_argument("--latencia-open-meteo-ms", type=float, default=20.0)
+    parser.add_argument("--taxa-erro", type=float, default=0.0)
+    args = parser.parse_args()
+
+    upstreams = iniciar_upstreams(args.latencia_cep_ms / 1000, args.latencia_nominatim_ms / 1000,
+                                  args.latencia_open_meteo_ms / 1000, args.taxa_erro)
+    for nome, valor in upstreams["env"].items():
+        print(f"export {nome}='{valor}'")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
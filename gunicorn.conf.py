@@ -0,0 +1,19 @@
+"""
+Configuração do gunicorn para servir a API com workers pré-forkados (gunicorn é opcional:
+pip install gunicorn).
+
+Uso (a partir da raiz do projeto):
+    gunicorn api.app:app
+
+Com preload_app o app (e o modelo, carregado na hora com MODELO_CARREGAMENTO=eager) é
+importado uma vez no processo mestre antes do fork: os workers herdam o modelo já pronto e
+compartilham a memória dele por copy-on-write, em vez de cada um carregar a sua cópia.
+"""
+import os
+
+os.environ.setdefault("MODELO_CARREGAMENTO", "eager")
+
+bind = os.environ.get("GUNICORN_BIND", "127.0.0.1:5000")
+workers = int(os.environ.get("GUNICORN_WORKERS", 4))
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+preload_app = True
@@ -1,70 +1,397 @@
+import asyncio
+import logging
+import os
+import threading
+
 from geopy.geocoders import Nominatim
 import brazilcep
+import brazilcep.opencep
+from brazilcep.exceptions import CEPNotFound, InvalidCEP
+from geopy.exc import GeocoderRateLimited
+
+from services.cep_cache import BASE_DIR, LocalizacaoCep, normalizar_cep, obter_cep_cache
+from services.cep_index import obter_indice_cep
+from services.geocoding_scheduler import PRIORIDADE_USUARIO, AgendadorGeocodificacao, TokenBucketCompartilhado
+from services.metrics import ERROS_UPSTREAM, amostras, medir, registrar_coletor
+from services.upstream import CircuitoAberto, Disjuntor, LimiteUpstream, marcar_degradacao
+
+logger = logging.getLogger(__name__)
+
+# Endpoints configuráveis (ex.: apontar para servidores locais em testes de carga)
+NOMINATIM_DOMAIN = os.environ.get("NOMINATIM_DOMAIN", "nominatim.openstreetmap.org")
+NOMINATIM_SCHEME = os.environ.get("NOMINATIM_SCHEME", "https")
+if os.environ.get("OPENCEP_URL"):
+    brazilcep.opencep.URL = os.environ["OPENCEP_URL"]
+
+# "rede": cache + APIs (padrão). "offline": cache + índice local de centroides (services/cep_index.py),
+# indo às APIs só quando o CEP não está no índice ou quando a consulta pede precisão ("preciso")
+CEP_MODO = os.environ.get("CEP_MODO", "rede")
+
+# Níveis das localizações vindas do índice offline (os níveis 1 a 3 são os do Nominatim)
+NIVEL_INDICE_FAIXA = 4  # centroide da faixa de CEP
+NIVEL_INDICE_CIDADE = 5  # centroide da cidade devolvida pelo brazilcep
 
+# Limites de concorrência e timeouts do brazilcep no modo assíncrono
+LIMITE_BRAZILCEP = LimiteUpstream(
+    "brazilcep",
+    concorrencia=int(os.environ.get("BRAZILCEP_CONCORRENCIA", 32)),
+    timeout=float(os.environ.get("BRAZILCEP_TIMEOUT", 5))
+)
 
-def buscar_localizacao_por_cep(cep_input: str):
+# Disjuntores por upstream (CEP inexistente, CEP mal formado e 429 são respostas ou erros do
+# cliente, não falhas do upstream). Com o disjuntor aberto, o CEP cai no centroide do índice
+# offline, quando existe (ver buscar_localizacao_por_cep)
+DISJUNTOR_BRAZILCEP = Disjuntor("brazilcep", lentidao=float(os.environ.get("BRAZILCEP_LENTIDAO_S", 2.0)),
+                                ignorar=(InvalidCEP, CEPNotFound, ValueError))
+DISJUNTOR_NOMINATIM = Disjuntor("nominatim", lentidao=float(os.environ.get("NOMINATIM_LENTIDAO_S", 3.0)),
+                                ignorar=(GeocoderRateLimited,))
+
+# O Nominatim público aceita no máximo 1 req/s por aplicação: todas as chamadas (threads do
+# Flask, lote e modo assíncrono) passam pela mesma fila com token bucket
+NOMINATIM_TAXA = float(os.environ.get("NOMINATIM_TAXA", 1.0))  # requisições por segundo
+NOMINATIM_RAJADA = float(os.environ.get("NOMINATIM_RAJADA", 1.0))
+# Arquivo do token bucket dividido pelos processos da máquina (workers do gunicorn); vazio = um
+# bucket por processo
+NOMINATIM_BUCKET_PATH = os.environ.get("NOMINATIM_BUCKET_PATH", os.path.join(BASE_DIR, "data", "nominatim_bucket.sqlite"))
+NOMINATIM_WORKERS = int(os.environ.get("NOMINATIM_WORKERS", 1))
+NOMINATIM_TIMEOUT = float(os.environ.get("NOMINATIM_TIMEOUT", 5))
+# Falhas (sem nenhum sucesso) para um nível do fallback ser pulado numa cidade
+NOMINATIM_LIMIAR_FALHAS = int(os.environ.get("NOMINATIM_LIMIAR_FALHAS", 3))
+# Consultas na fila do agendador a partir das quais as novas são recusadas (0 = sem limite) e
+# prazo de uma geocodificação (todos os níveis); passando de um ou de outro, a busca vai para o
+# centroide do índice offline ou responde 503
+NOMINATIM_FILA_MAX = int(os.environ.get("NOMINATIM_FILA_MAX", 30))
+NOMINATIM_ESPERA_MAX_S = float(os.environ.get("NOMINATIM_ESPERA_MAX_S", 10))
+
+_agendador = None
+_agendador_lock = threading.Lock()
+
+
+class CepInvalido(ValueError):
     """
-        Dado um CEP (string de números), busca o endereço via brazilcep e faz tentativas de
-        geocodificação em três níveis (completo → sem bairro → apenas cidade) até retornar um
-        objeto Location ou None, caso nenhuma tentativa encontre coordenadas.
+    O CEP não tem 8 dígitos: recusado antes do cache, do disjuntor e das APIs (HTTP 400).
+    """
+
+
+def _validar_cep(cep_input) -> str:
+    """
+    Normaliza o CEP e confere que sobraram exatamente 8 dígitos; senão levanta CepInvalido.
+    """
+    cep = normalizar_cep(cep_input)
+    if len(cep) != 8:
+        raise CepInvalido(f"CEP inválido: {cep_input!r} (esperados 8 dígitos).")
+    return cep
+
+
+def obter_agendador_geocodificacao() -> AgendadorGeocodificacao:
+    """
+        Agendador de geocodificação do processo, criado no primeiro uso.
+    """
+    global _agendador
+    if _agendador is None:
+        with _agendador_lock:
+            if _agendador is None:
+                geolocator = Nominatim(user_agent="Supernova_ML", domain=NOMINATIM_DOMAIN,
+                                       scheme=NOMINATIM_SCHEME, timeout=NOMINATIM_TIMEOUT)
+                # Sem hedge no Nominatim: uma cópia gastaria a cota de 1 req/s; o disjuntor só mede
+                _agendador = AgendadorGeocodificacao(
+                    lambda consulta: DISJUNTOR_NOMINATIM.medir(geolocator.geocode, consulta),
+                    taxa=NOMINATIM_TAXA,
+                    capacidade=NOMINATIM_RAJADA,
+                    workers=NOMINATIM_WORKERS,
+                    limiar_falhas=NOMINATIM_LIMIAR_FALHAS,
+                    fila_max=NOMINATIM_FILA_MAX,
+                    bucket=TokenBucketCompartilhado(NOMINATIM_BUCKET_PATH, NOMINATIM_TAXA, NOMINATIM_RAJADA)
+                    if NOMINATIM_BUCKET_PATH else None
+                )
+    return _agendador
+
+
+def estatisticas_geocodificacao() -> dict:
+    """
+        Profundidade da fila, tempos de espera e contadores do agendador do Nominatim.
+    """
+    return obter_agendador_geocodificacao().stats()
+
+
+def buscar_localizacao_por_cep(cep_input: str, preciso: bool = False, prioridade: int = PRIORIDADE_USUARIO):
+    """
+        Dado um CEP, consulta primeiro o cache (memória → SQLite) e, em caso de miss,
+        faz a busca completa nas APIs (brazilcep + Nominatim) e grava o resultado no cache.
+        CEPs inválidos, inexistentes ou sem coordenadas também são guardados (cache negativo).
+
+        No modo offline (CEP_MODO=offline) o índice local de centroides é consultado antes das
+        APIs. 'preciso=True' ignora o índice (e entradas do cache vindas dele) e vai ao Nominatim.
+
+        Com um upstream fora do ar (erro ou disjuntor aberto), devolve o centroide da faixa do
+        CEP no índice offline, sem gravar no cache e marcando a degradação "localizacao_aproximada";
+        sem entrada no índice, o erro sobe.
+
+        CEPs sem 8 dígitos levantam CepInvalido antes de qualquer cache ou upstream.
+        'prioridade' é a da fila do Nominatim (PRIORIDADE_FUNDO para buscas em segundo plano).
 
         Retorna:
-            geopy.location.Location ou None
+            LocalizacaoCep (address, latitude, longitude, nivel) ou None
     """
-    # Pega o endereço do CEP pela api do brazilcep
-    endereco = brazilcep.get_address_from_cep(cep_input)
+    cep = _validar_cep(cep_input)
+    cache = obter_cep_cache()
+    usar_indice = CEP_MODO == "offline" and not preciso
+
+    with medir("cep_cache"):
+        encontrado, localizacao = cache.buscar(cep)
+    if encontrado and _atende_precisao(localizacao, preciso):
+        return localizacao
+
+    if usar_indice:
+        with medir("cep_indice"):
+            do_indice = _buscar_no_indice(cep)
+        if do_indice is not None:
+            return do_indice
+        if encontrado and localizacao is None:
+            # Cache negativo e o índice também não conhece o CEP
+            return None
+
+    try:
+        localizacao = _geocodificar_cep(cep, usar_indice, prioridade)
+    except (InvalidCEP, CEPNotFound) as e:
+        logger.info("CEP inválido ou não encontrado nos correios: %s (%s)", cep, e)
+        localizacao = None
+    except Exception:
+        return _localizacao_aproximada(cep)
+
+    cache.gravar(cep, localizacao)
+    return localizacao
+
+
+def buscar_localizacao_sem_rede(cep_input: str) -> tuple:
+    """
+        Como buscar_localizacao_por_cep, mas só com o que já está na máquina: cache de CEP e,
+        no modo offline, o índice local. Retorna (encontrado, LocalizacaoCep ou None); com
+        encontrado=False o CEP precisa das APIs. Levanta CepInvalido como a busca completa.
+    """
+    cep = _validar_cep(cep_input)
+    encontrado, localizacao = obter_cep_cache().buscar(cep)
+    if encontrado and localizacao is not None:
+        return True, localizacao
+    if CEP_MODO == "offline":
+        do_indice = _buscar_no_indice(cep)
+        if do_indice is not None:
+            return True, do_indice
+    return encontrado, localizacao
+
+
+def _localizacao_aproximada(cep: str):
+    """
+        Fallback com um upstream fora do ar: centroide da faixa do CEP no índice offline (marcado
+        como degradação da requisição). Chamado dentro de um except; sem índice, relança o erro.
+    """
+    localizacao = _buscar_no_indice(cep)
+    if localizacao is None:
+        raise
+    logger.info("Upstream de CEP indisponível; usando o centroide do índice offline para %s.", cep)
+    marcar_degradacao("localizacao_aproximada")
+    return localizacao
+
+
+def _atende_precisao(localizacao, preciso: bool) -> bool:
+    """
+        Diz se a entrada do cache pode ser devolvida direto. Não pode quando a consulta pede
+        precisão e a entrada veio do índice offline, nem quando é negativa no modo offline
+        (o índice ainda pode conhecer o CEP).
+    """
+    if localizacao is None:
+        return CEP_MODO != "offline" or preciso
+    return not preciso or localizacao.nivel < NIVEL_INDICE_FAIXA
 
-    # Printa no console para analisar todos os parâmetros de saída em formato JSON
-    print("JSON do endereço buscado na API dos correios:")
-    print(endereco)
-    print(f"\n-----\n")
 
-    # Inicializa o geolocator utilizando a lib do Nominatim
-    geolocator = Nominatim(user_agent="Supernova_ML")
+def _buscar_no_indice(cep: str):
+    """
+        Centroide da faixa do CEP no índice offline, como LocalizacaoCep, ou None.
+    """
+    indice = obter_indice_cep()
+    centroide = indice.buscar_cep(cep) if indice is not None else None
+    if centroide is None:
+        return None
+    return LocalizacaoCep(f"{centroide.cidade} - {centroide.uf}, Brasil", centroide.latitude,
+                          centroide.longitude, NIVEL_INDICE_FAIXA)
 
-    # Printa no console para analisar novamente mas organizado de maneira legível
-    print("Endereço completo organizado de forma legível: \n")
-    print(f"{endereco.get('street')}, {endereco.get('district')} - "
-          f"{endereco.get('city')} - {endereco.get('uf')}, {endereco.get('cep')}")
-    print(f"\n-----\n")
 
+def _buscar_cidade_no_indice(endereco: dict):
+    """
+        Centroide da cidade do endereço (retornado pelo brazilcep) no índice offline, ou None.
+    """
+    indice = obter_indice_cep()
+    centroide = indice.buscar_cidade(endereco.get('city'), endereco.get('uf')) if indice is not None else None
+    if centroide is None:
+        return None
+    return LocalizacaoCep(f"{centroide.cidade} - {centroide.uf}, Brasil", centroide.latitude,
+                          centroide.longitude, NIVEL_INDICE_CIDADE)
+
+
+def _chave_cidade(endereco: dict) -> str:
+    """
+        Chave usada pelo agendador para lembrar quais níveis funcionam em cada cidade.
+    """
+    return f"{endereco.get('city')}-{endereco.get('uf')}".lower()
+
+
+def _consultas_geocodificacao(endereco: dict) -> list:
+    """
+        Monta as consultas ao Nominatim em ordem de precisão, cada uma com o seu nível:
+        1 = endereço completo, 2 = sem bairro, 3 = apenas cidade.
+    """
     # Extrai componentes básicos
     rua = endereco.get('street')  # ex: "Rua Capote Valente"
     bairro = endereco.get('district')  # ex: "Pinheiros"
     cidade = endereco.get('city')  # ex: "São Paulo"
     uf = endereco.get('uf')  # ex: "SP"
-    cep = endereco.get('cep')  # ex: "05409-000"
 
     '''
     Dividi o código em tentativas, pois consultando a documentação oficial verifiquei que existem cidades
     pequenas que não tem "street" e "district" no retorno do JSON
     '''
+    return [
+        # 1ª tentativa: Endereço completo (Mais apropriado para uma precisão EXATA)
+        (1, f"{rua}, {bairro}, {cidade} - {uf}, Brasil"),
+        # 2ª tentativa: Vai remover o bairro e tentar de novo
+        (2, f"{rua}, {cidade} - {uf}, Brasil"),
+        # 3ª tentativa: vai usar apenas cidade + Brasil
+        (3, f"{cidade} - Brasil"),
+    ]
 
-    # Variavel para armazenar a saída do endereço sendo buscado pelo geopy/Nominatim → localizacao
 
-    # 1ª tentativa: Endereço completo (Mais apropriado para uma precisão EXATA)
-    end_completo = f"{rua}, {bairro}, {cidade} - {uf}, Brasil"
-    localizacao = geolocator.geocode(end_completo)
+def _geocodificar_cep(cep_input: str, usar_indice: bool = False, prioridade: int = PRIORIDADE_USUARIO):
+    """
+        Dado um CEP (string de números), busca o endereço via brazilcep e faz tentativas de
+        geocodificação em três níveis (completo → sem bairro → apenas cidade) até retornar um
+        LocalizacaoCep ou None, caso nenhuma tentativa encontre coordenadas.
+        Com 'usar_indice', a cidade é procurada no índice offline antes do Nominatim.
+
+        Retorna:
+            LocalizacaoCep ou None
+    """
+    # Pega o endereço do CEP pela api do brazilcep
+    with medir("brazilcep"):
+        try:
+            endereco = DISJUNTOR_BRAZILCEP.chamar(brazilcep.get_address_from_cep, cep_input,
+                                                  timeout=LIMITE_BRAZILCEP.timeout, hedge=True)
+        except (InvalidCEP, CEPNotFound, CircuitoAberto, ValueError):
+            raise
+        except Exception:
+            ERROS_UPSTREAM.incrementar("brazilcep")
+            raise
 
-    # 2ª tentativa: Vai remover o bairro e tentar de novo
-    if localizacao is None:
-        end_sem_bairro = f"{rua}, {cidade} - {uf}, Brasil"
-        localizacao = geolocator.geocode(end_sem_bairro)
+    # Endereço devolvido pelos correios (só com LOG_NIVEL=DEBUG)
+    logger.debug("Endereço do CEP %s na API dos correios: %s", cep_input, endereco)
 
-    # 3ª tentativa: vai usar apenas cidade + Brasil
-    if localizacao is None:
-        end_apenas_cidade = f"{cidade} - Brasil"
-        localizacao = geolocator.geocode(end_apenas_cidade)
+    # Modo offline: a precisão de cidade basta, então o centroide local evita o Nominatim
+    if usar_indice:
+        localizacao = _buscar_cidade_no_indice(endereco)
+        if localizacao is not None:
+            logger.debug("Centroide da cidade (índice offline): %s", localizacao.address)
+            return localizacao
+
+    # Variavel para armazenar a saída do endereço sendo buscado pelo geopy/Nominatim → localizacao
+    # (as tentativas passam pela fila do agendador, que respeita o limite do Nominatim; com o
+    # disjuntor aberto nem entram na fila)
+    DISJUNTOR_NOMINATIM.permitir()
+    localizacao, nivel = obter_agendador_geocodificacao().geocodificar_niveis(
+        _chave_cidade(endereco), _consultas_geocodificacao(endereco),
+        timeout=NOMINATIM_ESPERA_MAX_S if prioridade == PRIORIDADE_USUARIO else None, prioridade=prioridade)
 
     # Se mesmo assim não encontrou em nenhuma tentativa, vai ter um aviso de erro e retornar None
     if localizacao is None:
-        print("Não foi possível obter as coordenadas para esse endereço. "
-              "Verifique se o CEP está correto ou se o local existe no Nominatim.")
+        logger.info("Não foi possível obter as coordenadas para o CEP %s no Nominatim.", cep_input)
         return None
 
-    # Caso encontre, vai exibir o endereço completo e latitude/longitude
-    print(f"Endereço encontrado: {localizacao.address}")
-    print(f"(Latitude: {localizacao.latitude}, Longitude: {localizacao.longitude})\n")
+    logger.debug("Endereço encontrado: %s (latitude %s, longitude %s)",
+                 localizacao.address, localizacao.latitude, localizacao.longitude)
+    return LocalizacaoCep(localizacao.address, localizacao.latitude, localizacao.longitude, nivel)
+
+
+# ------------------
+# Modo assíncrono (api/app_async.py)
+
+async def buscar_localizacao_por_cep_async(cep_input: str, preciso: bool = False):
+    """
+        Versão assíncrona de buscar_localizacao_por_cep: mesmo cache e mesmos três níveis de
+        geocodificação, mas sem bloquear o event loop: brazilcep com limite de concorrência e
+        timeout próprios (LIMITE_BRAZILCEP) e Nominatim pela mesma fila do agendador do modo síncrono.
+        Timeouts e cancelamentos (ex.: cliente desconectou) interrompem a busca em andamento.
+        O modo offline, 'preciso' e a validação (CepInvalido) funcionam como na versão síncrona.
+
+        Retorna:
+            LocalizacaoCep (address, latitude, longitude, nivel) ou None
+    """
+    cep = _validar_cep(cep_input)
+    cache = obter_cep_cache()
+
+    # O cache pode ir ao SQLite; roda fora do event loop
+    with medir("cep_cache"):
+        encontrado, localizacao = await asyncio.to_thread(cache.buscar, cep)
+    if encontrado and _atende_precisao(localizacao, preciso):
+        return localizacao
+
+    usar_indice = CEP_MODO == "offline" and not preciso
+    if usar_indice:
+        with medir("cep_indice"):
+            do_indice = _buscar_no_indice(cep)
+        if do_indice is not None:
+            return do_indice
+        if encontrado and localizacao is None:
+            # Cache negativo e o índice também não conhece o CEP
+            return None
+
+    try:
+        with medir("brazilcep"):
+            endereco = await DISJUNTOR_BRAZILCEP.chamar_async(lambda: LIMITE_BRAZILCEP.executar(
+                lambda: brazilcep.async_get_address_from_cep(cep, timeout=LIMITE_BRAZILCEP.timeout)), hedge=True)
+    except (InvalidCEP, CEPNotFound):
+        endereco = None
+    except (CircuitoAberto, ValueError):
+        return _localizacao_aproximada(cep)
+    except Exception:
+        ERROS_UPSTREAM.incrementar("brazilcep")
+        return _localizacao_aproximada(cep)
+
+    localizacao = None
+    if endereco is not None and usar_indice:
+        localizacao = _buscar_cidade_no_indice(endereco)
+    if endereco is not None and localizacao is None:
+        try:
+            DISJUNTOR_NOMINATIM.permitir()
+            encontrada, nivel = await obter_agendador_geocodificacao().geocodificar_niveis_async(
+                _chave_cidade(endereco), _consultas_geocodificacao(endereco), timeout=NOMINATIM_ESPERA_MAX_S)
+        except Exception:
+            return _localizacao_aproximada(cep)
+        if encontrada is not None:
+            localizacao = LocalizacaoCep(encontrada.address, encontrada.latitude, encontrada.longitude, nivel)
+
+    await asyncio.to_thread(cache.gravar, cep, localizacao)
     return localizacao
 
 
+@registrar_coletor
+def _coletar_metricas() -> list:
+    """
+    Contadores do cache de CEP, da fila do Nominatim e dos limites do brazilcep (lidos no /metrics).
+    """
+    metricas = []
+    from services.cep_cache import _cep_cache
+    if _cep_cache is not None:
+        stats = _cep_cache.stats()
+        metricas += amostras("supernova_cache_cep_total", "counter", "Consultas ao cache de CEP por resultado.",
+                             "resultado", {"hit_memoria": stats["hits_memoria"], "hit_disco": stats["hits_disco"],
+                                           "miss": stats["misses"]})
+        metricas += amostras("supernova_cache_cep_entradas", "gauge", "Entradas no cache de CEP.", "nivel",
+                             {"memoria": stats["tamanho_memoria"], "disco": stats["tamanho_disco"]})
+    if _agendador is not None:
+        stats = _agendador.stats()
+        metricas += amostras("supernova_nominatim_total", "counter", "Chamadas ao Nominatim pela fila.", "tipo",
+                             {"requisicoes": stats["requisicoes"], "agrupadas": stats["agrupadas"],
+                              "niveis_pulados": stats["niveis_pulados"], "limitadas_429": stats["limitadas_429"]})
+        metricas.append(("supernova_nominatim_fila", "gauge", "Consultas esperando na fila do Nominatim.", {},
+                         stats["fila"]))
+    metricas.append(("supernova_upstream_timeouts_total", "counter", "Timeouts dos upstreams no modo assíncrono.",
+                     {"upstream": LIMITE_BRAZILCEP.nome}, LIMITE_BRAZILCEP.timeouts))
+    return metricas
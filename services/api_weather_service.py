@@ -1,149 +1,577 @@
+import logging
+import math
+import os
+import threading
+import time
+
+import aiohttp
+import numpy as np
 import openmeteo_requests
-import pandas as pd
 import requests_cache
-from retry_requests import retry
+from requests.adapters import HTTPAdapter
+from urllib3 import Retry
 
-# Ajustes globais pro pandas
-pd.set_option('display.max_columns', None)
-pd.set_option('display.width', 1000)
+from openmeteo_sdk.WeatherApiResponse import WeatherApiResponse
 
+from services.metrics import ERROS_UPSTREAM, RETENTATIVAS_UPSTREAM, amostras, medir, registrar_coletor
+from services.upstream import CircuitoAberto, Disjuntor, LimiteUpstream, marcar_chamada_rede
+from services.weather_cache import OPEN_METEO_CADENCIA_SEGUNDOS, WeatherGridCache
+from services.weather_decoding import (decodificar_lote, dtype_lote, hora_local, ler_atuais, ler_horarias,
+                                      nome_canonico)
 
-def obter_previsao_por_coordenadas_json(latitude: float, longitude: float):
+logger = logging.getLogger(__name__)
+
+
+def _lista_env(nome: str) -> list:
+    return [item.strip() for item in os.environ.get(nome, "").split(",") if item.strip()]
+
+
+# Endpoint e variáveis "current" usadas pelo modelo (sempre pedidas à Open-Meteo)
+URL_OPEN_METEO = os.environ.get("OPEN_METEO_URL", "https://api.open-meteo.com/v1/forecast")
+VARIAVEIS_ATUAIS = [
+    "temperature_2m",
+    "precipitation",
+    "wind_speed_10m",
+    "wind_direction_10m",
+    "is_day",
+    "rain",
+    "snowfall",
+    "surface_pressure",
+    "weather_code",
+    "cloudcover",
+    "pressure_msl",
+    "showers",
+    "relativehumidity_2m",
+    "apparent_temperature",
+    "windgusts_10m"
+]
+
+# Variáveis "current" extras, só para a resposta (ex.: OPEN_METEO_ATUAIS_EXTRAS=visibility,dew_point_2m)
+VARIAVEIS_ATUAIS_EXTRAS = [nome for nome in _lista_env("OPEN_METEO_ATUAIS_EXTRAS") if nome not in VARIAVEIS_ATUAIS]
+VARIAVEIS_PEDIDAS = VARIAVEIS_ATUAIS + VARIAVEIS_ATUAIS_EXTRAS
+
+# Séries "hourly" das consultas de uma coordenada (padrão: nenhuma) e quantas horas à frente
+VARIAVEIS_HORARIAS = _lista_env("OPEN_METEO_HORARIAS")
+HORAS_PREVISAO = int(os.environ.get("OPEN_METEO_HORAS", 24))
+
+# Linha do tempo de risco (/consulta com "linha_do_tempo": true): as variáveis do modelo em
+# "hourly", de LINHA_DO_TEMPO_DIAS_PASSADOS dias atrás até LINHA_DO_TEMPO_DIAS_PREVISAO à frente
+# (padrão: ontem e hoje, 48 horas), numa única requisição junto com o "current"
+LINHA_DO_TEMPO_DIAS_PASSADOS = int(os.environ.get("LINHA_DO_TEMPO_DIAS_PASSADOS", 1))
+LINHA_DO_TEMPO_DIAS_PREVISAO = int(os.environ.get("LINHA_DO_TEMPO_DIAS_PREVISAO", 1))
+PARAMETROS_LINHA_DO_TEMPO = {
+    "current": VARIAVEIS_PEDIDAS,
+    "hourly": VARIAVEIS_ATUAIS,
+    "past_days": LINHA_DO_TEMPO_DIAS_PASSADOS,
+    "forecast_days": LINHA_DO_TEMPO_DIAS_PREVISAO,
+    "timezone": "auto"
+}
+
+# A Open-Meteo aceita várias coordenadas separadas por vírgula numa mesma requisição;
+# limitamos o tamanho de cada grupo para não estourar o tamanho da URL
+MAX_COORDENADAS_POR_REQUISICAO = 100
+
+
+# Configurações do client compartilhado (podem ser sobrescritas por variáveis de ambiente)
+OPEN_METEO_CACHE_PATH = os.environ.get("OPEN_METEO_CACHE_PATH", ".cache")
+OPEN_METEO_CACHE_EXPIRA_SEGUNDOS = int(os.environ.get("OPEN_METEO_CACHE_EXPIRA_SEGUNDOS", 3600))
+OPEN_METEO_POOL_SIZE = int(os.environ.get("OPEN_METEO_POOL_SIZE", 32))
+# Poucas retentativas e timeout por chamada: com a Open-Meteo degradada quem segura a latência é o
+# disjuntor (DISJUNTOR_OPEN_METEO), não uma fila de tentativas
+OPEN_METEO_RETRIES = int(os.environ.get("OPEN_METEO_RETRIES", 2))
+OPEN_METEO_BACKOFF = 0.2
+OPEN_METEO_TIMEOUT = float(os.environ.get("OPEN_METEO_TIMEOUT", 10))
+
+# Disjuntor da Open-Meteo: abre com muitas falhas ou muitas chamadas acima de OPEN_METEO_LENTIDAO_S
+DISJUNTOR_OPEN_METEO = Disjuntor("open-meteo", lentidao=float(os.environ.get("OPEN_METEO_LENTIDAO_S", 2.0)))
+
+
+class _SessaoOpenMeteo(requests_cache.CachedSession):
     """
-    Consulta a Open-Meteo (com cache e retry). Recebe latitude e longitude,
-    monta a requisição, e devolve um dicionário Python com:
-      - general: dados gerais (latitude, longitude, elevation, timezone, utc_offset_seconds)
-      - current: dicionário com as variáveis atuais (time_local, temperature_2m, precipitation, wind_speed_10m, wind_direction_10m,
-                 is_day, rain, snowfall, surface_pressure, weather_code, cloud_cover, pressure_msl, showers,
-                 relative_humidity_2m, apparent_temperature, wind_gusts_10m)
-    """
-    # Configura sessão com cache (expira em 1h) e retry automático (até 5 tentativas)
-    cache_session = requests_cache.CachedSession('.cache', expire_after=3600)
-    retry_session = retry(cache_session, retries=5, backoff_factor=0.2)
-    openmeteo = openmeteo_requests.Client(session=retry_session)
-
-    # Monta URL e parâmetros usando lat/lon
-    url = "https://api.open-meteo.com/v1/forecast"
-    params = {
-        "latitude": latitude,
-        "longitude": longitude,
-        "daily": "weather_code",
-        "hourly": [
-            "temperature_2m",
-            "weather_code",
-            "rain",
-            "visibility",
-            "precipitation_probability",
-            "precipitation",
-            "snowfall"
-        ],
-        "current": [
-            "temperature_2m",
-            "precipitation",
-            "wind_speed_10m",
-            "wind_direction_10m",
-            "is_day",
-            "rain",
-            "snowfall",
-            "surface_pressure",
-            "weather_code",
-            "cloudcover",
-            "pressure_msl",
-            "showers",
-            "relativehumidity_2m",
-            "apparent_temperature",
-            "windgusts_10m"
-        ],
-        "timezone": "auto",
-        "past_days": 1,
-        "forecast_days": 1
-    }
+    CachedSession que conta quantas respostas vieram do cache e quantas foram à rede.
+
+    Cada resposta guardada expira na próxima virada da cadência da Open-Meteo
+    (OPEN_METEO_CADENCIA_SEGUNDOS), no máximo OPEN_METEO_CACHE_EXPIRA_SEGUNDOS depois: o cache
+    HTTP nunca devolve dados de uma janela que o cache da grade, os tiles ou as varreduras já
+    consideram vencida.
+    """
+
+    def __init__(self, *args, cadencia: int = OPEN_METEO_CADENCIA_SEGUNDOS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cadencia = cadencia
+        self._stats_lock = threading.Lock()
+        self.stats = {"requisicoes": 0, "hits_cache": 0, "misses_cache": 0}
+
+    def request(self, *args, expire_after=None, **kwargs):
+        if expire_after is None:
+            agora = time.time()
+            ate_a_virada = (agora // self.cadencia + 1) * self.cadencia - agora
+            # Arredonda para baixo: 0 (menos de 1 s para a virada) é "expira na hora"
+            expire_after = min(math.floor(ate_a_virada), OPEN_METEO_CACHE_EXPIRA_SEGUNDOS)
+        return super().request(*args, expire_after=expire_after, **kwargs)
+
+    def send(self, request, **kwargs):
+        response = super().send(request, **kwargs)
+        veio_do_cache = getattr(response, "from_cache", False)
+        if not veio_do_cache:
+            marcar_chamada_rede()
+        with self._stats_lock:
+            self.stats["requisicoes"] += 1
+            self.stats["hits_cache" if veio_do_cache else "misses_cache"] += 1
+        return response
+
+
+class _RetryContado(Retry):
+    """
+    Retry do urllib3 que conta cada nova tentativa em RETENTATIVAS_UPSTREAM.
+    """
+
+    def increment(self, *args, **kwargs):
+        novo = super().increment(*args, **kwargs)
+        RETENTATIVAS_UPSTREAM.incrementar("open_meteo")
+        return novo
+
+
+_sessao = None
+_cliente = None
+_cliente_lock = threading.Lock()
+
+# Cache por célula da grade, compartilhado por todas as threads (não abre arquivos, pode nascer na importação)
+_cache_grade = WeatherGridCache()
+# As linhas do tempo (com as séries horárias) ficam num cache da grade separado
+_cache_linha_do_tempo = WeatherGridCache()
+
+
+def _criar_cliente_open_meteo():
+    """
+    Monta a sessão com cache em SQLite (WAL, seguro entre threads; expira na virada da cadência), um pool de
+    conexões keep-alive com OPEN_METEO_POOL_SIZE conexões por host e retry automático
+    (OPEN_METEO_RETRIES tentativas) — e o client da Open-Meteo em cima dela.
+    """
+    sessao = _SessaoOpenMeteo(
+        backend=requests_cache.SQLiteCache(OPEN_METEO_CACHE_PATH, wal=True),
+        expire_after=OPEN_METEO_CACHE_EXPIRA_SEGUNDOS
+    )
+    adapter = HTTPAdapter(
+        pool_connections=OPEN_METEO_POOL_SIZE,
+        pool_maxsize=OPEN_METEO_POOL_SIZE,
+        max_retries=_RetryContado(
+            total=OPEN_METEO_RETRIES,
+            backoff_factor=OPEN_METEO_BACKOFF,
+            status_forcelist=(500, 502, 504)
+        )
+    )
+    sessao.mount("http://", adapter)
+    sessao.mount("https://", adapter)
+    return sessao, openmeteo_requests.Client(session=sessao)
+
+
+def obter_cliente_open_meteo():
+    """
+    Devolve o client único da Open-Meteo, criado no primeiro uso e compartilhado por todas
+    as threads do Flask (a sessão, o pool de conexões e o arquivo de cache são reaproveitados).
+    """
+    global _sessao, _cliente
+    if _cliente is None:
+        with _cliente_lock:
+            if _cliente is None:
+                _sessao, _cliente = _criar_cliente_open_meteo()
+    return _cliente
+
+
+def _listar_pools(adapter) -> list:
+    """
+    Lista os connection pools de um HTTPAdapter. O openmeteo_requests instala o urllib3-future
+    (via niquests), que guarda os pools num TrafficPolice em vez do RecentlyUsedContainer.
+    """
+    pools = adapter.poolmanager.pools
+    if hasattr(pools, "_registry"):
+        return list(pools._registry.values())
+    return [pools[chave] for chave in list(pools.keys()) if chave in pools]
+
+
+def estatisticas_cliente_open_meteo() -> dict:
+    """
+    Estatísticas do client compartilhado: hits/misses do cache HTTP e uso do pool de conexões.
+    """
+    if _sessao is None:
+        return {"inicializado": False}
 
-    # Faz a requisição e obtém lista de respostas (normalmente só precisa do primeiro)
-    responses = openmeteo.weather_api(url, params=params)
-    response = responses[0]
+    # O mesmo adapter fica montado em http:// e https://
+    adapters = {id(a): a for a in (_sessao.get_adapter("http://"), _sessao.get_adapter("https://"))}
+    pools = []
+    for adapter in adapters.values():
+        for pool in _listar_pools(adapter):
+            pools.append({
+                "host": f"{pool.scheme}://{pool.host}:{pool.port}",
+                "conexoes_criadas": getattr(pool, "num_connections", 0),
+                "requisicoes": getattr(pool, "num_requests", 0),
+                "slots_livres": pool.pool.qsize() if getattr(pool, "pool", None) is not None else 0
+            })
+
+    with _sessao._stats_lock:
+        cache = dict(_sessao.stats)
+    return {"inicializado": True, "pool_size": OPEN_METEO_POOL_SIZE, "cache": cache, "pools": pools}
+
+
+def _texto(valor):
+    """
+    Strings do FlatBuffers chegam como bytes: decodifica aqui, na origem, para que o resto
+    da API (cache, modelo, serialização) só veja str.
+    """
+    return valor.decode("utf-8", errors="ignore") if isinstance(valor, bytes) else valor
 
-    # Exibe informações gerais
-    print(f"Coordenadas: {response.Latitude()}°N {response.Longitude()}°E")
-    print(f"Altitude: {response.Elevation()} m asl")
-    print(f"Time zone: {response.Timezone()}{response.TimezoneAbbreviation()}")
-    print(f"Diferença para GMT+0: {response.UtcOffsetSeconds()} segundos\n")
 
-    info_geral = {
+def _extrair_info_geral(response) -> dict:
+    """
+    Extrai os dados gerais (coordenadas da grade, altitude e fuso) de uma resposta da Open-Meteo.
+    """
+    return {
         "latitude": response.Latitude(),
         "longitude": response.Longitude(),
         "elevation": response.Elevation(),
-        "timezone": response.Timezone(),
-        "timezone_abbreviation": response.TimezoneAbbreviation(),
+        "timezone": _texto(response.Timezone()),
+        "timezone_abbreviation": _texto(response.TimezoneAbbreviation()),
         "utc_offset_seconds": response.UtcOffsetSeconds()
     }
 
-    # ------------------
-    # Dados ao vivo ("current")
+
+def _extrair_info_atual(response, variaveis=VARIAVEIS_PEDIDAS) -> dict:
+    """
+    Extrai as variáveis "current" de uma resposta da Open-Meteo, lidas pelo nome (ver
+    services/weather_decoding.py), mais o horário local da leitura.
+    """
     current = response.Current()
-    ts = current.Time()
-
-    # Deixando o utc legível
-    hora_local = pd.to_datetime(ts, unit='s').tz_localize('UTC').tz_convert('America/Sao_Paulo')
-
-    # Cada índice em Variables() corresponde a uma das variáveis solicitadas em "current"
-    current_temperature_2m        = current.Variables(0).Value()
-    current_precipitation         = current.Variables(1).Value()
-    current_wind_speed_10m        = current.Variables(2).Value()
-    current_wind_direction_10m    = current.Variables(3).Value()
-    current_is_day                = current.Variables(4).Value()
-    current_rain                  = current.Variables(5).Value()
-    current_snowfall              = current.Variables(6).Value()
-    current_surface_pressure      = current.Variables(7).Value()
-    current_weather_code          = current.Variables(8).Value()
-    current_cloud_cover           = current.Variables(9).Value()
-    current_pressure_msl          = current.Variables(10).Value()
-    current_showers               = current.Variables(11).Value()
-    current_relative_humidity_2m  = current.Variables(12).Value()
-    current_apparent_temperature  = current.Variables(13).Value()
-    current_wind_gusts_10m        = current.Variables(14).Value()
-
-    # Exibe informações ao vivo
-    print("\n== Dados atuais ==\n")
-    print(f"Hora da última atualização: {hora_local}")
-    print(f"Temperatura (2m): {current_temperature_2m}°C")
-    print(f"Precipitação atual: {current_precipitation} mm")
-    print(f"Velocidade do vento (10m): {current_wind_speed_10m} m/s")
-    print(f"Direção do vento (10m): {current_wind_direction_10m}°\n")
-    print(f"Está de dia?: {current_is_day}")
-    print(f"Chuva atual: {current_rain}")
-    print(f"Neve atual: {current_snowfall}")
-    print(f"Pressão do solo atual: {current_surface_pressure}")
-    print(f"Código de clima atual: {current_weather_code}")
-    print(f"Cobertura das nuvens: {current_cloud_cover}")
-    print(f"Presão de altura por nivel do mar: {current_pressure_msl}")
-    print(f"Garoa atual: {current_showers}")
-    print(f"Umidade relativa atual: {current_relative_humidity_2m}")
-    print(f"Sensação térmica atual: {current_apparent_temperature}")
-    print(f"Pico da velocidade do vento: {current_wind_gusts_10m}")
-
-    info_atual = {
-        "time_local": hora_local.isoformat(),
-        "temperature_2m": current_temperature_2m,
-        "precipitation": current_precipitation,
-        "wind_speed_10m": current_wind_speed_10m,
-        "wind_direction_10m": current_wind_direction_10m,
-        "is_day": current_is_day,
-        "rain": current_rain,
-        "snowfall": current_snowfall,
-        "surface_pressure": current_surface_pressure,
-        "weather_code": current_weather_code,
-        "cloud_cover": current_cloud_cover,
-        "pressure_msl": current_pressure_msl,
-        "showers": current_showers,
-        "relative_humidity_2m": current_relative_humidity_2m,
-        "apparent_temperature": current_apparent_temperature,
-        "wind_gusts_10m": current_wind_gusts_10m
-    }
+    return {"time_local": hora_local(current.Time()), **ler_atuais(current, variaveis)}
 
-    # Monta dicionário final
-    resultado_clima = {
-        "general": info_geral,
-        "current": info_atual,
-    }
+
+def _extrair_previsao(response) -> dict:
+    """
+    {"general", "current"} de uma resposta e, se VARIAVEIS_HORARIAS foram pedidas, "hourly"
+    com as séries em arrays NumPy ("time" em timestamps Unix).
+    """
+    previsao = {"general": _extrair_info_geral(response), "current": _extrair_info_atual(response)}
+    if VARIAVEIS_HORARIAS:
+        previsao["hourly"] = ler_horarias(response.Hourly(), VARIAVEIS_HORARIAS)
+    return previsao
+
+
+def _extrair_linha_do_tempo(response) -> dict:
+    """
+    {"general", "current", "hourly"} de uma resposta pedida com PARAMETROS_LINHA_DO_TEMPO
+    ("hourly" com as variáveis do modelo em arrays NumPy e "time" em timestamps Unix).
+    """
+    return {"general": _extrair_info_geral(response), "current": _extrair_info_atual(response),
+            "hourly": ler_horarias(response.Hourly(), VARIAVEIS_ATUAIS)}
+
+
+def _parametros_coordenada(latitude: float, longitude: float) -> dict:
+    """
+    Parâmetros da consulta de uma coordenada: só as variáveis usadas pelo modelo e pela resposta.
+    """
+    params = {"latitude": latitude, "longitude": longitude, "current": VARIAVEIS_PEDIDAS, "timezone": "auto"}
+    if VARIAVEIS_HORARIAS:
+        params["hourly"] = VARIAVEIS_HORARIAS
+        params["forecast_hours"] = HORAS_PREVISAO
+    return params
+
+
+def estatisticas_cache_grade() -> dict:
+    """
+    Estatísticas do cache por célula da grade (hits, misses, buscas agrupadas, células em cache).
+    """
+    return _cache_grade.stats()
+
+
+def obter_previsao_por_coordenadas_json(latitude: float, longitude: float):
+    """
+    Consulta a Open-Meteo (com cache e retry, via client compartilhado). Recebe latitude e longitude
+    e devolve um dicionário Python com:
+      - general: dados gerais (latitude, longitude, elevation, timezone, utc_offset_seconds)
+      - current: dicionário com as variáveis atuais (time_local, temperature_2m, precipitation, wind_speed_10m, wind_direction_10m,
+                 is_day, rain, snowfall, surface_pressure, weather_code, cloud_cover, pressure_msl, showers,
+                 relative_humidity_2m, apparent_temperature, wind_gusts_10m e as OPEN_METEO_ATUAIS_EXTRAS)
+      - hourly (só com OPEN_METEO_HORARIAS): {"time": timestamps Unix, variável: série float32} em
+                arrays NumPy, para as próximas OPEN_METEO_HORAS horas
+
+    Coordenadas que caem na mesma célula da grade da Open-Meteo reaproveitam a mesma previsão
+    enquanto o modelo não atualiza (ver WeatherGridCache).
+    """
+    return _cache_grade.obter(latitude, longitude, _buscar_previsao)
+
+
+def _buscar_previsao(latitude: float, longitude: float, params: dict = None, extrair=_extrair_previsao):
+    """
+    Faz a requisição à Open-Meteo para uma coordenada (sem passar pelo cache da grade).
+    'params' (padrão: _parametros_coordenada) e 'extrair' servem também à linha do tempo.
+    Passa pelo DISJUNTOR_OPEN_METEO, com hedge se a chamada demorar.
+    """
+    openmeteo = obter_cliente_open_meteo()
+
+    # Faz a requisição e obtém lista de respostas (uma por coordenada)
+    with medir("open_meteo"):
+        try:
+            responses = DISJUNTOR_OPEN_METEO.chamar(
+                openmeteo.weather_api, URL_OPEN_METEO, params=params or _parametros_coordenada(latitude, longitude),
+                timeout=OPEN_METEO_TIMEOUT, hedge=True
+            )
+        except CircuitoAberto:
+            raise
+        except Exception:
+            ERROS_UPSTREAM.incrementar("open_meteo")
+            raise
+    resultado_clima = extrair(responses[0])
+
+    # Resumo da previsão (só com LOG_NIVEL=DEBUG)
+    logger.debug("Open-Meteo (%s, %s): %s", latitude, longitude, resultado_clima["current"])
     return resultado_clima
+
+
+def obter_previsoes_por_coordenadas_json(coordenadas: list, desatualizadas: list = None) -> list:
+    """
+    Versão em lote de obter_previsao_por_coordenadas_json. Recebe uma lista de tuplas
+    (latitude, longitude) e agrupa as coordenadas em requisições multi-localização da
+    Open-Meteo (até MAX_COORDENADAS_POR_REQUISICAO por chamada), pedindo apenas "current".
+
+    Retorna uma lista de dicionários {"general": ..., "current": ...} na mesma ordem da entrada.
+    Só as células da grade que não estão no cache são buscadas; 'desatualizadas', se dada,
+    recebe os índices servidos com a previsão expirada (ver WeatherGridCache.obter_muitos).
+    """
+    if not coordenadas:
+        return []
+    return _cache_grade.obter_muitos(list(coordenadas), _buscar_previsoes, desatualizadas)
+
+
+def _respostas_em_grupos(coordenadas: list, parametros: dict = None):
+    """
+    Faz as requisições multi-localização à Open-Meteo (só "current", ou 'parametros', sem passar
+    pelo cache da grade) e gera as respostas de cada grupo de até MAX_COORDENADAS_POR_REQUISICAO
+    coordenadas.
+    """
+    openmeteo = obter_cliente_open_meteo()
+    for inicio in range(0, len(coordenadas), MAX_COORDENADAS_POR_REQUISICAO):
+        grupo = coordenadas[inicio:inicio + MAX_COORDENADAS_POR_REQUISICAO]
+        params = {
+            "latitude": [lat for lat, _ in grupo],
+            "longitude": [lon for _, lon in grupo],
+            **(parametros or {"current": VARIAVEIS_PEDIDAS, "timezone": "auto"})
+        }
+
+        # A Open-Meteo devolve uma resposta por coordenada, na mesma ordem da requisição
+        # (sem hedge: duplicar um lote de até 100 coordenadas custa caro para o upstream)
+        with medir("open_meteo_lote"):
+            try:
+                responses = DISJUNTOR_OPEN_METEO.chamar(openmeteo.weather_api, URL_OPEN_METEO, params=params,
+                                                        timeout=OPEN_METEO_TIMEOUT)
+            except CircuitoAberto:
+                raise
+            except Exception:
+                ERROS_UPSTREAM.incrementar("open_meteo")
+                raise
+        if len(responses) != len(grupo):
+            raise RuntimeError(f"Open-Meteo devolveu {len(responses)} respostas para {len(grupo)} coordenadas.")
+        yield responses
+
+
+def _previsoes_do_grupo(responses, estruturado: np.ndarray) -> list:
+    """
+    Dicts {"general", "current"} de um grupo de respostas, a partir do array estruturado já decodificado.
+    """
+    nomes = [nome_canonico(nome) for nome in VARIAVEIS_PEDIDAS]
+    previsoes = []
+    for response, linha in zip(responses, estruturado.tolist()):
+        current = {"time_local": hora_local(linha[3])}
+        current.update(zip(nomes, linha[4:]))
+        previsoes.append({"general": _extrair_info_geral(response), "current": current})
+    return previsoes
+
+
+def _buscar_previsoes(coordenadas: list) -> list:
+    """
+    Previsões de várias coordenadas como dicts {"general", "current"} (sem passar pelo cache da
+    grade). As variáveis de cada grupo são decodificadas de uma vez num array estruturado.
+    """
+    return buscar_previsoes_lote(coordenadas)[1]
+
+
+def buscar_previsoes_lote(coordenadas: list) -> tuple:
+    """
+    Previsões "current" de várias coordenadas (sem passar pelo cache da grade) nas duas formas:
+    (array estruturado como o de obter_previsoes_estruturadas, lista de dicts {"general", "current"}
+    como os de obter_previsoes_por_coordenadas_json), na ordem da entrada.
+    """
+    coordenadas = list(coordenadas)
+    blocos, previsoes = [np.empty(0, dtype=dtype_lote(VARIAVEIS_PEDIDAS))], []
+    for responses in _respostas_em_grupos(coordenadas):
+        estruturado = decodificar_lote(responses, VARIAVEIS_PEDIDAS)
+        blocos.append(estruturado)
+        previsoes.extend(_previsoes_do_grupo(responses, estruturado))
+    return np.concatenate(blocos), previsoes
+
+
+def chave_celula(latitude: float, longitude: float) -> tuple:
+    """
+    Apelido da coordenada na grade (mesma chave das consultas ao cache da grade).
+    """
+    return _cache_grade.chave(latitude, longitude)
+
+
+def obter_previsoes_estruturadas(coordenadas: list) -> np.ndarray:
+    """
+    Previsões "current" de várias coordenadas num único array estruturado (uma linha por
+    coordenada, na ordem da entrada): latitude/longitude/elevation da grade, "time" e as
+    VARIAVEIS_PEDIDAS com o nome atual ("cloud_cover", "relative_humidity_2m"...). Não passa
+    pelo cache da grade; o array vai direto para build_feature_matrix / classify_many.
+    """
+    coordenadas = list(coordenadas)
+    if not coordenadas:
+        return np.empty(0, dtype=dtype_lote(VARIAVEIS_PEDIDAS))
+    return np.concatenate([decodificar_lote(responses, VARIAVEIS_PEDIDAS)
+                           for responses in _respostas_em_grupos(coordenadas)])
+
+
+def obter_linha_do_tempo(latitude: float, longitude: float) -> dict:
+    """
+    {"general", "current", "hourly"} de uma coordenada, com as séries horárias das variáveis do
+    modelo de LINHA_DO_TEMPO_DIAS_PASSADOS dias atrás a LINHA_DO_TEMPO_DIAS_PREVISAO à frente
+    (ver services/risk_timeline.py). Passa por um cache da grade próprio.
+    """
+    return _cache_linha_do_tempo.obter(latitude, longitude, _buscar_linha_do_tempo)
+
+
+def _buscar_linha_do_tempo(latitude: float, longitude: float) -> dict:
+    params = {"latitude": latitude, "longitude": longitude, **PARAMETROS_LINHA_DO_TEMPO}
+    return _buscar_previsao(latitude, longitude, params, _extrair_linha_do_tempo)
+
+
+def obter_linhas_do_tempo(coordenadas: list, desatualizadas: list = None) -> list:
+    """
+    Versão em lote de obter_linha_do_tempo (requisições multi-localização, na ordem da entrada).
+    'desatualizadas' como em obter_previsoes_por_coordenadas_json.
+    """
+    if not coordenadas:
+        return []
+    return _cache_linha_do_tempo.obter_muitos(list(coordenadas), _buscar_linhas_do_tempo, desatualizadas)
+
+
+def _buscar_linhas_do_tempo(coordenadas: list) -> list:
+    return [_extrair_linha_do_tempo(response)
+            for responses in _respostas_em_grupos(coordenadas, PARAMETROS_LINHA_DO_TEMPO)
+            for response in responses]
+
+
+# ------------------
+# Modo assíncrono (api/app_async.py)
+
+LIMITE_OPEN_METEO = LimiteUpstream(
+    "open-meteo",
+    concorrencia=int(os.environ.get("OPEN_METEO_CONCORRENCIA", OPEN_METEO_POOL_SIZE)),
+    timeout=OPEN_METEO_TIMEOUT
+)
+
+_sessao_async = None
+
+
+def _obter_sessao_async() -> aiohttp.ClientSession:
+    """
+    Sessão aiohttp única do modo assíncrono, criada no primeiro uso dentro do event loop,
+    com o mesmo tamanho de pool do client síncrono.
+    """
+    global _sessao_async
+    if _sessao_async is None or _sessao_async.closed:
+        _sessao_async = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=OPEN_METEO_POOL_SIZE))
+    return _sessao_async
+
+
+async def fechar_sessao_async():
+    """
+    Fecha a sessão aiohttp da Open-Meteo (chamado no shutdown do app).
+    """
+    global _sessao_async
+    if _sessao_async is not None:
+        await _sessao_async.close()
+        _sessao_async = None
+
+
+def _decodificar_respostas(dados: bytes) -> list:
+    """
+    Decodifica o corpo FlatBuffers da Open-Meteo: uma mensagem por coordenada, cada uma
+    prefixada pelo seu tamanho (4 bytes little-endian) — mesmo formato lido pelo openmeteo_requests.
+    """
+    respostas = []
+    posicao = 0
+    while posicao < len(dados):
+        tamanho = int.from_bytes(dados[posicao:posicao + 4], byteorder="little")
+        respostas.append(WeatherApiResponse.GetRootAs(dados, posicao + 4))
+        posicao += tamanho + 4
+    return respostas
+
+
+async def obter_previsao_por_coordenadas_json_async(latitude: float, longitude: float):
+    """
+    Versão assíncrona de obter_previsao_por_coordenadas_json: mesmo formato de retorno
+    ({"general": ..., "current": ...}) e mesmo cache por célula da grade, com a requisição
+    feita por aiohttp sob LIMITE_OPEN_METEO (concorrência + timeout).
+    """
+    return await _cache_grade.obter_async(latitude, longitude, _buscar_previsao_async)
+
+
+async def obter_linha_do_tempo_async(latitude: float, longitude: float) -> dict:
+    """
+    Versão assíncrona de obter_linha_do_tempo (mesmo cache da grade das linhas do tempo).
+    """
+    return await _cache_linha_do_tempo.obter_async(latitude, longitude, _buscar_linha_do_tempo_async)
+
+
+async def _buscar_linha_do_tempo_async(latitude: float, longitude: float) -> dict:
+    params = {"latitude": latitude, "longitude": longitude, **PARAMETROS_LINHA_DO_TEMPO}
+    return await _buscar_previsao_async(latitude, longitude, params, _extrair_linha_do_tempo)
+
+
+async def _buscar_previsao_async(latitude: float, longitude: float, params: dict = None,
+                                 extrair=_extrair_previsao):
+    """
+    Faz a requisição assíncrona à Open-Meteo para uma coordenada (sem passar pelo cache da grade).
+    """
+    params = {chave: ",".join(valor) if isinstance(valor, list) else valor
+              for chave, valor in (params or _parametros_coordenada(latitude, longitude)).items()}
+    params["format"] = "flatbuffers"
+
+    async def requisitar():
+        marcar_chamada_rede()
+        async with _obter_sessao_async().get(URL_OPEN_METEO, params=params) as resposta:
+            if resposta.status != 200:
+                raise RuntimeError(f"Open-Meteo respondeu {resposta.status}: {await resposta.text()}")
+            return await resposta.read()
+
+    with medir("open_meteo"):
+        try:
+            dados = await DISJUNTOR_OPEN_METEO.chamar_async(lambda: LIMITE_OPEN_METEO.executar(requisitar), hedge=True)
+        except CircuitoAberto:
+            raise
+        except Exception:
+            ERROS_UPSTREAM.incrementar("open_meteo")
+            raise
+    return extrair(_decodificar_respostas(dados)[0])
+
+
+@registrar_coletor
+def _coletar_metricas() -> list:
+    """
+    Hits/misses do cache HTTP e do cache da grade e timeouts do modo assíncrono (lidos no /metrics).
+    """
+    metricas = []
+    if _sessao is not None:
+        with _sessao._stats_lock:
+            cache = dict(_sessao.stats)
+        metricas += amostras("supernova_cache_open_meteo_http_total", "counter",
+                             "Respostas da Open-Meteo vindas do cache HTTP ou da rede.", "resultado",
+                             {"hit": cache["hits_cache"], "miss": cache["misses_cache"]})
+    grade = _cache_grade.stats()
+    metricas += amostras("supernova_cache_grade_total", "counter", "Consultas ao cache por célula da grade.",
+                         "resultado", {"hit": grade["hits"], "miss": grade["misses"], "agrupada": grade["agrupadas"],
+                                       "desatualizada": grade["desatualizadas"]})
+    metricas.append(("supernova_cache_grade_celulas", "gauge", "Células da grade em cache.", {}, grade["celulas"]))
+    metricas.append(("supernova_upstream_timeouts_total", "counter", "Timeouts dos upstreams no modo assíncrono.",
+                     {"upstream": LIMITE_OPEN_METEO.nome}, LIMITE_OPEN_METEO.timeouts))
+    return metricas
@@ -0,0 +1,437 @@
+"""
+Pontuação em lote offline: categorias e probabilidades do modelo para arquivos grandes (CSV ou
+Parquet no esquema de FEATURE_COLS, como o weather_dataset_with_rules.csv), usada por
+utils/pontuar_lote.py.
+
+Etapas:
+  1) o arquivo de entrada é dividido em blocos de tamanho fixo sem ser lido inteiro: no CSV,
+     uma varredura dos bytes marca onde começa cada bloco de 'tamanho_chunk' linhas (supõe
+     campos sem quebra de linha, como nos dumps de observações); no Parquet, os blocos são
+     row groups consecutivos juntados até 'tamanho_chunk' linhas. O plano fica no manifesto
+     da pasta de saída e não é refeito numa retomada;
+  2) os blocos rodam num pool de processos; cada worker carrega o modelo uma vez, lê o próprio
+     bloco direto do arquivo (os dados não passam pelo processo principal) e grava o resultado
+     como uma parte da saída (parte-00000.parquet, ...), de forma atômica. A memória fica
+     limitada a um bloco por worker, qualquer que seja o tamanho da entrada;
+  3) cada bloco concluído é anexado a _blocos.jsonl, então uma pontuação interrompida continua
+     do último bloco concluído;
+  4) opcionalmente, as partes são juntadas num único arquivo no fim.
+
+A pasta de saída com as partes Parquet é lida direto por pd.read_parquet / pyarrow.dataset
+(os arquivos de controle começam com "_" e são ignorados por eles).
+"""
+import io
+import json
+import multiprocessing
+import os
+import resource
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from services.compiled_trees import file_sha256
+from services.model_service import BASE_DIR, FEATURE_COLS, PREDICTION_MODE, PREDICTION_MODES, model_version_path
+
+PONTUACAO_PATH = os.path.join(BASE_DIR, "data", "pontuacao")
+
+ARQUIVO_MANIFESTO = "_pontuacao.json"
+ARQUIVO_BLOCOS = "_blocos.jsonl"
+FORMATOS = ("parquet", "csv")
+
+COLUNA_LINHA = "linha"
+COLUNA_CATEGORIA = "categoria"
+PREFIXO_PROBABILIDADE = "prob_"
+
+# Bytes lidos por vez na varredura que divide o CSV em blocos
+LEITURA_BYTES = 16 * 1024 * 1024
+
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise RuntimeError("Entrada ou saída Parquet requer o pacote 'pyarrow' (pip install pyarrow).") from e
+    return pa, pq
+
+
+def _formato_entrada(caminho: str) -> str:
+    return "parquet" if caminho.endswith(".parquet") else "csv"
+
+
+def _conferir_colunas(colunas, manter: list, caminho: str):
+    faltando = [c for c in FEATURE_COLS + manter if c not in set(colunas)]
+    if faltando:
+        raise ValueError(f"Colunas ausentes em {caminho}: {faltando}.")
+
+
+def _planejar_csv(caminho: str, tamanho_chunk: int, manter: list) -> dict:
+    """
+    Divide o CSV em blocos de 'tamanho_chunk' linhas de dados: posição em bytes do início e do
+    fim de cada um, contando as quebras de linha em pedaços de LEITURA_BYTES.
+    """
+    import pandas as pd
+
+    with open(caminho, "rb") as f:
+        cabecalho = f.readline()
+        _conferir_colunas(pd.read_csv(io.BytesIO(cabecalho), nrows=0).columns, manter, caminho)
+        inicios = [f.tell()]
+        posicao, no_bloco, ultimo = f.tell(), 0, b"\n"
+        while True:
+            dados = f.read(LEITURA_BYTES)
+            if not dados:
+                break
+            quebras = np.flatnonzero(np.frombuffer(dados, dtype=np.uint8) == ord("\n"))
+            # Quebras que fecham um bloco: a (tamanho_chunk - no_bloco)-ésima e depois a cada tamanho_chunk
+            fechamentos = quebras[tamanho_chunk - no_bloco - 1::tamanho_chunk]
+            inicios.extend((posicao + fechamentos + 1).tolist())
+            no_bloco = (no_bloco + len(quebras)) % tamanho_chunk
+            posicao += len(dados)
+            ultimo = dados[-1:]
+        if ultimo != b"\n":
+            no_bloco += 1   # última linha sem quebra no fim do arquivo
+    fins = inicios[1:] + [posicao]
+    blocos = []
+    for i, (inicio, fim) in enumerate(zip(inicios, fins)):
+        if fim > inicio:
+            linhas = tamanho_chunk if fim != posicao else no_bloco or tamanho_chunk
+            blocos.append({"bloco": i, "linha_inicial": i * tamanho_chunk, "linhas": linhas,
+                           "inicio": inicio, "fim": fim})
+    return {"cabecalho": cabecalho.decode("utf-8"), "blocos": blocos}
+
+
+def _planejar_parquet(caminho: str, tamanho_chunk: int, manter: list) -> dict:
+    """
+    Junta row groups consecutivos em blocos de pelo menos 'tamanho_chunk' linhas (ou um row
+    group só, se ele já passa disso). Lê apenas os metadados do arquivo.
+    """
+    _, pq = _pyarrow()
+    arquivo = pq.ParquetFile(caminho)
+    _conferir_colunas(arquivo.schema_arrow.names, manter, caminho)
+    blocos, grupos, linhas, linha_inicial = [], [], 0, 0
+    for grupo in range(arquivo.num_row_groups):
+        grupos.append(grupo)
+        linhas += arquivo.metadata.row_group(grupo).num_rows
+        if linhas >= tamanho_chunk or grupo == arquivo.num_row_groups - 1:
+            blocos.append({"bloco": len(blocos), "linha_inicial": linha_inicial, "linhas": linhas, "grupos": grupos})
+            linha_inicial += linhas
+            grupos, linhas = [], 0
+    return {"cabecalho": None, "blocos": blocos}
+
+
+def planejar_blocos(caminho: str, tamanho_chunk: int, manter: list = ()) -> dict:
+    """
+    Plano da pontuação do arquivo: {"cabecalho": linha de cabeçalho do CSV (None no Parquet),
+    "blocos": [{"bloco", "linha_inicial", "linhas", ...posição no arquivo}, ...]}. Levanta
+    ValueError se faltam colunas de FEATURE_COLS ou de 'manter'.
+    """
+    if tamanho_chunk < 1:
+        raise ValueError("tamanho_chunk deve ser pelo menos 1.")
+    planejar = _planejar_parquet if _formato_entrada(caminho) == "parquet" else _planejar_csv
+    return planejar(caminho, tamanho_chunk, list(manter))
+
+
+# ---------------------------------------------------------------------------
+# Worker: um modelo por processo, um bloco por tarefa
+# ---------------------------------------------------------------------------
+
+_servico = None
+_modo = None
+
+
+def _iniciar_worker(caminho_modelo: str, modo: str, threads: int):
+    """
+    Inicializador dos processos do pool: limita as threads do OpenMP (lidas quando o LightGBM
+    é importado, o que só acontece ao carregar o modelo) e carrega o modelo uma vez.
+    """
+    global _servico, _modo
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+    _modo = modo
+    if modo != "regras":
+        from services.model_service import WeatherModelService
+
+        _servico = WeatherModelService(model_path=caminho_modelo)
+
+
+def _ler_bloco(caminho: str, bloco: dict, cabecalho: str, colunas: list):
+    """
+    Colunas do bloco como {nome: array}, lidas direto do arquivo de entrada.
+    """
+    if "grupos" in bloco:
+        _, pq = _pyarrow()
+        tabela = pq.ParquetFile(caminho, memory_map=True).read_row_groups(bloco["grupos"], columns=colunas)
+        return {c: tabela.column(c).to_numpy() for c in colunas}
+
+    import pandas as pd
+
+    with open(caminho, "rb") as f:
+        f.seek(bloco["inicio"])
+        dados = f.read(bloco["fim"] - bloco["inicio"])
+    df = pd.read_csv(io.BytesIO(cabecalho.encode("utf-8") + dados), usecols=colunas)
+    return {c: df[c].to_numpy() for c in colunas}
+
+
+def _gravar_parte(colunas: dict, caminho: str, formato: str):
+    """
+    Grava a parte num arquivo temporário oculto e o renomeia: uma parte existente está sempre
+    completa, e um temporário deixado por uma interrupção não é lido como parte.
+    """
+    pasta, nome = os.path.split(caminho)
+    temporario = os.path.join(pasta, f".{nome}.{os.getpid()}.tmp")
+    try:
+        pa, pq = _pyarrow()
+    except RuntimeError:
+        if formato == "parquet":
+            raise
+        import pandas as pd
+
+        pd.DataFrame(colunas).to_csv(temporario, index=False)
+    else:
+        tabela = pa.table(colunas)
+        if formato == "parquet":
+            pq.write_table(tabela, temporario)
+        else:
+            import pyarrow.csv as pa_csv
+
+            pa_csv.write_csv(tabela, temporario, pa_csv.WriteOptions(quoting_style="needed"))
+    os.replace(temporario, caminho)
+
+
+def _caminho_parte(pasta: str, bloco: int, formato: str) -> str:
+    return os.path.join(pasta, f"parte-{bloco:05d}.{formato}")
+
+
+def pontuar_bloco(caminho: str, bloco: dict, cabecalho: str, manter: list, pasta: str, formato: str) -> dict:
+    """
+    Pontua um bloco no worker e grava a parte da saída: coluna COLUNA_LINHA (posição da linha
+    na entrada, a partir de 0), as colunas de 'manter', COLUNA_CATEGORIA e uma coluna
+    PREFIXO_PROBABILIDADE + classe (float32) por classe do modelo (nenhuma no modo "regras").
+    Devolve o resultado anexado a _blocos.jsonl.
+    """
+    inicio = time.perf_counter()
+    dados = _ler_bloco(caminho, bloco, cabecalho, list(dict.fromkeys(FEATURE_COLS + manter)))
+    leitura = time.perf_counter() - inicio
+
+    x = np.column_stack([dados[c].astype(np.float64, copy=False) for c in FEATURE_COLS])
+    if _servico is None:
+        from services.model_service import classify_by_rules
+
+        labels, proba = classify_by_rules(x), None
+    else:
+        labels, proba = _servico.score_many(x, mode=_modo)
+
+    colunas = {COLUNA_LINHA: bloco["linha_inicial"] + np.arange(len(x), dtype=np.int64)}
+    colunas.update({c: dados[c] for c in manter})
+    colunas[COLUNA_CATEGORIA] = labels
+    if proba is not None:
+        for j, classe in enumerate(_servico.classes):
+            colunas[f"{PREFIXO_PROBABILIDADE}{classe}"] = proba[:, j].astype(np.float32)
+    _gravar_parte(colunas, _caminho_parte(pasta, bloco["bloco"], formato), formato)
+
+    nomes, contagens = np.unique(labels.astype(str), return_counts=True)
+    return {
+        "bloco": bloco["bloco"],
+        "linhas": len(x),
+        "segundos": round(time.perf_counter() - inicio, 3),
+        "leitura_s": round(leitura, 3),
+        "categorias": dict(zip(nomes.tolist(), contagens.tolist())),
+        "rss_pico_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "pid": os.getpid(),
+    }
+
+
+# ---------------------------------------------------------------------------
+# Processo principal: manifesto, retomada e pool
+# ---------------------------------------------------------------------------
+
+def _gravar_json(caminho: str, dados: dict):
+    temporario = f"{caminho}.{os.getpid()}.tmp"
+    with open(temporario, "w", encoding="utf-8") as f:
+        json.dump(dados, f, ensure_ascii=False, indent=2)
+    os.replace(temporario, caminho)
+
+
+def _ler_json(caminho: str):
+    if not os.path.exists(caminho):
+        return None
+    with open(caminho, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _ler_concluidos(pasta: str, formato: str) -> dict:
+    """
+    Blocos concluídos (bloco → resultado) cuja parte existe. Uma última linha cortada
+    (interrupção no meio da escrita) é ignorada.
+    """
+    concluidos = {}
+    caminho = os.path.join(pasta, ARQUIVO_BLOCOS)
+    if os.path.exists(caminho):
+        with open(caminho, encoding="utf-8") as f:
+            for linha in f:
+                try:
+                    resultado = json.loads(linha)
+                except ValueError:
+                    continue
+                if os.path.exists(_caminho_parte(pasta, resultado["bloco"], formato)):
+                    concluidos[resultado["bloco"]] = resultado
+    return concluidos
+
+
+def _anexar_bloco(pasta: str, resultado: dict):
+    with open(os.path.join(pasta, ARQUIVO_BLOCOS), "a", encoding="utf-8") as f:
+        f.write(json.dumps(resultado, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _limpar_pasta(pasta: str, partes: bool):
+    # Temporários de partes interrompidas; com partes=True, também as partes e o progresso
+    for nome in os.listdir(pasta):
+        if nome.startswith(".parte-") or partes and (nome.startswith("parte-") or nome == ARQUIVO_BLOCOS):
+            os.remove(os.path.join(pasta, nome))
+
+
+def _abrir_pontuacao(pasta: str, configuracao: dict, caminho: str, tamanho_chunk: int, manter: list,
+                     recomecar: bool) -> tuple:
+    """
+    Confere se a pontuação salva na pasta usa a mesma configuração (entrada, modelo, modo,
+    blocos, saída); com recomecar=True (ou sem pontuação salva) começa uma nova, planejando os
+    blocos. Devolve (plano, blocos já concluídos).
+    """
+    caminho_manifesto = os.path.join(pasta, ARQUIVO_MANIFESTO)
+    salvo = _ler_json(caminho_manifesto)
+    if salvo is not None and salvo["configuracao"] != configuracao and not recomecar:
+        raise ValueError(f"A pontuação salva em {pasta} usa outra configuração; use --recomecar para descartá-la.")
+    _limpar_pasta(pasta, partes=salvo is None or recomecar)
+    if salvo is None or recomecar:
+        salvo = {"configuracao": configuracao, **planejar_blocos(caminho, tamanho_chunk, manter)}
+        _gravar_json(caminho_manifesto, salvo)
+    return salvo, _ler_concluidos(pasta, configuracao["formato"])
+
+
+def juntar_partes(pasta: str, destino: str) -> int:
+    """
+    Junta as partes da pasta, na ordem dos blocos, num único arquivo do mesmo formato (uma
+    parte por vez em memória). Devolve o número de linhas gravadas.
+    """
+    manifesto = _ler_json(os.path.join(pasta, ARQUIVO_MANIFESTO))
+    formato = manifesto["configuracao"]["formato"]
+    partes = [_caminho_parte(pasta, bloco["bloco"], formato) for bloco in manifesto["blocos"]]
+    temporario = f"{destino}.{os.getpid()}.tmp"
+    linhas = 0
+    if formato == "parquet":
+        _, pq = _pyarrow()
+        writer = None
+        try:
+            for parte in partes:
+                tabela = pq.read_table(parte)
+                writer = writer or pq.ParquetWriter(temporario, tabela.schema)
+                writer.write_table(tabela)
+                linhas += tabela.num_rows
+        finally:
+            if writer is not None:
+                writer.close()
+    else:
+        with open(temporario, "wb") as saida:
+            for i, parte in enumerate(partes):
+                with open(parte, "rb") as f:
+                    cabecalho = f.readline()
+                    if i == 0:
+                        saida.write(cabecalho)
+                    for bloco in iter(lambda: f.read(LEITURA_BYTES), b""):
+                        linhas += bloco.count(b"\n")
+                        saida.write(bloco)
+    os.replace(temporario, destino)
+    return linhas
+
+
+def pontuar_arquivo(caminho: str, pasta: str, formato: str = "parquet", modo: str = None, versao: str = None,
+                    caminho_modelo: str = None, processos: int = None, threads: int = 1,
+                    tamanho_chunk: int = 500_000, manter: list = (), recomecar: bool = False,
+                    ao_concluir_bloco=None) -> dict:
+    """
+    Roda as etapas do módulo e devolve o relatório: linhas e blocos (executados/retomados),
+    linhas/s, pico de memória (RSS) do processo principal e do maior worker e a contagem das
+    categorias. O modelo é 'caminho_modelo' ou a versão 'versao' do registro (padrão: a ativa).
+    'processos' padrão: núcleos // threads. 'ao_concluir_bloco(resultado, andamento)' é
+    chamado a cada bloco terminado, com andamento = {"blocos", "total", "linhas", "linhas_s",
+    "rss_pico_mb", "rss_pico_worker_mb"}.
+    """
+    modo = modo or PREDICTION_MODE
+    if modo not in PREDICTION_MODES:
+        raise ValueError(f"Modo de predição inválido: '{modo}' (use um de {PREDICTION_MODES}).")
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato de saída inválido: '{formato}' (use um de {FORMATOS}).")
+    if formato == "parquet" or _formato_entrada(caminho) == "parquet":
+        _pyarrow()
+    manter = list(manter)
+    processos = processos or max(1, (os.cpu_count() or 1) // threads)
+
+    modelo = None
+    if modo != "regras":
+        if caminho_modelo is None:
+            versao, caminho_modelo = model_version_path(versao)
+        modelo = {"versao": versao, "sha256": file_sha256(caminho_modelo)}
+    info = os.stat(caminho)
+    configuracao = {"entrada": {"arquivo": os.path.abspath(caminho), "bytes": info.st_size,
+                                "modificado_ns": info.st_mtime_ns},
+                    "tamanho_chunk": tamanho_chunk, "modo": modo, "modelo": modelo, "formato": formato,
+                    "manter": manter}
+    os.makedirs(pasta, exist_ok=True)
+    plano, concluidos = _abrir_pontuacao(pasta, configuracao, caminho, tamanho_chunk, manter, recomecar)
+
+    blocos = plano["blocos"]
+    pendentes = [bloco for bloco in blocos if bloco["bloco"] not in concluidos]
+    retomados = len(concluidos)
+    linhas = rss_worker = 0
+    inicio = time.perf_counter()
+    if pendentes:
+        # spawn: o LightGBM usa OpenMP, que não convive com fork
+        with ProcessPoolExecutor(max_workers=min(processos, len(pendentes)),
+                                 mp_context=multiprocessing.get_context("spawn"), initializer=_iniciar_worker,
+                                 initargs=(caminho_modelo, modo, threads)) as pool:
+            futuros = [pool.submit(pontuar_bloco, caminho, bloco, plano["cabecalho"], manter, pasta, formato)
+                       for bloco in pendentes]
+            try:
+                for futuro in as_completed(futuros):
+                    resultado = futuro.result()
+                    _anexar_bloco(pasta, resultado)
+                    concluidos[resultado["bloco"]] = resultado
+                    linhas += resultado["linhas"]
+                    rss_worker = max(rss_worker, resultado["rss_pico_mb"])
+                    if ao_concluir_bloco is not None:
+                        ao_concluir_bloco(resultado, {
+                            "blocos": len(concluidos), "total": len(blocos), "linhas": linhas,
+                            "linhas_s": linhas / (time.perf_counter() - inicio),
+                            "rss_pico_mb": _rss_pico_mb(), "rss_pico_worker_mb": rss_worker,
+                        })
+            except BaseException:
+                for futuro in futuros:
+                    futuro.cancel()
+                raise
+    segundos = time.perf_counter() - inicio
+
+    categorias = Counter()
+    for resultado in concluidos.values():
+        categorias.update(resultado["categorias"])
+    return {
+        "pasta": pasta,
+        "linhas": sum(resultado["linhas"] for resultado in concluidos.values()),
+        "blocos": {"total": len(blocos), "executados": len(pendentes), "retomados": retomados},
+        "linhas_executadas": linhas,
+        "segundos": round(segundos, 3),
+        "linhas_s": round(linhas / segundos, 1) if linhas else None,
+        "processos": processos,
+        "threads": threads,
+        "modelo": modelo,
+        "rss_pico_mb": _rss_pico_mb(),
+        "rss_pico_worker_mb": rss_worker or None,
+        "categorias": dict(categorias.most_common()),
+    }
+
+
+def _rss_pico_mb() -> float:
+    # ru_maxrss vem em KiB no Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
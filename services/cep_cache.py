@@ -0,0 +1,185 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+
+BASE_DIR = os.path.dirname(os.path.dirname(__file__))  # volta de services/ para a pasta raiz
+
+# Configurações do cache (podem ser sobrescritas por variáveis de ambiente)
+CEP_CACHE_PATH = os.environ.get("CEP_CACHE_PATH", os.path.join(BASE_DIR, "data", "cep_cache.sqlite"))
+CEP_CACHE_TTL_SEGUNDOS = float(os.environ.get("CEP_CACHE_TTL_SEGUNDOS", 180 * 24 * 3600))  # 180 dias
+CEP_CACHE_TTL_NEGATIVO_SEGUNDOS = float(os.environ.get("CEP_CACHE_TTL_NEGATIVO_SEGUNDOS", 24 * 3600))  # 1 dia
+CEP_CACHE_MAX_MEMORIA = int(os.environ.get("CEP_CACHE_MAX_MEMORIA", 50000))
+
+
+class LocalizacaoCep(NamedTuple):
+    """
+    Coordenadas resolvidas para um CEP. Tem os mesmos atributos usados do geopy.Location
+    (address, latitude, longitude) e guarda em qual nível do fallback a geocodificação deu certo:
+    1 = endereço completo, 2 = sem bairro, 3 = apenas cidade; 4 e 5 = centroide da faixa de
+    CEP / da cidade no índice offline (services/cep_index.py).
+    """
+    address: str
+    latitude: float
+    longitude: float
+    nivel: int
+
+
+class _EntradaCache(NamedTuple):
+    localizacao: Optional[LocalizacaoCep]  # None = cache negativo (CEP não resolvido)
+    expira_em: float
+
+
+def normalizar_cep(cep) -> str:
+    """
+    Remove tudo que não for dígito ("05409-000" → "05409000").
+    """
+    return re.sub(r"\D", "", str(cep))
+
+
+class CepCache:
+    """
+    Cache em dois níveis para CEP → coordenadas:
+      - memória: LRU com tamanho máximo (OrderedDict protegido por lock)
+      - disco: tabela SQLite indexada pelo CEP normalizado
+
+    Entradas positivas guardam endereço, lat/lon e nível do fallback; entradas negativas
+    (CEP que não foi resolvido) expiram mais cedo, com TTL próprio.
+    """
+
+    def __init__(self, caminho: str = CEP_CACHE_PATH, ttl: float = CEP_CACHE_TTL_SEGUNDOS,
+                 ttl_negativo: float = CEP_CACHE_TTL_NEGATIVO_SEGUNDOS, max_memoria: int = CEP_CACHE_MAX_MEMORIA):
+        self.caminho = caminho
+        self.ttl = ttl
+        self.ttl_negativo = ttl_negativo
+        self.max_memoria = max_memoria
+
+        self._memoria = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits_memoria": 0, "hits_disco": 0, "hits_negativos": 0, "misses": 0, "gravacoes": 0}
+
+        if caminho != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+        self._conn = sqlite3.connect(caminho, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS cep_cache (
+                cep        TEXT PRIMARY KEY,
+                address    TEXT,
+                latitude   REAL,
+                longitude  REAL,
+                nivel      INTEGER,
+                expira_em  REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+
+    def buscar(self, cep: str):
+        """
+        Procura o CEP (já normalizado) na memória e depois no disco.
+
+        Retorna a tupla (encontrado, localizacao):
+          - (False, None): miss, é preciso consultar as APIs
+          - (True, None): cache negativo, o CEP já falhou recentemente
+          - (True, LocalizacaoCep): hit
+        """
+        agora = time.time()
+        with self._lock:
+            entrada = self._memoria.get(cep)
+            if entrada is not None and entrada.expira_em > agora:
+                self._memoria.move_to_end(cep)
+                self._registrar_hit(entrada, "hits_memoria")
+                return True, entrada.localizacao
+
+            linha = self._conn.execute(
+                "SELECT address, latitude, longitude, nivel, expira_em FROM cep_cache WHERE cep = ?", (cep,)
+            ).fetchone()
+            if linha is not None and linha[4] > agora:
+                localizacao = LocalizacaoCep(*linha[:4]) if linha[1] is not None else None
+                entrada = _EntradaCache(localizacao, linha[4])
+                self._guardar_memoria(cep, entrada)
+                self._registrar_hit(entrada, "hits_disco")
+                return True, localizacao
+
+            self._stats["misses"] += 1
+            return False, None
+
+    def gravar(self, cep: str, localizacao: Optional[LocalizacaoCep]):
+        """
+        Grava o resultado de uma geocodificação (ou None, para cache negativo) nos dois níveis.
+        """
+        ttl = self.ttl if localizacao is not None else self.ttl_negativo
+        entrada = _EntradaCache(localizacao, time.time() + ttl)
+        valores = localizacao if localizacao is not None else (None, None, None, None)
+
+        with self._lock:
+            self._guardar_memoria(cep, entrada)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cep_cache (cep, address, latitude, longitude, nivel, expira_em) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (cep, *valores, entrada.expira_em)
+            )
+            self._conn.commit()
+            self._stats["gravacoes"] += 1
+
+    def remover(self, cep: str):
+        """
+        Descarta a entrada do CEP nos dois níveis (a próxima busca vai às APIs).
+        """
+        with self._lock:
+            self._memoria.pop(cep, None)
+            self._conn.execute("DELETE FROM cep_cache WHERE cep = ?", (cep,))
+            self._conn.commit()
+
+    def limpar_expirados(self) -> int:
+        """
+        Remove do disco as entradas vencidas. Retorna quantas foram apagadas.
+        """
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM cep_cache WHERE expira_em <= ?", (time.time(),))
+            self._conn.commit()
+            return cursor.rowcount
+
+    def stats(self) -> dict:
+        """
+        Contadores de hit/miss e tamanhos atuais dos dois níveis.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["tamanho_memoria"] = len(self._memoria)
+            stats["tamanho_disco"] = self._conn.execute("SELECT COUNT(*) FROM cep_cache").fetchone()[0]
+        consultas = stats["hits_memoria"] + stats["hits_disco"] + stats["misses"]
+        stats["taxa_hit"] = (consultas - stats["misses"]) / consultas if consultas else 0.0
+        return stats
+
+    def _guardar_memoria(self, cep: str, entrada: _EntradaCache):
+        # Chamado com self._lock adquirido
+        self._memoria[cep] = entrada
+        self._memoria.move_to_end(cep)
+        while len(self._memoria) > self.max_memoria:
+            self._memoria.popitem(last=False)
+
+    def _registrar_hit(self, entrada: _EntradaCache, contador: str):
+        # Chamado com self._lock adquirido
+        self._stats[contador] += 1
+        if entrada.localizacao is None:
+            self._stats["hits_negativos"] += 1
+
+
+_cep_cache = None
+_cep_cache_lock = threading.Lock()
+
+
+def obter_cep_cache() -> CepCache:
+    """
+    Devolve a instância única do cache, criada (e o arquivo SQLite aberto) só no primeiro uso.
+    """
+    global _cep_cache
+    if _cep_cache is None:
+        with _cep_cache_lock:
+            if _cep_cache is None:
+                _cep_cache = CepCache()
+    return _cep_cache
@@ -0,0 +1,226 @@
+import csv
+import logging
+import os
+import threading
+import unicodedata
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.dirname(__file__))  # volta de services/ para a pasta raiz
+
+# Pasta com os arquivos .npy do índice (gerada por utils/construir_indice_cep.py)
+CEP_INDICE_PATH = os.environ.get("CEP_INDICE_PATH", os.path.join(BASE_DIR, "data", "cep_indice"))
+
+# Colunas do índice: faixas de CEP ordenadas pelo início e cidades ordenadas pela chave "cidade|uf"
+_COLUNAS_FAIXAS = ("faixa_inicio", "faixa_fim", "faixa_latitude", "faixa_longitude", "faixa_cidade")
+_COLUNAS_CIDADES = ("cidade_chave", "cidade_nome", "cidade_uf", "cidade_latitude", "cidade_longitude")
+
+
+class CentroideCep(NamedTuple):
+    """
+    Centroide (latitude e longitude) de uma faixa de CEP ou de uma cidade.
+    """
+    cidade: str
+    uf: str
+    latitude: float
+    longitude: float
+
+
+def chave_cidade(cidade: str, uf: str) -> str:
+    """
+    Chave de busca de uma cidade: sem acentos, minúscula e com a UF ("São Paulo", "SP" → "sao paulo|sp").
+    """
+    texto = unicodedata.normalize("NFKD", f"{cidade}|{uf}")
+    return "".join(c for c in texto if not unicodedata.combining(c)).strip().lower()
+
+
+def _faixa_da_linha(linha: dict) -> tuple:
+    """
+    Lê a faixa de CEPs de uma linha do CSV: colunas 'cep_inicio'/'cep_fim' ou um 'prefixo'
+    ("01310" → 01310000 a 01310999).
+    """
+    prefixo = (linha.get("prefixo") or "").strip()
+    if prefixo:
+        digitos = 8 - len(prefixo)
+        return int(prefixo) * 10 ** digitos, (int(prefixo) + 1) * 10 ** digitos - 1
+    return int(linha["cep_inicio"]), int(linha["cep_fim"])
+
+
+def construir_indice(caminho_csv: str, pasta: str = CEP_INDICE_PATH) -> dict:
+    """
+    Gera o índice a partir de um CSV com as colunas:
+        cep_inicio, cep_fim (ou prefixo), cidade, uf, latitude, longitude
+
+    Cada linha é uma faixa de CEPs com o seu centroide (outras colunas são ignoradas). O
+    centroide de cada cidade é a média dos centroides das suas faixas. As faixas não podem se
+    sobrepor.
+
+    Retorna quantas faixas e cidades foram gravadas.
+    """
+    inicios, fins, lats, lons, cidades = [], [], [], [], []
+    nomes = {}
+    with open(caminho_csv, newline="", encoding="utf-8") as f:
+        for linha in csv.DictReader(f):
+            inicio, fim = _faixa_da_linha(linha)
+            if fim < inicio:
+                raise ValueError(f"Faixa de CEP invertida: {inicio:08d}-{fim:08d}")
+            chave = chave_cidade(linha["cidade"], linha["uf"])
+            nomes.setdefault(chave, (linha["cidade"].strip(), linha["uf"].strip().upper()))
+            inicios.append(inicio)
+            fins.append(fim)
+            lats.append(float(linha["latitude"]))
+            lons.append(float(linha["longitude"]))
+            cidades.append(chave)
+
+    # 1) faixas ordenadas pelo início, sem sobreposição
+    ordem = np.argsort(np.asarray(inicios, dtype=np.uint32), kind="stable")
+    faixa_inicio = np.asarray(inicios, dtype=np.uint32)[ordem]
+    faixa_fim = np.asarray(fins, dtype=np.uint32)[ordem]
+    sobrepostas = np.flatnonzero(faixa_inicio[1:] <= faixa_fim[:-1])
+    if sobrepostas.size:
+        i = sobrepostas[0]
+        raise ValueError(f"Faixas de CEP sobrepostas: {faixa_inicio[i]:08d}-{faixa_fim[i]:08d} e "
+                         f"{faixa_inicio[i + 1]:08d}-{faixa_fim[i + 1]:08d}")
+
+    # 2) cidades ordenadas pela chave; cada faixa aponta para a posição da sua cidade
+    chaves = np.asarray(sorted(nomes))
+    faixa_cidade = np.searchsorted(chaves, np.asarray(cidades)[ordem]).astype(np.int32)
+    faixa_latitude = np.asarray(lats, dtype=np.float32)[ordem]
+    faixa_longitude = np.asarray(lons, dtype=np.float32)[ordem]
+
+    contagem = np.bincount(faixa_cidade, minlength=len(chaves))
+    colunas = {
+        "faixa_inicio": faixa_inicio,
+        "faixa_fim": faixa_fim,
+        "faixa_latitude": faixa_latitude,
+        "faixa_longitude": faixa_longitude,
+        "faixa_cidade": faixa_cidade,
+        "cidade_chave": chaves,
+        "cidade_nome": np.asarray([nomes[c][0] for c in chaves]),
+        "cidade_uf": np.asarray([nomes[c][1] for c in chaves]),
+        "cidade_latitude": (np.bincount(faixa_cidade, faixa_latitude, len(chaves)) / contagem).astype(np.float32),
+        "cidade_longitude": (np.bincount(faixa_cidade, faixa_longitude, len(chaves)) / contagem).astype(np.float32),
+    }
+
+    os.makedirs(pasta, exist_ok=True)
+    for nome, valores in colunas.items():
+        np.save(os.path.join(pasta, f"{nome}.npy"), valores)
+    return {"faixas": int(faixa_inicio.size), "cidades": int(chaves.size)}
+
+
+class IndiceCep:
+    """
+    Índice local CEP → centroide, lido com memory-map (np.load(mmap_mode="r")): abrir é
+    instantâneo, as páginas são carregadas sob demanda e compartilhadas entre processos.
+
+    Cada coluna fica num .npy contíguo, então as buscas são binárias (np.searchsorted,
+    O(log n)) direto sobre o arquivo mapeado:
+      - por CEP: última faixa com início <= CEP, se o CEP não passar do fim dela;
+      - por cidade/UF: chave normalizada na lista ordenada de cidades.
+    """
+
+    def __init__(self, pasta: str = CEP_INDICE_PATH):
+        self.pasta = pasta
+        for nome in _COLUNAS_FAIXAS + _COLUNAS_CIDADES:
+            setattr(self, nome, np.load(os.path.join(pasta, f"{nome}.npy"), mmap_mode="r"))
+        self._stats = {"hits_cep": 0, "misses_cep": 0, "hits_cidade": 0, "misses_cidade": 0}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.faixa_inicio)
+
+    def buscar_cep(self, cep: str) -> Optional[CentroideCep]:
+        """
+        Centroide da faixa que contém o CEP (já normalizado, 8 dígitos) ou None.
+        """
+        if len(cep) != 8 or not cep.isdigit():
+            self._contar("misses_cep")
+            return None
+        # Mesmo dtype do array mapeado: senão o numpy converte (copia) a coluna inteira a cada busca
+        numero = np.uint32(cep)
+        i = int(np.searchsorted(self.faixa_inicio, numero, side="right")) - 1
+        if i < 0 or numero > self.faixa_fim[i]:
+            self._contar("misses_cep")
+            return None
+        self._contar("hits_cep")
+        c = int(self.faixa_cidade[i])
+        return CentroideCep(str(self.cidade_nome[c]), str(self.cidade_uf[c]), float(self.faixa_latitude[i]),
+                            float(self.faixa_longitude[i]))
+
+    def buscar_ceps(self, ceps) -> tuple:
+        """
+        Versão vetorizada de buscar_cep para lotes (CEPs já normalizados).
+
+        Retorna (encontrados, latitudes, longitudes): arrays do tamanho da entrada, com NaN nas
+        posições não encontradas.
+        """
+        validos = np.asarray([len(cep) == 8 and cep.isdigit() for cep in ceps], dtype=bool)
+        numeros = np.asarray([int(cep) if ok else 0 for cep, ok in zip(ceps, validos)], dtype=np.uint32)
+        posicoes = np.searchsorted(self.faixa_inicio, numeros, side="right") - 1
+        seguras = np.clip(posicoes, 0, None)
+        encontrados = validos & (posicoes >= 0) & (numeros <= self.faixa_fim[seguras])
+
+        def coluna(valores):
+            return np.where(encontrados, valores[seguras], np.nan)
+
+        self._contar("hits_cep", int(encontrados.sum()))
+        self._contar("misses_cep", int((~encontrados).sum()))
+        return encontrados, coluna(self.faixa_latitude), coluna(self.faixa_longitude)
+
+    def buscar_cidade(self, cidade: str, uf: str) -> Optional[CentroideCep]:
+        """
+        Centroide da cidade (média das suas faixas) ou None.
+        """
+        chave = chave_cidade(cidade, uf)
+        if len(chave) > self.cidade_chave.dtype.itemsize // 4:
+            # Maior que qualquer chave gravada (e evita que o numpy copie a coluna para compará-la)
+            self._contar("misses_cidade")
+            return None
+        c = int(np.searchsorted(self.cidade_chave, np.asarray(chave, dtype=self.cidade_chave.dtype)))
+        if c >= len(self.cidade_chave) or self.cidade_chave[c] != chave:
+            self._contar("misses_cidade")
+            return None
+        self._contar("hits_cidade")
+        return CentroideCep(str(self.cidade_nome[c]), str(self.cidade_uf[c]), float(self.cidade_latitude[c]),
+                            float(self.cidade_longitude[c]))
+
+    def stats(self) -> dict:
+        """
+        Tamanho do índice e contadores de hit/miss.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        stats["faixas"] = len(self.faixa_inicio)
+        stats["cidades"] = len(self.cidade_chave)
+        return stats
+
+    def _contar(self, contador: str, quantidade: int = 1):
+        with self._lock:
+            self._stats[contador] += quantidade
+
+
+_indice = None
+_indice_carregado = False
+_indice_lock = threading.Lock()
+
+
+def obter_indice_cep() -> Optional[IndiceCep]:
+    """
+    Devolve o índice do processo, aberto no primeiro uso, ou None se ele ainda não foi gerado
+    em CEP_INDICE_PATH (o serviço segue só com as APIs).
+    """
+    global _indice, _indice_carregado
+    if not _indice_carregado:
+        with _indice_lock:
+            if not _indice_carregado:
+                try:
+                    _indice = IndiceCep()
+                except FileNotFoundError:
+                    logger.warning("Índice offline de CEP não encontrado em %s; "
+                                   "gere com: python -m utils.construir_indice_cep <csv>", CEP_INDICE_PATH)
+                    _indice = None
+                _indice_carregado = True
+    return _indice
@@ -0,0 +1,381 @@
+import hashlib
+import os
+
+import numpy as np
+
+# Backend de inferência "compilado": as árvores do LightGBM (Booster.dump_model()) viram arrays
+# NumPy contíguos e são percorridas sem passar pela biblioteca — nada de chamada C, pool de
+# threads ou import do lightgbm para predizer.
+#
+# Todos os nós de todas as árvores são numerados juntos: primeiro os internos (feature, limiar,
+# filhos), depois as folhas (valor). No percurso, folhas apontam para si mesmas, então uma linha
+# que já chegou à folha fica parada enquanto as outras continuam descendo.
+
+# Tipos de valor ausente de cada split (missing_type do LightGBM)
+_MISSING_NONE, _MISSING_ZERO, _MISSING_NAN = 0, 1, 2
+_MISSING_TYPES = {"None": _MISSING_NONE, "Zero": _MISSING_ZERO, "NaN": _MISSING_NAN}
+# Mesmo limiar de "zero" do LightGBM (kZeroThreshold)
+_ZERO_THRESHOLD = 1e-35
+
+# Quantos pares (linha, árvore) são percorridos por vez no caminho em lote (limita a memória)
+_PARES_POR_BLOCO = 1 << 18
+
+# Arrays gravados no .npz: nós internos (feature … missing_type, children), folhas (value) e árvores
+_ARRAYS = ("feature", "threshold", "default_left", "missing_type", "children", "value",
+           "roots", "tree_class", "active_trees")
+
+
+def file_sha256(caminho: str) -> str:
+    """
+    SHA-256 do arquivo (identifica o modelo nativo de onde o ensemble foi compilado).
+    """
+    digest = hashlib.sha256()
+    with open(caminho, "rb") as f:
+        for bloco in iter(lambda: f.read(1 << 20), b""):
+            digest.update(bloco)
+    return digest.hexdigest()
+
+
+class CompiledTreeEnsemble:
+    """
+    Ensemble de árvores do LightGBM compilado em arrays NumPy, com a mesma interface de
+    predição do Booster: predict(X) devolve as probabilidades (multiclasse: (n_linhas, n_classes)).
+
+    - Lote: percurso vetorizado e sincronizado por nível — a cada nível, todas as linhas
+      descem um passo em todas as árvores ao mesmo tempo. As árvores ficam ordenadas da mais
+      profunda para a mais rasa, então os níveis mais fundos só percorrem as poucas árvores
+      que ainda têm nós ali.
+    - Uma linha: decide todos os splits do ensemble de uma vez (uma comparação vetorizada) e
+      acha a folha de cada árvore com máscaras de bits, sem percorrer níveis: cada split que
+      manda a linha para a direita elimina as folhas da sua subárvore esquerda, e a folha
+      alcançada é a mais à esquerda que sobra (o AND das máscaras da árvore). Árvores com
+      mais de 64 folhas (ou só uma) caem no percurso por ponteiros.
+
+    Suporta splits numéricos ("<=") com os três tratamentos de ausentes do LightGBM e os
+    objetivos multiclass, multiclassova, binary e regressão (saída identidade).
+    """
+
+    def __init__(self, arrays: dict, num_class: int, objective: str, sigmoid: float = 1.0,
+                 average_output: bool = False, num_iterations: int = 1, feature_names=None, source_sha256=None):
+        for nome in _ARRAYS:
+            setattr(self, nome, arrays[nome])
+        self.num_class = num_class
+        self.objective = objective
+        self.sigmoid = sigmoid
+        self.average_output = average_output
+        self.num_iterations = num_iterations
+        self.feature_names = list(feature_names) if feature_names is not None else None
+        self.source_sha256 = source_sha256
+        self.num_feature = int(self.feature.max()) + 1 if len(self.feature) else 0
+
+        n_internos = len(self.feature)
+        n_nos = n_internos + len(self.value)
+        folhas = np.arange(n_internos, n_nos, dtype=np.intp)
+        # Sem splits que tratam ausentes: NaN vira 0.0 uma vez na entrada e cada passo é uma comparação
+        self._only_missing_none = not self.missing_type.any()
+        # Matriz árvore → classe (one-hot): soma dos valores das folhas por classe num produto de matrizes
+        self._class_matrix = np.zeros((len(self.roots), num_class), dtype=np.float64)
+        self._class_matrix[np.arange(len(self.roots)), self.tree_class] = 1.0
+
+        # Percurso em lote: o estado de cada (árvore, linha) é 2 * nó, e o próximo estado é
+        # _next2[estado + vai_para_direita]; os arrays por nó são repetidos para indexar pelo estado
+        def por_estado(valores_internos, valor_folha):
+            completo = np.concatenate([valores_internos, np.full(len(folhas), valor_folha, dtype=valores_internos.dtype)])
+            return np.repeat(completo, 2)
+
+        self._feature2 = por_estado(self.feature.astype(np.intp), 0)
+        self._threshold2 = por_estado(self.threshold, 0.0)
+        self._missing_type2 = por_estado(self.missing_type, _MISSING_NONE)
+        self._default_left2 = por_estado(self.default_left, True)
+        self._next2 = np.concatenate([2 * self.children.astype(np.intp).ravel(), np.repeat(2 * folhas, 2)])
+        self._roots2 = 2 * self.roots.astype(np.intp)
+
+        # Percurso de uma linha: próximo nó de cada nó (folhas apontam para si mesmas)
+        self._next_base = np.arange(n_nos, dtype=np.intp)
+        self._children_flat = self.children.astype(np.intp).ravel()
+        self._internal_left2 = 2 * np.arange(n_internos, dtype=np.intp)
+        self._feature = self.feature.astype(np.intp)
+        self._roots = self.roots.astype(np.intp)
+        self._n_internal = n_internos
+        self._prepare_bitmasks()
+
+    def _prepare_bitmasks(self):
+        """
+        Máscaras de bits do caminho de uma linha. Os nós internos de cada árvore são contíguos
+        (numerados em pré-ordem a partir da raiz), então o AND por árvore é um reduceat.
+        """
+        self._bitmasks = None
+        if not len(self.roots) or (self._roots >= self._n_internal).any():
+            return
+        mascaras = np.empty(self._n_internal, dtype=np.uint64)
+        valores_folhas = np.zeros((len(self.roots), 64), dtype=np.float64)
+        for k, raiz in enumerate(self._roots):
+            # Pré-ordem (esquerda antes da direita): 'inicio' = folhas já vistas ao chegar no nó
+            inicio, folhas, pendentes = {}, [], [int(raiz)]
+            while pendentes:
+                no = pendentes.pop()
+                inicio[no] = len(folhas)
+                if no >= self._n_internal:
+                    folhas.append(no)
+                else:
+                    pendentes.extend((int(self.children[no, 1]), int(self.children[no, 0])))
+            if len(folhas) > 64:
+                return
+            for no, posicao in inicio.items():
+                if no < self._n_internal:
+                    # Folhas da subárvore esquerda: da posição do filho esquerdo até a do direito
+                    a, b = posicao, inicio[int(self.children[no, 1])]
+                    mascaras[no] = ~(((1 << (b - a)) - 1) << a) & 0xFFFFFFFFFFFFFFFF
+            valores_folhas[k, :len(folhas)] = self.value[np.asarray(folhas) - self._n_internal]
+
+        ordem = np.argsort(self._roots)  # árvores na ordem dos seus nós internos
+        self._bitmasks = mascaras
+        self._bitmask_starts = self._roots[ordem]
+        self._bitmask_values = valores_folhas[ordem].ravel()
+        self._bitmask_offsets = np.arange(len(self.roots), dtype=np.intp) * 64
+        self._bitmask_class_matrix = self._class_matrix[ordem]
+
+    @classmethod
+    def from_booster(cls, booster, source_sha256: str = None) -> "CompiledTreeEnsemble":
+        """
+        Compila um lgb.Booster (a partir de booster.dump_model()).
+        """
+        return cls.from_dump(booster.dump_model(), source_sha256=source_sha256)
+
+    @classmethod
+    def from_dump(cls, dump: dict, source_sha256: str = None) -> "CompiledTreeEnsemble":
+        """
+        Compila o dict de Booster.dump_model(). Levanta ValueError para o que não é suportado
+        (splits categóricos, árvores lineares, objetivos com transformação diferente).
+        """
+        objective, _, parametros = dump["objective"].partition(" ")
+        sigmoid = 1.0
+        for parametro in parametros.split():
+            nome, _, valor = parametro.partition(":")
+            if nome == "sigmoid":
+                sigmoid = float(valor)
+        if objective.startswith("regression"):
+            objective = "regression"
+        elif objective not in ("multiclass", "multiclassova", "binary"):
+            raise ValueError(f"Objetivo do LightGBM não suportado pelo backend compilado: '{dump['objective']}'.")
+
+        por_iteracao = dump["num_tree_per_iteration"]
+        feature, threshold, default_left, missing_type, children, value = [], [], [], [], [], []
+        roots, tree_class, depths = [], [], []
+
+        # Numeração provisória: nós internos >= 0, folhas como ~indice_da_folha (< 0)
+        for arvore in dump["tree_info"]:
+            if arvore.get("is_linear") or arvore.get("num_cat", 0):
+                raise ValueError("Árvores lineares e splits categóricos não são suportados pelo backend compilado.")
+            tree_class.append(arvore["tree_index"] % por_iteracao)
+
+            profundidade = 0
+            raiz = None
+            pendentes = [(arvore["tree_structure"], 0, None)]
+            while pendentes:
+                no, nivel, pai = pendentes.pop()
+                profundidade = max(profundidade, nivel)
+                if "leaf_value" in no:
+                    indice = ~len(value)
+                    value.append(no["leaf_value"])
+                else:
+                    if no["decision_type"] != "<=":
+                        raise ValueError(f"Split '{no['decision_type']}' não suportado pelo backend compilado.")
+                    indice = len(feature)
+                    feature.append(no["split_feature"])
+                    threshold.append(no["threshold"])
+                    default_left.append(no["default_left"])
+                    missing_type.append(_MISSING_TYPES[no["missing_type"]])
+                    children.append([0, 0])
+                    pendentes.append((no["right_child"], nivel + 1, (indice, 1)))
+                    pendentes.append((no["left_child"], nivel + 1, (indice, 0)))
+                if pai is None:
+                    raiz = indice
+                else:
+                    children[pai[0]][pai[1]] = indice
+            roots.append(raiz)
+            depths.append(profundidade)
+
+        # Numeração final: internos 0..I-1, folhas I..I+F-1
+        n_internos = len(feature)
+        def numerar(indices):
+            indices = np.asarray(indices, dtype=np.int64).reshape(-1)
+            return np.where(indices < 0, n_internos + ~indices, indices).astype(np.int32)
+
+        # Árvores da mais profunda para a mais rasa: no nível k só as primeiras active_trees[k] descem
+        ordem = np.argsort(-np.asarray(depths), kind="stable")
+        depths = np.asarray(depths)[ordem]
+        arrays = {
+            "feature": np.asarray(feature, dtype=np.int32),
+            "threshold": np.asarray(threshold, dtype=np.float64),
+            "default_left": np.asarray(default_left, dtype=bool),
+            "missing_type": np.asarray(missing_type, dtype=np.int8),
+            "children": numerar(children).reshape(-1, 2),
+            "value": np.asarray(value, dtype=np.float64),
+            "roots": numerar(roots)[ordem],
+            "tree_class": np.asarray(tree_class, dtype=np.int32)[ordem],
+            "active_trees": np.asarray([(depths > nivel).sum() for nivel in range(int(depths.max(initial=0)))],
+                                       dtype=np.int64),
+        }
+        return cls(arrays, num_class=dump["num_class"], objective=objective, sigmoid=sigmoid,
+                   average_output=dump.get("average_output", False),
+                   num_iterations=max(1, len(dump["tree_info"]) // por_iteracao),
+                   feature_names=dump.get("feature_names"), source_sha256=source_sha256)
+
+    def save(self, caminho: str):
+        """
+        Grava o ensemble num .npz (escreve num temporário e troca no fim).
+        """
+        temporario = f"{caminho}.{os.getpid()}.tmp"
+        with open(temporario, "wb") as f:
+            np.savez(
+                f,
+                **{nome: getattr(self, nome) for nome in _ARRAYS},
+                num_class=self.num_class,
+                objective=self.objective,
+                sigmoid=self.sigmoid,
+                average_output=self.average_output,
+                num_iterations=self.num_iterations,
+                feature_names=np.asarray(self.feature_names or [], dtype=str),
+                source_sha256=self.source_sha256 or "",
+            )
+        os.replace(temporario, caminho)
+
+    @classmethod
+    def load(cls, caminho: str) -> "CompiledTreeEnsemble":
+        """
+        Lê um ensemble gravado por save().
+        """
+        with np.load(caminho) as dados:
+            return cls(
+                {nome: dados[nome] for nome in _ARRAYS},
+                num_class=int(dados["num_class"]),
+                objective=str(dados["objective"]),
+                sigmoid=float(dados["sigmoid"]),
+                average_output=bool(dados["average_output"]),
+                num_iterations=int(dados["num_iterations"]),
+                feature_names=dados["feature_names"].tolist() or None,
+                source_sha256=str(dados["source_sha256"]) or None,
+            )
+
+    def predict(self, X) -> np.ndarray:
+        """
+        Mesma saída de Booster.predict(X): probabilidades (ou valor, na regressão).
+        """
+        return self._transform(self.predict_raw(X))
+
+    def predict_raw(self, X) -> np.ndarray:
+        """
+        Soma dos valores das folhas por classe (Booster.predict(X, raw_score=True)),
+        sempre com shape (n_linhas, num_class).
+        """
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] < self.num_feature:
+            raise ValueError(f"O modelo usa {self.num_feature} features; a entrada tem {X.shape[1]}.")
+        if self._only_missing_none and np.isnan(X).any():
+            X = np.where(np.isnan(X), 0.0, X)
+
+        if X.shape[0] == 1 and self._bitmasks is not None:
+            raw = self._raw_one(X[0])[None, :]
+        elif X.shape[0] == 1:
+            raw = self.value[self._leaves_one(X[0]) - self._n_internal][None, :] @ self._class_matrix
+        else:
+            bloco = max(1, _PARES_POR_BLOCO // max(1, len(self.roots)))
+            folhas = np.concatenate([self._leaves_many(X[i:i + bloco]) for i in range(0, X.shape[0], bloco)]) \
+                if X.shape[0] else np.empty((0, len(self.roots)), dtype=np.intp)
+            raw = self.value[folhas - self._n_internal] @ self._class_matrix
+        if self.average_output:
+            raw /= self.num_iterations
+        return raw
+
+    def _go_right(self, x, threshold, missing_type, default_left):
+        """
+        Decisão dos splits (arrays alinhados com 'x'): True = filho da direita.
+        """
+        tipo = missing_type
+        nan = np.isnan(x)
+        # Como no LightGBM: NaN vira 0.0, exceto nos splits que tratam NaN como ausente
+        x = np.where(nan & (tipo != _MISSING_NAN), 0.0, x)
+        ausente = ((tipo == _MISSING_ZERO) & (np.abs(x) <= _ZERO_THRESHOLD)) | ((tipo == _MISSING_NAN) & nan)
+        return np.where(ausente, ~default_left, x > threshold)
+
+    def _leaves_many(self, X: np.ndarray) -> np.ndarray:
+        """
+        Folha de cada (linha, árvore): percurso sincronizado por nível, todas as linhas juntas.
+        Usa np.take com buffers pré-alocados e mode="clip" (os índices são sempre válidos por
+        construção; com o mode padrão o NumPy ainda copia a saída para um buffer intermediário).
+        """
+        n = X.shape[0]
+        n_arvores = len(self.roots)
+        # Layout (árvore, linha): as árvores ativas de cada nível são um bloco contíguo
+        estado = np.empty((n_arvores, n), dtype=np.intp)
+        estado[:] = self._roots2[:, None]
+        X_plano = np.ascontiguousarray(X.T).ravel()  # feature f da linha i em f * n + i
+        posicao_base = np.arange(n, dtype=np.intp)
+        feature2_n = self._feature2 * n
+        posicao = np.empty_like(estado)
+        x = np.empty(estado.shape, dtype=np.float64)
+        limiar = np.empty_like(x)
+        direita = np.empty(estado.shape, dtype=bool)
+
+        for ativas in self.active_trees:
+            e, p, xa, la, d = estado[:ativas], posicao[:ativas], x[:ativas], limiar[:ativas], direita[:ativas]
+            np.take(feature2_n, e, out=p, mode="clip")
+            p += posicao_base
+            np.take(X_plano, p, out=xa, mode="clip")
+            if self._only_missing_none:
+                np.take(self._threshold2, e, out=la, mode="clip")
+                np.greater(xa, la, out=d)
+            else:
+                d[:] = self._go_right(xa, self._threshold2[e], self._missing_type2[e], self._default_left2[e])
+            e += d
+            np.take(self._next2, e, out=p, mode="clip")
+            e[:] = p
+        return (estado >> 1).T
+
+    def _raw_one(self, x: np.ndarray) -> np.ndarray:
+        """
+        Valores brutos por classe de uma linha, pelas máscaras de bits (ver docstring da classe).
+        """
+        valores = np.take(x, self._feature, mode="clip")
+        if self._only_missing_none:
+            direita = valores > self.threshold
+        else:
+            direita = self._go_right(valores, self.threshold, self.missing_type, self.default_left)
+        # Split que vai para a direita usa a sua máscara; para a esquerda, todos os bits ligados
+        # (True - 1 = 0 e False - 1 = -1, que em 64 bits é 0xFF…FF)
+        mascaras = self._bitmasks | (direita.view(np.int8) - np.int8(1)).astype(np.int64).view(np.uint64)
+        restantes = np.bitwise_and.reduceat(mascaras, self._bitmask_starts)
+        # Bit mais baixo ligado = folha mais à esquerda que sobrou (log2 é exato para potências de 2)
+        menor_bit = restantes & (~restantes + np.uint64(1))
+        posicao = np.log2(menor_bit.astype(np.float64)).astype(np.intp)
+        return np.take(self._bitmask_values, self._bitmask_offsets + posicao, mode="clip") @ self._bitmask_class_matrix
+
+    def _leaves_one(self, x: np.ndarray) -> np.ndarray:
+        """
+        Folha de cada árvore para uma linha: decide todos os splits de uma vez e segue os ponteiros.
+        """
+        valores = np.take(x, self._feature, mode="clip")
+        if self._only_missing_none:
+            direita = valores > self.threshold
+        else:
+            direita = self._go_right(valores, self.threshold, self.missing_type, self.default_left)
+        proximo = self._next_base.copy()
+        proximo[:self._n_internal] = np.take(self._children_flat, self._internal_left2 + direita, mode="clip")
+        nos = self._roots.copy()
+        for ativas in self.active_trees:
+            e = nos[:ativas]
+            np.take(proximo, e, out=e, mode="clip")
+        return nos
+
+    def _transform(self, raw: np.ndarray) -> np.ndarray:
+        if self.objective == "multiclass":
+            exp = np.exp(raw - raw.max(axis=1, keepdims=True))
+            return exp / exp.sum(axis=1, keepdims=True)
+        if self.objective == "multiclassova":
+            return 1.0 / (1.0 + np.exp(-self.sigmoid * raw))
+        if self.objective == "binary":
+            return 1.0 / (1.0 + np.exp(-self.sigmoid * raw[:, 0]))
+        return raw[:, 0] if self.num_class == 1 else raw
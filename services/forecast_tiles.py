@@ -0,0 +1,372 @@
+"""
+Previsões pré-computadas das regiões monitoradas.
+
+Os mesmos poucos milhares de CEPs são consultados o tempo todo. Em vez de buscar o clima e
+pontuar o modelo a cada /consulta, uma thread em segundo plano mantém uma tabela em memória
+(célula da grade → features, categoria, probabilidades, versão do modelo, horário) para as
+células e CEPs listados em PREVISOES_MONITORADAS_PATH. A cada PREVISOES_INTERVALO_SEGUNDOS:
+
+  1) os CEPs ainda não resolvidos que já estão no cache de CEP (ou no índice offline) são
+     ligados à sua célula na hora;
+  2) só as células sem entrada ou vencidas (passou a virada da cadência da Open-Meteo,
+     OPEN_METEO_CADENCIA_SEGUNDOS) são buscadas de novo, em requisições multi-localização;
+  3) as entradas pontuadas por outra versão do modelo são repontuadas com as features
+     guardadas, sem ir à Open-Meteo;
+  4) tudo isso é pontuado numa única chamada vetorizada (score_many) e trocado na tabela;
+  5) depois de pontuar, até PREVISOES_CEPS_POR_RODADA dos CEPs restantes são geocodificados nas
+     APIs, com prioridade de segundo plano na fila do Nominatim (as consultas de usuários passam
+     na frente); entram na tabela na rodada seguinte.
+
+/consulta serve direto da tabela quando a entrada é da versão ativa do modelo e tem no máximo
+PREVISOES_IDADE_MAXIMA_SEGUNDOS; senão segue o caminho normal (busca + predição).
+
+Arquivo de regiões: uma por linha, CEP ("01001-000") ou coordenada ("-23.55,-46.63");
+linhas vazias e comentários (#) são ignorados.
+"""
+import logging
+import os
+import threading
+import time
+from typing import NamedTuple
+
+import numpy as np
+
+from services.api_cep_service import CepInvalido, buscar_localizacao_por_cep, buscar_localizacao_sem_rede
+from services.api_weather_service import VARIAVEIS_HORARIAS, buscar_previsoes_lote, chave_celula
+from services.cep_cache import normalizar_cep
+from services.geocoding_scheduler import PRIORIDADE_FUNDO
+from services.metrics import amostras, medir, registrar_coletor
+from services.model_service import active_model_version, build_feature_matrix, score_many
+from services.weather_cache import OPEN_METEO_CADENCIA_SEGUNDOS
+
+logger = logging.getLogger(__name__)
+
+# Arquivo com os CEPs/coordenadas monitorados (sem ele, a tabela fica desligada)
+PREVISOES_MONITORADAS_PATH = os.environ.get("PREVISOES_MONITORADAS_PATH")
+PREVISOES_INTERVALO_SEGUNDOS = float(os.environ.get("PREVISOES_INTERVALO_SEGUNDOS", 60))
+PREVISOES_IDADE_MAXIMA_SEGUNDOS = float(os.environ.get("PREVISOES_IDADE_MAXIMA_SEGUNDOS", 900))
+# CEPs geocodificados nas APIs por rodada (os do cache e do índice offline não contam)
+PREVISOES_CEPS_POR_RODADA = int(os.environ.get("PREVISOES_CEPS_POR_RODADA", 20))
+
+
+class EntradaPrevisao(NamedTuple):
+    features: np.ndarray    # linha float64 na ordem de FEATURE_COLS (para repontuar sem buscar de novo)
+    previsao: dict          # {"general", "current"}, como em obter_previsao_por_coordenadas_json
+    categoria: str
+    probabilidades: dict    # {classe: probabilidade}, ou None no modo "regras"
+    versao: str             # versão do modelo que pontuou ("regras" no modo "regras")
+    atualizado_em: float    # quando os dados foram buscados na Open-Meteo
+    expira_em: float        # próxima virada da cadência da Open-Meteo
+
+
+class ForecastTiles:
+    """
+    Tabela de previsões pré-computadas por célula da grade (ver a descrição do módulo).
+
+    As dependências são injetáveis: buscar_lote(coordenadas) → (array estruturado, dicts),
+    pontuar(matriz) → (versao, labels, proba, classes), versao_ativa() → versão servida agora,
+    geocodificar(cep) → LocalizacaoCep ou None, localizar(cep) → (encontrado, LocalizacaoCep ou
+    None) sem ir à rede e chave(lat, lon) → célula da grade.
+    """
+
+    def __init__(self, buscar_lote=buscar_previsoes_lote, pontuar=score_many, versao_ativa=active_model_version,
+                 geocodificar=None, localizar=buscar_localizacao_sem_rede, chave=chave_celula,
+                 cadencia: int = OPEN_METEO_CADENCIA_SEGUNDOS, idade_maxima: float = PREVISOES_IDADE_MAXIMA_SEGUNDOS,
+                 ceps_por_rodada: int = PREVISOES_CEPS_POR_RODADA):
+        self.buscar_lote = buscar_lote
+        self.pontuar = pontuar
+        self.versao_ativa = versao_ativa
+        self.geocodificar = geocodificar or _geocodificar_em_segundo_plano
+        self.localizar = localizar
+        self.chave = chave
+        self.ceps_por_rodada = ceps_por_rodada
+        self.cadencia = cadencia
+        self.idade_maxima = idade_maxima
+
+        self._coordenadas = {}          # célula → (lat, lon) monitorada
+        self._ceps_pendentes = set()    # CEPs ainda não geocodificados
+        self._ceps = {}                 # CEP → (LocalizacaoCep, célula)
+        # célula → EntradaPrevisao; a tabela inteira é trocada a cada atualização, nunca alterada no lugar
+        self._entradas = {}
+        self._lock = threading.Lock()
+        self._lock_atualizacao = threading.Lock()
+        self._intervalo = None
+        self._stats = {"hits": 0, "misses": 0, "atualizacoes": 0, "buscadas": 0, "repontuadas": 0, "falhas": 0}
+
+        # A thread de atualização não sobrevive a um fork: o filho a recomeça
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._apos_fork)
+
+    def monitorar(self, ceps=(), coordenadas=()):
+        """
+        Acrescenta CEPs e coordenadas (lat, lon) às regiões monitoradas; entram na próxima atualização.
+        """
+        with self._lock:
+            for cep in ceps:
+                cep = normalizar_cep(cep)
+                if cep and cep not in self._ceps:
+                    self._ceps_pendentes.add(cep)
+            for lat, lon in coordenadas:
+                self._coordenadas.setdefault(self.chave(lat, lon), (float(lat), float(lon)))
+
+    def carregar_arquivo(self, caminho: str) -> int:
+        """
+        Lê o arquivo de regiões (CEP ou "lat,lon" por linha) e devolve quantas linhas válidas leu.
+        """
+        ceps, coordenadas = [], []
+        with open(caminho, encoding="utf-8") as arquivo:
+            for numero, linha in enumerate(arquivo, start=1):
+                linha = linha.split("#", 1)[0].strip()
+                if not linha:
+                    continue
+                if "," in linha:
+                    try:
+                        lat, lon = (float(parte) for parte in linha.split(","))
+                    except ValueError:
+                        logger.warning("Linha %d de %s ignorada: coordenada inválida (%r).", numero, caminho, linha)
+                        continue
+                    coordenadas.append((lat, lon))
+                else:
+                    ceps.append(linha)
+        self.monitorar(ceps, coordenadas)
+        return len(ceps) + len(coordenadas)
+
+    def _servivel(self, entrada) -> bool:
+        return (entrada is not None and entrada.versao == self.versao_ativa()
+                and time.time() - entrada.atualizado_em <= self.idade_maxima)
+
+    def _contar(self, entrada):
+        with self._lock:
+            self._stats["hits" if entrada is not None else "misses"] += 1
+        return entrada
+
+    def obter(self, latitude: float, longitude: float):
+        """
+        EntradaPrevisao da célula de (latitude, longitude) se ela está fresca e foi pontuada pela
+        versão ativa do modelo; senão None.
+        """
+        entrada = self._entradas.get(self.chave(latitude, longitude))
+        return self._contar(entrada if self._servivel(entrada) else None)
+
+    def obter_por_cep(self, cep: str):
+        """
+        (LocalizacaoCep, EntradaPrevisao) de um CEP monitorado com entrada fresca; senão None.
+        Não geocodifica: CEPs fora da tabela devolvem None na hora.
+        """
+        resolvido = self._ceps.get(normalizar_cep(cep))
+        if resolvido is None:
+            return None
+        entrada = self._entradas.get(resolvido[1])
+        if not self._servivel(entrada):
+            return self._contar(None)
+        return resolvido[0], self._contar(entrada)
+
+    def _resolver_ceps(self, limite: int = None):
+        """
+        Liga os CEPs pendentes às suas células. Sem 'limite', só com o que já está na máquina
+        (localizar); com 'limite', geocodifica nas APIs até 'limite' CEPs.
+        """
+        with self._lock:
+            pendentes = sorted(self._ceps_pendentes)
+        if limite is not None:
+            pendentes = pendentes[:limite]
+        for cep in pendentes:
+            try:
+                if limite is None:
+                    encontrado, location = self.localizar(cep)
+                    if not encontrado:
+                        continue
+                else:
+                    location = self.geocodificar(cep)
+            except CepInvalido:
+                with self._lock:
+                    self._ceps_pendentes.discard(cep)
+                logger.warning("CEP monitorado %s inválido; removido da tabela.", cep)
+                continue
+            except Exception as e:
+                # Falha de upstream: tenta de novo na próxima atualização
+                logger.warning("Falha ao geocodificar o CEP monitorado %s: %s", cep, e)
+                continue
+            with self._lock:
+                self._ceps_pendentes.discard(cep)
+                if location is None:
+                    logger.warning("CEP monitorado %s não encontrado; removido da tabela.", cep)
+                    continue
+                celula = self.chave(location.latitude, location.longitude)
+                self._ceps[cep] = (location, celula)
+                self._coordenadas.setdefault(celula, (location.latitude, location.longitude))
+
+    def atualizar(self) -> dict:
+        """
+        Uma rodada de atualização (incremental): liga os CEPs já conhecidos na máquina, busca
+        só as células ausentes ou vencidas, repontua as de outra versão do modelo e pontua tudo
+        numa única chamada. Depois, fora do lock da atualização, geocodifica nas APIs um lote
+        limitado dos CEPs restantes (entram na próxima rodada). Devolve {"buscadas", "repontuadas"}.
+        """
+        try:
+            with self._lock_atualizacao:
+                self._resolver_ceps()
+                return self._atualizar_celulas()
+        finally:
+            if self.ceps_por_rodada > 0:
+                self._resolver_ceps(self.ceps_por_rodada)
+
+    def _atualizar_celulas(self) -> dict:
+        # Chamado com self._lock_atualizacao adquirido
+        agora = time.time()
+        versao = self.versao_ativa()
+        with self._lock:
+            alvos = dict(self._coordenadas)
+        entradas = self._entradas
+
+        buscar = [celula for celula in alvos
+                  if celula not in entradas or entradas[celula].expira_em <= agora]
+        repontuar = [celula for celula in alvos
+                     if celula in entradas and celula not in buscar and entradas[celula].versao != versao]
+        resumo = {"buscadas": 0, "repontuadas": 0}
+        if not buscar and not repontuar:
+            return resumo
+
+        celulas, previsoes, buscado_em, blocos = [], [], [], []
+        if buscar:
+            try:
+                with medir("previsoes_monitoradas_busca"):
+                    estruturado, novas = self.buscar_lote([alvos[celula] for celula in buscar])
+                blocos.append(build_feature_matrix(estruturado))
+                celulas += buscar
+                previsoes += novas
+                buscado_em += [agora] * len(buscar)
+                resumo["buscadas"] = len(buscar)
+            except Exception as e:
+                # As entradas antigas continuam na tabela (e deixam de ser servidas quando envelhecem)
+                logger.warning("Falha ao buscar as previsões monitoradas: %s", e)
+                with self._lock:
+                    self._stats["falhas"] += 1
+        if repontuar:
+            blocos.append(np.vstack([entradas[celula].features for celula in repontuar]))
+            celulas += repontuar
+            previsoes += [entradas[celula].previsao for celula in repontuar]
+            buscado_em += [entradas[celula].atualizado_em for celula in repontuar]
+            resumo["repontuadas"] = len(repontuar)
+        if not celulas:
+            return resumo
+
+        matriz = np.vstack(blocos)
+        versao, labels, proba, classes = self.pontuar(matriz)
+
+        novas_entradas = dict(entradas)
+        for i, (celula, previsao, atualizado_em) in enumerate(zip(celulas, previsoes, buscado_em)):
+            probabilidades = None if proba is None else dict(zip(map(str, classes), proba[i].tolist()))
+            entrada = EntradaPrevisao(matriz[i], previsao, str(labels[i]), probabilidades, versao, atualizado_em,
+                                      (atualizado_em // self.cadencia + 1) * self.cadencia)
+            novas_entradas[celula] = entrada
+            # Também pela célula que a Open-Meteo informou, como no cache da grade (sem
+            # sobrescrever a entrada de outra célula monitorada)
+            celula_grade = self.chave(previsao["general"]["latitude"], previsao["general"]["longitude"])
+            if celula_grade not in alvos:
+                novas_entradas[celula_grade] = entrada
+        self._entradas = novas_entradas
+        with self._lock:
+            self._stats["atualizacoes"] += 1
+            self._stats["buscadas"] += resumo["buscadas"]
+            self._stats["repontuadas"] += resumo["repontuadas"]
+        return resumo
+
+    def iniciar(self, intervalo: float = PREVISOES_INTERVALO_SEGUNDOS):
+        """
+        Thread que chama atualizar() agora e a cada 'intervalo' segundos (uma por processo).
+        """
+        with self._lock:
+            if self._intervalo is not None:
+                return
+            self._intervalo = intervalo
+        threading.Thread(target=self._executar, name="previsoes-monitoradas", daemon=True).start()
+
+    def _executar(self):
+        while True:
+            try:
+                self.atualizar()
+            except Exception as e:
+                logger.warning("Falha ao atualizar as previsões monitoradas: %s", e)
+            time.sleep(self._intervalo)
+
+    def _apos_fork(self):
+        # Locks herdados podem estar em qualquer estado: recria no filho e recomeça a thread
+        self._lock = threading.Lock()
+        self._lock_atualizacao = threading.Lock()
+        intervalo, self._intervalo = self._intervalo, None
+        if intervalo is not None:
+            self.iniciar(intervalo)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "celulas": len(self._coordenadas), "ceps": len(self._ceps),
+                    "ceps_pendentes": len(self._ceps_pendentes)}
+
+
+def _geocodificar_em_segundo_plano(cep: str):
+    # Os CEPs monitorados vão para o fim da fila do Nominatim, atrás das consultas de usuários
+    return buscar_localizacao_por_cep(cep, prioridade=PRIORIDADE_FUNDO)
+
+
+_tabela = ForecastTiles()
+
+
+def iniciar_previsoes_monitoradas():
+    """
+    Carrega PREVISOES_MONITORADAS_PATH e começa as atualizações em segundo plano
+    (não faz nada sem o arquivo configurado).
+    """
+    if not PREVISOES_MONITORADAS_PATH:
+        return
+    try:
+        regioes = _tabela.carregar_arquivo(PREVISOES_MONITORADAS_PATH)
+    except OSError as e:
+        logger.warning("Previsões monitoradas desligadas: não foi possível ler %s (%s).", PREVISOES_MONITORADAS_PATH, e)
+        return
+    logger.info("Previsões monitoradas: %d regiões de %s.", regioes, PREVISOES_MONITORADAS_PATH)
+    _tabela.iniciar(PREVISOES_INTERVALO_SEGUNDOS)
+
+
+def _ativa() -> bool:
+    # Com OPEN_METEO_HORARIAS a resposta de /consulta traz as séries horárias, que a tabela não guarda
+    return bool(PREVISOES_MONITORADAS_PATH) and not VARIAVEIS_HORARIAS
+
+
+def previsao_monitorada_por_cep(cep: str):
+    """
+    (LocalizacaoCep, EntradaPrevisao) pré-computados para o CEP, ou None.
+    """
+    return _tabela.obter_por_cep(cep) if _ativa() else None
+
+
+def previsao_monitorada(latitude: float, longitude: float):
+    """
+    EntradaPrevisao pré-computada da célula de (latitude, longitude), ou None.
+    """
+    return _tabela.obter(latitude, longitude) if _ativa() else None
+
+
+def estatisticas_previsoes_monitoradas() -> dict:
+    return _tabela.stats()
+
+
+@registrar_coletor
+def _coletar_metricas() -> list:
+    """
+    Consultas servidas (ou não) pela tabela, rodadas de atualização e tamanho da tabela.
+    """
+    if not PREVISOES_MONITORADAS_PATH:
+        return []
+    stats = _tabela.stats()
+    metricas = amostras("supernova_previsoes_monitoradas_total", "counter",
+                        "Consultas às previsões pré-computadas por resultado.", "resultado",
+                        {"hit": stats["hits"], "miss": stats["misses"]})
+    metricas += amostras("supernova_previsoes_monitoradas_celulas_total", "counter",
+                         "Células buscadas na Open-Meteo ou repontuadas pelas atualizações.", "tipo",
+                         {"buscada": stats["buscadas"], "repontuada": stats["repontuadas"]})
+    metricas.append(("supernova_previsoes_monitoradas_falhas_total", "counter",
+                     "Rodadas de atualização em que a busca na Open-Meteo falhou.", {}, stats["falhas"]))
+    metricas.append(("supernova_previsoes_monitoradas_celulas", "gauge", "Células monitoradas.", {},
+                     stats["celulas"]))
+    return metricas
@@ -0,0 +1,324 @@
+import asyncio
+import itertools
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter, OrderedDict, defaultdict, deque
+from concurrent.futures import Future
+from concurrent.futures import TimeoutError as FuturoExpirado
+from queue import PriorityQueue
+
+import numpy as np
+from geopy.exc import GeocoderRateLimited
+
+from services.metrics import ERROS_UPSTREAM, RETENTATIVAS_UPSTREAM, medir
+
+# Prioridades na fila do agendador: as consultas de usuários passam na frente das de segundo
+# plano (ex.: CEPs das previsões monitoradas)
+PRIORIDADE_USUARIO = 0
+PRIORIDADE_FUNDO = 1
+
+
+class TokenBucket:
+    """
+    Token bucket thread-safe: 'taxa' fichas por segundo, acumulando no máximo 'capacidade'.
+    """
+
+    def __init__(self, taxa: float, capacidade: float = 1.0):
+        self.taxa = taxa
+        self.capacidade = capacidade
+        self._fichas = capacidade
+        self._ultima = time.monotonic()
+        self._pausado_ate = 0.0
+        self._lock = threading.Lock()
+
+    def aguardar(self) -> float:
+        """
+        Bloqueia até haver uma ficha e a consome. Retorna quantos segundos esperou.
+        """
+        inicio = time.monotonic()
+        while True:
+            with self._lock:
+                agora = time.monotonic()
+                self._fichas = min(self.capacidade, self._fichas + (agora - self._ultima) * self.taxa)
+                self._ultima = agora
+                if agora >= self._pausado_ate and self._fichas >= 1:
+                    self._fichas -= 1
+                    return agora - inicio
+                espera = max(self._pausado_ate - agora, (1 - self._fichas) / self.taxa)
+            time.sleep(espera)
+
+    def pausar(self, segundos: float):
+        """
+        Suspende a liberação de fichas (ex.: o provedor respondeu 429 com Retry-After).
+        """
+        with self._lock:
+            self._pausado_ate = max(self._pausado_ate, time.monotonic() + segundos)
+            self._fichas = 0
+
+
+class TokenBucketCompartilhado(TokenBucket):
+    """
+    Token bucket com o estado num arquivo SQLite, dividido por todos os processos que abrem o
+    mesmo 'caminho' (ex.: os workers do gunicorn): o limite vale para a máquina, não para cada
+    processo. Cada ficha é uma transação curta (BEGIN IMMEDIATE) sobre uma linha por 'nome'.
+    """
+
+    def __init__(self, caminho: str, taxa: float, capacidade: float = 1.0, nome: str = "nominatim"):
+        super().__init__(taxa, capacidade)
+        self.caminho = caminho
+        self.nome = nome
+        self._conn = None
+        self._pid = None
+
+    def aguardar(self) -> float:
+        inicio = time.monotonic()
+        while True:
+            with self._lock:
+                espera = self._transacao(self._consumir)
+            if espera <= 0:
+                return time.monotonic() - inicio
+            time.sleep(espera)
+
+    def pausar(self, segundos: float):
+        with self._lock:
+            self._transacao(lambda fichas, agora, pausado_ate: (0.0, max(pausado_ate, agora + segundos), None))
+
+    def _consumir(self, fichas: float, agora: float, pausado_ate: float) -> tuple:
+        if agora >= pausado_ate and fichas >= 1:
+            return fichas - 1, pausado_ate, 0.0
+        return fichas, pausado_ate, max(pausado_ate - agora, (1 - fichas) / self.taxa)
+
+    def _transacao(self, funcao):
+        """
+        Lê o estado, aplica funcao(fichas, agora, pausado_ate) → (fichas, pausado_ate, retorno)
+        e grava, tudo com o arquivo travado. O relógio é o de parede (time.time()), o único
+        comum aos processos. Chamado com self._lock adquirido.
+        """
+        conn = self._conexao()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            agora = time.time()
+            linha = conn.execute("SELECT fichas, ultima, pausado_ate FROM bucket WHERE nome = ?",
+                                 (self.nome,)).fetchone()
+            fichas, ultima, pausado_ate = linha if linha is not None else (self.capacidade, agora, 0.0)
+            fichas = min(self.capacidade, fichas + max(0.0, agora - ultima) * self.taxa)
+            fichas, pausado_ate, retorno = funcao(fichas, agora, pausado_ate)
+            conn.execute("INSERT OR REPLACE INTO bucket (nome, fichas, ultima, pausado_ate) VALUES (?, ?, ?, ?)",
+                         (self.nome, fichas, agora, pausado_ate))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return retorno
+
+    def _conexao(self) -> sqlite3.Connection:
+        # Uma conexão por processo: a herdada de um fork não pode ser usada no filho
+        if self._conn is None or self._pid != os.getpid():
+            pasta = os.path.dirname(self.caminho)
+            if pasta:
+                os.makedirs(pasta, exist_ok=True)
+            self._conn = sqlite3.connect(self.caminho, timeout=30, isolation_level=None, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS bucket "
+                               "(nome TEXT PRIMARY KEY, fichas REAL, ultima REAL, pausado_ate REAL)")
+            self._pid = os.getpid()
+        return self._conn
+
+
+class GeocodificacaoIndisponivel(RuntimeError):
+    """
+    A fila do agendador está cheia ou a consulta não ficou pronta dentro do prazo: quem chamou
+    cai no caminho degradado em vez de esperar atrás da fila.
+    """
+
+
+class AgendadorGeocodificacao:
+    """
+    Fila central de geocodificação compartilhada por todas as threads (e pelo modo assíncrono).
+
+      - respeita o limite do provedor com um token bucket (o Nominatim público aceita ~1 req/s);
+      - consultas idênticas já em andamento são agrupadas num único Future;
+      - aprende, por cidade, quais níveis do fallback (1 = completo, 2 = sem bairro,
+        3 = apenas cidade) nunca funcionam e passa direto para o nível mais barato que funciona;
+      - atende primeiro as consultas de menor 'prioridade' (PRIORIDADE_USUARIO antes de
+        PRIORIDADE_FUNDO) e, entre as de mesma prioridade, na ordem de chegada;
+      - com 'fila_max' consultas de prioridade igual ou maior na fila (0 = sem limite), recusa
+        as novas na hora (GeocodificacaoIndisponivel) em vez de deixar as threads esperando;
+      - expõe profundidade da fila e tempos de espera em stats().
+
+    'geocodificar' é a função que faz a chamada de fato (ex.: Nominatim.geocode); 'upstream'
+    nomeia as métricas (etapas "<upstream>_n1", "<upstream>_n2"... e erros/retentativas).
+    'bucket' substitui o TokenBucket(taxa, capacidade) do processo, ex.: por um
+    TokenBucketCompartilhado entre os workers.
+    """
+
+    def __init__(self, geocodificar, taxa: float = 1.0, capacidade: float = 1.0, workers: int = 1,
+                 limiar_falhas: int = 3, max_tentativas_429: int = 3, upstream: str = "nominatim",
+                 bucket: TokenBucket = None, fila_max: int = 0, max_cidades: int = 10000):
+        self.geocodificar = geocodificar
+        self.upstream = upstream
+        self.bucket = bucket if bucket is not None else TokenBucket(taxa, capacidade)
+        self.workers = workers
+        self.limiar_falhas = limiar_falhas
+        self.max_tentativas_429 = max_tentativas_429
+        self.fila_max = fila_max
+        self.max_cidades = max_cidades
+
+        self._fila = PriorityQueue()
+        self._sequencia = itertools.count()
+        self._enfileiradas = Counter()  # prioridade → consultas na fila
+        self._em_andamento = {}
+        # cidade → nivel → [sucessos, falhas]; as 'max_cidades' usadas mais recentemente
+        self._niveis_por_cidade = OrderedDict()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._esperas = deque(maxlen=1000)
+        self._stats = {"requisicoes": 0, "agrupadas": 0, "niveis_pulados": 0, "limitadas_429": 0, "erros": 0,
+                       "recusadas": 0}
+
+    def submeter(self, consulta: str, prioridade: int = PRIORIDADE_USUARIO) -> Future:
+        """
+        Enfileira uma consulta (ou reaproveita a mesma consulta já em andamento) e devolve
+        o Future com o resultado do geocodificador. Levanta GeocodificacaoIndisponivel com a
+        fila cheia.
+        """
+        with self._lock:
+            futuro = self._em_andamento.get(consulta)
+            if futuro is not None:
+                self._stats["agrupadas"] += 1
+                return futuro
+            if self.fila_max and sum(n for p, n in self._enfileiradas.items() if p <= prioridade) >= self.fila_max:
+                self._stats["recusadas"] += 1
+                raise GeocodificacaoIndisponivel(f"Fila de geocodificação do {self.upstream} cheia "
+                                                 f"({self.fila_max} consultas).")
+            futuro = Future()
+            self._em_andamento[consulta] = futuro
+            self._enfileiradas[prioridade] += 1
+            self._iniciar_workers()
+        self._fila.put((prioridade, next(self._sequencia), consulta, futuro, time.monotonic()))
+        return futuro
+
+    def geocodificar_niveis(self, cidade: str, consultas: list, timeout: float = None,
+                            prioridade: int = PRIORIDADE_USUARIO):
+        """
+        Tenta as consultas [(nivel, consulta), ...] em ordem, pulando os níveis que já se
+        mostraram inúteis para a cidade. Retorna (localizacao, nivel) ou (None, None).
+        'timeout' é o prazo em segundos para todos os níveis juntos; esgotado, levanta
+        GeocodificacaoIndisponivel (a consulta continua na fila e o resultado é descartado).
+        """
+        prazo = None if timeout is None else time.monotonic() + timeout
+        for nivel, consulta in self._niveis_a_tentar(cidade, consultas):
+            with medir(f"{self.upstream}_n{nivel}"):
+                try:
+                    localizacao = self.submeter(consulta, prioridade).result(timeout=self._restante(prazo))
+                except FuturoExpirado:
+                    raise GeocodificacaoIndisponivel(f"Geocodificação no {self.upstream} passou de {timeout} s.") from None
+            self._registrar(cidade, nivel, localizacao is not None)
+            if localizacao is not None:
+                return localizacao, nivel
+        return None, None
+
+    async def geocodificar_niveis_async(self, cidade: str, consultas: list, timeout: float = None):
+        """
+        Versão para o event loop de geocodificar_niveis (aguarda os Futures sem bloquear).
+        """
+        prazo = None if timeout is None else time.monotonic() + timeout
+        for nivel, consulta in self._niveis_a_tentar(cidade, consultas):
+            futuro = asyncio.wrap_future(self.submeter(consulta))
+            with medir(f"{self.upstream}_n{nivel}"):
+                try:
+                    localizacao = await asyncio.wait_for(asyncio.shield(futuro), timeout=self._restante(prazo))
+                except asyncio.TimeoutError:
+                    raise GeocodificacaoIndisponivel(f"Geocodificação no {self.upstream} passou de {timeout} s.") from None
+            self._registrar(cidade, nivel, localizacao is not None)
+            if localizacao is not None:
+                return localizacao, nivel
+        return None, None
+
+    def stats(self) -> dict:
+        """
+        Profundidade da fila, tempos de espera pelo token bucket (últimas 1000 consultas) e contadores.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            esperas = np.asarray(self._esperas) * 1000
+            stats["em_andamento"] = len(self._em_andamento)
+            stats["cidades_conhecidas"] = len(self._niveis_por_cidade)
+        stats["fila"] = self._fila.qsize()
+        stats["espera_media_ms"] = float(esperas.mean()) if esperas.size else 0.0
+        stats["espera_p95_ms"] = float(np.percentile(esperas, 95)) if esperas.size else 0.0
+        stats["espera_max_ms"] = float(esperas.max()) if esperas.size else 0.0
+        return stats
+
+    @staticmethod
+    def _restante(prazo: float):
+        return None if prazo is None else max(0.0, prazo - time.monotonic())
+
+    def _niveis_a_tentar(self, cidade: str, consultas: list) -> list:
+        """
+        Remove os níveis com pelo menos 'limiar_falhas' falhas e nenhum sucesso nesta cidade
+        (o último nível nunca é removido).
+        """
+        with self._lock:
+            historico = self._niveis_por_cidade.get(cidade, {})
+            tentar = [(nivel, consulta) for nivel, consulta in consultas[:-1]
+                      if not (nivel in historico and historico[nivel][0] == 0
+                              and historico[nivel][1] >= self.limiar_falhas)]
+            self._stats["niveis_pulados"] += len(consultas) - 1 - len(tentar)
+        return tentar + consultas[-1:]
+
+    def _registrar(self, cidade: str, nivel: int, sucesso: bool):
+        with self._lock:
+            historico = self._niveis_por_cidade.get(cidade)
+            if historico is None:
+                historico = self._niveis_por_cidade[cidade] = defaultdict(lambda: [0, 0])
+                if len(self._niveis_por_cidade) > self.max_cidades:
+                    self._niveis_por_cidade.popitem(last=False)
+            else:
+                self._niveis_por_cidade.move_to_end(cidade)
+            historico[nivel][0 if sucesso else 1] += 1
+
+    def _iniciar_workers(self):
+        # Chamado com self._lock adquirido
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._loop_worker, name="geocodificacao", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _loop_worker(self):
+        while True:
+            prioridade, _, consulta, futuro, enfileirada_em = self._fila.get()
+            with self._lock:
+                self._enfileiradas[prioridade] -= 1
+            try:
+                resultado = self._executar(consulta, enfileirada_em)
+            except Exception as e:
+                ERROS_UPSTREAM.incrementar(self.upstream)
+                with self._lock:
+                    self._stats["erros"] += 1
+                    self._em_andamento.pop(consulta, None)
+                futuro.set_exception(e)
+            else:
+                with self._lock:
+                    self._em_andamento.pop(consulta, None)
+                futuro.set_result(resultado)
+
+    def _executar(self, consulta: str, enfileirada_em: float):
+        for tentativa in range(self.max_tentativas_429):
+            self.bucket.aguardar()
+            if tentativa == 0:
+                with self._lock:
+                    self._esperas.append(time.monotonic() - enfileirada_em)
+                    self._stats["requisicoes"] += 1
+            try:
+                return self.geocodificar(consulta)
+            except GeocoderRateLimited as e:
+                # O provedor pediu para esperar: pausa o bucket inteiro, não só esta consulta
+                with self._lock:
+                    self._stats["limitadas_429"] += 1
+                self.bucket.pausar(e.retry_after or 1.0 / self.bucket.taxa)
+                if tentativa == self.max_tentativas_429 - 1:
+                    raise
+                RETENTATIVAS_UPSTREAM.incrementar(self.upstream)
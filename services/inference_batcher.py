@@ -0,0 +1,139 @@
+"""
+Micro-lotes de inferência: junta as predições de uma linha que chegam ao mesmo tempo (várias
+/consulta concorrentes) numa única chamada vetorizada ao modelo.
+
+Cada pedido entra numa fila e recebe um Future. Uma thread dedicada tira da fila até
+'max_linhas' pedidos, esperando no máximo 'espera_max' segundos desde o pedido mais antigo
+para completar o lote, chama executar(itens) uma vez e entrega a cada Future o seu resultado.
+Com a fila cheia ('max_fila' pedidos esperando), submeter() falha na hora com
+FilaInferenciaCheia (a API responde 503) em vez de acumular latência.
+
+Tamanho dos lotes, espera na fila e pedidos rejeitados vão para o /metrics.
+"""
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from services.metrics import Contador, Histograma, medir, registrar_coletor
+from services.model_registry import ModeloIndisponivel
+
+TAMANHO_LOTE = Histograma("supernova_inferencia_lote_linhas", "Linhas por micro-lote de inferência.",
+                          limites=(1, 2, 4, 8, 16, 32, 64, 128, 256))
+ESPERA_FILA = Histograma("supernova_inferencia_fila_segundos", "Espera dos pedidos na fila de inferência.",
+                         limites=(0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1))
+REJEITADOS = Contador("supernova_inferencia_rejeitados_total", "Pedidos recusados com a fila de inferência cheia.")
+
+_agrupadores = []
+
+
+class FilaInferenciaCheia(ModeloIndisponivel):
+    """
+    A fila de inferência está cheia: o pedido é recusado na hora (HTTP 503).
+    """
+
+
+class AgrupadorInferencia:
+    """
+    Fila de pedidos + thread que os executa em micro-lotes (ver a descrição do módulo).
+    'executar' recebe a lista de itens de um lote e devolve os resultados na mesma ordem.
+    """
+
+    def __init__(self, executar, max_linhas: int = 32, espera_max: float = 0.001, max_fila: int = 1024,
+                 nome: str = "inferencia"):
+        self.executar = executar
+        self.max_linhas = max_linhas
+        self.espera_max = espera_max
+        self.max_fila = max_fila
+        self.nome = nome
+
+        self._fila = deque()   # (item, Future, instante em que entrou)
+        self._condicao = threading.Condition()
+        self._thread = None
+        self._stats = {"pedidos": 0, "lotes": 0, "rejeitados": 0}
+        _agrupadores.append(self)
+
+        # A thread não sobrevive a um fork: o filho começa com a fila vazia e sobe a sua no primeiro pedido
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._apos_fork)
+
+    def submeter(self, item) -> Future:
+        """
+        Enfileira um item e devolve o Future com o resultado. Levanta FilaInferenciaCheia se já
+        há max_fila pedidos esperando.
+        """
+        futuro = Future()
+        with self._condicao:
+            if len(self._fila) >= self.max_fila:
+                self._stats["rejeitados"] += 1
+                REJEITADOS.incrementar()
+                raise FilaInferenciaCheia(f"Fila de inferência cheia ({self.max_fila} pedidos).")
+            self._fila.append((item, futuro, time.perf_counter()))
+            self._stats["pedidos"] += 1
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._trabalhar, name=self.nome, daemon=True)
+                self._thread.start()
+            # Acorda a thread no primeiro pedido e quando o lote completa (no meio, ela espera o prazo)
+            if len(self._fila) == 1 or len(self._fila) >= self.max_linhas:
+                self._condicao.notify()
+        return futuro
+
+    def _proximo_lote(self) -> list:
+        with self._condicao:
+            while not self._fila:
+                self._condicao.wait()
+            prazo = self._fila[0][2] + self.espera_max
+            while len(self._fila) < self.max_linhas:
+                restante = prazo - time.perf_counter()
+                if restante <= 0:
+                    break
+                self._condicao.wait(restante)
+            return [self._fila.popleft() for _ in range(min(len(self._fila), self.max_linhas))]
+
+    def _trabalhar(self):
+        while True:
+            pedidos = self._proximo_lote()
+            agora = time.perf_counter()
+            lote = []
+            for item, futuro, entrada in pedidos:
+                # Pedidos cancelados enquanto esperavam (ex.: cliente do modo assíncrono desconectou) saem do lote
+                if futuro.set_running_or_notify_cancel():
+                    ESPERA_FILA.observar(agora - entrada)
+                    lote.append((item, futuro))
+            if not lote:
+                continue
+            TAMANHO_LOTE.observar(len(lote))
+            with self._condicao:
+                self._stats["lotes"] += 1
+            try:
+                with medir("microlote"):
+                    resultados = self.executar([item for item, _ in lote])
+                if len(resultados) != len(lote):
+                    raise RuntimeError(f"Esperados {len(lote)} resultados do micro-lote, recebidos {len(resultados)}.")
+            except BaseException as e:
+                for _, futuro in lote:
+                    futuro.set_exception(e)
+                continue
+            for (_, futuro), resultado in zip(lote, resultados):
+                futuro.set_result(resultado)
+
+    def _apos_fork(self):
+        self._fila = deque()
+        self._condicao = threading.Condition()
+        self._thread = None
+
+    def stats(self) -> dict:
+        with self._condicao:
+            stats = dict(self._stats, fila=len(self._fila))
+        stats["linhas_por_lote"] = stats["pedidos"] / stats["lotes"] if stats["lotes"] else None
+        return stats
+
+
+@registrar_coletor
+def _coletar_metricas() -> list:
+    """
+    Profundidade atual da fila de cada agrupador.
+    """
+    return [("supernova_inferencia_fila", "gauge", "Pedidos esperando na fila de inferência.",
+             {"fila": agrupador.nome}, agrupador.stats()["fila"]) for agrupador in _agrupadores]
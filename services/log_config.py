@@ -0,0 +1,50 @@
+"""
+Configuração dos logs dos serviços e das APIs (loggers "services.*" e "api.*").
+
+LOG_NIVEL define o nível mínimo (padrão: WARNING, para não escrever no stdout a cada
+requisição) e LOG_AMOSTRA a fração dos registros abaixo de WARNING que é de fato escrita
+(ex.: LOG_NIVEL=DEBUG LOG_AMOSTRA=0.01 mostra 1% das mensagens de depuração sob carga).
+Avisos e erros nunca são amostrados. Os registros descartados não chegam a ser formatados.
+"""
+import logging
+import os
+import random
+
+LOG_NIVEL = os.environ.get("LOG_NIVEL", "WARNING").upper()
+LOG_AMOSTRA = float(os.environ.get("LOG_AMOSTRA", 1.0))
+
+LOGGERS = ("services", "api")
+
+
+class FiltroAmostragem(logging.Filter):
+    """
+    Deixa passar só a fração 'taxa' dos registros abaixo de WARNING.
+    """
+
+    def __init__(self, taxa: float):
+        super().__init__()
+        self.taxa = taxa
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.levelno >= logging.WARNING or self.taxa >= 1.0 or random.random() < self.taxa
+
+
+def configurar_logs(nivel: str = LOG_NIVEL, amostra: float = LOG_AMOSTRA):
+    """
+    Aplica nível e amostragem aos loggers do projeto (uma vez; chamadas repetidas só ajustam
+    o nível e a taxa).
+    """
+    for nome in LOGGERS:
+        logger = logging.getLogger(nome)
+        logger.setLevel(nivel)
+        logger.propagate = False
+        if not logger.handlers:
+            handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+            handler.addFilter(FiltroAmostragem(amostra))
+            logger.addHandler(handler)
+        else:
+            for handler in logger.handlers:
+                for filtro in handler.filters:
+                    if isinstance(filtro, FiltroAmostragem):
+                        filtro.taxa = amostra
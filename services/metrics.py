@@ -0,0 +1,246 @@
+"""
+Métricas do processo no formato de texto do Prometheus (endpoint /metrics) e tempos por
+etapa de cada requisição (cabeçalho Server-Timing).
+
+  - Histograma / Contador: séries com rótulos, guardadas em memória; observar um valor é uma
+    busca binária nos limites dos buckets e um incremento sob lock (sem alocação);
+  - medir("etapa"): bloco with que cronometra uma etapa (cep, brazilcep, nominatim_n1,
+    open_meteo, predicao...) em ETAPAS e, se a requisição atual estiver coletando tempos
+    (SERVER_TIMING=1), também na lista que vira o Server-Timing;
+  - registrar_coletor(funcao): valores lidos só na hora do /metrics (ex.: stats() dos caches,
+    que já contam hits e misses), sem custo no caminho da requisição.
+
+As métricas são por processo: com vários workers, cada um expõe as suas.
+"""
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+# Liga o cabeçalho Server-Timing (tempo de cada etapa) nas respostas
+SERVER_TIMING = os.environ.get("SERVER_TIMING", "0") == "1"
+
+# Limites dos buckets dos histogramas de tempo, em segundos (o último bucket é +Inf)
+LIMITES_SEGUNDOS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_metricas = []
+_coletores = []
+_registro_lock = threading.Lock()
+
+
+def _formatar_rotulos(nomes: tuple, valores: tuple, extra: str = None) -> str:
+    pares = [f'{nome}="{_escapar(valor)}"' for nome, valor in zip(nomes, valores)]
+    if extra is not None:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _formatar_valor(valor) -> str:
+    if valor == float("inf"):
+        return "+Inf"
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class _Metrica:
+    tipo = None
+
+    def __init__(self, nome: str, ajuda: str, rotulos: tuple = ()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self._series = {}
+        self._lock = threading.Lock()
+        with _registro_lock:
+            _metricas.append(self)
+
+    def _cabecalho(self) -> list:
+        return [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} {self.tipo}"]
+
+
+class Contador(_Metrica):
+    """
+    Contador monotônico por combinação de rótulos (ex.: erros por upstream).
+    """
+    tipo = "counter"
+
+    def incrementar(self, *valores_rotulos, valor: float = 1):
+        with self._lock:
+            self._series[valores_rotulos] = self._series.get(valores_rotulos, 0) + valor
+
+    def valor(self, *valores_rotulos) -> float:
+        return self._series.get(valores_rotulos, 0)
+
+    def exportar(self) -> list:
+        with self._lock:
+            series = sorted(self._series.items())
+        linhas = self._cabecalho()
+        for valores, total in series:
+            linhas.append(f"{self.nome}{_formatar_rotulos(self.rotulos, valores)} {_formatar_valor(total)}")
+        return linhas
+
+
+class Histograma(_Metrica):
+    """
+    Histograma de buckets fixos por combinação de rótulos, com soma e contagem.
+    """
+    tipo = "histogram"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: tuple = (), limites: tuple = LIMITES_SEGUNDOS):
+        super().__init__(nome, ajuda, rotulos)
+        self.limites = tuple(limites)
+
+    def observar(self, valor: float, *valores_rotulos):
+        indice = bisect_left(self.limites, valor)
+        with self._lock:
+            serie = self._series.get(valores_rotulos)
+            if serie is None:
+                # [contagem por bucket (o último é +Inf)..., soma]
+                serie = self._series[valores_rotulos] = [0] * (len(self.limites) + 1) + [0.0]
+            serie[indice] += 1
+            serie[-1] += valor
+
+    def resumo(self, *valores_rotulos) -> dict:
+        """
+        Contagem, soma e percentis aproximados (limite superior do bucket) de uma série.
+        """
+        with self._lock:
+            serie = list(self._series.get(valores_rotulos, [0] * (len(self.limites) + 1) + [0.0]))
+        contagens, soma = serie[:-1], serie[-1]
+        total = sum(contagens)
+        resumo = {"contagem": total, "soma": soma}
+        for nome, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+            acumulado, limite = 0, None
+            for i, n in enumerate(contagens):
+                acumulado += n
+                if total and acumulado >= q * total:
+                    limite = self.limites[i] if i < len(self.limites) else float("inf")
+                    break
+            resumo[nome] = limite
+        return resumo
+
+    def exportar(self) -> list:
+        with self._lock:
+            series = sorted((valores, list(serie)) for valores, serie in self._series.items())
+        linhas = self._cabecalho()
+        for valores, serie in series:
+            acumulado = 0
+            for limite, n in zip(self.limites + (float("inf"),), serie[:-1]):
+                acumulado += n
+                le = f'le="{_formatar_valor(float(limite))}"'
+                linhas.append(f"{self.nome}_bucket{_formatar_rotulos(self.rotulos, valores, le)} {acumulado}")
+            rotulos = _formatar_rotulos(self.rotulos, valores)
+            linhas.append(f"{self.nome}_sum{rotulos} {_formatar_valor(serie[-1])}")
+            linhas.append(f"{self.nome}_count{rotulos} {acumulado}")
+        return linhas
+
+
+# Métricas comuns aos serviços e às APIs
+ETAPAS = Histograma("supernova_etapa_segundos", "Tempo de cada etapa do atendimento.", ("etapa",))
+REQUISICOES = Contador("supernova_requisicoes_total", "Requisições HTTP atendidas.", ("rota", "status"))
+DURACAO_REQUISICOES = Histograma("supernova_requisicao_segundos", "Tempo total das requisições HTTP.", ("rota",))
+ERROS_UPSTREAM = Contador("supernova_upstream_erros_total", "Falhas nas chamadas aos upstreams.", ("upstream",))
+RETENTATIVAS_UPSTREAM = Contador("supernova_upstream_retentativas_total",
+                                 "Novas tentativas de chamadas aos upstreams.", ("upstream",))
+
+# Tempos das etapas da requisição atual, quando ela coleta Server-Timing (None = não coleta)
+_tempos_requisicao = ContextVar("tempos_requisicao", default=None)
+
+
+class _Cronometro:
+    __slots__ = ("nome", "_inicio")
+
+    def __init__(self, nome: str):
+        self.nome = nome
+
+    def __enter__(self):
+        self._inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        duracao = time.perf_counter() - self._inicio
+        ETAPAS.observar(duracao, self.nome)
+        tempos = _tempos_requisicao.get()
+        if tempos is not None:
+            tempos.append((self.nome, duracao))
+        return False
+
+
+def medir(nome: str) -> _Cronometro:
+    """
+    Cronometra o bloco como a etapa 'nome' (with medir("open_meteo"): ...). Funciona também
+    em volta de await, no modo assíncrono.
+    """
+    return _Cronometro(nome)
+
+
+def amostras(nome: str, tipo: str, ajuda: str, rotulo: str, valores: dict) -> list:
+    """
+    Monta as amostras de um coletor a partir de um dict {valor do rótulo: número}.
+    """
+    return [(nome, tipo, ajuda, {rotulo: chave}, valor) for chave, valor in valores.items()]
+
+
+def iniciar_server_timing():
+    """
+    Começa a coletar os tempos das etapas da requisição atual. Devolve o token para
+    encerrar_server_timing, ou None se SERVER_TIMING está desligado.
+    """
+    if not SERVER_TIMING:
+        return None
+    return _tempos_requisicao.set([])
+
+
+def encerrar_server_timing(token, total: float = None):
+    """
+    Para a coleta iniciada com o token e devolve o valor do cabeçalho Server-Timing
+    ("cep;dur=12.3, open_meteo;dur=80.1, total;dur=95.0", em ms), ou None.
+    """
+    if token is None:
+        return None
+    tempos = _tempos_requisicao.get() or []
+    _tempos_requisicao.reset(token)
+    if total is not None:
+        tempos = tempos + [("total", total)]
+    return ", ".join(f"{nome};dur={duracao * 1000:.1f}" for nome, duracao in tempos) or None
+
+
+def registrar_coletor(funcao):
+    """
+    Registra funcao() → [(nome, tipo, ajuda, {rótulo: valor}, valor), ...], chamada a cada
+    exportação (tipo "counter" ou "gauge"). Um coletor que falha é ignorado naquela exportação.
+    """
+    with _registro_lock:
+        _coletores.append(funcao)
+    return funcao
+
+
+def exportar_prometheus() -> str:
+    """
+    Todas as métricas e coletores no formato de texto do Prometheus (versão 0.0.4).
+    """
+    with _registro_lock:
+        metricas, coletores = list(_metricas), list(_coletores)
+    linhas = []
+    for metrica in metricas:
+        linhas.extend(metrica.exportar())
+
+    familias = {}
+    for coletor in coletores:
+        try:
+            amostras = list(coletor())
+        except Exception:
+            continue
+        for nome, tipo, ajuda, rotulos, valor in amostras:
+            familias.setdefault((nome, tipo, ajuda), []).append((rotulos, valor))
+    for (nome, tipo, ajuda), amostras in familias.items():
+        linhas.append(f"# HELP {nome} {ajuda}")
+        linhas.append(f"# TYPE {nome} {tipo}")
+        for rotulos, valor in amostras:
+            linhas.append(f"{nome}{_formatar_rotulos(tuple(rotulos), tuple(rotulos.values()))} "
+                          f"{_formatar_valor(valor)}")
+    return "\n".join(linhas) + "\n"
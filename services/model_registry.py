@@ -0,0 +1,406 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class ModeloIndisponivel(RuntimeError):
+    """
+    O modelo ainda está carregando (e não ficou pronto dentro do tempo de espera) ou falhou ao carregar.
+    """
+
+
+class ArmazemModelos:
+    """
+    Versões de modelo em disco, uma pasta por versão (v0001, v0002, ...), cada uma com o modelo
+    nativo (modelo.txt) e os metadados (modelo.json: classes, features, métricas, data de criação).
+    Versões publicadas nunca são alteradas.
+
+    O ponteiro ativo.json diz qual versão os processos servem ("ativa"), a anterior (para o
+    rollback) e a versão em sombra, se houver. Todos os processos da API leem o mesmo ponteiro,
+    então trocar a versão num worker vale para todos (ver ModelRegistry.iniciar_vigia).
+    """
+
+    ARQUIVO_MODELO = "modelo.txt"
+    ARQUIVO_META = "modelo.json"
+    ARQUIVO_PONTEIRO = "ativo.json"
+
+    def __init__(self, pasta: str):
+        self.pasta = pasta
+        self._lock = threading.Lock()
+
+    def versoes(self) -> list:
+        """
+        Versões publicadas, da mais antiga para a mais nova.
+        """
+        if not os.path.isdir(self.pasta):
+            return []
+        return sorted(nome for nome in os.listdir(self.pasta)
+                      if nome.startswith("v") and nome[1:].isdigit()
+                      and os.path.exists(os.path.join(self.pasta, nome, self.ARQUIVO_MODELO)))
+
+    def caminho_modelo(self, versao: str) -> str:
+        """
+        Caminho do modelo nativo da versão. Levanta ValueError se a versão não existe.
+        """
+        if versao not in self.versoes():
+            raise ValueError(f"Versão de modelo inexistente: '{versao}'.")
+        return os.path.join(self.pasta, versao, self.ARQUIVO_MODELO)
+
+    def metadados(self, versao: str) -> dict:
+        with open(os.path.join(self.pasta, versao, self.ARQUIVO_META), encoding="utf-8") as f:
+            return json.load(f)
+
+    def listar(self) -> list:
+        """
+        Versões com data de criação, origem e métricas (sem classes e features).
+        """
+        versoes = []
+        for versao in self.versoes():
+            meta = self.metadados(versao)
+            versoes.append({"versao": versao, "criado_em": meta.get("criado_em"), "origem": meta.get("origem"),
+                            "metricas": meta.get("metricas")})
+        return versoes
+
+    def publicar(self, arquivo_modelo: str, origem: str = None) -> str:
+        """
+        Copia um modelo nativo (e o JSON de metadados ao lado dele) como uma versão nova e
+        devolve o nome da versão. A pasta é montada num temporário e renomeada no fim.
+        """
+        os.makedirs(self.pasta, exist_ok=True)
+        temporaria = os.path.join(self.pasta, f".publicando-{os.getpid()}-{threading.get_ident()}")
+        shutil.rmtree(temporaria, ignore_errors=True)
+        os.makedirs(temporaria)
+        shutil.copyfile(arquivo_modelo, os.path.join(temporaria, self.ARQUIVO_MODELO))
+        with open(os.path.splitext(arquivo_modelo)[0] + ".json", encoding="utf-8") as f:
+            meta = json.load(f)
+        meta["criado_em"] = time.strftime("%Y-%m-%dT%H:%M:%S%z")
+        meta["origem"] = origem
+        with open(os.path.join(temporaria, self.ARQUIVO_META), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+
+        # Próximo número livre; se outro processo publicar ao mesmo tempo, o rename falha e tenta o seguinte
+        versoes = self.versoes()
+        numero = int(versoes[-1][1:]) + 1 if versoes else 1
+        while True:
+            versao = f"v{numero:04d}"
+            try:
+                os.rename(temporaria, os.path.join(self.pasta, versao))
+                return versao
+            except OSError:
+                if not os.path.exists(os.path.join(self.pasta, versao)):
+                    raise
+                numero += 1
+
+    def ponteiro(self) -> dict:
+        """
+        Conteúdo do ativo.json: {"ativa", "anterior", "sombra", "fracao_sombra"}. Sem ponteiro
+        gravado, a ativa é a versão mais nova.
+        """
+        try:
+            with open(os.path.join(self.pasta, self.ARQUIVO_PONTEIRO), encoding="utf-8") as f:
+                ponteiro = json.load(f)
+        except FileNotFoundError:
+            versoes = self.versoes()
+            ponteiro = {"ativa": versoes[-1] if versoes else None}
+        return {"ativa": ponteiro.get("ativa"), "anterior": ponteiro.get("anterior"),
+                "sombra": ponteiro.get("sombra"), "fracao_sombra": ponteiro.get("fracao_sombra", 0.0)}
+
+    def gravar_ponteiro(self, **mudancas) -> dict:
+        """
+        Atualiza campos do ponteiro (escrita atômica: temporário + os.replace) e devolve o novo.
+        Ao mudar a "ativa", a ativa de antes vira a "anterior".
+        """
+        with self._lock:
+            ponteiro = self.ponteiro()
+            if "ativa" in mudancas and mudancas["ativa"] != ponteiro["ativa"]:
+                ponteiro["anterior"] = ponteiro["ativa"]
+            ponteiro.update(mudancas)
+            os.makedirs(self.pasta, exist_ok=True)
+            caminho = os.path.join(self.pasta, self.ARQUIVO_PONTEIRO)
+            temporario = f"{caminho}.{os.getpid()}.tmp"
+            with open(temporario, "w", encoding="utf-8") as f:
+                json.dump(ponteiro, f, ensure_ascii=False, indent=2)
+            os.replace(temporario, caminho)
+            return ponteiro
+
+
+class ModelRegistry:
+    """
+    Guarda o modelo ativo do processo (e o candidato em sombra) e controla o carregamento das
+    versões do ArmazemModelos.
+
+    O primeiro carregamento pode ser:
+      - preguiçoso: na primeira chamada de obter();
+      - em segundo plano: iniciar() dispara uma thread e obter() espera até o modelo ficar pronto;
+      - imediato: carregar() no processo principal, antes de um fork (workers pré-forkados
+        herdam o modelo já carregado e compartilham a memória por copy-on-write).
+
+    Trocas de versão (trocar/reverter) carregam a versão nova numa thread e só então substituem
+    o par (versão, modelo) de uma vez, numa única atribuição: as predições em andamento terminam
+    com o modelo que já tinham em mãos e o caminho de predição (obter) nunca pega lock.
+
+    'carregar_modelo(versao)' constrói e devolve o modelo de uma versão; 'preparar_armazem()' é
+    chamada quando o armazém está vazio e deve publicar a versão inicial (devolve o nome dela).
+    """
+
+    NAO_CARREGADO = "nao_carregado"
+    CARREGANDO = "carregando"
+    PRONTO = "pronto"
+    ERRO = "erro"
+
+    def __init__(self, carregar_modelo, armazem: ArmazemModelos, preparar_armazem=None):
+        self._carregar_modelo = carregar_modelo
+        self._armazem = armazem
+        self._preparar_armazem = preparar_armazem
+        # Par (versão, modelo) servido; trocado inteiro, nunca alterado no lugar
+        self._ativo = None
+        # Tupla (versão, modelo, fração) do candidato em sombra, ou None
+        self._sombra = None
+        self._estado = self.NAO_CARREGADO
+        self._erro = None
+        self._segundos_carregamento = None
+        # Última troca de versão pedida: {"versao", "estado", "erro"}
+        self._troca = None
+        self._pronto = threading.Event()
+        self._lock = threading.Lock()
+        self._lock_troca = threading.Lock()
+        self._intervalo_vigia = None
+
+        # As threads (carregamento e vigia) não sobrevivem a um fork: o filho recomeça o que faltar
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._apos_fork)
+
+    def iniciar(self):
+        """
+        Começa a carregar o modelo numa thread em segundo plano (não faz nada se já começou).
+        """
+        with self._lock:
+            if self._estado != self.NAO_CARREGADO:
+                return
+            self._estado = self.CARREGANDO
+        threading.Thread(target=self._executar_carregamento, name="carregar-modelo", daemon=True).start()
+
+    def carregar(self):
+        """
+        Carrega o modelo na thread atual (ou espera o carregamento em andamento) e o devolve.
+        """
+        with self._lock:
+            iniciar_aqui = self._estado == self.NAO_CARREGADO
+            if iniciar_aqui:
+                self._estado = self.CARREGANDO
+        if iniciar_aqui:
+            self._executar_carregamento()
+        return self.obter()
+
+    def obter(self, timeout: float = None):
+        """
+        Devolve o modelo ativo. Se ninguém começou a carregá-lo, carrega agora (modo preguiçoso);
+        se está carregando, espera até 'timeout' segundos. Levanta ModeloIndisponivel se o modelo
+        não ficar pronto a tempo ou se o carregamento falhou.
+        """
+        return self.obter_versao(timeout)[1]
+
+    def obter_versao(self, timeout: float = None) -> tuple:
+        """
+        Como obter(), mas devolve o par (versão, modelo).
+        """
+        ativo = self._ativo
+        if ativo is not None:
+            return ativo
+        if self._estado == self.NAO_CARREGADO:
+            self.carregar()
+        elif not self._pronto.wait(timeout):
+            raise ModeloIndisponivel("Modelo ainda está carregando.")
+        if self._estado == self.ERRO:
+            raise ModeloIndisponivel(f"Falha ao carregar o modelo: {self._erro}")
+        return self._ativo
+
+    def versao_ativa(self):
+        """
+        Versão servida neste processo, ou None se o modelo ainda não carregou (não espera).
+        """
+        ativo = self._ativo
+        return ativo[0] if ativo is not None else None
+
+    def sombra(self):
+        """
+        (versão, modelo, fração) do candidato em sombra, ou None.
+        """
+        return self._sombra
+
+    def trocar(self, versao: str, persistir: bool = True):
+        """
+        Carrega 'versao' em segundo plano e a coloca no lugar da ativa quando estiver pronta.
+        Com persistir=True grava o ponteiro (os outros processos seguem a troca). Levanta
+        ValueError se a versão não existe.
+        """
+        self._armazem.caminho_modelo(versao)
+        pedido = {"versao": versao, "estado": self.CARREGANDO}
+        with self._lock:
+            self._troca = pedido
+        threading.Thread(target=self._executar_troca, args=(pedido, persistir), name="trocar-modelo",
+                         daemon=True).start()
+
+    def reverter(self) -> str:
+        """
+        Volta para a versão anterior do ponteiro (em segundo plano, como trocar) e devolve o nome dela.
+        """
+        anterior = self._armazem.ponteiro()["anterior"]
+        if anterior is None:
+            raise ValueError("Não há versão anterior para voltar.")
+        self.trocar(anterior)
+        return anterior
+
+    def definir_sombra(self, versao, fracao: float = 1.0, persistir: bool = True):
+        """
+        Pontua em sombra uma fração do tráfego com a versão candidata (carregada em segundo
+        plano); versao=None desliga a sombra.
+        """
+        if versao is not None:
+            self._armazem.caminho_modelo(versao)
+        if persistir:
+            self._armazem.gravar_ponteiro(sombra=versao, fracao_sombra=fracao)
+        if versao is None:
+            self._sombra = None
+            return
+
+        def carregar_sombra():
+            try:
+                modelo = self._carregar_modelo(versao)
+            except Exception as e:
+                self._troca = {"versao": versao, "estado": self.ERRO, "erro": f"sombra: {e}"}
+                return
+            self._sombra = (versao, modelo, fracao)
+
+        threading.Thread(target=carregar_sombra, name="carregar-sombra", daemon=True).start()
+
+    def sincronizar(self):
+        """
+        Segue o ponteiro gravado por outro processo: troca a ativa e a sombra se mudaram.
+        """
+        ponteiro = self._armazem.ponteiro()
+        ativo, troca = self._ativo, self._troca
+        em_troca = troca is not None and troca["estado"] == self.CARREGANDO
+        if (ponteiro["ativa"] and ativo is not None and ponteiro["ativa"] != ativo[0]
+                and not (em_troca and troca["versao"] == ponteiro["ativa"])):
+            self.trocar(ponteiro["ativa"], persistir=False)
+
+        sombra = self._sombra
+        if ponteiro["sombra"] is None and sombra is not None:
+            self._sombra = None
+        elif ponteiro["sombra"] is not None:
+            if sombra is None or sombra[0] != ponteiro["sombra"]:
+                self.definir_sombra(ponteiro["sombra"], ponteiro["fracao_sombra"], persistir=False)
+            elif sombra[2] != ponteiro["fracao_sombra"]:
+                self._sombra = (sombra[0], sombra[1], ponteiro["fracao_sombra"])
+
+    def iniciar_vigia(self, intervalo: float):
+        """
+        Thread que chama sincronizar() a cada 'intervalo' segundos (uma por processo).
+        """
+        with self._lock:
+            if self._intervalo_vigia is not None:
+                return
+            self._intervalo_vigia = intervalo
+        threading.Thread(target=self._vigiar, name="vigia-modelo", daemon=True).start()
+
+    def estado(self) -> dict:
+        """
+        Estado do carregamento ("nao_carregado", "carregando", "pronto" ou "erro"), quanto tempo
+        levou, o erro (se houver), a versão ativa, a última troca pedida e a sombra.
+        """
+        estado = {"estado": self._estado}
+        if self._segundos_carregamento is not None:
+            estado["segundos_carregamento"] = round(self._segundos_carregamento, 3)
+        if self._erro is not None:
+            estado["erro"] = self._erro
+        ativo, sombra = self._ativo, self._sombra
+        if ativo is not None:
+            estado["versao"] = ativo[0]
+        if self._troca is not None:
+            estado["troca"] = dict(self._troca)
+        if sombra is not None:
+            estado["sombra"] = {"versao": sombra[0], "fracao": sombra[2]}
+        return estado
+
+    def _versao_inicial(self) -> str:
+        versao = self._armazem.ponteiro()["ativa"]
+        if versao is None and self._preparar_armazem is not None:
+            versao = self._preparar_armazem()
+        if versao is None:
+            raise ModeloIndisponivel("Nenhuma versão de modelo publicada.")
+        return versao
+
+    def _executar_carregamento(self):
+        inicio = time.perf_counter()
+        try:
+            versao = self._versao_inicial()
+            self._ativo = (versao, self._carregar_modelo(versao))
+            ponteiro = self._armazem.ponteiro()
+            if ponteiro["sombra"] is not None:
+                self.definir_sombra(ponteiro["sombra"], ponteiro["fracao_sombra"], persistir=False)
+        except Exception as e:
+            self._erro = str(e) or type(e).__name__
+            self._estado = self.ERRO
+        else:
+            self._estado = self.PRONTO
+        self._segundos_carregamento = time.perf_counter() - inicio
+        self._pronto.set()
+
+    def _executar_troca(self, pedido: dict, persistir: bool):
+        # Uma troca carrega por vez; um pedido que já foi substituído por outro mais novo é descartado
+        with self._lock_troca:
+            if self._troca is not pedido:
+                return
+            versao = pedido["versao"]
+            try:
+                modelo = self._carregar_modelo(versao)
+            except Exception as e:
+                with self._lock:
+                    if self._troca is pedido:
+                        self._troca = {"versao": versao, "estado": self.ERRO, "erro": str(e) or type(e).__name__}
+                return
+            with self._lock:
+                if self._troca is not pedido:
+                    return
+                if persistir:
+                    self._armazem.gravar_ponteiro(ativa=versao)
+                self._ativo = (versao, modelo)
+                self._troca = {"versao": versao, "estado": self.PRONTO}
+                if self._estado != self.PRONTO:
+                    self._erro = None
+                    self._estado = self.PRONTO
+                    self._pronto.set()
+
+    def _vigiar(self):
+        while True:
+            time.sleep(self._intervalo_vigia)
+            if self._ativo is None:
+                continue
+            try:
+                self.sincronizar()
+            except Exception as e:
+                logger.warning("Falha ao sincronizar a versão do modelo: %s", e)
+
+    def _apos_fork(self):
+        # Locks e Events herdados podem estar em qualquer estado: recria todos no filho
+        self._lock = threading.Lock()
+        self._lock_troca = threading.Lock()
+        pronto = self._pronto.is_set()
+        self._pronto = threading.Event()
+        if pronto:
+            self._pronto.set()
+        elif self._estado == self.CARREGANDO:
+            # O fork aconteceu no meio do carregamento em segundo plano: recomeça neste processo
+            self._estado = self.NAO_CARREGADO
+            self.iniciar()
+        if self._troca is not None and self._troca["estado"] == self.CARREGANDO:
+            self.trocar(self._troca["versao"], persistir=False)
+        intervalo, self._intervalo_vigia = self._intervalo_vigia, None
+        if intervalo is not None:
+            self.iniciar_vigia(intervalo)
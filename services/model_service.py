@@ -1,17 +1,52 @@
+import gc
+import json
+import multiprocessing
 import os
-import pandas as pd
+import random
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from collections.abc import Mapping
+from itertools import chain
+from operator import itemgetter
+
 import numpy as np
-from sklearn.preprocessing import LabelEncoder
-from sklearn.model_selection import train_test_split
-from sklearn.metrics import classification_report, roc_auc_score
-import lightgbm as lgb
-import joblib
+
+from services.compiled_trees import CompiledTreeEnsemble, file_sha256
+from services.inference_batcher import AgrupadorInferencia
+from services.metrics import medir, registrar_coletor
+from services.model_registry import ArmazemModelos, ModelRegistry, ModeloIndisponivel
+from services.rules_service import AgreementStats, categorize_many, categorize_one, evaluate_rules, evaluate_rules_one
+
+# lightgbm, pandas, scikit-learn e joblib são importados só dentro das funções que os usam:
+# juntos levam segundos para importar e não devem pesar no import da API
 
 # Caminho para o CSV de treinamento
 BASE_DIR = os.path.dirname(os.path.dirname(__file__))  # volta de services/ para a pasta raiz
 CSV_PATH = os.path.join(BASE_DIR, "data", "weather_dataset_with_rules.csv")
 
-# Nome do arquivo onde vamos salvar (pickle) o modelo já treinado
+# Modelo treinado no formato nativo do LightGBM (texto) + classes e features num JSON ao lado
+MODEL_NATIVE_PATH = os.environ.get("MODELO_PATH", os.path.join(BASE_DIR, "data", "weather_model_lgbm.txt"))
+MODEL_META_PATH = os.path.splitext(MODEL_NATIVE_PATH)[0] + ".json"
+
+# Backend de inferência (MODELO_BACKEND):
+#   "lightgbm"  → lgb.Booster.predict
+#   "compilado" → árvores compiladas em arrays NumPy (services/compiled_trees.py), sem chamar o
+#                 LightGBM para predizer; o ensemble compilado fica em cache num .npz ao lado do
+#                 modelo nativo e, com o cache válido, nem o lightgbm é importado
+MODEL_BACKEND = os.environ.get("MODELO_BACKEND", "lightgbm")
+MODEL_BACKENDS = ("lightgbm", "compilado")
+
+# Versões publicadas do modelo (ver ArmazemModelos); na primeira execução o modelo de
+# MODEL_NATIVE_PATH vira a versão v0001
+MODELS_DIR = os.environ.get("MODELOS_PATH", os.path.join(BASE_DIR, "data", "modelos"))
+# De quanto em quanto tempo cada processo confere se a versão ativa mudou (troca feita por outro worker)
+MODEL_WATCH_SECONDS = float(os.environ.get("MODELO_VERIFICAR_SEGUNDOS", 5))
+# Máximo de lotes esperando a pontuação em sombra; acima disso os novos são descartados
+SHADOW_MAX_PENDING = int(os.environ.get("SOMBRA_MAX_PENDENTES", 64))
+
+# Formato antigo (pickle via joblib com o LabelEncoder): só lido se o nativo não existir,
+# e convertido para o nativo no primeiro carregamento
 MODEL_PATH = os.path.join(BASE_DIR, "data", "weather_model_lgbm.pkl")
 
 # Lista de colunas numéricas que usamos como FEATURES (todas as do dataset, exceto a target)
@@ -41,33 +76,200 @@ FEATURE_COLS = [
 
 TARGET_COL = "previsao_condicao_climatica"
 
+# Como as categorias são servidas (classify_condition / classify_many):
+#   "modelo"  → LightGBM em todas as linhas (as regras rodam junto só para medir a concordância)
+#   "regras"  → só o motor de regras (services/rules_service.py), sem o modelo
+#   "hibrido" → regras primeiro; o modelo só pontua as linhas ambíguas para as regras
+PREDICTION_MODE = os.environ.get("MODO_PREDICAO", "modelo")
+PREDICTION_MODES = ("modelo", "regras", "hibrido")
+
+# Quando o modelo é carregado (ver start_model_loading):
+#   "background" → numa thread, ao subir a API; /health responde "carregando" até ficar pronto
+#   "eager"      → na hora, no processo principal (ex.: gunicorn --preload, workers herdam o modelo)
+#   "lazy"       → na primeira predição
+MODEL_LOADING = os.environ.get("MODELO_CARREGAMENTO", "background")
+# Quanto uma predição espera o modelo que ainda está carregando antes de desistir
+MODEL_WAIT_SECONDS = float(os.environ.get("MODELO_ESPERA_SEGUNDOS", 30))
+
+# Micro-lotes (services/inference_batcher.py): com INFERENCIA_MICROLOTES=1, as predições de uma
+# linha concorrentes são juntadas em até INFERENCIA_LOTE_MAX linhas ou INFERENCIA_ESPERA_US µs de
+# espera e pontuadas numa única chamada; com INFERENCIA_FILA_MAX pedidos na fila, responde 503
+MICRO_BATCHING = os.environ.get("INFERENCIA_MICROLOTES", "0") == "1"
+MICRO_BATCH_MAX_ROWS = int(os.environ.get("INFERENCIA_LOTE_MAX", 32))
+MICRO_BATCH_WAIT_US = float(os.environ.get("INFERENCIA_ESPERA_US", 1000))
+MICRO_BATCH_MAX_QUEUE = int(os.environ.get("INFERENCIA_FILA_MAX", 1024))
+
+# Extrai os valores de um dict já na ordem de FEATURE_COLS (usado para montar a matriz sem DataFrame)
+_feature_getter = itemgetter(*FEATURE_COLS)
+
+
+def build_feature_matrix(rows, dtype=np.float64) -> np.ndarray:
+    """
+    Monta uma matriz contígua (n_linhas, len(FEATURE_COLS)) na ordem de FEATURE_COLS,
+    sem passar por um DataFrame. Aceita:
+      - lista (ou iterável com len) de dicts com as chaves de FEATURE_COLS
+      - array NumPy 2-D já na ordem de FEATURE_COLS
+      - array estruturado com um campo por feature (ex.: obter_previsoes_estruturadas)
+      - mapping orientado a colunas: {"temperature_2m": [...], "rain": [...], ...}
+
+    dtype pode ser np.float64 (padrão) ou np.float32.
+    """
+    n_cols = len(FEATURE_COLS)
+
+    if isinstance(rows, np.ndarray) and rows.dtype.names is not None:
+        faltando = [col for col in FEATURE_COLS if col not in rows.dtype.names]
+        if faltando:
+            raise ValueError(f"Array estruturado sem os campos {faltando}.")
+        matrix = np.empty((rows.shape[0], n_cols), dtype=dtype)
+        for j, col in enumerate(FEATURE_COLS):
+            matrix[:, j] = rows[col]
+        return matrix
+
+    if isinstance(rows, np.ndarray):
+        if rows.ndim != 2 or rows.shape[1] != n_cols:
+            raise ValueError(f"Array deve ter shape (n, {n_cols}), recebido {rows.shape}.")
+        return np.ascontiguousarray(rows, dtype=dtype)
+
+    if isinstance(rows, Mapping):
+        n_rows = len(rows[FEATURE_COLS[0]])
+        matrix = np.empty((n_rows, n_cols), dtype=dtype)
+        for j, col in enumerate(FEATURE_COLS):
+            coluna = np.asarray(rows[col], dtype=dtype)
+            if coluna.shape != (n_rows,):
+                raise ValueError(f"Coluna '{col}' deve ter {n_rows} valores, recebido shape {coluna.shape}.")
+            matrix[:, j] = coluna
+        return matrix
+
+    n_rows = len(rows)
+    valores = chain.from_iterable(map(_feature_getter, rows))
+    return np.fromiter(valores, dtype=dtype, count=n_rows * n_cols).reshape(n_rows, n_cols)
+
+
+def classify_by_rules(rows, dtype=np.float64) -> np.ndarray:
+    """
+    Categorias de várias linhas só pelas regras (modo "regras"); não precisa do modelo.
+    """
+    x_new = build_feature_matrix(rows, dtype=dtype)
+    if x_new.shape[0] == 0:
+        return np.empty(0, dtype=object)
+    return categorize_many({col: x_new[:, j] for j, col in enumerate(FEATURE_COLS)})
+
 
 class WeatherModelService:
-    def __init__(self):
-        self.label_encoder = LabelEncoder()
+    def __init__(self, model_path: str = None, train: bool = False, csv_path: str = CSV_PATH):
+        """
+        'model_path' é o modelo nativo a carregar (padrão: MODEL_NATIVE_PATH; o JSON de metadados
+        e o cache do backend compilado ficam ao lado dele). Com train=True, treina um modelo novo
+        a partir de 'csv_path' e o grava em 'model_path'.
+        """
+        self.model_path = model_path or MODEL_NATIVE_PATH
+        self.meta_path = os.path.splitext(self.model_path)[0] + ".json"
+        self.compiled_path = os.path.splitext(self.model_path)[0] + ".npz"
+        # LabelEncoder só existe quando o modelo vem do pickle antigo ou de um treino novo
+        self.label_encoder = None
         self.model = None
-        # Ao inicializar, tentamos carregar o modelo já treinado
-        if os.path.exists(MODEL_PATH):
+        # Array com as classes do LabelEncoder, para decodificar índices sem inverse_transform
+        self.classes = None
+        # Métricas do conjunto de teste, quando o modelo foi treinado por este código
+        self.metrics = None
+        # Concordância entre regras e modelo nas linhas em que os dois foram avaliados
+        self.agreement = AgreementStats()
+        # Ao inicializar, tentamos carregar o modelo já treinado (formato nativo, depois o pickle)
+        if train:
+            self._train_and_save_model(csv_path)
+        elif os.path.exists(self.model_path):
+            self._load_native_model()
+        elif model_path is not None:
+            raise FileNotFoundError(f"Modelo não encontrado: {self.model_path}")
+        elif os.path.exists(MODEL_PATH):
             self._load_model()
+            self._save_native_model()
         else:
             # Se não existir, treinamos um novo
-            self._train_and_save_model()
+            self._train_and_save_model(csv_path)
+        if MODEL_BACKEND == "compilado" and not isinstance(self.model, CompiledTreeEnsemble):
+            self.model = self._load_compiled_model()
+
+    def _load_native_model(self):
+        """
+        Carrega o modelo do formato nativo do LightGBM (ou o ensemble compilado dele, conforme
+        MODEL_BACKEND) e as classes do JSON ao lado (sem unpickle e sem scikit-learn).
+        """
+        if MODEL_BACKEND not in MODEL_BACKENDS:
+            raise ValueError(f"Backend de inferência inválido: '{MODEL_BACKEND}' (use um de {MODEL_BACKENDS}).")
+        with open(self.meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta["feature_cols"] != FEATURE_COLS:
+            raise ValueError(f"Features do modelo em {self.model_path} não batem com FEATURE_COLS.")
+        self.classes = np.asarray(meta["classes"], dtype=object)
+        self.metrics = meta.get("metricas")
+        if MODEL_BACKEND == "compilado":
+            self.model = self._load_compiled_model()
+        else:
+            import lightgbm as lgb
+
+            self.model = lgb.Booster(model_file=self.model_path)
+
+    def _load_compiled_model(self) -> CompiledTreeEnsemble:
+        """
+        Ensemble compilado do modelo nativo: lido do cache .npz se ele foi gerado a partir do
+        mesmo arquivo (SHA-256); senão compila com o LightGBM e regrava o cache.
+        """
+        origem = file_sha256(self.model_path)
+        if os.path.exists(self.compiled_path):
+            compilado = CompiledTreeEnsemble.load(self.compiled_path)
+            if compilado.source_sha256 == origem:
+                return compilado
+
+        import lightgbm as lgb
+
+        compilado = CompiledTreeEnsemble.from_booster(lgb.Booster(model_file=self.model_path), source_sha256=origem)
+        compilado.save(self.compiled_path)
+        return compilado
 
     def _load_model(self):
         """
-        Carrega o modelo e o LabelEncoder do disco.
+        Carrega o modelo e o LabelEncoder do pickle antigo.
         """
+        import joblib
+
         saved = joblib.load(MODEL_PATH)
         self.model = saved["model"]
         self.label_encoder = saved["label_encoder"]
+        self.classes = np.asarray(self.label_encoder.classes_, dtype=object)
+
+    def _save_native_model(self):
+        """
+        Grava o modelo no formato nativo + JSON com classes, features e métricas. Escreve em
+        arquivos temporários e troca no fim, para outro processo nunca ler um arquivo pela metade.
+        """
+        temporario = f"{self.model_path}.{os.getpid()}.tmp"
+        self.model.save_model(temporario)
+        os.replace(temporario, self.model_path)
+
+        meta = {"classes": self.classes.tolist(), "feature_cols": FEATURE_COLS}
+        if self.metrics is not None:
+            meta["metricas"] = self.metrics
+        temporario = f"{self.meta_path}.{os.getpid()}.tmp"
+        with open(temporario, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        os.replace(temporario, self.meta_path)
 
-    def _train_and_save_model(self):
+    def _train_and_save_model(self, csv_path: str = CSV_PATH):
         """
-        Carrega o CSV, treina o modelo LightGBM e salva model + label_encoder em disco.
+        Carrega o CSV, treina o modelo LightGBM e salva o modelo (formato nativo) + classes em disco.
         Exibe relatório de métricas (AUC-ROC, precisão e recall).
         """
+        import lightgbm as lgb
+        import pandas as pd
+        from sklearn.metrics import classification_report, roc_auc_score
+        from sklearn.model_selection import train_test_split
+        from sklearn.preprocessing import LabelEncoder
+
+        self.label_encoder = LabelEncoder()
+
         # 1) Carregar CSV
-        df = pd.read_csv(CSV_PATH)
+        df = pd.read_csv(csv_path)
 
         # 2) Separar X e y
         x = df[FEATURE_COLS].copy()
@@ -75,6 +277,7 @@ class WeatherModelService:
 
         # 3) Codificar labels (por exemplo: “Crítico” → 0, “Severo” → 1, etc.)
         y = self.label_encoder.fit_transform(y_raw)
+        self.classes = np.asarray(self.label_encoder.classes_, dtype=object)
 
         # 4) Dividir em treino e teste
         x_train, x_test, y_train, y_test = train_test_split(
@@ -135,15 +338,17 @@ class WeatherModelService:
         print("\n=== Classification Report (Precision / Recall / F1) ===")
         print(pd.DataFrame(report).transpose())
 
-        # 11) Salvar modelo + label_encoder no disco (joblib)
-        joblib.dump(
-            {
-                "model": self.model,
-                "label_encoder": self.label_encoder
-            },
-            MODEL_PATH
-        )
-        print(f"\nModelo treinado e salvo em: {MODEL_PATH}")
+        # 11) Salvar modelo (formato nativo do LightGBM) + classes e métricas no disco
+        self.classes = np.asarray(self.label_encoder.classes_, dtype=object)
+        self.metrics = {
+            "auc_roc": auc_roc,
+            "acuracia": report["accuracy"],
+            "f1_macro": report["macro avg"]["f1-score"],
+            "linhas_treino": int(len(x_train)),
+            "iteracoes": int(self.model.best_iteration or self.model.current_iteration()),
+        }
+        self._save_native_model()
+        print(f"\nModelo treinado e salvo em: {self.model_path}")
 
     def predict_condition(self, weather_dict: dict) -> str:
         """
@@ -179,24 +384,479 @@ class WeatherModelService:
         if self.model is None:
             raise RuntimeError("Modelo não está carregado.")
 
-        # 2) Monta um DataFrame com uma única linha (com as FEATURES na mesma ordem)
-        x_new = pd.DataFrame([weather_dict])[FEATURE_COLS].copy()
+        # 2) Predição em lote de uma única linha (matriz montada direto na ordem de FEATURE_COLS)
+        return self.predict_many([weather_dict])[0]
+
+    def predict_proba_many(self, rows, dtype=np.float64):
+        """
+        Predição vetorizada para várias linhas de uma vez. 'rows' pode ser uma lista de dicts,
+        um array NumPy 2-D na ordem de FEATURE_COLS ou um mapping orientado a colunas
+        (ver build_feature_matrix).
+
+        Retorna a tupla (labels, proba):
+          - labels: array (n_linhas,) com os rótulos preditos
+          - proba: array (n_linhas, num_classes) com as probabilidades, colunas na ordem de self.classes
+        """
+        if self.model is None:
+            raise RuntimeError("Modelo não está carregado.")
+
+        x_new = build_feature_matrix(rows, dtype=dtype)
+        if x_new.shape[0] == 0:
+            return np.empty(0, dtype=object), np.empty((0, len(self.classes)))
+
+        proba = self.model.predict(x_new)  # retorna array shape (n_linhas, num_classes)
+        labels = self.classes[np.argmax(proba, axis=1)]
+        return labels, proba
+
+    def predict_many(self, rows, dtype=np.float64) -> np.ndarray:
+        """
+        Versão em lote de predict_condition: aceita as mesmas entradas de predict_proba_many
+        e faz uma única chamada vetorizada a self.model.predict para todas as linhas.
+
+        Retorna o array de rótulos preditos, na mesma ordem da entrada.
+        """
+        labels, _ = self.predict_proba_many(rows, dtype=dtype)
+        return labels
+
+    def classify_many(self, rows, mode: str = None, dtype=np.float64) -> np.ndarray:
+        """
+        Categoriza várias linhas segundo o modo de serviço ('mode' ou PREDICTION_MODE):
+        "modelo", "regras" ou "hibrido" (ver PREDICTION_MODE). Aceita as mesmas entradas de
+        predict_many e devolve o array de categorias na ordem da entrada.
+        """
+        mode = mode or PREDICTION_MODE
+        if mode not in PREDICTION_MODES:
+            raise ValueError(f"Modo de predição inválido: '{mode}' (use um de {PREDICTION_MODES}).")
+
+        if mode == "regras":
+            return classify_by_rules(rows, dtype=dtype)
+
+        x_new = build_feature_matrix(rows, dtype=dtype)
+        if x_new.shape[0] == 0:
+            return np.empty(0, dtype=object)
+        columns = {col: x_new[:, j] for j, col in enumerate(FEATURE_COLS)}
+
+        if mode == "modelo":
+            labels = self.predict_many(x_new)
+            self.agreement.registrar(categorize_many(columns), labels)
+            return labels
+
+        # "hibrido": o modelo só entra onde as regras são ambíguas
+        labels, ambiguous = evaluate_rules(columns)
+        if ambiguous.any():
+            model_labels = self.predict_many(x_new[ambiguous])
+            self.agreement.registrar(labels[ambiguous], model_labels)
+            labels[ambiguous] = model_labels
+        return labels
+
+    def score_many(self, rows, mode: str = None, dtype=np.float64) -> tuple:
+        """
+        Categorias e probabilidades de várias linhas numa única chamada vetorizada ao modelo:
+        (labels, proba). As categorias seguem o modo como em classify_many (no "hibrido" o modelo
+        só decide onde as regras são ambíguas); no modo "regras" o modelo não é usado e proba é
+        None. Não registra a concordância entre regras e modelo.
+        """
+        mode = mode or PREDICTION_MODE
+        if mode not in PREDICTION_MODES:
+            raise ValueError(f"Modo de predição inválido: '{mode}' (use um de {PREDICTION_MODES}).")
+        if mode == "regras":
+            return classify_by_rules(rows, dtype=dtype), None
+
+        x_new = build_feature_matrix(rows, dtype=dtype)
+        labels, proba = self.predict_proba_many(x_new)
+        if mode == "hibrido" and len(x_new):
+            regras, ambiguous = evaluate_rules({col: x_new[:, j] for j, col in enumerate(FEATURE_COLS)})
+            labels = np.where(ambiguous, labels, regras)
+        return labels, proba
+
+    def classify_condition(self, weather_dict: dict, mode: str = None) -> str:
+        """
+        Versão de uma linha de classify_many (mesmo dict de predict_condition). Nos modos
+        "regras" e "hibrido" as regras rodam pelo caminho escalar, sem montar matriz.
+        """
+        mode = mode or PREDICTION_MODE
+        if mode == "regras":
+            return categorize_one(weather_dict)
+        if mode == "hibrido":
+            label, ambiguous = evaluate_rules_one(weather_dict)
+            if not ambiguous:
+                return label
+            model_label = self.predict_many([weather_dict])[0]
+            self.agreement.registrar([label], [model_label])
+            return model_label
+        return self.classify_many([weather_dict], mode=mode)[0]
+
+
+def _seed_store() -> str:
+    """
+    Publica a versão inicial a partir do modelo de MODEL_NATIVE_PATH (convertendo o pickle
+    antigo ou treinando, se ele ainda não existir).
+    """
+    if not os.path.exists(MODEL_NATIVE_PATH):
+        WeatherModelService()
+    versao = _store.publicar(MODEL_NATIVE_PATH, origem=os.path.relpath(MODEL_NATIVE_PATH, BASE_DIR))
+    _store.gravar_ponteiro(ativa=versao)
+    return versao
+
+
+def _load_version(versao: str) -> WeatherModelService:
+    return WeatherModelService(model_path=_store.caminho_modelo(versao))
+
+
+def model_version_path(versao: str = None) -> tuple:
+    """
+    (versao, caminho do modelo nativo) de uma versão publicada — padrão: a ativa, publicando a
+    inicial se o registro ainda estiver vazio. Para quem carrega o modelo fora da API (ex.: os
+    workers da pontuação em lote), sem passar pelo registro do processo.
+    """
+    versao = versao or _store.ponteiro()["ativa"] or _seed_store()
+    return versao, _store.caminho_modelo(versao)
+
+
+# Registro do modelo do processo: o WeatherModelService só é construído quando alguém pede
+# (ou em segundo plano, ao subir a API) — importar este módulo não carrega nem treina nada
+_store = ArmazemModelos(MODELS_DIR)
+_registry = ModelRegistry(_load_version, _store, preparar_armazem=_seed_store)
+
+
+def start_model_loading():
+    """
+    Dispara o carregamento do modelo conforme MODEL_LOADING e a verificação periódica da
+    versão ativa. Chamada pelas APIs ao subir. No modo de predição "regras" o modelo não é
+    usado e só carrega se alguém pedir.
+    """
+    if PREDICTION_MODE == "regras":
+        return
+    _registry.iniciar_vigia(MODEL_WATCH_SECONDS)
+    if MODEL_LOADING == "background":
+        _registry.iniciar()
+    elif MODEL_LOADING == "eager":
+        _registry.carregar()
+        # Tira do rastreamento do GC tudo o que já foi carregado: depois de um fork (gunicorn
+        # --preload) o coletor dos workers não reescreve essas páginas, que seguem compartilhadas
+        gc.freeze()
+
+
+def model_status() -> dict:
+    """
+    Estado do carregamento do modelo (ver ModelRegistry.estado), para o /health.
+    """
+    return _registry.estado()
+
 
-        # 3) Predição das probabilidades
-        proba = self.model.predict(x_new) # retorna array shape (1, num_classes)
-        idx_pred = np.argmax(proba, axis=1)[0]  # índice da classe com maior probabilidade
+def _model_service() -> WeatherModelService:
+    return _registry.obter(timeout=MODEL_WAIT_SECONDS)
 
-        # 4) Decodifica para o rótulo original
-        label_pred = self.label_encoder.inverse_transform([idx_pred])[0]
-        return label_pred
 
+# ---------------------------------------------------------------------------
+# Versões: troca, rollback, sombra e retreino (usados pelo endpoint /admin/modelos)
+# ---------------------------------------------------------------------------
+
+def model_versions() -> dict:
+    """
+    Versões publicadas (com métricas), o ponteiro (ativa / anterior / sombra) e o estado deste processo.
+    """
+    return {"versoes": _store.listar(), "ponteiro": _store.ponteiro(), "processo": _registry.estado()}
+
+
+def activate_model_version(versao: str):
+    """
+    Carrega a versão em segundo plano e passa a servi-la quando estiver pronta (em todos os
+    processos). Levanta ValueError se a versão não existe.
+    """
+    _registry.trocar(versao)
+
+
+def rollback_model_version() -> str:
+    """
+    Volta para a versão anterior e devolve o nome dela. Levanta ValueError se não há anterior.
+    """
+    return _registry.reverter()
+
+
+def set_shadow_model(versao, fraction: float = 1.0):
+    """
+    Pontua em sombra 'fraction' das requisições com a versão candidata (versao=None desliga).
+    A resposta continua vindo da versão ativa; a comparação roda numa thread à parte.
+    """
+    if not 0.0 <= fraction <= 1.0:
+        raise ValueError("A fração da sombra deve estar entre 0 e 1.")
+    _registry.definir_sombra(versao, fraction)
+
+
+# Concordância ativa × sombra (linhas = ativa, colunas = candidata) do par de versões atual
+_shadow = {"par": None, "agreement": AgreementStats(), "lotes": 0, "descartados": 0, "pendentes": 0, "erros": 0}
+_shadow_lock = threading.Lock()
+_shadow_executor = None
+
+
+def _shadow_score(versao: str, servico: WeatherModelService, rows, dtype):
+    """
+    Agenda a pontuação em sombra de um lote já servido (amostrado pela fração da sombra).
+    """
+    global _shadow_executor
+    sombra = _registry.sombra()
+    if sombra is None or random.random() >= sombra[2]:
+        return
+    with _shadow_lock:
+        if _shadow["pendentes"] >= SHADOW_MAX_PENDING:
+            _shadow["descartados"] += 1
+            return
+        _shadow["pendentes"] += 1
+        if _shadow_executor is None:
+            _shadow_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sombra")
+    _shadow_executor.submit(_run_shadow, versao, servico, sombra, rows, dtype)
+
+
+def _run_shadow(versao: str, servico: WeatherModelService, sombra: tuple, rows, dtype):
+    versao_candidata, candidato, _ = sombra
+    try:
+        x_new = build_feature_matrix(rows, dtype=dtype)
+        labels_ativo = servico.predict_many(x_new)
+        labels_candidato = candidato.predict_many(x_new)
+    except Exception:
+        with _shadow_lock:
+            _shadow["pendentes"] -= 1
+            _shadow["erros"] += 1
+        return
+    par = (versao, versao_candidata)
+    with _shadow_lock:
+        _shadow["pendentes"] -= 1
+        if _shadow["par"] != par:
+            _shadow.update(par=par, agreement=AgreementStats(), lotes=0)
+        _shadow["lotes"] += 1
+        agreement = _shadow["agreement"]
+    agreement.registrar(labels_ativo, labels_candidato)
+
+
+def shadow_stats() -> dict:
+    """
+    Concordância entre a versão ativa e a candidata nas linhas pontuadas em sombra.
+    """
+    with _shadow_lock:
+        par = _shadow["par"]
+        stats = {"ativa": par and par[0], "candidata": par and par[1], "lotes": _shadow["lotes"],
+                 "descartados": _shadow["descartados"], "pendentes": _shadow["pendentes"], "erros": _shadow["erros"]}
+        agreement = _shadow["agreement"]
+    stats.update(agreement.stats())
+    return stats
+
+
+def _train_version(csv_path: str, models_dir: str) -> str:
+    """
+    (Processo de retreino) Treina um modelo novo e o publica como uma versão nova.
+    """
+    with tempfile.TemporaryDirectory(dir=models_dir) as temporaria:
+        caminho = os.path.join(temporaria, "modelo.txt")
+        WeatherModelService(model_path=caminho, train=True, csv_path=csv_path)
+        return ArmazemModelos(models_dir).publicar(caminho, origem=f"retreino:{os.path.basename(csv_path)}")
+
+
+_retrain = {"estado": "ocioso"}
+_retrain_lock = threading.Lock()
+_retrain_executor = None
+
+
+def retrain_model(activate: bool = False, csv_path: str = CSV_PATH) -> dict:
+    """
+    Retreina o modelo num processo separado (a API segue servindo a versão ativa) e publica o
+    resultado como versão nova; com activate=True, passa a servi-la quando o treino terminar.
+    Só um retreino por vez: se já houver um em andamento, devolve o estado dele.
+    """
+    global _retrain_executor
+    with _retrain_lock:
+        if _retrain["estado"] == "treinando":
+            return dict(_retrain)
+        if _retrain_executor is None:
+            _retrain_executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
+        os.makedirs(MODELS_DIR, exist_ok=True)
+        _retrain.clear()
+        _retrain.update(estado="treinando", ativar=activate, csv=csv_path)
+        futuro = _retrain_executor.submit(_train_version, csv_path, MODELS_DIR)
+
+    def concluir(futuro):
+        with _retrain_lock:
+            try:
+                versao = futuro.result()
+            except Exception as e:
+                _retrain.update(estado="erro", erro=str(e) or type(e).__name__)
+                return
+            _retrain.update(estado="concluido", versao=versao)
+        if activate:
+            _registry.trocar(versao)
+
+    futuro.add_done_callback(concluir)
+    return dict(_retrain)
+
+
+def retrain_status() -> dict:
+    """
+    Estado do último retreino: "ocioso", "treinando", "concluido" (com a versão) ou "erro".
+    """
+    with _retrain_lock:
+        return dict(_retrain)
+
+
+def _reset_executors_after_fork():
+    # Threads e processos auxiliares não atravessam o fork: o filho cria os seus quando precisar
+    global _shadow_executor, _retrain_executor, _shadow_lock, _retrain_lock
+    _shadow_executor = None
+    _retrain_executor = None
+    _shadow_lock = threading.Lock()
+    _retrain_lock = threading.Lock()
+    _shadow["pendentes"] = 0
+    if _retrain.get("estado") == "treinando":
+        _retrain.clear()
+        _retrain["estado"] = "ocioso"
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_executors_after_fork)
 
-# Instancia única do serviço para todo o ciclo de vida da aplicação
-_model_service = WeatherModelService()
 
 def predict_condition(weather_dict: dict) -> str:
     """
     Função conveniência para ser importada externamente.
     Devolve o rótulo predito (string) para o dicionário de atributos meteorológicos.
+    Levanta ModeloIndisponivel se o modelo não ficar pronto em MODEL_WAIT_SECONDS.
+    """
+    return _model_service().predict_condition(weather_dict)
+
+
+def predict_many(rows, dtype=np.float64) -> np.ndarray:
+    """
+    Função conveniência para predição em lote.
+    Devolve o array de rótulos preditos para uma lista de dicts, array 2-D ou mapping de colunas.
+    """
+    return _model_service().predict_many(rows, dtype=dtype)
+
+
+def predict_proba_many(rows, dtype=np.float64):
+    """
+    Função conveniência para predição em lote com probabilidades.
+    Devolve a tupla (labels, proba) — ver WeatherModelService.predict_proba_many.
+    """
+    return _model_service().predict_proba_many(rows, dtype=dtype)
+
+
+def classify_condition(weather_dict: dict, mode: str = None) -> str:
+    """
+    Função conveniência: categoria de uma linha segundo o modo de serviço (MODO_PREDICAO).
+    No modo "regras" não usa (nem espera) o modelo. Com uma versão em sombra, a linha também
+    é pontuada (fora do caminho da resposta) pela candidata. Com INFERENCIA_MICROLOTES=1 a
+    linha vai para a fila de micro-lotes (levanta FilaInferenciaCheia se ela está cheia).
+    """
+    with medir("predicao"):
+        if (mode or PREDICTION_MODE) == "regras":
+            return categorize_one(weather_dict)
+        if _micro_batcher is not None:
+            try:
+                return _micro_batcher.submeter((weather_dict, mode or PREDICTION_MODE)).result(MODEL_WAIT_SECONDS)
+            except TimeoutError:
+                raise ModeloIndisponivel(f"A predição não terminou em {MODEL_WAIT_SECONDS:g} s.") from None
+        versao, servico = _registry.obter_versao(timeout=MODEL_WAIT_SECONDS)
+        label = servico.classify_condition(weather_dict, mode=mode)
+    _shadow_score(versao, servico, [weather_dict], np.float64)
+    return label
+
+
+def submit_condition(weather_dict: dict, mode: str = None):
+    """
+    Versão não bloqueante de classify_condition para o modo assíncrono: o Future da linha na
+    fila de micro-lotes, ou None se os micro-lotes estão desligados (ou no modo "regras") —
+    nesse caso use classify_condition. Levanta FilaInferenciaCheia se a fila está cheia.
+    """
+    mode = mode or PREDICTION_MODE
+    if _micro_batcher is None or mode == "regras":
+        return None
+    return _micro_batcher.submeter((weather_dict, mode))
+
+
+def _classify_micro_batch(itens: list) -> list:
+    """
+    Executa um micro-lote [(weather_dict, modo), ...]: uma chamada classify_many por modo
+    (normalmente só um), com a pontuação em sombra do lote inteiro.
+    """
+    versao, servico = _registry.obter_versao(timeout=MODEL_WAIT_SECONDS)
+    rows = [weather_dict for weather_dict, _ in itens]
+    labels = [None] * len(itens)
+    for mode in {mode for _, mode in itens}:
+        indices = [i for i, (_, modo) in enumerate(itens) if modo == mode]
+        for i, label in zip(indices, servico.classify_many([rows[i] for i in indices], mode=mode)):
+            labels[i] = label
+    _shadow_score(versao, servico, rows, np.float64)
+    return labels
+
+
+_micro_batcher = (AgrupadorInferencia(_classify_micro_batch, MICRO_BATCH_MAX_ROWS, MICRO_BATCH_WAIT_US / 1e6,
+                                      MICRO_BATCH_MAX_QUEUE) if MICRO_BATCHING else None)
+
+
+def micro_batch_stats() -> dict:
+    """
+    Pedidos, lotes, linhas por lote, rejeitados e fila atual dos micro-lotes (None se desligados).
+    """
+    return _micro_batcher.stats() if _micro_batcher is not None else None
+
+
+def classify_many(rows, mode: str = None, dtype=np.float64) -> np.ndarray:
+    """
+    Função conveniência: categorias de várias linhas segundo o modo de serviço (MODO_PREDICAO).
+    No modo "regras" não usa (nem espera) o modelo. Com uma versão em sombra, as linhas também
+    são pontuadas (fora do caminho da resposta) pela candidata.
+    """
+    with medir("predicao"):
+        if (mode or PREDICTION_MODE) == "regras":
+            return classify_by_rules(rows, dtype=dtype)
+        versao, servico = _registry.obter_versao(timeout=MODEL_WAIT_SECONDS)
+        labels = servico.classify_many(rows, mode=mode, dtype=dtype)
+    _shadow_score(versao, servico, rows, dtype)
+    return labels
+
+
+def score_many(rows, mode: str = None, dtype=np.float64) -> tuple:
+    """
+    Categorias e probabilidades de várias linhas numa única chamada vetorizada ao modelo, com a
+    versão que as produziu: (versao, labels, proba, classes). As categorias seguem o modo de
+    serviço como em classify_many; no modo "regras" o modelo não é usado (versao "regras",
+    proba e classes None). Não pontua em sombra (usado fora do caminho das requisições).
+    """
+    mode = mode or PREDICTION_MODE
+    with medir("predicao_lote"):
+        if mode == "regras":
+            return "regras", classify_by_rules(rows, dtype=dtype), None, None
+        versao, servico = _registry.obter_versao(timeout=MODEL_WAIT_SECONDS)
+        labels, proba = servico.score_many(rows, mode=mode, dtype=dtype)
+    return versao, labels, proba, servico.classes
+
+
+def active_model_version():
+    """
+    Versão que classify_condition / classify_many usariam agora ("regras" no modo "regras"),
+    ou None se o modelo ainda não carregou. Não espera o carregamento.
+    """
+    if PREDICTION_MODE == "regras":
+        return "regras"
+    return _registry.versao_ativa()
+
+
+def agreement_stats() -> dict:
+    """
+    Concordância acumulada entre regras e modelo (ver AgreementStats.stats).
+    """
+    return _model_service().agreement.stats()
+
+
+@registrar_coletor
+def _collect_metrics() -> list:
+    """
+    Versão e estado do modelo e contadores da pontuação em sombra (lidos no /metrics).
     """
-    return _model_service.predict_condition(weather_dict)
+    estado = _registry.estado()
+    metricas = [("supernova_modelo_info", "gauge", "Versão ativa e estado do modelo neste processo.",
+                 {"versao": estado.get("versao", ""), "estado": estado["estado"]}, 1)]
+    with _shadow_lock:
+        sombra = {"descartado": _shadow["descartados"], "erro": _shadow["erros"]}
+    metricas += [("supernova_sombra_falhas_total", "counter", "Lotes que a versão em sombra não pontuou.",
+                  {"motivo": motivo}, total) for motivo, total in sombra.items()]
+    return metricas
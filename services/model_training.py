@@ -0,0 +1,386 @@
+"""
+Treino offline do modelo com validação cruzada e busca de hiperparâmetros (usado por
+utils/treinar_modelo.py).
+
+Etapas, todas guardadas numa pasta de trabalho para serem reaproveitadas:
+  1) os dados (CSV ou Parquet) são lidos em blocos e gravados num arquivo binário mapeado em
+     memória; a partir dele o lgb.Dataset é construído uma vez e salvo no formato binário do
+     LightGBM (dataset.bin), que os processos da busca abrem sem refazer o binning;
+  2) cada linha recebe um fold (k-fold estratificado, com seed);
+  3) os trials (conjuntos de hiperparâmetros sorteados de ESPACO_BUSCA, o trial 0 é o padrão do
+     LightGBM) rodam a validação cruzada num pool de processos, cada um com 'threads' threads
+     do LightGBM; cada trial concluído é anexado a trials.jsonl, então uma busca interrompida
+     continua de onde parou;
+  4) o melhor trial é treinado com todas as linhas e publicado como versão nova no registro de
+     modelos (services/model_registry.py), no mesmo formato que o WeatherModelService carrega.
+"""
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from services.model_registry import ArmazemModelos
+from services.model_service import BASE_DIR, FEATURE_COLS, MODELS_DIR, TARGET_COL
+
+TREINO_PATH = os.path.join(BASE_DIR, "data", "treino")
+
+ARQUIVO_DATASET = "dataset.bin"
+ARQUIVO_DADOS = "dados.json"
+ARQUIVO_ROTULOS = "rotulos.npy"
+ARQUIVO_FOLDS = "folds.npy"
+ARQUIVO_ESTUDO = "estudo.json"
+ARQUIVO_TRIALS = "trials.jsonl"
+ARQUIVO_RELATORIO = "relatorio.json"
+PASTA_MELHOR = "melhor"
+
+# Parâmetros que definem o binning do Dataset (fixos depois de construído). feature_pre_filter
+# desligado deixa os trials variarem min_data_in_leaf sobre o mesmo Dataset.
+PARAMS_DATASET = {"feature_pre_filter": False, "verbosity": -1}
+
+# Parâmetros comuns a todos os trials (os mesmos do treino do WeatherModelService)
+PARAMS_BASE = {
+    "objective": "multiclass",
+    "metric": ["multi_logloss", "multi_error"],
+    "boosting_type": "gbdt",
+    "verbosity": -1,
+    "seed": 42,
+}
+
+# Espaço da busca aleatória: nome → (escala, mínimo, máximo)
+ESPACO_BUSCA = {
+    "num_leaves": ("inteiro_log", 15, 255),
+    "learning_rate": ("log", 0.02, 0.3),
+    "min_data_in_leaf": ("inteiro_log", 5, 200),
+    "feature_fraction": ("uniforme", 0.5, 1.0),
+    "bagging_fraction": ("uniforme", 0.5, 1.0),
+    "lambda_l2": ("log", 1e-3, 10.0),
+}
+
+
+def sortear_params(trial: int, semente: int) -> dict:
+    """
+    Hiperparâmetros do trial: o trial 0 usa os padrões do LightGBM; os outros são sorteados de
+    ESPACO_BUSCA com um gerador derivado de (semente, trial), então o mesmo trial sempre
+    recebe os mesmos parâmetros (o que permite retomar a busca).
+    """
+    if trial == 0:
+        return {}
+    rng = np.random.default_rng([semente, trial])
+    params = {}
+    for nome, (escala, minimo, maximo) in ESPACO_BUSCA.items():
+        if escala == "uniforme":
+            params[nome] = round(float(rng.uniform(minimo, maximo)), 4)
+        else:
+            valor = float(np.exp(rng.uniform(np.log(minimo), np.log(maximo))))
+            params[nome] = int(round(valor)) if escala == "inteiro_log" else round(valor, 6)
+    if params["bagging_fraction"] < 1.0:
+        params["bagging_freq"] = 1
+    return params
+
+
+def _blocos(caminho: str, tamanho_chunk: int):
+    """
+    Lê o arquivo de treino em blocos de até 'tamanho_chunk' linhas e gera pares
+    (features float64 na ordem de FEATURE_COLS, rótulos).
+    """
+    if caminho.endswith(".parquet"):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise RuntimeError("Entrada Parquet requer o pacote 'pyarrow' (pip install pyarrow).") from e
+        arquivo = pq.ParquetFile(caminho, memory_map=True)
+        for lote in arquivo.iter_batches(batch_size=tamanho_chunk, columns=FEATURE_COLS + [TARGET_COL]):
+            x = np.column_stack([lote.column(c).to_numpy(zero_copy_only=False).astype(np.float64, copy=False)
+                                 for c in FEATURE_COLS])
+            yield x, lote.column(TARGET_COL).to_numpy(zero_copy_only=False)
+    else:
+        import pandas as pd
+
+        for df in pd.read_csv(caminho, usecols=FEATURE_COLS + [TARGET_COL], chunksize=tamanho_chunk):
+            yield df[FEATURE_COLS].to_numpy(dtype=np.float64), df[TARGET_COL].to_numpy(dtype=object)
+
+
+def _assinatura_dados(caminho: str, max_bin: int) -> dict:
+    info = os.stat(caminho)
+    return {"arquivo": os.path.abspath(caminho), "bytes": info.st_size, "modificado_ns": info.st_mtime_ns,
+            "max_bin": max_bin}
+
+
+def _gravar_json(caminho: str, dados: dict):
+    temporario = f"{caminho}.{os.getpid()}.tmp"
+    with open(temporario, "w", encoding="utf-8") as f:
+        json.dump(dados, f, ensure_ascii=False, indent=2)
+    os.replace(temporario, caminho)
+
+
+def _ler_json(caminho: str):
+    if not os.path.exists(caminho):
+        return None
+    with open(caminho, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def preparar_dados(caminho: str, pasta: str, tamanho_chunk: int = 1_000_000, max_bin: int = 255) -> dict:
+    """
+    Gera (ou reaproveita, se o arquivo de entrada e o max_bin não mudaram) o dataset.bin do
+    LightGBM, os rótulos codificados e as classes. Devolve o conteúdo de dados.json, com
+    "reaproveitado" indicando se nada precisou ser refeito.
+    """
+    import lightgbm as lgb
+
+    os.makedirs(pasta, exist_ok=True)
+    assinatura = _assinatura_dados(caminho, max_bin)
+    dados = _ler_json(os.path.join(pasta, ARQUIVO_DADOS))
+    if (dados is not None and dados["assinatura"] == assinatura
+            and os.path.exists(os.path.join(pasta, ARQUIVO_DATASET))):
+        return {**dados, "reaproveitado": True}
+
+    # 1) Blocos → arquivo binário de features (memória limitada pelo bloco) + rótulos
+    inicio = time.perf_counter()
+    caminho_x = os.path.join(pasta, "features.f64")
+    rotulos, linhas = [], 0
+    with open(caminho_x, "wb") as f:
+        for x, y in _blocos(caminho, tamanho_chunk):
+            np.ascontiguousarray(x).tofile(f)
+            rotulos.append(y)
+            linhas += len(y)
+    classes, codigos = np.unique(np.concatenate(rotulos), return_inverse=True)
+    del rotulos
+    t_leitura = time.perf_counter() - inicio
+
+    # 2) Dataset do LightGBM a partir do arquivo mapeado em memória, salvo no formato binário
+    inicio = time.perf_counter()
+    x = np.memmap(caminho_x, dtype=np.float64, mode="r", shape=(linhas, len(FEATURE_COLS)))
+    temporario = os.path.join(pasta, f"{ARQUIVO_DATASET}.{os.getpid()}.tmp")
+    dataset = lgb.Dataset(x, label=codigos, feature_name=FEATURE_COLS, params={**PARAMS_DATASET, "max_bin": max_bin})
+    dataset.save_binary(temporario)
+    os.replace(temporario, os.path.join(pasta, ARQUIVO_DATASET))
+    del dataset, x
+    os.remove(caminho_x)
+    np.save(os.path.join(pasta, ARQUIVO_ROTULOS), codigos.astype(np.int32))
+    t_dataset = time.perf_counter() - inicio
+
+    dados = {"assinatura": assinatura, "linhas": linhas, "classes": classes.tolist(),
+             "segundos_leitura": round(t_leitura, 3), "segundos_dataset": round(t_dataset, 3)}
+    _gravar_json(os.path.join(pasta, ARQUIVO_DADOS), dados)
+    return {**dados, "reaproveitado": False}
+
+
+def preparar_folds(pasta: str, n_folds: int, semente: int) -> np.ndarray:
+    """
+    Fold de cada linha (k-fold estratificado pelo rótulo), gravado em folds.npy.
+    """
+    from sklearn.model_selection import StratifiedKFold
+
+    codigos = np.load(os.path.join(pasta, ARQUIVO_ROTULOS))
+    folds = np.empty(len(codigos), dtype=np.int8)
+    divisor = StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=semente)
+    for k, (_, validacao) in enumerate(divisor.split(np.zeros(len(codigos)), codigos)):
+        folds[validacao] = k
+    np.save(os.path.join(pasta, ARQUIVO_FOLDS), folds)
+    return folds
+
+
+# Dataset e folds já abertos neste processo do pool (reaproveitados entre trials)
+_abertos = {}
+
+
+def _abrir(pasta: str) -> tuple:
+    import lightgbm as lgb
+
+    if pasta not in _abertos:
+        base = lgb.Dataset(os.path.join(pasta, ARQUIVO_DATASET), params=PARAMS_DATASET).construct()
+        _abertos[pasta] = (base, np.load(os.path.join(pasta, ARQUIVO_FOLDS)))
+    return _abertos[pasta]
+
+
+def avaliar_trial(pasta: str, trial: int, params: dict, n_classes: int, threads: int,
+                  max_rodadas: int, parada: int) -> dict:
+    """
+    (Processo do pool) Validação cruzada de um conjunto de hiperparâmetros: treina um modelo
+    por fold com early stopping no multi_logloss do fold de validação e devolve as médias.
+    """
+    import lightgbm as lgb
+
+    inicio = time.perf_counter()
+    base, folds = _abrir(pasta)
+    params_treino = {**PARAMS_BASE, **params, "num_class": n_classes, "num_threads": threads}
+    loglosses, erros, iteracoes = [], [], []
+    for k in range(int(folds.max()) + 1):
+        treino = base.subset(np.flatnonzero(folds != k))
+        validacao = base.subset(np.flatnonzero(folds == k))
+        booster = lgb.train(params_treino, treino, num_boost_round=max_rodadas, valid_sets=[validacao],
+                            callbacks=[lgb.early_stopping(parada, first_metric_only=True, verbose=False)])
+        melhor = booster.best_score["valid_0"]
+        loglosses.append(float(melhor["multi_logloss"]))
+        erros.append(float(melhor["multi_error"]))
+        iteracoes.append(booster.best_iteration or booster.current_iteration())
+    return {
+        "trial": trial,
+        "params": params,
+        "multi_logloss": float(np.mean(loglosses)),
+        "acuracia": 1.0 - float(np.mean(erros)),
+        "iteracoes": int(round(np.mean(iteracoes))),
+        "multi_logloss_folds": loglosses,
+        "segundos": round(time.perf_counter() - inicio, 3),
+    }
+
+
+def _ler_trials(caminho: str) -> dict:
+    """
+    Trials concluídos (trial → resultado). Uma última linha cortada (busca interrompida no meio
+    da escrita) é ignorada.
+    """
+    concluidos = {}
+    if os.path.exists(caminho):
+        with open(caminho, encoding="utf-8") as f:
+            for linha in f:
+                try:
+                    resultado = json.loads(linha)
+                except ValueError:
+                    continue
+                concluidos[resultado["trial"]] = resultado
+    return concluidos
+
+
+def _anexar_trial(caminho: str, resultado: dict):
+    with open(caminho, "a", encoding="utf-8") as f:
+        f.write(json.dumps(resultado, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _abrir_estudo(pasta: str, estudo: dict, recomecar: bool) -> dict:
+    """
+    Confere se a busca salva na pasta usa a mesma configuração (dados, folds, seed, rodadas);
+    com recomecar=True (ou sem busca salva) começa uma nova. Devolve os trials já concluídos.
+    """
+    caminho_trials = os.path.join(pasta, ARQUIVO_TRIALS)
+    salvo = _ler_json(os.path.join(pasta, ARQUIVO_ESTUDO))
+    if salvo is not None and salvo != estudo and not recomecar:
+        raise ValueError(f"A busca salva em {pasta} usa outra configuração; use --recomecar para descartá-la.")
+    if recomecar or salvo != estudo:
+        if os.path.exists(caminho_trials):
+            os.remove(caminho_trials)
+        _gravar_json(os.path.join(pasta, ARQUIVO_ESTUDO), estudo)
+    return _ler_trials(caminho_trials)
+
+
+def _salvar_modelo_final(pasta: str, melhor: dict, dados: dict, threads: int) -> str:
+    """
+    Treina o melhor trial com todas as linhas e grava modelo.txt + modelo.json (classes,
+    features e métricas da validação cruzada) em <pasta>/melhor.
+    """
+    import lightgbm as lgb
+
+    base = lgb.Dataset(os.path.join(pasta, ARQUIVO_DATASET), params=PARAMS_DATASET)
+    params = {**PARAMS_BASE, **melhor["params"], "num_class": len(dados["classes"]), "num_threads": threads}
+    booster = lgb.train(params, base, num_boost_round=melhor["iteracoes"])
+
+    destino = os.path.join(pasta, PASTA_MELHOR)
+    os.makedirs(destino, exist_ok=True)
+    caminho = os.path.join(destino, "modelo.txt")
+    booster.save_model(caminho)
+    _gravar_json(os.path.join(destino, "modelo.json"), {
+        "classes": dados["classes"],
+        "feature_cols": FEATURE_COLS,
+        "metricas": {
+            "acuracia": melhor["acuracia"],
+            "multi_logloss": melhor["multi_logloss"],
+            "validacao": f"{len(melhor['multi_logloss_folds'])}-fold",
+            "linhas_treino": dados["linhas"],
+            "iteracoes": melhor["iteracoes"],
+            "trial": melhor["trial"],
+            "params": melhor["params"],
+        },
+    })
+    return caminho
+
+
+def treinar_com_busca(caminho_dados: str, pasta: str = TREINO_PATH, trials: int = 20, n_folds: int = 5,
+                      processos: int = None, threads: int = 1, semente: int = 42, max_rodadas: int = 1000,
+                      parada: int = 20, max_bin: int = 255, tamanho_chunk: int = 1_000_000,
+                      pasta_modelos: str = MODELS_DIR, publicar: bool = True, ativar: bool = False,
+                      recomecar: bool = False, ao_concluir_trial=None) -> dict:
+    """
+    Roda as etapas do módulo e devolve o relatório (também gravado em relatorio.json): tempo de
+    cada etapa, trials executados/retomados, o melhor trial e a versão publicada. 'processos'
+    padrão: núcleos // threads. 'ao_concluir_trial(resultado, concluidos, total)' é chamado a
+    cada trial terminado.
+    """
+    processos = processos or max(1, (os.cpu_count() or 1) // threads)
+    etapas = {}
+
+    # 1) Dados → dataset.bin (reaproveitado se a entrada não mudou)
+    inicio = time.perf_counter()
+    dados = preparar_dados(caminho_dados, pasta, tamanho_chunk=tamanho_chunk, max_bin=max_bin)
+    etapas["dados"] = time.perf_counter() - inicio
+
+    # 2) Busca salva (retomada) e folds
+    estudo = {"dados": dados["assinatura"], "folds": n_folds, "semente": semente,
+              "max_rodadas": max_rodadas, "parada": parada}
+    concluidos = _abrir_estudo(pasta, estudo, recomecar)
+    inicio = time.perf_counter()
+    if not concluidos or not os.path.exists(os.path.join(pasta, ARQUIVO_FOLDS)):
+        preparar_folds(pasta, n_folds, semente)
+    etapas["folds"] = time.perf_counter() - inicio
+
+    # 3) Trials pendentes no pool de processos (spawn: o LightGBM usa OpenMP, que não convive com fork)
+    retomados = len([t for t in concluidos if t < trials])
+    pendentes = [t for t in range(trials) if t not in concluidos]
+    caminho_trials = os.path.join(pasta, ARQUIVO_TRIALS)
+    inicio = time.perf_counter()
+    if pendentes:
+        with ProcessPoolExecutor(max_workers=min(processos, len(pendentes)),
+                                 mp_context=multiprocessing.get_context("spawn")) as pool:
+            futuros = [pool.submit(avaliar_trial, pasta, t, sortear_params(t, semente), len(dados["classes"]),
+                                   threads, max_rodadas, parada) for t in pendentes]
+            try:
+                for futuro in as_completed(futuros):
+                    resultado = futuro.result()
+                    _anexar_trial(caminho_trials, resultado)
+                    concluidos[resultado["trial"]] = resultado
+                    if ao_concluir_trial is not None:
+                        ao_concluir_trial(resultado, len([t for t in concluidos if t < trials]), trials)
+            except BaseException:
+                for futuro in futuros:
+                    futuro.cancel()
+                raise
+    etapas["busca"] = time.perf_counter() - inicio
+    executados = [concluidos[t] for t in pendentes]
+
+    # 4) Melhor trial treinado com todas as linhas e publicado no registro
+    melhor = min((concluidos[t] for t in range(trials)), key=lambda r: r["multi_logloss"])
+    inicio = time.perf_counter()
+    caminho_modelo = _salvar_modelo_final(pasta, melhor, dados, threads * processos)
+    etapas["modelo_final"] = time.perf_counter() - inicio
+
+    versao = None
+    if publicar:
+        inicio = time.perf_counter()
+        armazem = ArmazemModelos(pasta_modelos)
+        versao = armazem.publicar(caminho_modelo, origem=f"busca:{os.path.basename(caminho_dados)}:trial{melhor['trial']}")
+        if ativar:
+            armazem.gravar_ponteiro(ativa=versao)
+        etapas["publicar"] = time.perf_counter() - inicio
+
+    segundos_trials = sum(r["segundos"] for r in executados)
+    relatorio = {
+        "etapas_s": {nome: round(s, 3) for nome, s in etapas.items()},
+        "dados": {"linhas": dados["linhas"], "reaproveitado": dados["reaproveitado"],
+                  "leitura_s": dados["segundos_leitura"], "dataset_s": dados["segundos_dataset"]},
+        "trials": {"total": trials, "executados": len(executados), "retomados": retomados,
+                   "processos": processos, "threads_por_trial": threads,
+                   "soma_trials_s": round(segundos_trials, 3),
+                   "media_trial_s": round(segundos_trials / len(executados), 3) if executados else None,
+                   "paralelismo": round(segundos_trials / etapas["busca"], 2) if executados else None},
+        "melhor": melhor,
+        "modelo": caminho_modelo,
+        "versao": versao,
+        "ativada": bool(versao and ativar),
+    }
+    _gravar_json(os.path.join(pasta, ARQUIVO_RELATORIO), relatorio)
+    return relatorio
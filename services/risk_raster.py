@@ -0,0 +1,340 @@
+"""
+Varredura de risco de uma região inteira (ex.: um estado), sem passar por CEPs.
+
+Uma caixa (lat_min, lat_max, lon_min, lon_max) e uma resolução em graus viram uma grade
+regular de células; o clima "current" dos centros das células vem em requisições
+multi-localização à Open-Meteo (MAX_COORDENADAS_POR_REQUISICAO coordenadas cada, no máximo
+RISCO_REGIAO_CONCORRENCIA em andamento) e a grade inteira é pontuada numa única chamada
+vetorizada ao modelo (score_many). O resultado (Varredura) são arrays compactos: o índice da
+categoria de cada célula em 'classes' (int8, -1 sem dados), as probabilidades (float32), as
+features usadas e quando cada célula foi buscada; salvar_varredura grava tudo num .npz.
+
+Re-varreduras são incrementais quando recebem a varredura anterior da mesma grade:
+  1) só as células cujos dados venceram (passou a virada da cadência da Open-Meteo,
+     OPEN_METEO_CADENCIA_SEGUNDOS) ou que não têm dados são buscadas de novo;
+  2) só as células cujas features mudaram são repontuadas — as demais mantêm a categoria e as
+     probabilidades; com outra versão do modelo (ou outro modo), todas são repontuadas com as
+     features guardadas, sem ir à Open-Meteo;
+  3) um grupo cuja busca falha mantém os dados anteriores das suas células (contadas em
+     "falhas").
+
+O endpoint POST /risco/regiao (api/app.py) guarda as últimas RISCO_REGIAO_CACHE varreduras do
+processo, então repetir a mesma região só busca e repontua o que mudou.
+"""
+import io
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+import numpy as np
+
+from services.api_weather_service import MAX_COORDENADAS_POR_REQUISICAO, obter_previsoes_estruturadas
+from services.metrics import amostras, medir, registrar_coletor
+from services.model_service import (BASE_DIR, FEATURE_COLS, PREDICTION_MODE, active_model_version,
+                                    build_feature_matrix, score_many)
+from services.rules_service import CATEGORIAS
+from services.weather_cache import OPEN_METEO_CADENCIA_SEGUNDOS
+
+logger = logging.getLogger(__name__)
+
+# Requisições multi-localização simultâneas à Open-Meteo por varredura
+RISCO_REGIAO_CONCORRENCIA = int(os.environ.get("RISCO_REGIAO_CONCORRENCIA", 4))
+# Limite de células por varredura do endpoint (a ferramenta offline não tem limite)
+RISCO_REGIAO_MAX_CELULAS = int(os.environ.get("RISCO_REGIAO_MAX_CELULAS", 20000))
+# Varreduras guardadas por processo para as re-varreduras incrementais do endpoint
+RISCO_REGIAO_CACHE = int(os.environ.get("RISCO_REGIAO_CACHE", 4))
+
+RESOLUCAO_PADRAO = 0.1
+RISCO_PATH = os.path.join(BASE_DIR, "data", "risco", "regiao.npz")
+
+
+class Varredura(NamedTuple):
+    latitudes: np.ndarray       # (linhas,) centros das células, de norte para sul
+    longitudes: np.ndarray      # (colunas,) centros das células, de oeste para leste
+    categorias: np.ndarray      # (linhas, colunas) int8: índice em 'classes', -1 sem dados
+    probabilidades: np.ndarray  # (linhas, colunas, classes) float32 (NaN sem dados), ou None no modo "regras"
+    features: np.ndarray        # (linhas, colunas, FEATURE_COLS) float32, NaN sem dados
+    tempo: np.ndarray           # (linhas, colunas) int64: "time" dos dados na Open-Meteo (0 sem dados)
+    buscado_em: np.ndarray      # (linhas, colunas) float64: quando a célula foi buscada (0 sem dados)
+    classes: np.ndarray         # nomes das categorias (str)
+    versao: str                 # versão do modelo que pontuou ("regras" no modo "regras")
+    modo: str
+
+
+def dimensoes_grade(lat_min: float, lat_max: float, lon_min: float, lon_max: float,
+                    resolucao: float = RESOLUCAO_PADRAO) -> tuple:
+    """
+    (linhas, colunas) da grade de 'resolucao' graus que cobre a caixa, sem alocar nada.
+    Levanta ValueError para caixas ou resoluções inválidas (inclusive NaN e infinito).
+    """
+    if not (-90 <= lat_min < lat_max <= 90 and -180 <= lon_min < lon_max <= 180):
+        raise ValueError("Caixa inválida: use lat_min < lat_max (em [-90, 90]) e lon_min < lon_max (em [-180, 180]).")
+    if not (np.isfinite(resolucao) and resolucao > 0):
+        raise ValueError("A resolução deve ser um número positivo e finito.")
+    linhas = max(1, int(np.ceil(round((lat_max - lat_min) / resolucao, 9))))
+    colunas = max(1, int(np.ceil(round((lon_max - lon_min) / resolucao, 9))))
+    return linhas, colunas
+
+
+def montar_grade(lat_min: float, lat_max: float, lon_min: float, lon_max: float,
+                 resolucao: float = RESOLUCAO_PADRAO) -> tuple:
+    """
+    (latitudes, longitudes) dos centros das células de 'resolucao' graus que cobrem a caixa:
+    latitudes de norte para sul (a primeira linha do raster é a mais ao norte) e longitudes
+    de oeste para leste. Levanta ValueError para caixas ou resoluções inválidas.
+    """
+    linhas, colunas = dimensoes_grade(lat_min, lat_max, lon_min, lon_max, resolucao)
+    latitudes = np.round(lat_max - (np.arange(linhas) + 0.5) * resolucao, 6)
+    longitudes = np.round(lon_min + (np.arange(colunas) + 0.5) * resolucao, 6)
+    return latitudes, longitudes
+
+
+def _indices_categorias(labels, classes: np.ndarray) -> np.ndarray:
+    posicao = {str(classe): i for i, classe in enumerate(classes)}
+    return np.fromiter((posicao[str(label)] for label in labels), dtype=np.int8, count=len(labels))
+
+
+def _buscar_celulas(coordenadas: np.ndarray, concorrencia: int, buscar) -> tuple:
+    """
+    Busca as coordenadas em grupos de MAX_COORDENADAS_POR_REQUISICAO, até 'concorrencia' grupos
+    ao mesmo tempo. Devolve (array estruturado com uma linha por coordenada, máscara das
+    coordenadas buscadas com sucesso).
+    """
+    grupos = [slice(inicio, inicio + MAX_COORDENADAS_POR_REQUISICAO)
+              for inicio in range(0, len(coordenadas), MAX_COORDENADAS_POR_REQUISICAO)]
+
+    def buscar_grupo(fatia: slice):
+        try:
+            return fatia, buscar([tuple(coordenada) for coordenada in coordenadas[fatia].tolist()])
+        except Exception as e:
+            logger.warning("Falha ao buscar um grupo de %d células da varredura: %s", len(coordenadas[fatia]), e)
+            return fatia, None
+
+    estruturado, buscadas = None, np.zeros(len(coordenadas), dtype=bool)
+    with ThreadPoolExecutor(max_workers=max(1, min(concorrencia, len(grupos))),
+                            thread_name_prefix="risco-regiao") as executor:
+        for fatia, lote in executor.map(buscar_grupo, grupos):
+            if lote is None:
+                continue
+            if estruturado is None:
+                estruturado = np.zeros(len(coordenadas), dtype=lote.dtype)
+            estruturado[fatia] = lote
+            buscadas[fatia] = True
+    return estruturado, buscadas
+
+
+def varrer(lat_min: float, lat_max: float, lon_min: float, lon_max: float, resolucao: float = RESOLUCAO_PADRAO,
+           anterior: Varredura = None, mode: str = None, concorrencia: int = RISCO_REGIAO_CONCORRENCIA,
+           agora: float = None, buscar=obter_previsoes_estruturadas, pontuar=score_many,
+           versao_ativa=active_model_version, cadencia: int = OPEN_METEO_CADENCIA_SEGUNDOS) -> tuple:
+    """
+    Varre a região (ver a descrição do módulo) e devolve (Varredura, resumo), com resumo =
+    {"celulas", "buscadas", "falhas", "repontuadas", "sem_dados", "segundos"}. Com 'anterior'
+    da mesma grade, a varredura é incremental; de outra grade, é ignorada.
+
+    As dependências são injetáveis como em ForecastTiles: buscar(coordenadas) → array
+    estruturado (obter_previsoes_estruturadas), pontuar(matriz, mode) → (versao, labels, proba,
+    classes) e versao_ativa() → versão que pontuaria agora (None se ainda não se sabe: aí a
+    troca de versão só é percebida quando alguma célula é repontuada).
+    """
+    inicio = time.perf_counter()
+    mode = mode or PREDICTION_MODE
+    agora = time.time() if agora is None else agora
+    latitudes, longitudes = montar_grade(lat_min, lat_max, lon_min, lon_max, resolucao)
+    forma = (len(latitudes), len(longitudes))
+    n = forma[0] * forma[1]
+    if anterior is not None and not (np.array_equal(anterior.latitudes, latitudes)
+                                     and np.array_equal(anterior.longitudes, longitudes)):
+        anterior = None
+
+    if anterior is None:
+        features = np.full((n, len(FEATURE_COLS)), np.nan, dtype=np.float32)
+        tempo = np.zeros(n, dtype=np.int64)
+        buscado_em = np.zeros(n, dtype=np.float64)
+        categorias = np.full(n, -1, dtype=np.int8)
+        probabilidades, classes, versao = None, None, None
+    else:
+        features = anterior.features.reshape(n, -1).copy()
+        tempo = anterior.tempo.reshape(n).copy()
+        buscado_em = anterior.buscado_em.reshape(n).copy()
+        categorias = anterior.categorias.reshape(n).copy()
+        probabilidades = None if anterior.probabilidades is None else anterior.probabilidades.reshape(n, -1).copy()
+        classes, versao = anterior.classes, anterior.versao
+
+    # 1) Células sem dados ou vencidas (virada da cadência), buscadas na Open-Meteo
+    vencidas = (buscado_em == 0) | ((buscado_em // cadencia + 1) * cadencia <= agora)
+    alvos = np.flatnonzero(vencidas)
+    mudaram = np.zeros(n, dtype=bool)
+    falhas = 0
+    if len(alvos):
+        coordenadas = np.column_stack([np.repeat(latitudes, forma[1]), np.tile(longitudes, forma[0])])[alvos]
+        with medir("regiao_busca"):
+            estruturado, buscadas = _buscar_celulas(coordenadas, concorrencia, buscar)
+        falhas = int((~buscadas).sum())
+        if buscadas.any():
+            ok = alvos[buscadas]
+            novas = build_feature_matrix(estruturado[buscadas], dtype=np.float32)
+            iguais = (novas == features[ok]) | (np.isnan(novas) & np.isnan(features[ok]))
+            mudaram[ok] = ~iguais.all(axis=1) | (categorias[ok] < 0)
+            features[ok] = novas
+            tempo[ok] = estruturado["time"][buscadas]
+            buscado_em[ok] = agora
+
+    # 2) Repontua só o que mudou, ou tudo o que tem dados se o modelo/modo é outro
+    com_dados = buscado_em > 0
+    esperada = "regras" if mode == "regras" else versao_ativa()
+    if anterior is None or anterior.modo != mode or esperada not in (None, versao):
+        mudaram = com_dados.copy()
+    selecao = np.flatnonzero(mudaram)
+    if len(selecao):
+        nova_versao, labels, proba, classes_modelo = pontuar(features[selecao].astype(np.float64), mode=mode)
+        if nova_versao != versao and not mudaram[com_dados].all():
+            # A versão ativa trocou entre versao_ativa() e a predição: o resto da grade também é repontuado
+            selecao = np.flatnonzero(com_dados)
+            nova_versao, labels, proba, classes_modelo = pontuar(features[selecao].astype(np.float64), mode=mode)
+        versao = nova_versao
+        classes = np.asarray(CATEGORIAS if classes_modelo is None else classes_modelo, dtype=str)
+        categorias[selecao] = _indices_categorias(labels, classes)
+        if proba is None:
+            probabilidades = None
+        else:
+            if probabilidades is None or probabilidades.shape[1] != proba.shape[1]:
+                probabilidades = np.full((n, proba.shape[1]), np.nan, dtype=np.float32)
+            probabilidades[selecao] = proba
+
+    varredura = Varredura(
+        latitudes, longitudes, categorias.reshape(forma),
+        None if probabilidades is None else probabilidades.reshape(*forma, -1),
+        features.reshape(*forma, -1), tempo.reshape(forma), buscado_em.reshape(forma),
+        classes if classes is not None else np.asarray(CATEGORIAS, dtype=str), versao, mode,
+    )
+    resumo = {"celulas": n, "buscadas": len(alvos) - falhas, "falhas": falhas, "repontuadas": len(selecao),
+              "sem_dados": int((~com_dados).sum()), "segundos": round(time.perf_counter() - inicio, 3)}
+    return varredura, resumo
+
+
+# ---------------------------------------------------------------------------
+# Arquivo .npz
+# ---------------------------------------------------------------------------
+
+def salvar_varredura(destino, varredura: Varredura):
+    """
+    Grava a varredura num .npz comprimido ('destino' é um caminho ou um arquivo binário), um
+    array por campo (sem pickle: np.load(destino) lê com allow_pickle=False).
+    """
+    arrays = {campo: np.asarray(valor) for campo, valor in varredura._asdict().items() if valor is not None}
+    arrays["classes"] = np.asarray(varredura.classes, dtype=str)
+    if isinstance(destino, str):
+        os.makedirs(os.path.dirname(os.path.abspath(destino)), exist_ok=True)
+        temporario = f"{destino}.{os.getpid()}.tmp"
+        with open(temporario, "wb") as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(temporario, destino)
+    else:
+        np.savez_compressed(destino, **arrays)
+
+
+def carregar_varredura(caminho: str) -> Varredura:
+    """
+    Varredura gravada por salvar_varredura.
+    """
+    with np.load(caminho, allow_pickle=False) as dados:
+        campos = {campo: dados[campo] if campo in dados.files else None for campo in Varredura._fields}
+    campos["versao"] = None if campos["versao"] is None else str(campos["versao"])
+    campos["modo"] = str(campos["modo"])
+    return Varredura(**campos)
+
+
+def varredura_npz(varredura: Varredura) -> bytes:
+    arquivo = io.BytesIO()
+    salvar_varredura(arquivo, varredura)
+    return arquivo.getvalue()
+
+
+# ---------------------------------------------------------------------------
+# Varreduras recentes do processo (endpoint /risco/regiao)
+# ---------------------------------------------------------------------------
+
+class VarredurasRecentes:
+    """
+    As últimas 'maximo' varreduras do processo, por região/resolução/modo, para que pedir a
+    mesma região de novo seja uma re-varredura incremental. Varreduras simultâneas da mesma
+    região rodam uma de cada vez (a segunda reaproveita a primeira).
+    """
+
+    def __init__(self, maximo: int = RISCO_REGIAO_CACHE, varrer_regiao=varrer):
+        self.maximo = maximo
+        self.varrer_regiao = varrer_regiao
+        self._varreduras = OrderedDict()    # chave → Varredura
+        self._locks = {}                    # chave → lock da varredura em andamento
+        self._lock = threading.Lock()
+        self._stats = {"varreduras": 0, "buscadas": 0, "falhas": 0, "repontuadas": 0}
+
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._apos_fork)
+
+    def varrer(self, lat_min: float, lat_max: float, lon_min: float, lon_max: float,
+               resolucao: float = RESOLUCAO_PADRAO, mode: str = None) -> tuple:
+        chave = (lat_min, lat_max, lon_min, lon_max, resolucao, mode or PREDICTION_MODE)
+        with self._lock:
+            lock = self._locks.setdefault(chave, threading.Lock())
+        with lock:
+            with self._lock:
+                anterior = self._varreduras.get(chave)
+            varredura, resumo = self.varrer_regiao(lat_min, lat_max, lon_min, lon_max, resolucao,
+                                                   anterior=anterior, mode=mode)
+            with self._lock:
+                self._varreduras[chave] = varredura
+                self._varreduras.move_to_end(chave)
+                while len(self._varreduras) > self.maximo:
+                    antiga, _ = self._varreduras.popitem(last=False)
+                    self._locks.pop(antiga, None)
+                self._stats["varreduras"] += 1
+                for campo in ("buscadas", "falhas", "repontuadas"):
+                    self._stats[campo] += resumo[campo]
+        return varredura, resumo
+
+    def _apos_fork(self):
+        self._lock = threading.Lock()
+        self._locks = {}
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {**self._stats, "guardadas": len(self._varreduras)}
+
+
+_recentes = VarredurasRecentes()
+
+
+def varrer_regiao(lat_min: float, lat_max: float, lon_min: float, lon_max: float,
+                  resolucao: float = RESOLUCAO_PADRAO, mode: str = None) -> tuple:
+    """
+    (Varredura, resumo) da região, incremental em relação à última varredura dela neste
+    processo. Levanta ValueError se a grade passa de RISCO_REGIAO_MAX_CELULAS células.
+    """
+    # O limite é conferido antes de montar a grade: uma resolução minúscula não chega a alocar nada
+    linhas, colunas = dimensoes_grade(lat_min, lat_max, lon_min, lon_max, resolucao)
+    if linhas * colunas > RISCO_REGIAO_MAX_CELULAS:
+        raise ValueError(f"A grade teria {linhas * colunas} células; o máximo é "
+                         f"{RISCO_REGIAO_MAX_CELULAS} (use células maiores em 'resolucao' ou reduza a caixa).")
+    return _recentes.varrer(lat_min, lat_max, lon_min, lon_max, resolucao, mode)
+
+
+@registrar_coletor
+def _coletar_metricas() -> list:
+    """
+    Varreduras de região e células buscadas, que falharam ou foram repontuadas.
+    """
+    stats = _recentes.stats()
+    if not stats["varreduras"]:
+        return []
+    metricas = [("supernova_risco_regiao_varreduras_total", "counter", "Varreduras de risco de região.", {},
+                 stats["varreduras"])]
+    metricas += amostras("supernova_risco_regiao_celulas_total", "counter",
+                         "Células das varreduras de região por tipo.", "tipo",
+                         {"buscada": stats["buscadas"], "falha": stats["falhas"], "repontuada": stats["repontuadas"]})
+    return metricas
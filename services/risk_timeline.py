@@ -0,0 +1,81 @@
+"""
+Linha do tempo de risco: a categoria prevista hora a hora a partir das séries "hourly" da
+Open-Meteo (obter_linha_do_tempo), que vêm na mesma requisição do "current".
+
+Cada hora vira uma linha de features (FEATURE_COLS) pelas regras:
+  - variável do modelo com série horária → o valor daquela hora;
+  - latitude, longitude e elevation → os da célula da grade ("general"), iguais em todas as horas;
+  - variável do modelo sem série horária (ex.: a Open-Meteo não a devolveu em "hourly") → o
+    valor "current" repetido em todas as horas (persistência).
+
+A linha "current" e todas as horas de todas as coordenadas são pontuadas numa única chamada
+vetorizada (score_many). Para cada hora vão a categoria e a probabilidade dela segundo o modelo
+(None no modo "regras"), além da próxima hora, a partir de agora, em que a categoria muda.
+"""
+import time
+
+import numpy as np
+
+from services.model_service import FEATURE_COLS, score_many
+from services.weather_decoding import hora_local
+
+
+def matriz_linha_do_tempo(previsao: dict) -> np.ndarray:
+    """
+    Matriz (1 + n_horas, len(FEATURE_COLS)) de uma previsão {"general", "current", "hourly"}:
+    a linha 0 é o "current"; as seguintes, as horas de "hourly" (regras na descrição do módulo).
+    """
+    horarias = previsao["hourly"]
+    atuais = {**previsao["general"], **previsao["current"]}
+    matriz = np.empty((len(horarias["time"]) + 1, len(FEATURE_COLS)))
+    for j, coluna in enumerate(FEATURE_COLS):
+        matriz[0, j] = atuais[coluna]
+        matriz[1:, j] = horarias.get(coluna, atuais[coluna])
+    return matriz
+
+
+def proxima_mudanca(horarios: np.ndarray, categorias: np.ndarray, agora: float):
+    """
+    {"time_local", "horas", "de", "para"} da primeira hora depois da hora corrente em que a
+    categoria muda, ou None se ela não muda até o fim da série.
+    """
+    if len(horarios) == 0:
+        return None
+    atual = max(int(np.searchsorted(horarios, agora, side="right")) - 1, 0)
+    mudancas = np.flatnonzero(categorias[atual + 1:] != categorias[atual])
+    if len(mudancas) == 0:
+        return None
+    seguinte = atual + 1 + int(mudancas[0])
+    return {"time_local": hora_local(int(horarios[seguinte])), "horas": seguinte - atual,
+            "de": str(categorias[atual]), "para": str(categorias[seguinte])}
+
+
+def pontuar_linhas_do_tempo(previsoes: list, mode: str = None, agora: float = None) -> list:
+    """
+    Pontua o "current" e todas as horas de várias previsões numa única chamada ao modelo.
+    Devolve, na ordem da entrada, (categoria atual, linha do tempo) com a linha do tempo em
+    colunas: {"versao_modelo", "time_local": [...], "categoria": [...], "probabilidade": array ou
+    None, "proxima_mudanca": {...} ou None}.
+    """
+    if not previsoes:
+        return []
+    agora = time.time() if agora is None else agora
+    matrizes = [matriz_linha_do_tempo(previsao) for previsao in previsoes]
+    versao, labels, proba, classes = score_many(np.vstack(matrizes), mode=mode)
+    if proba is not None:
+        indice = {classe: i for i, classe in enumerate(classes)}
+        proba = proba[np.arange(len(labels)), [indice[label] for label in labels]]
+
+    resultados, inicio = [], 0
+    for previsao, matriz in zip(previsoes, matrizes):
+        horas = slice(inicio + 1, inicio + len(matriz))
+        horarios, categorias = previsao["hourly"]["time"], labels[horas]
+        resultados.append((str(labels[inicio]), {
+            "versao_modelo": versao,
+            "time_local": [hora_local(horario) for horario in horarios.tolist()],
+            "categoria": [str(categoria) for categoria in categorias],
+            "probabilidade": None if proba is None else proba[horas],
+            "proxima_mudanca": proxima_mudanca(horarios, categorias, agora),
+        }))
+        inicio += len(matriz)
+    return resultados
@@ -0,0 +1,255 @@
+import os
+import threading
+from typing import NamedTuple
+
+import numpy as np
+
+# Regras de negócio que geram os rótulos do dataset (categorize em utils/gerador_csv.py), em forma
+# de tabela de limiares: cada categoria tem condições (uma por variável) e o mínimo de condições
+# atendidas. As categorias são avaliadas em ordem de prioridade; se nenhuma bate, vale a padrão.
+
+INF = float("inf")
+
+
+class Intervalo(NamedTuple):
+    """
+    Intervalo de valores de uma variável; os limites podem ser abertos ou fechados.
+    """
+    minimo: float
+    maximo: float
+    inclui_minimo: bool = True
+    inclui_maximo: bool = False
+
+    def contem(self, x):
+        """
+        Funciona tanto para escalares quanto para arrays NumPy (máscara booleana).
+        """
+        if self.minimo == -INF:
+            return x <= self.maximo if self.inclui_maximo else x < self.maximo
+        acima = x >= self.minimo if self.inclui_minimo else x > self.minimo
+        if self.maximo == INF:
+            return acima
+        abaixo = x <= self.maximo if self.inclui_maximo else x < self.maximo
+        return acima & abaixo
+
+
+class Regra(NamedTuple):
+    categoria: str
+    minimo_condicoes: int
+    condicoes: dict  # variável → tupla de Intervalos (a condição vale se o valor cair em qualquer um)
+
+
+REGRAS = [
+    Regra("Crítico (Emergência Imediata)", 5, {
+        "wind_speed_10m": (Intervalo(20, INF, True, True),),
+        "wind_gusts_10m": (Intervalo(25, INF, True, True),),
+        "precipitation": (Intervalo(50, INF, True, True),),
+        "snowfall": (Intervalo(20, INF, True, True),),
+        "temperature_2m": (Intervalo(-INF, -20, True, True), Intervalo(45, INF, True, True)),
+        "relative_humidity_2m": (Intervalo(95, INF, True, True),),
+        "cloud_cover": (Intervalo(90, INF, True, True),),
+    }),
+    Regra("Severo (Alerta Vermelho)", 3, {
+        "wind_speed_10m": (Intervalo(12, 20),),
+        "wind_gusts_10m": (Intervalo(15, 25),),
+        "precipitation": (Intervalo(30, 50),),
+        "snowfall": (Intervalo(10, 20),),
+        "temperature_2m": (Intervalo(-20, -10), Intervalo(40, 45, False, False)),
+        "relative_humidity_2m": (Intervalo(90, 95),),
+        "cloud_cover": (Intervalo(75, 90),),
+    }),
+    Regra("Moderado (Atenção Amarela)", 3, {
+        "wind_speed_10m": (Intervalo(6, 12),),
+        "wind_gusts_10m": (Intervalo(8, 15),),
+        "precipitation": (Intervalo(10, 30),),
+        "snowfall": (Intervalo(5, 10),),
+        "temperature_2m": (Intervalo(-10, -5), Intervalo(35, 40, False, True)),
+        "relative_humidity_2m": (Intervalo(80, 90),),
+        "cloud_cover": (Intervalo(50, 75),),
+    }),
+    Regra("Estável (Suporte Disponível)", 3, {
+        "wind_speed_10m": (Intervalo(2, 6),),
+        "wind_gusts_10m": (Intervalo(3, 8),),
+        "precipitation": (Intervalo(1, 10),),
+        "snowfall": (Intervalo(1, 5),),
+        "temperature_2m": (Intervalo(0, 35, True, True),),
+        "relative_humidity_2m": (Intervalo(50, 80),),
+        "cloud_cover": (Intervalo(25, 50),),
+    }),
+]
+
+CATEGORIA_PADRAO = "Suave (Verde)"
+CATEGORIAS = [regra.categoria for regra in REGRAS] + [CATEGORIA_PADRAO]
+
+# Variáveis usadas pelas regras
+RULE_VARIABLES = list(REGRAS[0].condicoes)
+
+# Margem (na unidade de cada variável) dentro da qual um valor é considerado "em cima" de um
+# limiar: se mexer o valor dentro da margem muda a categoria, a linha é ambígua para as regras.
+# REGRAS_MARGEM_FATOR escala todas as margens (0 = nenhuma linha é ambígua)
+MARGEM_FATOR = float(os.environ.get("REGRAS_MARGEM_FATOR", 1.0))
+MARGENS = {
+    "wind_speed_10m": 0.5,  # km/h
+    "wind_gusts_10m": 0.5,  # km/h
+    "precipitation": 0.5,  # mm
+    "snowfall": 0.5,  # cm
+    "temperature_2m": 0.5,  # °C
+    "relative_humidity_2m": 1.0,  # %
+    "cloud_cover": 1.0,  # %
+}
+
+
+def thresholds() -> dict:
+    """
+    Limiares finitos de cada variável das regras, ordenados (as bordas de todos os intervalos).
+    """
+    limiares = {variavel: set() for variavel in RULE_VARIABLES}
+    for regra in REGRAS:
+        for variavel, intervalos in regra.condicoes.items():
+            for intervalo in intervalos:
+                limiares[variavel].update(v for v in (intervalo.minimo, intervalo.maximo) if abs(v) != INF)
+    return {variavel: sorted(valores) for variavel, valores in limiares.items()}
+
+
+_LIMIARES_ESCALARES = thresholds()
+_LIMIARES = {variavel: np.asarray(valores, dtype=np.float64) for variavel, valores in _LIMIARES_ESCALARES.items()}
+
+
+def rule_counts(colunas) -> np.ndarray:
+    """
+    Quantas condições de cada regra cada linha atende. 'colunas' é um dict (ou DataFrame) com
+    arrays das variáveis das regras. Retorna um array int8 (n_linhas, len(REGRAS)).
+    """
+    valores = {variavel: np.asarray(colunas[variavel]) for variavel in RULE_VARIABLES}
+    n = len(valores[RULE_VARIABLES[0]])
+    contagens = np.zeros((n, len(REGRAS)), dtype=np.int8)
+    for i, regra in enumerate(REGRAS):
+        for variavel, intervalos in regra.condicoes.items():
+            x = valores[variavel]
+            mascara = intervalos[0].contem(x)
+            for intervalo in intervalos[1:]:
+                mascara |= intervalo.contem(x)
+            contagens[:, i] += mascara
+    return contagens
+
+
+def categorize_many(colunas) -> np.ndarray:
+    """
+    Versão vetorizada de categorize: devolve um array (object) com a categoria de cada linha.
+    """
+    contagens = rule_counts(colunas)
+    disparou = contagens >= np.array([regra.minimo_condicoes for regra in REGRAS], dtype=np.int8)
+    return np.select(list(disparou.T), CATEGORIAS[:-1], default=CATEGORIA_PADRAO).astype(object)
+
+
+def categorize_one(linha) -> str:
+    """
+    Caminho escalar de categorize_many para uma única linha (dict com as variáveis das regras):
+    em Python puro, sem o custo fixo das operações NumPy.
+    """
+    for regra in REGRAS:
+        atendidas = 0
+        for variavel, intervalos in regra.condicoes.items():
+            x = linha[variavel]
+            atendidas += any(intervalo.contem(x) for intervalo in intervalos)
+        if atendidas >= regra.minimo_condicoes:
+            return regra.categoria
+    return CATEGORIA_PADRAO
+
+
+def evaluate_rules_one(linha, margens: dict = None, fator: float = None) -> tuple:
+    """
+    Caminho escalar de evaluate_rules. Retorna (categoria, ambigua).
+    """
+    margens = MARGENS if margens is None else margens
+    fator = MARGEM_FATOR if fator is None else fator
+    valores = {variavel: float(linha[variavel]) for variavel in RULE_VARIABLES}
+    categoria = categorize_one(valores)
+    if fator <= 0:
+        return categoria, False
+    for variavel, x in valores.items():
+        margem = margens[variavel] * fator
+        if not any(abs(x - limiar) <= margem for limiar in _LIMIARES_ESCALARES[variavel]):
+            continue
+        for deslocamento in (-margem, margem):
+            if categorize_one(dict(valores, **{variavel: x + deslocamento})) != categoria:
+                return categoria, True
+    return categoria, False
+
+
+def evaluate_rules(colunas, margens: dict = None, fator: float = None) -> tuple:
+    """
+    Categoriza pelas regras e marca as linhas ambíguas: aquelas em que mover uma das variáveis
+    em ± margem (até o limiar mais próximo) muda a categoria.
+
+    Retorna (labels, ambiguas): array de categorias e máscara booleana das linhas ambíguas.
+    """
+    margens = MARGENS if margens is None else margens
+    fator = MARGEM_FATOR if fator is None else fator
+    valores = {variavel: np.asarray(colunas[variavel], dtype=np.float64) for variavel in RULE_VARIABLES}
+    labels = categorize_many(valores)
+    ambiguas = np.zeros(len(labels), dtype=bool)
+    if fator <= 0 or len(labels) == 0:
+        return labels, ambiguas
+
+    # 1) só as linhas com alguma variável perto de um limiar podem mudar de categoria
+    proximas = {}
+    for variavel, x in valores.items():
+        limiares = _LIMIARES[variavel]
+        margem = margens[variavel] * fator
+        posicao = np.clip(np.searchsorted(limiares, x), 1, len(limiares) - 1)
+        distancia = np.minimum(np.abs(x - limiares[posicao - 1]), np.abs(x - limiares[posicao]))
+        proximas[variavel] = distancia <= margem
+
+    # 2) nessas linhas, recategoriza com a variável deslocada para cada lado
+    candidatas = np.flatnonzero(np.logical_or.reduce(list(proximas.values())))
+    if candidatas.size == 0:
+        return labels, ambiguas
+    base = {variavel: x[candidatas] for variavel, x in valores.items()}
+    for variavel in RULE_VARIABLES:
+        if not proximas[variavel][candidatas].any():
+            continue
+        margem = margens[variavel] * fator
+        for deslocamento in (-margem, margem):
+            deslocado = dict(base)
+            deslocado[variavel] = base[variavel] + deslocamento
+            ambiguas[candidatas] |= categorize_many(deslocado) != labels[candidatas]
+    return labels, ambiguas
+
+
+class AgreementStats:
+    """
+    Matriz de concordância (regras × modelo) acumulada das linhas em que os dois foram avaliados.
+    """
+
+    def __init__(self):
+        self._indice = {categoria: i for i, categoria in enumerate(CATEGORIAS)}
+        self._matriz = np.zeros((len(CATEGORIAS), len(CATEGORIAS)), dtype=np.int64)
+        self._lock = threading.Lock()
+
+    def registrar(self, labels_regras, labels_modelo):
+        i = np.fromiter((self._indice[c] for c in labels_regras), dtype=np.intp, count=len(labels_regras))
+        j = np.fromiter((self._indice[c] for c in labels_modelo), dtype=np.intp, count=len(labels_modelo))
+        contagem = np.bincount(i * len(CATEGORIAS) + j, minlength=len(CATEGORIAS) ** 2)
+        with self._lock:
+            self._matriz += contagem.reshape(len(CATEGORIAS), len(CATEGORIAS))
+
+    def stats(self) -> dict:
+        """
+        Taxa de concordância geral e por categoria das regras, e a matriz (linhas = regras,
+        colunas = modelo, na ordem de CATEGORIAS).
+        """
+        with self._lock:
+            matriz = self._matriz.copy()
+        total = int(matriz.sum())
+        por_regra = matriz.sum(axis=1)
+        return {
+            "linhas": total,
+            "concordancia": float(np.trace(matriz) / total) if total else None,
+            "concordancia_por_categoria": {
+                categoria: float(matriz[i, i] / por_regra[i]) if por_regra[i] else None
+                for i, categoria in enumerate(CATEGORIAS)
+            },
+            "categorias": CATEGORIAS,
+            "matriz": matriz.tolist(),
+        }
@@ -0,0 +1,433 @@
+import asyncio
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from services.metrics import registrar_coletor
+
+logger = logging.getLogger(__name__)
+
+
+class LimiteUpstream:
+    """
+    Limite de concorrência + timeout para as chamadas assíncronas a um upstream
+    (brazilcep, Nominatim, Open-Meteo). Cada upstream tem o seu, para que um serviço lento
+    não ocupe as vagas dos outros.
+    """
+
+    def __init__(self, nome: str, concorrencia: int, timeout: float):
+        self.nome = nome
+        self.concorrencia = concorrencia
+        self.timeout = timeout
+        # Desde o Python 3.10 o semáforo só se prende ao event loop no primeiro uso
+        self._semaforo = asyncio.Semaphore(concorrencia)
+        self.em_uso = 0
+        self.timeouts = 0
+
+    async def executar(self, criar_corotina):
+        """
+        Espera uma vaga, executa criar_corotina() e cancela a chamada se passar de self.timeout
+        (levanta asyncio.TimeoutError). O tempo na fila da vaga não conta para o timeout.
+        """
+        async with self._semaforo:
+            self.em_uso += 1
+            try:
+                return await asyncio.wait_for(criar_corotina(), timeout=self.timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                raise
+            finally:
+                self.em_uso -= 1
+
+    def stats(self) -> dict:
+        return {"upstream": self.nome, "concorrencia": self.concorrencia, "em_uso": self.em_uso,
+                "timeouts": self.timeouts}
+
+
+# ------------------
+# Disjuntores, hedge e degradação
+
+# Parâmetros comuns dos disjuntores (a lentidão é por upstream, ver Disjuntor)
+CIRCUITO_JANELA = int(os.environ.get("CIRCUITO_JANELA", 50))              # últimas chamadas avaliadas
+CIRCUITO_MINIMO = int(os.environ.get("CIRCUITO_MINIMO", 10))              # chamadas antes de poder abrir
+CIRCUITO_TAXA_FALHAS = float(os.environ.get("CIRCUITO_TAXA_FALHAS", 0.5))
+CIRCUITO_TAXA_LENTAS = float(os.environ.get("CIRCUITO_TAXA_LENTAS", 0.5))
+CIRCUITO_PAUSA_SEGUNDOS = float(os.environ.get("CIRCUITO_PAUSA_SEGUNDOS", 10))
+# Hedge: uma chamada que passa do percentil HEDGE_PERCENTIL das latências recentes do upstream
+# ganha uma cópia; vale a que responder primeiro
+HEDGE_ATIVO = os.environ.get("HEDGE_ATIVO", "1") == "1"
+HEDGE_PERCENTIL = float(os.environ.get("HEDGE_PERCENTIL", 0.95))
+HEDGE_ATRASO_MIN_MS = float(os.environ.get("HEDGE_ATRASO_MIN_MS", 50))
+HEDGE_WORKERS = int(os.environ.get("HEDGE_WORKERS", 32))
+
+_ESTADOS = {"fechado": 0, "meio_aberto": 1, "aberto": 2}
+
+_disjuntores = []
+_executor_hedge = None
+_executor_hedge_lock = threading.Lock()
+# Vagas livres no executor do hedge: uma tarefa só é submetida com vaga, então nunca espera na fila
+_vagas_hedge = threading.BoundedSemaphore(HEDGE_WORKERS)
+
+
+class CircuitoAberto(RuntimeError):
+    """
+    O disjuntor do upstream está aberto: a chamada é recusada na hora, sem ir à rede.
+    """
+
+
+class Disjuntor:
+    """
+    Disjuntor (circuit breaker) de um upstream, que abre por falhas ou por lentidão.
+
+    Guarda o resultado das últimas 'janela' chamadas. Com pelo menos 'minimo' chamadas, abre
+    quando a fração de falhas passa de 'taxa_falhas' ou a de chamadas mais lentas que 'lentidao'
+    segundos passa de 'taxa_lentas'. Aberto, recusa as chamadas (CircuitoAberto) por 'pausa'
+    segundos; depois deixa passar uma sonda (meio aberto): se ela responde bem e rápido o
+    disjuntor fecha, senão abre de novo. Fora do estado fechado só o resultado da sonda conta, e
+    resultados de chamadas que começaram antes da última mudança de estado são descartados (uma
+    resposta atrasada de antes da abertura não fecha nem reabre o disjuntor).
+
+    As latências das chamadas bem-sucedidas também dão o atraso do hedge (atraso_hedge).
+    Exceções em 'ignorar' (ex.: CEP inexistente) são respostas normais do upstream, não falhas.
+    """
+
+    def __init__(self, nome: str, lentidao: float, janela: int = CIRCUITO_JANELA, minimo: int = CIRCUITO_MINIMO,
+                 taxa_falhas: float = CIRCUITO_TAXA_FALHAS, taxa_lentas: float = CIRCUITO_TAXA_LENTAS,
+                 pausa: float = CIRCUITO_PAUSA_SEGUNDOS, ignorar: tuple = ()):
+        self.nome = nome
+        self.lentidao = lentidao
+        self.minimo = minimo
+        self.taxa_falhas = taxa_falhas
+        self.taxa_lentas = taxa_lentas
+        self.pausa = pausa
+        self.ignorar = tuple(ignorar)
+
+        self._chamadas = deque(maxlen=janela)                  # (falhou, lenta)
+        self._latencias = deque(maxlen=max(janela, 200))       # segundos das chamadas bem-sucedidas
+        self._estado = "fechado"
+        self._aberto_ate = 0.0
+        self._sonda_desde = None
+        self._mudou_em = 0.0  # time.monotonic() da última abertura ou fechamento
+        self._lock = threading.Lock()
+        self._stats = {"chamadas": 0, "falhas": 0, "lentas": 0, "recusadas": 0, "aberturas": 0,
+                       "hedges": 0, "hedges_vencedores": 0, "hedges_sem_vaga": 0}
+        _disjuntores.append(self)
+
+    @property
+    def estado(self) -> str:
+        return self._estado
+
+    def permitir(self):
+        """
+        Levanta CircuitoAberto se a chamada não pode ir ao upstream agora.
+        """
+        with self._lock:
+            if self._estado == "fechado":
+                return
+            agora = time.monotonic()
+            if self._estado == "aberto" and agora >= self._aberto_ate:
+                self._estado = "meio_aberto"
+            # Meio aberto: uma sonda por vez (uma sonda que nunca voltou é substituída depois da pausa)
+            if self._estado == "meio_aberto" and (self._sonda_desde is None or agora - self._sonda_desde > self.pausa):
+                self._sonda_desde = agora
+                return
+            self._stats["recusadas"] += 1
+        raise CircuitoAberto(f"{self.nome} indisponível (circuito aberto).")
+
+    def registrar(self, duracao: float, sucesso: bool, inicio: float = None):
+        """
+        Resultado de uma chamada ao upstream que começou em 'inicio' (time.monotonic(); por
+        padrão, agora menos a duração).
+        """
+        lenta = duracao > self.lentidao
+        if inicio is None:
+            inicio = time.monotonic() - duracao
+        with self._lock:
+            self._stats["chamadas"] += 1
+            self._stats["falhas"] += not sucesso
+            self._stats["lentas"] += lenta
+            if self._estado != "fechado":
+                # Só a sonda decide: chamadas de antes da abertura (ou de uma sonda substituída)
+                # não dizem nada sobre o upstream agora
+                if self._sonda_desde is None or inicio < self._sonda_desde:
+                    return
+                self._sonda_desde = None
+                if sucesso and not lenta:
+                    self._estado = "fechado"
+                    self._mudou_em = time.monotonic()
+                    self._chamadas.clear()
+                else:
+                    self._abrir()
+                return
+            if inicio < self._mudou_em:
+                return
+            if sucesso:
+                self._latencias.append(duracao)
+            self._chamadas.append((not sucesso, lenta))
+            n = len(self._chamadas)
+            if n >= self.minimo:
+                falhas = sum(falhou for falhou, _ in self._chamadas)
+                lentas = sum(lenta for _, lenta in self._chamadas)
+                if falhas >= self.taxa_falhas * n or lentas >= self.taxa_lentas * n:
+                    self._abrir()
+
+    def _abrir(self):
+        # Chamado com self._lock adquirido
+        if self._estado != "aberto":
+            self._stats["aberturas"] += 1
+            logger.warning("Circuito do upstream %s aberto por %.0f s.", self.nome, self.pausa)
+        self._estado = "aberto"
+        self._mudou_em = time.monotonic()
+        self._aberto_ate = self._mudou_em + self.pausa
+        self._chamadas.clear()
+
+    def _sucesso(self, erro: BaseException) -> bool:
+        return erro is None or isinstance(erro, self.ignorar)
+
+    def medir(self, funcao, *args, **kwargs):
+        """
+        Executa funcao(*args, **kwargs) registrando a duração e o resultado (sem checar o estado).
+        """
+        inicio = time.monotonic()
+        try:
+            resultado = funcao(*args, **kwargs)
+        except BaseException as e:
+            self.registrar(time.monotonic() - inicio, self._sucesso(e), inicio)
+            raise
+        self.registrar(time.monotonic() - inicio, True, inicio)
+        return resultado
+
+    async def medir_async(self, criar_corotina):
+        inicio = time.monotonic()
+        try:
+            resultado = await criar_corotina()
+        except asyncio.CancelledError:
+            # Cancelada por quem chamou (ou pelo hedge): não diz nada sobre o upstream
+            raise
+        except BaseException as e:
+            self.registrar(time.monotonic() - inicio, self._sucesso(e), inicio)
+            raise
+        self.registrar(time.monotonic() - inicio, True, inicio)
+        return resultado
+
+    def atraso_hedge(self):
+        """
+        Segundos até disparar a cópia de uma chamada (percentil HEDGE_PERCENTIL das latências
+        recentes, no mínimo HEDGE_ATRASO_MIN_MS), ou None sem hedge (desligado, poucas amostras
+        ou disjuntor fora do estado fechado).
+        """
+        with self._lock:
+            if not HEDGE_ATIVO or self._estado != "fechado" or len(self._latencias) < self.minimo:
+                return None
+            latencias = sorted(self._latencias)
+        posicao = min(int(HEDGE_PERCENTIL * len(latencias)), len(latencias) - 1)
+        return max(latencias[posicao], HEDGE_ATRASO_MIN_MS / 1000)
+
+    def _contar_hedge(self, venceu: bool):
+        with self._lock:
+            self._stats["hedges"] += 1
+            self._stats["hedges_vencedores"] += venceu
+
+    def chamar(self, funcao, *args, hedge: bool = False, **kwargs):
+        """
+        Chamada síncrona protegida pelo disjuntor; com hedge=True, se ela passar de
+        atraso_hedge(), uma cópia é disparada e vale a primeira que responder (a outra termina
+        em segundo plano e é descartada). Só para chamadas idempotentes.
+
+        As tentativas do hedge só vão para o executor compartilhado quando há uma thread livre
+        nele (nunca esperam na fila, então o atraso conta do início real da chamada). Com o
+        executor ocupado, a chamada roda na thread de quem chamou, sem hedge, e a cópia que não
+        acha vaga não é disparada.
+        """
+        self.permitir()
+        atraso = self.atraso_hedge() if hedge else None
+        primeira = None if atraso is None else self._submeter_tentativa(funcao, *args, **kwargs)
+        if primeira is None:
+            return self.medir(funcao, *args, **kwargs)
+
+        if not wait([primeira], timeout=atraso).done:
+            segunda = self._submeter_tentativa(funcao, *args, **kwargs)
+            if segunda is None:
+                return primeira.result()
+            pendentes, erro = {primeira, segunda}, None
+            while pendentes:
+                feitas, pendentes = wait(pendentes, return_when=FIRST_COMPLETED)
+                for feita in feitas:
+                    if feita.exception() is None:
+                        self._contar_hedge(feita is segunda)
+                        return feita.result()
+                    erro = feita.exception()
+            self._contar_hedge(False)
+            raise erro
+        return primeira.result()
+
+    def _submeter_tentativa(self, funcao, *args, **kwargs):
+        """
+        Future de uma tentativa no executor do hedge, ou None se ele não tem thread livre.
+        As tentativas rodam no contexto de quem chamou (degradações e contagem de chamadas à rede).
+        """
+        if not _vagas_hedge.acquire(blocking=False):
+            with self._lock:
+                self._stats["hedges_sem_vaga"] += 1
+            return None
+        try:
+            futuro = _obter_executor_hedge().submit(contextvars.copy_context().run, self.medir, funcao, *args, **kwargs)
+        except BaseException:
+            _vagas_hedge.release()
+            raise
+        futuro.add_done_callback(lambda _: _vagas_hedge.release())
+        return futuro
+
+    async def chamar_async(self, criar_corotina, hedge: bool = False):
+        """
+        Versão assíncrona de chamar: criar_corotina() cria cada tentativa; a perdedora do
+        hedge é cancelada.
+        """
+        self.permitir()
+        atraso = self.atraso_hedge() if hedge else None
+        if atraso is None:
+            return await self.medir_async(criar_corotina)
+
+        primeira = asyncio.ensure_future(self.medir_async(criar_corotina))
+        tarefas = {primeira}
+        try:
+            feitas, _ = await asyncio.wait(tarefas, timeout=atraso)
+            if feitas:
+                return primeira.result()
+            segunda = asyncio.ensure_future(self.medir_async(criar_corotina))
+            tarefas.add(segunda)
+            pendentes, erro = set(tarefas), None
+            while pendentes:
+                feitas, pendentes = await asyncio.wait(pendentes, return_when=asyncio.FIRST_COMPLETED)
+                for feita in feitas:
+                    if feita.exception() is None:
+                        self._contar_hedge(feita is segunda)
+                        return feita.result()
+                    erro = feita.exception()
+            self._contar_hedge(False)
+            raise erro
+        finally:
+            for tarefa in tarefas:
+                tarefa.cancel()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"upstream": self.nome, "estado": self._estado, **self._stats}
+
+
+def _obter_executor_hedge() -> ThreadPoolExecutor:
+    global _executor_hedge
+    if _executor_hedge is None:
+        with _executor_hedge_lock:
+            if _executor_hedge is None:
+                _executor_hedge = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="hedge")
+    return _executor_hedge
+
+
+def _apos_fork():
+    # Threads e locks herdados não valem no filho
+    global _executor_hedge, _executor_hedge_lock, _vagas_hedge
+    _executor_hedge = None
+    _executor_hedge_lock = threading.Lock()
+    _vagas_hedge = threading.BoundedSemaphore(HEDGE_WORKERS)
+    for disjuntor in _disjuntores:
+        disjuntor._lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_apos_fork)
+
+
+# Degradações usadas na requisição atual ("clima_desatualizado", "localizacao_aproximada"...),
+# listadas na resposta de /consulta; None fora de uma requisição
+_degradacoes = ContextVar("degradacoes", default=None)
+
+
+def iniciar_degradacoes():
+    """
+    Começa a anotar as degradações da requisição atual. Devolve o token para encerrar_degradacoes.
+    """
+    return _degradacoes.set([])
+
+
+def encerrar_degradacoes(token):
+    if token is not None:
+        _degradacoes.reset(token)
+
+
+def marcar_degradacao(motivo: str):
+    """
+    Anota que a requisição atual usou um dado degradado (sem efeito fora de uma requisição).
+    """
+    degradacoes = _degradacoes.get()
+    if degradacoes is not None and motivo not in degradacoes:
+        degradacoes.append(motivo)
+
+
+def degradacoes() -> list:
+    """
+    Degradações anotadas na requisição atual.
+    """
+    return list(_degradacoes.get() or ())
+
+
+# Chamadas que foram mesmo à rede (não a um cache HTTP) dentro de contar_chamadas_rede
+_chamadas_rede = ContextVar("chamadas_rede", default=None)
+
+
+@contextmanager
+def contar_chamadas_rede():
+    """
+    Conta as chamadas aos upstreams feitas dentro do bloco que foram à rede (ver
+    marcar_chamada_rede), inclusive as cópias do hedge. Produz uma lista que ganha um item por
+    chamada.
+    """
+    chamadas = []
+    token = _chamadas_rede.set(chamadas)
+    try:
+        yield chamadas
+    finally:
+        _chamadas_rede.reset(token)
+
+
+def marcar_chamada_rede():
+    """
+    Anota uma chamada que foi à rede (sem efeito fora de contar_chamadas_rede).
+    """
+    chamadas = _chamadas_rede.get()
+    if chamadas is not None:
+        chamadas.append(time.monotonic())
+
+
+@registrar_coletor
+def _coletar_metricas() -> list:
+    """
+    Estado, aberturas, chamadas recusadas e hedges dos disjuntores (lidos no /metrics).
+    """
+    metricas = []
+    for disjuntor in _disjuntores:
+        stats = disjuntor.stats()
+        rotulos = {"upstream": disjuntor.nome}
+        metricas += [
+            ("supernova_circuito_estado", "gauge", "Estado do disjuntor (0 fechado, 1 meio aberto, 2 aberto).",
+             rotulos, _ESTADOS[stats["estado"]]),
+            ("supernova_circuito_aberturas_total", "counter", "Vezes que o disjuntor abriu.", rotulos,
+             stats["aberturas"]),
+            ("supernova_circuito_recusadas_total", "counter", "Chamadas recusadas com o disjuntor aberto.", rotulos,
+             stats["recusadas"]),
+            ("supernova_upstream_lentas_total", "counter", "Chamadas acima do limiar de lentidão.", rotulos,
+             stats["lentas"]),
+            ("supernova_hedge_total", "counter", "Chamadas que ganharam uma cópia (hedge).", rotulos, stats["hedges"]),
+            ("supernova_hedge_vencedores_total", "counter", "Hedges em que a cópia respondeu primeiro.", rotulos,
+             stats["hedges_vencedores"]),
+            ("supernova_hedge_sem_vaga_total", "counter",
+             "Tentativas que rodaram sem hedge (ou cópias não disparadas) com o executor do hedge ocupado.",
+             rotulos, stats["hedges_sem_vaga"]),
+        ]
+    return metricas
@@ -0,0 +1,274 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import NamedTuple
+
+from services.upstream import contar_chamadas_rede, marcar_degradacao
+
+logger = logging.getLogger(__name__)
+
+# Configurações do cache por célula da grade (podem ser sobrescritas por variáveis de ambiente)
+# Passo (em graus) do apelido da coordenada pedida; bem menor que as células dos modelos, para
+# que duas coordenadas com o mesmo apelido caiam quase sempre na mesma célula
+GRADE_PASSO_LAT = float(os.environ.get("GRADE_PASSO_LAT", 0.01))
+GRADE_PASSO_LON = float(os.environ.get("GRADE_PASSO_LON", 0.01))
+# Os dados "current" da Open-Meteo são atualizados a cada 15 minutos
+OPEN_METEO_CADENCIA_SEGUNDOS = int(os.environ.get("OPEN_METEO_CADENCIA_SEGUNDOS", 900))
+GRADE_MAX_CELULAS = int(os.environ.get("GRADE_MAX_CELULAS", 100000))
+# Stale-while-revalidate: por quantos segundos depois de expirar uma previsão ainda é servida
+# (marcada "clima_desatualizado") enquanto a atualização roda em segundo plano; 0 desliga
+GRADE_STALE_SEGUNDOS = int(os.environ.get("GRADE_STALE_SEGUNDOS", 900))
+
+
+class _EntradaGrade(NamedTuple):
+    previsao: dict
+    expira_em: float
+
+
+def _copiar_previsao(previsao: dict) -> dict:
+    # Quem chama costuma acrescentar chaves (ex.: "previsao_condicao_climatica"); não mexe no cache
+    return {chave: dict(valor) if isinstance(valor, dict) else valor for chave, valor in previsao.items()}
+
+
+class WeatherGridCache:
+    """
+    Cache de previsões por célula da grade da Open-Meteo.
+
+    A Open-Meteo resolve cada coordenada para a célula do modelo e devolve a latitude/longitude
+    dessa célula em "general". As entradas ficam indexadas por essa latitude/longitude exata; a
+    coordenada pedida, arredondada para GRADE_PASSO_LAT × GRADE_PASSO_LON, é só um apelido que
+    aponta para a célula informada na última busca. Coordenadas próximas que o modelo resolve
+    para células diferentes não se misturam, e a atualização de uma célula vale para todos os
+    apelidos que apontam para ela.
+
+    As entradas expiram na próxima virada da cadência de atualização do modelo
+    (OPEN_METEO_CADENCIA_SEGUNDOS), e buscas simultâneas da mesma célula são agrupadas numa
+    única requisição em andamento (single-flight).
+
+    Até 'stale' segundos depois de expirar, a entrada antiga é devolvida na hora (e a
+    requisição atual marcada com a degradação "clima_desatualizado") enquanto uma única
+    atualização da célula roda em segundo plano — numa thread, ou numa Task no modo assíncrono.
+    Assim um upstream lento ou fora do ar não segura a resposta.
+    """
+
+    def __init__(self, passo_lat: float = GRADE_PASSO_LAT, passo_lon: float = GRADE_PASSO_LON,
+                 cadencia: int = OPEN_METEO_CADENCIA_SEGUNDOS, max_celulas: int = GRADE_MAX_CELULAS,
+                 stale: int = GRADE_STALE_SEGUNDOS):
+        self.passo_lat = passo_lat
+        self.passo_lon = passo_lon
+        self.cadencia = cadencia
+        self.max_celulas = max_celulas
+        self.stale = stale
+
+        self._celulas = OrderedDict()   # célula informada pela Open-Meteo → _EntradaGrade
+        self._apelidos = OrderedDict()  # chave(coordenada pedida) → célula informada
+        self._em_andamento = {}
+        self._em_andamento_async = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "agrupadas": 0, "buscas_upstream": 0, "desatualizadas": 0}
+
+    def chave(self, latitude: float, longitude: float) -> tuple:
+        """
+        Apelido da coordenada pedida (arredondada para o passo), chave das consultas ao cache.
+        """
+        return (round(round(latitude / self.passo_lat) * self.passo_lat, 6),
+                round(round(longitude / self.passo_lon) * self.passo_lon, 6))
+
+    def obter(self, latitude: float, longitude: float, buscar) -> dict:
+        """
+        Devolve a previsão da célula de (latitude, longitude). Em caso de miss chama
+        buscar(latitude, longitude) — uma única vez por célula, mesmo com várias threads.
+        """
+        return self.obter_muitos([(latitude, longitude)], lambda coords: [buscar(*coords[0])])[0]
+
+    def obter_muitos(self, coordenadas: list, buscar_muitos, desatualizadas: list = None) -> list:
+        """
+        Versão em lote de obter: as células que faltam (sem repetição e sem as que outra
+        thread já está buscando) são buscadas numa única chamada buscar_muitos(coordenadas),
+        que deve devolver as previsões na mesma ordem. Se 'desatualizadas' é dada, recebe os
+        índices das coordenadas servidas com a previsão expirada (stale-while-revalidate).
+        """
+        chaves = [self.chave(lat, lon) for lat, lon in coordenadas]
+        resultados = [None] * len(coordenadas)
+        minhas = {}     # chave → (coordenada, Future) que esta chamada vai buscar
+        esperando = {}  # chave → Future de outra thread
+        revalidar = {}  # chave → (coordenada, Future) atualizadas em segundo plano
+
+        agora = time.time()
+        with self._lock:
+            for i, chave in enumerate(chaves):
+                entrada = self._entrada(chave)
+                if entrada is not None and entrada.expira_em > agora:
+                    self._stats["hits"] += 1
+                    resultados[i] = _copiar_previsao(entrada.previsao)
+                elif self._servivel(entrada, agora):
+                    self._stats["desatualizadas"] += 1
+                    resultados[i] = _copiar_previsao(entrada.previsao)
+                    if desatualizadas is not None:
+                        desatualizadas.append(i)
+                    if chave not in self._em_andamento and chave not in revalidar:
+                        futuro = Future()
+                        self._em_andamento[chave] = futuro
+                        revalidar[chave] = (coordenadas[i], futuro)
+                elif chave in minhas:
+                    self._stats["agrupadas"] += 1
+                elif chave in self._em_andamento:
+                    self._stats["agrupadas"] += 1
+                    esperando[chave] = self._em_andamento[chave]
+                else:
+                    self._stats["misses"] += 1
+                    futuro = Future()
+                    self._em_andamento[chave] = futuro
+                    minhas[chave] = (coordenadas[i], futuro)
+
+        if revalidar:
+            marcar_degradacao("clima_desatualizado")
+            threading.Thread(target=self._revalidar, args=(revalidar, buscar_muitos),
+                             name="revalidar-grade", daemon=True).start()
+        if minhas:
+            self._buscar_e_guardar(minhas, buscar_muitos)
+
+        for i, chave in enumerate(chaves):
+            if resultados[i] is None:
+                futuro = minhas[chave][1] if chave in minhas else esperando[chave]
+                resultados[i] = _copiar_previsao(futuro.result())
+        return resultados
+
+    async def obter_async(self, latitude: float, longitude: float, buscar_async) -> dict:
+        """
+        Versão para o modo assíncrono: em caso de miss aguarda buscar_async(latitude, longitude).
+        Corotinas simultâneas da mesma célula aguardam a mesma Task (single-flight); o cancelamento
+        de quem espera não cancela a busca compartilhada.
+        """
+        chave = self.chave(latitude, longitude)
+        with self._lock:
+            entrada = self._entrada(chave)
+            if entrada is not None and entrada.expira_em > time.time():
+                self._stats["hits"] += 1
+                return _copiar_previsao(entrada.previsao)
+
+            tarefa = self._em_andamento_async.get(chave)
+            if self._servivel(entrada, time.time()):
+                self._stats["desatualizadas"] += 1
+                if tarefa is None:
+                    tarefa = asyncio.ensure_future(self._buscar_e_guardar_async(chave, latitude, longitude, buscar_async))
+                    tarefa.add_done_callback(_registrar_falha_revalidacao)
+                    self._em_andamento_async[chave] = tarefa
+                marcar_degradacao("clima_desatualizado")
+                return _copiar_previsao(entrada.previsao)
+            if tarefa is not None:
+                self._stats["agrupadas"] += 1
+            else:
+                self._stats["misses"] += 1
+                tarefa = asyncio.ensure_future(self._buscar_e_guardar_async(chave, latitude, longitude, buscar_async))
+                self._em_andamento_async[chave] = tarefa
+
+        return _copiar_previsao(await asyncio.shield(tarefa))
+
+    async def _buscar_e_guardar_async(self, chave: tuple, latitude: float, longitude: float, buscar_async) -> dict:
+        with contar_chamadas_rede() as chamadas:
+            try:
+                previsao = await buscar_async(latitude, longitude)
+                with self._lock:
+                    self._guardar_previsao(chave, previsao, self._expiracao())
+                return previsao
+            finally:
+                with self._lock:
+                    self._em_andamento_async.pop(chave, None)
+                    self._stats["buscas_upstream"] += len(chamadas)
+
+    def _servivel(self, entrada, agora: float) -> bool:
+        # Entrada expirada, mas ainda dentro da janela de stale-while-revalidate
+        return entrada is not None and agora < entrada.expira_em + self.stale
+
+    def _revalidar(self, revalidar: dict, buscar_muitos):
+        try:
+            self._buscar_e_guardar(revalidar, buscar_muitos)
+        except Exception as e:
+            logger.warning("Falha ao atualizar %d célula(s) da grade em segundo plano: %r", len(revalidar), e)
+
+    def stats(self) -> dict:
+        """
+        Contadores de hits, misses, buscas agrupadas (single-flight), previsões desatualizadas
+        servidas (stale-while-revalidate) e chamadas ao upstream que foram à rede.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+            stats["celulas"] = len(self._celulas)
+            stats["apelidos"] = len(self._apelidos)
+            stats["em_andamento"] = len(self._em_andamento) + len(self._em_andamento_async)
+        return stats
+
+    def _expiracao(self) -> float:
+        # Próxima virada da cadência de atualização do modelo
+        return (time.time() // self.cadencia + 1) * self.cadencia
+
+    def _buscar_e_guardar(self, minhas: dict, buscar_muitos):
+        chaves = list(minhas)
+        with contar_chamadas_rede() as chamadas:
+            try:
+                previsoes = buscar_muitos([minhas[chave][0] for chave in chaves])
+                if len(previsoes) != len(chaves):
+                    raise RuntimeError(f"Esperadas {len(chaves)} previsões, recebidas {len(previsoes)}.")
+            except BaseException as e:
+                with self._lock:
+                    for chave in chaves:
+                        self._em_andamento.pop(chave, None)
+                for chave in chaves:
+                    minhas[chave][1].set_exception(e)
+                raise
+            finally:
+                # Só as chamadas que foram à rede: respostas do cache HTTP não contam
+                with self._lock:
+                    self._stats["buscas_upstream"] += len(chamadas)
+
+        expira_em = self._expiracao()
+        with self._lock:
+            for chave, previsao in zip(chaves, previsoes):
+                self._guardar_previsao(chave, previsao, expira_em)
+                self._em_andamento.pop(chave, None)
+        for chave, previsao in zip(chaves, previsoes):
+            minhas[chave][1].set_result(previsao)
+
+    def _entrada(self, chave: tuple):
+        # Chamado com self._lock adquirido: resolve o apelido para a entrada da célula
+        celula = self._apelidos.get(chave)
+        if celula is None:
+            return None
+        entrada = self._celulas.get(celula)
+        if entrada is None:
+            # A célula saiu do cache (LRU); o apelido não serve mais
+            del self._apelidos[chave]
+            return None
+        self._apelidos.move_to_end(chave)
+        self._celulas.move_to_end(celula)
+        return entrada
+
+    def _guardar_previsao(self, chave: tuple, previsao: dict, expira_em: float):
+        # Chamado com self._lock adquirido. A entrada fica na célula que a própria Open-Meteo
+        # informou (ou no apelido, se a resposta não traz a célula)
+        general = previsao.get("general", {})
+        if "latitude" in general and "longitude" in general:
+            celula = (round(float(general["latitude"]), 6), round(float(general["longitude"]), 6))
+        else:
+            celula = chave
+        self._guardar(self._celulas, celula, _EntradaGrade(previsao, expira_em))
+        self._guardar(self._apelidos, chave, celula)
+
+    def _guardar(self, indice: OrderedDict, chave: tuple, valor):
+        # Chamado com self._lock adquirido
+        indice[chave] = valor
+        indice.move_to_end(chave)
+        while len(indice) > self.max_celulas:
+            indice.popitem(last=False)
+
+
+def _registrar_falha_revalidacao(tarefa: asyncio.Task):
+    # Ninguém aguarda a atualização em segundo plano: a exceção é lida aqui para não virar
+    # "Task exception was never retrieved"
+    if not tarefa.cancelled() and tarefa.exception() is not None:
+        logger.warning("Falha ao atualizar uma célula da grade em segundo plano: %r", tarefa.exception())
@@ -0,0 +1,220 @@
+"""
+Leitura das respostas FlatBuffers da Open-Meteo pelo nome das variáveis.
+
+Dentro de um bloco ("current", "hourly") cada variável é um VariableWithValues identificado pelo
+par (Variable, altitude), não pela posição em que foi pedida. Aqui os nomes da API
+("temperature_2m", "windgusts_10m"...) são convertidos nesse par e os valores lidos pelos
+acessores do openmeteo_sdk (Variables(i), Variable(), Altitude(), Value(), ValuesAsNumpy()):
+  - current: um float por variável (Value());
+  - hourly: ValuesAsNumpy(), um array float32 sobre o próprio buffer da resposta (sem um objeto
+    Python por valor; o array é só leitura e pode ser compartilhado entre requisições);
+  - várias coordenadas: um único array estruturado, uma linha por coordenada e um campo por
+    variável, que build_feature_matrix aceita direto na predição em lote.
+
+Os valores "current" têm um caminho rápido que lê as tabelas do
+buffer direto (struct.unpack_from), sem criar os objetos do SDK — cada acessor gerado custa
+alguns µs em Python (ver benchmarks/bench_decodificacao.py). Ele depende do layout do schema
+atual, então cada processo o confere contra os acessores do SDK nas primeiras respostas; se
+divergir (ex.: o schema mudou numa versão nova do SDK), é desligado e tudo passa pelo SDK.
+OPEN_METEO_DECODIFICACAO_RAPIDA=0 desliga o caminho rápido.
+"""
+import logging
+import os
+import re
+import struct
+import threading
+from datetime import datetime
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+
+import numpy as np
+from openmeteo_sdk.Variable import Variable
+
+logger = logging.getLogger(__name__)
+
+# Nomes antigos aceitos pela Open-Meteo → nome atual (a resposta usa sempre o atual)
+_APELIDOS = {"cloudcover": "cloud_cover", "relativehumidity": "relative_humidity", "windgusts": "wind_gusts"}
+
+# Fuso do "time_local" das respostas
+FUSO_LOCAL = ZoneInfo("America/Sao_Paulo")
+
+# Campos gerais de cada coordenada no array estruturado (além de "time" e das variáveis)
+CAMPOS_GERAIS = ("latitude", "longitude", "elevation")
+
+_RE_ALTITUDE = re.compile(r"^(.*)_(\d+)m$")
+
+DECODIFICACAO_RAPIDA = os.environ.get("OPEN_METEO_DECODIFICACAO_RAPIDA", "1") == "1"
+# Blocos "current" conferidos contra o SDK antes de o caminho rápido valer sozinho
+CONFERENCIAS_CAMINHO_RAPIDO = 8
+
+# Caminho rápido: deslocamentos na vtable do vetor Variables de VariablesWithTime e, em
+# VariableWithValues, dos campos Variable, Unit, Value, Values, ValuesInt64 e Altitude (nessa
+# ordem, a partir de 4), no layout do schema atual
+_VT_VARIAVEIS = 10
+_N_CAMPOS_VARIAVEL = 6
+
+_U16 = struct.Struct("<H")
+_I16 = struct.Struct("<h")
+_U32 = struct.Struct("<I")
+_I32 = struct.Struct("<i")
+_F32 = struct.Struct("<f")
+
+_caminho_rapido = {"ativo": DECODIFICACAO_RAPIDA, "conferencias": 0}
+_caminho_rapido_lock = threading.Lock()
+
+
+def _separar_altitude(nome: str) -> tuple:
+    casamento = _RE_ALTITUDE.match(nome)
+    if casamento:
+        return casamento.group(1), int(casamento.group(2))
+    return nome, 0
+
+
+@lru_cache(maxsize=None)
+def nome_canonico(nome: str) -> str:
+    """
+    Nome atual de uma variável ("relativehumidity_2m" → "relative_humidity_2m").
+    """
+    base, altitude = _separar_altitude(nome)
+    base = _APELIDOS.get(base, base)
+    return f"{base}_{altitude}m" if altitude else base
+
+
+@lru_cache(maxsize=None)
+def variavel_open_meteo(nome: str) -> tuple:
+    """
+    Par (Variable, altitude) do FlatBuffers para o nome de uma variável da API.
+    """
+    base, altitude = _separar_altitude(nome)
+    return getattr(Variable, _APELIDOS.get(base, base), Variable.undefined), altitude
+
+
+def _variaveis_do_bloco(bloco) -> dict:
+    """
+    {(Variable, altitude): VariableWithValues} das variáveis de um bloco VariablesWithTime.
+    """
+    variaveis = {}
+    for i in range(bloco.VariablesLength()):
+        variavel = bloco.Variables(i)
+        variaveis[(variavel.Variable(), variavel.Altitude())] = variavel
+    return variaveis
+
+
+def _localizar(encontradas: dict, nomes) -> list:
+    """
+    Entrada de 'encontradas' de cada nome pedido, na ordem de 'nomes'.
+    """
+    selecionadas = []
+    for nome in nomes:
+        entrada = encontradas.get(variavel_open_meteo(nome))
+        if entrada is None:
+            raise RuntimeError(f"Open-Meteo não devolveu a variável '{nome}'.")
+        selecionadas.append(entrada)
+    return selecionadas
+
+
+def _valores_atuais_sdk(bloco, nomes) -> list:
+    return [variavel.Value() for variavel in _localizar(_variaveis_do_bloco(bloco), nomes)]
+
+
+def _tabelas_do_bloco(bloco) -> dict:
+    """
+    Caminho rápido de _variaveis_do_bloco: {(Variable, altitude): (posição da tabela,
+    deslocamentos dos campos)}, lidos direto do buffer.
+    """
+    buf, tab = bloco._tab.Bytes, bloco._tab
+    o = tab.Offset(_VT_VARIAVEIS)
+    if not o:
+        return {}
+    inicio, n = tab.Vector(o), tab.VectorLen(o)
+    tabelas = {}
+    for k in range(n):
+        pos = inicio + 4 * k
+        tabela = pos + _U32.unpack_from(buf, pos)[0]
+        vtable = tabela - _I32.unpack_from(buf, tabela)[0]
+        n_campos = min((_U16.unpack_from(buf, vtable)[0] - 4) // 2, _N_CAMPOS_VARIAVEL)
+        campos = struct.unpack_from(f"<{n_campos}H", buf, vtable + 4) + (0,) * (_N_CAMPOS_VARIAVEL - n_campos)
+        variavel = buf[tabela + campos[0]] if campos[0] else 0
+        altitude = _I16.unpack_from(buf, tabela + campos[5])[0] if campos[5] else 0
+        tabelas[(variavel, altitude)] = (tabela, campos)
+    return tabelas
+
+
+def _valores_atuais_rapido(bloco, nomes) -> list:
+    buf = bloco._tab.Bytes
+    return [_F32.unpack_from(buf, tabela + campos[2])[0] if campos[2] else 0.0
+            for tabela, campos in _localizar(_tabelas_do_bloco(bloco), nomes)]
+
+
+def _valores_atuais(bloco, nomes) -> list:
+    """
+    Valores "current" das variáveis 'nomes': pelo caminho rápido enquanto ele bate com o SDK.
+    """
+    if not _caminho_rapido["ativo"]:
+        return _valores_atuais_sdk(bloco, nomes)
+    if _caminho_rapido["conferencias"] >= CONFERENCIAS_CAMINHO_RAPIDO:
+        return _valores_atuais_rapido(bloco, nomes)
+
+    sdk = _valores_atuais_sdk(bloco, nomes)
+    try:
+        rapido = _valores_atuais_rapido(bloco, nomes)
+        igual = np.array_equal(np.asarray(rapido, dtype=np.float32), np.asarray(sdk, dtype=np.float32),
+                               equal_nan=True)
+    except Exception as e:
+        igual, rapido = False, e
+    with _caminho_rapido_lock:
+        if igual:
+            _caminho_rapido["conferencias"] += 1
+        elif _caminho_rapido["ativo"]:
+            _caminho_rapido["ativo"] = False
+            logger.error("Leitura direta do FlatBuffers da Open-Meteo diverge do openmeteo_sdk (%r != %r); "
+                         "usando só os acessores do SDK.", rapido, sdk)
+    return sdk
+
+
+def hora_local(timestamp: int) -> str:
+    """
+    Timestamp Unix (s) → ISO 8601 no fuso local ("2025-06-08T06:00:00-03:00").
+    """
+    return datetime.fromtimestamp(timestamp, FUSO_LOCAL).isoformat()
+
+
+def ler_atuais(bloco, nomes) -> dict:
+    """
+    {nome canônico: valor} das variáveis 'nomes' de um bloco "current".
+    """
+    return dict(zip(map(nome_canonico, nomes), _valores_atuais(bloco, nomes)))
+
+
+def ler_horarias(bloco, nomes) -> dict:
+    """
+    Séries de um bloco "hourly": {"time": int64 (timestamps Unix), nome canônico: float32}.
+    """
+    series = {"time": np.arange(bloco.Time(), bloco.TimeEnd(), bloco.Interval(), dtype=np.int64)}
+    for nome, variavel in zip(nomes, _localizar(_variaveis_do_bloco(bloco), nomes)):
+        if variavel.ValuesIsNone():
+            raise RuntimeError(f"Open-Meteo não devolveu a série horária de '{nome}'.")
+        series[nome_canonico(nome)] = variavel.ValuesAsNumpy()
+    return series
+
+
+def dtype_lote(nomes) -> np.dtype:
+    """
+    dtype do array estruturado de decodificar_lote para as variáveis 'nomes'.
+    """
+    campos = [(campo, np.float32) for campo in CAMPOS_GERAIS] + [("time", np.int64)]
+    campos += [(nome_canonico(nome), np.float32) for nome in nomes]
+    return np.dtype(campos)
+
+
+def decodificar_lote(respostas, nomes) -> np.ndarray:
+    """
+    Respostas de uma requisição multi-localização → array estruturado (uma linha por resposta)
+    com latitude/longitude/elevation da grade, o "time" do bloco current e as variáveis 'nomes'.
+    """
+    linhas = []
+    for resposta in respostas:
+        atual = resposta.Current()
+        linhas.append((resposta.Latitude(), resposta.Longitude(), resposta.Elevation(), atual.Time(),
+                       *_valores_atuais(atual, nomes)))
+    return np.array(linhas, dtype=dtype_lote(nomes))
@@ -0,0 +1,75 @@
+import time
+
+from services.cep_cache import CepCache, LocalizacaoCep, normalizar_cep
+
+SE = LocalizacaoCep("Praça da Sé, São Paulo", -23.5503, -46.6339, 1)
+
+
+def _cache(tmp_path, **kwargs):
+    return CepCache(str(tmp_path / "cep_cache.sqlite"), **kwargs)
+
+
+def test_normalizar_cep():
+    assert normalizar_cep("01001-000") == "01001000"
+    assert normalizar_cep(1001000) == "1001000"
+
+
+def test_miss_gravacao_e_hit_em_memoria(tmp_path):
+    cache = _cache(tmp_path)
+    assert cache.buscar("01001000") == (False, None)
+    cache.gravar("01001000", SE)
+    assert cache.buscar("01001000") == (True, SE)
+    stats = cache.stats()
+    assert (stats["misses"], stats["hits_memoria"], stats["gravacoes"]) == (1, 1, 1)
+
+
+def test_segundo_nivel_sobrevive_a_um_novo_processo(tmp_path):
+    _cache(tmp_path).gravar("01001000", SE)
+    cache = _cache(tmp_path)
+    assert cache.buscar("01001000") == (True, SE)
+    assert cache.buscar("01001000") == (True, SE)
+    stats = cache.stats()
+    assert (stats["hits_disco"], stats["hits_memoria"]) == (1, 1)
+
+
+def test_entrada_expira_nos_dois_niveis(tmp_path):
+    cache = _cache(tmp_path, ttl=0.05)
+    cache.gravar("01001000", SE)
+    time.sleep(0.06)
+    assert cache.buscar("01001000") == (False, None)
+    assert _cache(tmp_path).buscar("01001000") == (False, None)
+    assert cache.limpar_expirados() == 1
+
+
+def test_cache_negativo_tem_ttl_proprio(tmp_path):
+    cache = _cache(tmp_path, ttl=60, ttl_negativo=0.05)
+    cache.gravar("99999999", None)
+    cache.gravar("01001000", SE)
+    assert cache.buscar("99999999") == (True, None)
+    assert cache.stats()["hits_negativos"] == 1
+    time.sleep(0.06)
+    assert cache.buscar("99999999") == (False, None)
+    assert cache.buscar("01001000") == (True, SE)
+
+
+def test_memoria_descarta_o_menos_usado(tmp_path):
+    cache = _cache(tmp_path, max_memoria=2)
+    for cep in ("00000001", "00000002"):
+        cache.gravar(cep, SE)
+    cache.buscar("00000001")
+    cache.gravar("00000003", SE)
+
+    stats = cache.stats()
+    assert (stats["tamanho_memoria"], stats["tamanho_disco"]) == (2, 3)
+    # "00000002" saiu da memória, mas continua no disco
+    cache.buscar("00000001")
+    cache.buscar("00000002")
+    stats = cache.stats()
+    assert (stats["hits_memoria"], stats["hits_disco"]) == (2, 1)
+
+
+def test_remover(tmp_path):
+    cache = _cache(tmp_path)
+    cache.gravar("01001000", SE)
+    cache.remover("01001000")
+    assert cache.buscar("01001000") == (False, None)
@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from services.cep_index import IndiceCep, chave_cidade, construir_indice
+
+CSV = """cep_inicio,cep_fim,prefixo,cidade,uf,latitude,longitude
+01000000,01599999,,São Paulo,SP,-23.55,-46.63
+,,04,São Paulo,SP,-23.65,-46.65
+13000000,13139999,,Campinas,SP,-22.90,-47.06
+20000000,23799999,,Rio de Janeiro,RJ,-22.91,-43.21
+"""
+
+
+@pytest.fixture
+def indice(tmp_path):
+    csv = tmp_path / "centroides.csv"
+    csv.write_text(CSV, encoding="utf-8")
+    assert construir_indice(str(csv), str(tmp_path / "indice")) == {"faixas": 4, "cidades": 3}
+    return IndiceCep(str(tmp_path / "indice"))
+
+
+def test_chave_cidade_sem_acentos_e_minuscula():
+    assert chave_cidade("São Paulo", "SP") == "sao paulo|sp"
+
+
+def test_colunas_abertas_com_memory_map(indice):
+    assert isinstance(indice.faixa_inicio, np.memmap)
+    assert len(indice) == 4
+
+
+def test_busca_por_cep_nas_bordas_das_faixas(indice):
+    assert indice.buscar_cep("01000000").cidade == "São Paulo"
+    assert indice.buscar_cep("01599999").latitude == pytest.approx(-23.55)
+    # Faixa por prefixo: 04000000 a 04999999
+    assert indice.buscar_cep("04999999").latitude == pytest.approx(-23.65)
+    assert indice.buscar_cep("01600000") is None
+    assert indice.buscar_cep("00999999") is None
+    assert indice.buscar_cep("99999999") is None
+    assert indice.buscar_cep("0100") is None
+
+
+def test_busca_vetorizada_igual_a_busca_unitaria(indice):
+    ceps = ["01310100", "13083970", "05000000", "abc", "22041001"]
+    encontrados, latitudes, longitudes = indice.buscar_ceps(ceps)
+    assert encontrados.tolist() == [True, True, False, False, True]
+    for cep, achou, lat, lon in zip(ceps, encontrados, latitudes, longitudes):
+        if achou:
+            centroide = indice.buscar_cep(cep)
+            assert (lat, lon) == pytest.approx((centroide.latitude, centroide.longitude))
+        else:
+            assert np.isnan(lat) and np.isnan(lon)
+
+
+def test_centroide_da_cidade_e_a_media_das_faixas(indice):
+    centroide = indice.buscar_cidade("sao paulo", "sp")
+    assert (centroide.cidade, centroide.uf) == ("São Paulo", "SP")
+    assert (centroide.latitude, centroide.longitude) == pytest.approx((-23.60, -46.64), abs=1e-4)
+    assert indice.buscar_cidade("Curitiba", "PR") is None
+    assert indice.buscar_cidade("Uma cidade com um nome bem maior que qualquer chave", "SP") is None
+    stats = indice.stats()
+    assert (stats["hits_cidade"], stats["misses_cidade"]) == (1, 2)
+
+
+def test_faixas_sobrepostas_sao_recusadas(tmp_path):
+    csv = tmp_path / "sobrepostas.csv"
+    csv.write_text("cep_inicio,cep_fim,cidade,uf,latitude,longitude\n"
+                   "01000000,01599999,São Paulo,SP,-23.55,-46.63\n"
+                   "01500000,01699999,São Paulo,SP,-23.55,-46.63\n", encoding="utf-8")
+    with pytest.raises(ValueError, match="sobrepostas"):
+        construir_indice(str(csv), str(tmp_path / "indice"))
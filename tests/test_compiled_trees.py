@@ -0,0 +1,70 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from services.compiled_trees import CompiledTreeEnsemble
+from services.model_service import CSV_PATH, FEATURE_COLS, MODEL_NATIVE_PATH
+
+lgb = pytest.importorskip("lightgbm")
+
+
+def _com_nan(X: np.ndarray, fracao: float = 0.1, semente: int = 7) -> np.ndarray:
+    X = X.copy()
+    X[np.random.default_rng(semente).random(X.shape) < fracao] = np.nan
+    return X
+
+
+def _conferir(booster, X: np.ndarray, compilado: CompiledTreeEnsemble = None):
+    compilado = compilado or CompiledTreeEnsemble.from_booster(booster)
+    esperado = booster.predict(X)
+    # Lote e caminho de uma linha (máscaras de bits ou ponteiros)
+    obtido = compilado.predict(X)
+    assert obtido.shape == esperado.shape
+    assert np.allclose(obtido, esperado, rtol=1e-9, atol=1e-12)
+    linhas = np.vstack([compilado.predict(linha[None, :]) for linha in X[:200]])
+    assert np.allclose(linhas.reshape(esperado[:200].shape), esperado[:200], rtol=1e-9, atol=1e-12)
+
+
+@pytest.fixture(scope="module")
+def dataset():
+    df = pd.read_csv(CSV_PATH, nrows=3000)
+    return df[FEATURE_COLS].to_numpy(dtype=np.float64)
+
+
+def test_modelo_do_projeto(dataset, tmp_path):
+    booster = lgb.Booster(model_file=MODEL_NATIVE_PATH)
+    _conferir(booster, dataset)
+    _conferir(booster, _com_nan(dataset))
+
+    # O cache .npz devolve o mesmo ensemble
+    compilado = CompiledTreeEnsemble.from_booster(booster, source_sha256="abc")
+    compilado.save(str(tmp_path / "modelo.npz"))
+    lido = CompiledTreeEnsemble.load(str(tmp_path / "modelo.npz"))
+    assert lido.source_sha256 == "abc"
+    _conferir(booster, _com_nan(dataset), lido)
+
+
+@pytest.mark.parametrize("parametros", [
+    {"objective": "multiclass", "num_class": 3},                            # ausentes como NaN
+    {"objective": "multiclass", "num_class": 3, "zero_as_missing": True},   # ausentes como zero
+    {"objective": "multiclass", "num_class": 3, "use_missing": False},      # sem tratamento de ausentes
+    {"objective": "multiclass", "num_class": 3, "num_leaves": 100},         # mais de 64 folhas: ponteiros
+    {"objective": "multiclassova", "num_class": 3},
+    {"objective": "binary"},
+    {"objective": "regression"},
+    {"objective": "multiclass", "num_class": 3, "boosting": "rf", "bagging_freq": 1, "bagging_fraction": 0.7},
+])
+def test_objetivos_e_tratamentos_de_ausentes(parametros):
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(2000, 6))
+    X[rng.random(X.shape) < 0.05] = 0.0
+    y_continuo = X[:, 0] + 0.5 * X[:, 1] ** 2 - X[:, 2]
+    X_treino = _com_nan(X, 0.1, semente=1)
+    num_class = parametros.get("num_class")
+    y = np.digitize(y_continuo, np.quantile(y_continuo, [1 / 3, 2 / 3])) if num_class else \
+        (y_continuo > 0).astype(int) if parametros["objective"] == "binary" else y_continuo
+
+    booster = lgb.train({"num_leaves": 31, "min_data_in_leaf": 5, "verbose": -1, "seed": 1, **parametros},
+                        lgb.Dataset(X_treino, label=y), num_boost_round=15)
+    _conferir(booster, X)
+    _conferir(booster, _com_nan(X, 0.2, semente=2))
@@ -0,0 +1,114 @@
+import numpy as np
+
+from services.api_cep_service import CepInvalido
+from services.cep_cache import LocalizacaoCep
+from services.forecast_tiles import ForecastTiles
+from services.model_service import FEATURE_COLS
+
+
+def _chave(latitude, longitude):
+    return round(latitude, 1), round(longitude, 1)
+
+
+class _Upstreams:
+    """
+    Open-Meteo e modelo falsos: registram as coordenadas buscadas e as linhas pontuadas.
+    """
+
+    def __init__(self):
+        self.versao = "v1"
+        self.buscadas = []
+        self.pontuadas = 0
+
+    def buscar_lote(self, coordenadas):
+        self.buscadas.append(list(coordenadas))
+        matriz = np.zeros((len(coordenadas), len(FEATURE_COLS)))
+        previsoes = [{"general": {"latitude": lat, "longitude": lon}, "current": {}} for lat, lon in coordenadas]
+        return matriz, previsoes
+
+    def pontuar(self, matriz):
+        self.pontuadas += len(matriz)
+        return self.versao, np.array(["ceu_limpo"] * len(matriz)), None, None
+
+
+def _tabela(upstreams, **kwargs):
+    kwargs.setdefault("geocodificar", lambda cep: None)
+    kwargs.setdefault("localizar", lambda cep: (False, None))
+    return ForecastTiles(buscar_lote=upstreams.buscar_lote, pontuar=upstreams.pontuar,
+                         versao_ativa=lambda: upstreams.versao, chave=_chave, **kwargs)
+
+
+def test_so_celulas_novas_ou_vencidas_sao_buscadas():
+    upstreams = _Upstreams()
+    tabela = _tabela(upstreams)
+    tabela.monitorar(coordenadas=[(-23.5, -46.6), (-22.9, -43.2)])
+    assert tabela.atualizar() == {"buscadas": 2, "repontuadas": 0}
+    assert tabela.atualizar() == {"buscadas": 0, "repontuadas": 0}
+    assert tabela.obter(-23.52, -46.61).categoria == "ceu_limpo"
+
+    tabela.monitorar(coordenadas=[(-15.8, -47.9)])
+    celula = _chave(-22.9, -43.2)
+    tabela._entradas = {**tabela._entradas, celula: tabela._entradas[celula]._replace(expira_em=0)}
+    assert tabela.atualizar() == {"buscadas": 2, "repontuadas": 0}
+    assert sorted(upstreams.buscadas[-1]) == [(-22.9, -43.2), (-15.8, -47.9)]
+
+
+def test_nova_versao_do_modelo_repontua_sem_buscar():
+    upstreams = _Upstreams()
+    tabela = _tabela(upstreams)
+    tabela.monitorar(coordenadas=[(-23.5, -46.6)])
+    tabela.atualizar()
+
+    upstreams.versao = "v2"
+    assert tabela.obter(-23.5, -46.6) is None
+    assert tabela.atualizar() == {"buscadas": 0, "repontuadas": 1}
+    assert len(upstreams.buscadas) == 1
+    assert tabela.obter(-23.5, -46.6).versao == "v2"
+
+
+def test_falha_na_busca_mantem_as_entradas_antigas():
+    upstreams = _Upstreams()
+    tabela = _tabela(upstreams)
+    tabela.monitorar(coordenadas=[(-23.5, -46.6)])
+    tabela.atualizar()
+    celula = _chave(-23.5, -46.6)
+    tabela._entradas = {celula: tabela._entradas[celula]._replace(expira_em=0)}
+
+    def fora_do_ar(coordenadas):
+        raise RuntimeError("Open-Meteo fora do ar")
+
+    tabela.buscar_lote = fora_do_ar
+    assert tabela.atualizar() == {"buscadas": 0, "repontuadas": 0}
+    assert tabela.obter(-23.5, -46.6) is not None
+    assert tabela.stats()["falhas"] == 1
+
+
+def test_ceps_locais_entram_na_hora_e_os_da_rede_em_lotes_limitados():
+    se = LocalizacaoCep("São Paulo", -23.55, -46.63, 1)
+    geocodificados = []
+
+    def geocodificar(cep):
+        geocodificados.append(cep)
+        if cep == "00000000":
+            raise CepInvalido(cep)
+        if cep == "11111111":
+            raise RuntimeError("Nominatim fora do ar")
+        return LocalizacaoCep("Campinas", -22.9, -47.06, 1)
+
+    upstreams = _Upstreams()
+    tabela = _tabela(upstreams, geocodificar=geocodificar, ceps_por_rodada=2,
+                     localizar=lambda cep: (True, se) if cep == "01001000" else (False, None))
+    tabela.monitorar(ceps=["01001-000", "00000000", "11111111", "13083970"])
+
+    # Rodada 1: o CEP do cache é pontuado; dois CEPs vão à rede depois de pontuar
+    assert tabela.atualizar() == {"buscadas": 1, "repontuadas": 0}
+    assert tabela.obter_por_cep("01001000")[0] == se
+    assert geocodificados == ["00000000", "11111111"]
+    assert tabela.stats()["ceps_pendentes"] == 2  # o inválido saiu; o que falhou volta na próxima
+
+    # Rodada 2: mais dois
+    tabela.atualizar()
+    assert geocodificados[2:] == ["11111111", "13083970"]
+    assert tabela.atualizar() == {"buscadas": 1, "repontuadas": 0}
+    assert tabela.obter_por_cep("13083-970")[0].address == "Campinas"
+    assert tabela.obter_por_cep("99999999") is None
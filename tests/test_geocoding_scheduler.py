@@ -0,0 +1,133 @@
+import threading
+import time
+
+import pytest
+
+from services.geocoding_scheduler import (PRIORIDADE_FUNDO, AgendadorGeocodificacao, GeocodificacaoIndisponivel,
+                                          TokenBucket, TokenBucketCompartilhado)
+
+
+class _Geocodificador:
+    """
+    Geocodificador falso: registra as consultas e, com 'segurar', prende o worker na primeira
+    até liberar() ser chamado.
+    """
+
+    def __init__(self, respostas=None, segurar=False):
+        self.respostas = respostas or {}
+        self.consultas = []
+        self.ocupado = threading.Event()
+        self._liberado = threading.Event()
+        if not segurar:
+            self._liberado.set()
+
+    def __call__(self, consulta):
+        self.consultas.append(consulta)
+        self.ocupado.set()
+        self._liberado.wait(5)
+        return self.respostas.get(consulta)
+
+    def liberar(self):
+        self._liberado.set()
+
+
+def _agendador(geocodificador, **kwargs):
+    return AgendadorGeocodificacao(geocodificador, taxa=1000.0, capacidade=1000.0, **kwargs)
+
+
+def _ocupar_worker(agendador, geocodificador):
+    futuro = agendador.submeter("primeira")
+    assert geocodificador.ocupado.wait(5)
+    return futuro
+
+
+def test_token_bucket_respeita_a_taxa():
+    bucket = TokenBucket(taxa=50.0, capacidade=1.0)
+    inicio = time.monotonic()
+    for _ in range(6):
+        bucket.aguardar()
+    assert time.monotonic() - inicio >= 0.09
+
+
+def test_token_bucket_compartilhado_divide_as_fichas(tmp_path):
+    caminho = str(tmp_path / "bucket.sqlite")
+    a = TokenBucketCompartilhado(caminho, taxa=20.0, capacidade=2.0)
+    b = TokenBucketCompartilhado(caminho, taxa=20.0, capacidade=2.0)
+    assert a.aguardar() < 0.01
+    assert a.aguardar() < 0.01
+    assert b.aguardar() >= 0.03
+
+
+def test_consultas_identicas_em_andamento_viram_uma_so():
+    geocodificador = _Geocodificador({"Rua A": "local"}, segurar=True)
+    agendador = _agendador(geocodificador)
+    primeira = _ocupar_worker(agendador, geocodificador)
+    futuros = [agendador.submeter("Rua A") for _ in range(3)]
+    geocodificador.liberar()
+
+    assert all(futuro is futuros[0] for futuro in futuros)
+    assert futuros[0].result(timeout=5) == "local"
+    primeira.result(timeout=5)
+    assert geocodificador.consultas == ["primeira", "Rua A"]
+    assert agendador.stats()["agrupadas"] == 2
+
+
+def test_nivel_que_nunca_funciona_na_cidade_e_pulado():
+    geocodificador = _Geocodificador({"Centro, Campinas": "centroide"})
+    agendador = _agendador(geocodificador, limiar_falhas=2)
+    consultas = [(1, "Rua X, Centro, Campinas"), (3, "Centro, Campinas")]
+
+    for _ in range(2):
+        assert agendador.geocodificar_niveis("Campinas", consultas) == ("centroide", 3)
+    geocodificador.consultas.clear()
+    assert agendador.geocodificar_niveis("Campinas", consultas) == ("centroide", 3)
+    assert geocodificador.consultas == ["Centro, Campinas"]
+    assert agendador.stats()["niveis_pulados"] == 1
+
+    # Outra cidade começa sem histórico
+    agendador.geocodificar_niveis("Jundiaí", [(1, "Rua X, Jundiaí"), (3, "Jundiaí")])
+    assert geocodificador.consultas[-2:] == ["Rua X, Jundiaí", "Jundiaí"]
+
+
+def test_consultas_de_usuario_passam_na_frente_das_de_fundo():
+    geocodificador = _Geocodificador(segurar=True)
+    agendador = _agendador(geocodificador)
+    _ocupar_worker(agendador, geocodificador)
+    fundo = agendador.submeter("fundo", PRIORIDADE_FUNDO)
+    usuario = agendador.submeter("usuario")
+    geocodificador.liberar()
+    fundo.result(timeout=5)
+    usuario.result(timeout=5)
+    assert geocodificador.consultas == ["primeira", "usuario", "fundo"]
+
+
+def test_fila_cheia_recusa_na_hora_sem_barrar_usuario_por_causa_do_fundo():
+    geocodificador = _Geocodificador(segurar=True)
+    agendador = _agendador(geocodificador, fila_max=1)
+    _ocupar_worker(agendador, geocodificador)
+    agendador.submeter("fundo", PRIORIDADE_FUNDO)
+    agendador.submeter("usuario")
+    with pytest.raises(GeocodificacaoIndisponivel):
+        agendador.submeter("outro usuario")
+    with pytest.raises(GeocodificacaoIndisponivel):
+        agendador.submeter("outro fundo", PRIORIDADE_FUNDO)
+    assert agendador.stats()["recusadas"] == 2
+    geocodificador.liberar()
+
+
+def test_prazo_vale_para_todos_os_niveis():
+    geocodificador = _Geocodificador(segurar=True)
+    agendador = _agendador(geocodificador)
+    _ocupar_worker(agendador, geocodificador)
+    inicio = time.monotonic()
+    with pytest.raises(GeocodificacaoIndisponivel):
+        agendador.geocodificar_niveis("Campinas", [(1, "a"), (2, "b"), (3, "c")], timeout=0.05)
+    assert time.monotonic() - inicio < 1.0
+    geocodificador.liberar()
+
+
+def test_historico_de_cidades_e_limitado():
+    agendador = _agendador(_Geocodificador(), max_cidades=2)
+    for cidade in ("A", "B", "C"):
+        agendador.geocodificar_niveis(cidade, [(3, cidade)])
+    assert agendador.stats()["cidades_conhecidas"] == 2
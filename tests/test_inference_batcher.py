@@ -0,0 +1,89 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from services.inference_batcher import AgrupadorInferencia, FilaInferenciaCheia
+
+
+def test_pedidos_concorrentes_viram_poucos_lotes_na_ordem():
+    lotes = []
+
+    def executar(itens):
+        lotes.append(list(itens))
+        return [item * 10 for item in itens]
+
+    agrupador = AgrupadorInferencia(executar, max_linhas=8, espera_max=0.05, nome="teste-lotes")
+    with ThreadPoolExecutor(max_workers=20) as executor:
+        futuros = list(executor.map(agrupador.submeter, range(20)))
+    assert [futuro.result(timeout=5) for futuro in futuros] == [i * 10 for i in range(20)]
+    assert all(len(lote) <= 8 for lote in lotes)
+    assert sum(len(lote) for lote in lotes) == 20
+    assert len(lotes) < 20
+    assert agrupador.stats()["pedidos"] == 20
+
+
+def test_pedido_sozinho_sai_depois_da_espera_maxima():
+    agrupador = AgrupadorInferencia(lambda itens: list(itens), max_linhas=32, espera_max=0.01, nome="teste-prazo")
+    inicio = time.perf_counter()
+    assert agrupador.submeter("a").result(timeout=5) == "a"
+    assert time.perf_counter() - inicio < 1
+
+
+def test_erro_do_lote_vai_para_todos_os_pedidos():
+    def executar(itens):
+        raise ValueError("falhou")
+
+    agrupador = AgrupadorInferencia(executar, espera_max=0.01, nome="teste-erro")
+    futuros = [agrupador.submeter(i) for i in range(3)]
+    for futuro in futuros:
+        with pytest.raises(ValueError):
+            futuro.result(timeout=5)
+
+
+def test_resultados_a_menos_falham_em_vez_de_travar():
+    agrupador = AgrupadorInferencia(lambda itens: list(itens)[:-1], max_linhas=4, espera_max=0.05,
+                                    nome="teste-resultados")
+    futuros = [agrupador.submeter(i) for i in range(4)]
+    for futuro in futuros:
+        with pytest.raises(RuntimeError, match="resultados"):
+            futuro.result(timeout=5)
+
+
+def test_fila_cheia_recusa_na_hora():
+    liberar = threading.Event()
+
+    def executar(itens):
+        liberar.wait(5)
+        return list(itens)
+
+    agrupador = AgrupadorInferencia(executar, max_linhas=1, espera_max=0, max_fila=2, nome="teste-fila")
+    primeiro = agrupador.submeter(0)
+    while agrupador.stats()["fila"]:   # o primeiro pedido já saiu da fila e está executando
+        time.sleep(0.001)
+    pendentes = [agrupador.submeter(1), agrupador.submeter(2)]
+    with pytest.raises(FilaInferenciaCheia):
+        agrupador.submeter(3)
+    assert agrupador.stats()["rejeitados"] == 1
+    liberar.set()
+    assert [futuro.result(timeout=5) for futuro in [primeiro, *pendentes]] == [0, 1, 2]
+
+
+def test_pedido_cancelado_sai_do_lote():
+    executados = []
+    liberar = threading.Event()
+
+    def executar(itens):
+        liberar.wait(5)
+        executados.extend(itens)
+        return list(itens)
+
+    agrupador = AgrupadorInferencia(executar, max_linhas=1, espera_max=0, nome="teste-cancelado")
+    primeiro = agrupador.submeter("a")
+    cancelado = agrupador.submeter("b")
+    assert cancelado.cancel()
+    ultimo = agrupador.submeter("c")
+    liberar.set()
+    assert primeiro.result(timeout=5) == "a" and ultimo.result(timeout=5) == "c"
+    assert executados == ["a", "c"]
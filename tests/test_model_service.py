@@ -0,0 +1,51 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from services.model_service import CSV_PATH, FEATURE_COLS, MODEL_NATIVE_PATH, WeatherModelService, build_feature_matrix
+
+
+@pytest.fixture(scope="module")
+def servico():
+    return WeatherModelService(model_path=MODEL_NATIVE_PATH)
+
+
+@pytest.fixture(scope="module")
+def linhas():
+    return pd.read_csv(CSV_PATH, usecols=FEATURE_COLS, nrows=300)[FEATURE_COLS]
+
+
+def test_build_feature_matrix_aceita_as_mesmas_linhas_em_todas_as_formas(linhas):
+    esperado = linhas.to_numpy(dtype=np.float64)
+    estruturado = np.zeros(len(linhas), dtype=[(col, np.float32) for col in FEATURE_COLS])
+    for col in FEATURE_COLS:
+        estruturado[col] = linhas[col]
+
+    assert np.array_equal(build_feature_matrix(linhas.to_dict("records")), esperado)
+    assert np.array_equal(build_feature_matrix({col: linhas[col].to_numpy() for col in FEATURE_COLS}), esperado)
+    assert np.array_equal(build_feature_matrix(esperado), esperado)
+    assert np.allclose(build_feature_matrix(estruturado), esperado, rtol=1e-6)
+    assert build_feature_matrix(linhas.to_dict("records"), dtype=np.float32).dtype == np.float32
+
+
+def test_predict_many_igual_a_predicao_linha_a_linha(servico, linhas):
+    registros = linhas.to_dict("records")
+    lote = servico.predict_many(registros)
+    assert lote.tolist() == [servico.predict_condition(registro) for registro in registros]
+    # A ordem da entrada é mantida mesmo com as linhas embaralhadas
+    ordem = np.random.default_rng(0).permutation(len(registros))
+    assert servico.predict_many([registros[i] for i in ordem]).tolist() == lote[ordem].tolist()
+
+
+def test_predict_proba_many_igual_ao_modelo(servico, linhas):
+    labels, proba = servico.predict_proba_many(linhas.to_dict("records"))
+    assert proba.shape == (len(linhas), len(servico.classes))
+    assert np.allclose(proba, servico.model.predict(linhas.to_numpy(dtype=np.float64)))
+    assert np.allclose(proba.sum(axis=1), 1.0)
+    assert labels.tolist() == servico.classes[np.argmax(proba, axis=1)].tolist()
+
+
+def test_predict_many_sem_linhas(servico):
+    labels, proba = servico.predict_proba_many([])
+    assert labels.shape == (0,)
+    assert proba.shape == (0, len(servico.classes))
@@ -0,0 +1,54 @@
+import json
+
+import numpy as np
+import pytest
+
+from api import resposta
+from api.resposta import formato_aceito, serializar
+
+
+def _estrito(texto):
+    def recusar(constante):
+        raise ValueError(f"JSON inválido: {constante}")
+    return json.loads(texto, parse_constant=recusar)
+
+
+@pytest.fixture
+def stdlib(monkeypatch):
+    monkeypatch.setattr(resposta, "orjson", None)
+
+
+def test_json_da_stdlib_troca_nan_por_null(stdlib):
+    corpo = {"current": {"rain": float("nan"), "temperature_2m": 21.5},
+             "hourly": {"rain": np.array([0.5, np.nan, np.inf], dtype=np.float32)},
+             "lista": [float("-inf"), (1.0, float("nan"))], "escalar": np.float64("nan")}
+    assert _estrito(serializar(corpo)) == {
+        "current": {"rain": None, "temperature_2m": 21.5}, "hourly": {"rain": [0.5, None, None]},
+        "lista": [None, [1.0, None]], "escalar": None}
+
+
+def test_json_da_stdlib_sem_nan_sai_igual(stdlib):
+    corpo = {"cep": "01001000", "weather": {"current": {"rain": 0.25}}, "serie": np.arange(3)}
+    assert serializar(corpo) == b'{"cep":"01001000","weather":{"current":{"rain":0.25}},"serie":[0,1,2]}'
+
+
+@pytest.mark.parametrize("accept, formato", [
+    ("application/msgpack", "msgpack"),
+    ("application/x-msgpack;q=0.8, application/json;q=0.5", "msgpack"),
+    ("application/msgpack;q=0", "json"),
+    ("application/msgpack; q=0.0, */*", "json"),
+    ("application/json, application/msgpack;q=0.9", "json"),
+    ("application/msgpack;q=abc", "json"),
+    ("APPLICATION/MSGPACK;Q=1", "msgpack"),
+    ("application/json", "json"),
+    ("", "json"),
+    (None, "json"),
+])
+def test_formato_aceito_respeita_q(monkeypatch, accept, formato):
+    monkeypatch.setattr(resposta, "msgpack", object())
+    assert formato_aceito(accept) == formato
+
+
+def test_sem_msgpack_instalado_responde_json(monkeypatch):
+    monkeypatch.setattr(resposta, "msgpack", None)
+    assert formato_aceito("application/msgpack") == "json"
@@ -0,0 +1,109 @@
+import numpy as np
+import pytest
+
+from services.model_service import FEATURE_COLS, score_many
+from services.risk_raster import carregar_varredura, dimensoes_grade, montar_grade, salvar_varredura, varrer
+
+AGORA = 1_750_000_000 // 900 * 900 + 10
+CAIXA = (-24.0, -23.6, -46.9, -46.5)  # 4 × 4 células de 0.1°
+
+
+class _OpenMeteo:
+    """
+    Open-Meteo falsa: chuva por coordenada (0 por padrão) e registro das coordenadas buscadas.
+    """
+
+    def __init__(self):
+        self.chuva = {}
+        self.buscadas = []
+        self.fora_do_ar = False
+
+    def __call__(self, coordenadas):
+        if self.fora_do_ar:
+            raise RuntimeError("Open-Meteo fora do ar")
+        self.buscadas.append(len(coordenadas))
+        lote = np.zeros(len(coordenadas), dtype=[(coluna, "f8") for coluna in FEATURE_COLS] + [("time", "i8")])
+        lote["precipitation"] = [self.chuva.get(coordenada, 0.0) for coordenada in coordenadas]
+        lote["time"] = AGORA // 900 * 900
+        return lote
+
+
+class _Pontuar:
+    def __init__(self):
+        self.linhas = 0
+
+    def __call__(self, matriz, mode=None):
+        self.linhas += len(matriz)
+        return score_many(matriz, mode=mode)
+
+
+def _varrer(open_meteo, pontuar, anterior=None, agora=AGORA, mode="regras"):
+    return varrer(*CAIXA, resolucao=0.1, anterior=anterior, mode=mode, agora=agora, buscar=open_meteo,
+                  pontuar=pontuar, versao_ativa=lambda: None)
+
+
+def test_grade_de_norte_para_sul_e_de_oeste_para_leste():
+    latitudes, longitudes = montar_grade(*CAIXA, resolucao=0.1)
+    assert latitudes.tolist() == [-23.65, -23.75, -23.85, -23.95]
+    assert longitudes.tolist() == [-46.85, -46.75, -46.65, -46.55]
+    assert dimensoes_grade(-34.0, 6.0, -74.0, -34.0, 0.001) == (40000, 40000)
+    for resolucao in (0.0, -0.1, float("nan"), float("inf")):
+        with pytest.raises(ValueError):
+            dimensoes_grade(*CAIXA, resolucao)
+    with pytest.raises(ValueError):
+        dimensoes_grade(-23.6, -24.0, -46.9, -46.5)
+
+
+def test_re_varredura_antes_da_virada_nao_busca_nem_repontua():
+    open_meteo, pontuar = _OpenMeteo(), _Pontuar()
+    varredura, resumo = _varrer(open_meteo, pontuar)
+    assert (resumo["celulas"], resumo["buscadas"], resumo["repontuadas"], resumo["sem_dados"]) == (16, 16, 16, 0)
+    assert (varredura.categorias >= 0).all()
+
+    _, resumo = _varrer(open_meteo, pontuar, anterior=varredura, agora=AGORA + 60)
+    assert (resumo["buscadas"], resumo["repontuadas"]) == (0, 0)
+    assert open_meteo.buscadas == [16]
+    assert pontuar.linhas == 16
+
+
+def test_depois_da_virada_so_repontua_as_celulas_que_mudaram():
+    open_meteo, pontuar = _OpenMeteo(), _Pontuar()
+    varredura, _ = _varrer(open_meteo, pontuar)
+    open_meteo.chuva[(-23.65, -46.85)] = 40.0
+
+    nova, resumo = _varrer(open_meteo, pontuar, anterior=varredura, agora=AGORA + 900)
+    assert (resumo["buscadas"], resumo["repontuadas"]) == (16, 1)
+    assert nova.features[0, 0, FEATURE_COLS.index("precipitation")] == 40.0
+    assert (nova.categorias.ravel()[1:] == varredura.categorias.ravel()[1:]).all()
+
+
+def test_outro_modo_repontua_tudo_sem_buscar():
+    open_meteo, pontuar = _OpenMeteo(), _Pontuar()
+    varredura, _ = _varrer(open_meteo, pontuar)
+    _, resumo = _varrer(open_meteo, pontuar, anterior=varredura._replace(modo="modelo"))
+    assert (resumo["buscadas"], resumo["repontuadas"]) == (0, 16)
+
+
+def test_grupo_que_falha_mantem_os_dados_anteriores():
+    open_meteo, pontuar = _OpenMeteo(), _Pontuar()
+    varredura, _ = _varrer(open_meteo, pontuar)
+    open_meteo.fora_do_ar = True
+    nova, resumo = _varrer(open_meteo, pontuar, anterior=varredura, agora=AGORA + 900)
+    assert (resumo["buscadas"], resumo["falhas"], resumo["repontuadas"]) == (0, 16, 0)
+    assert (nova.categorias == varredura.categorias).all()
+    assert (nova.buscado_em == AGORA).all()
+
+    # Sem varredura anterior, as células ficam sem dados
+    vazia, resumo = _varrer(open_meteo, pontuar)
+    assert resumo["sem_dados"] == 16
+    assert (vazia.categorias == -1).all()
+
+
+def test_varredura_salva_e_carregada_sem_pickle(tmp_path):
+    varredura, _ = _varrer(_OpenMeteo(), _Pontuar())
+    caminho = str(tmp_path / "regiao.npz")
+    salvar_varredura(caminho, varredura)
+    carregada = carregar_varredura(caminho)
+    assert (carregada.categorias == varredura.categorias).all()
+    assert carregada.probabilidades is None
+    assert (carregada.versao, carregada.modo) == ("regras", "regras")
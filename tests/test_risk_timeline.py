@@ -0,0 +1,64 @@
+import numpy as np
+
+from services.model_service import FEATURE_COLS, classify_by_rules
+from services.risk_timeline import matriz_linha_do_tempo, pontuar_linhas_do_tempo, proxima_mudanca
+from services.weather_decoding import hora_local
+
+INICIO = 1_750_000_000 // 3600 * 3600
+HORAS = np.arange(INICIO, INICIO + 6 * 3600, 3600)
+
+
+def _previsao(tempestade):
+    # Nas horas com tempestade (1), vento, rajadas e chuva batem três condições de "Severo"
+    tempestade = np.asarray(tempestade, dtype=float)
+    general = {"latitude": -23.5, "longitude": -46.625, "elevation": 760.0}
+    current = {coluna: 0.0 for coluna in FEATURE_COLS if coluna not in general}
+    current["temperature_2m"] = 22.0
+    hourly = {"time": HORAS, "wind_speed_10m": 15.0 * tempestade, "wind_gusts_10m": 20.0 * tempestade,
+              "precipitation": 40.0 * tempestade, "temperature_2m": np.linspace(20.0, 25.0, len(HORAS))}
+    return {"general": general, "current": current, "hourly": hourly}
+
+
+def test_matriz_usa_a_serie_horaria_ou_repete_o_current():
+    previsao = _previsao([0, 0, 1, 1, 0, 0])
+    matriz = matriz_linha_do_tempo(previsao)
+    assert matriz.shape == (1 + len(HORAS), len(FEATURE_COLS))
+
+    coluna = {nome: j for j, nome in enumerate(FEATURE_COLS)}
+    assert matriz[0, coluna["temperature_2m"]] == 22.0
+    assert matriz[1:, coluna["temperature_2m"]].tolist() == np.linspace(20.0, 25.0, 6).tolist()
+    assert matriz[1:, coluna["precipitation"]].tolist() == [0, 0, 40, 40, 0, 0]
+    # Sem série horária: o valor "current" em todas as horas; a célula da grade também
+    assert (matriz[:, coluna["cloud_cover"]] == 0.0).all()
+    assert (matriz[:, coluna["elevation"]] == 760.0).all()
+    assert (matriz[:, coluna["latitude"]] == -23.5).all()
+
+
+def test_proxima_mudanca_a_partir_da_hora_corrente():
+    categorias = np.array(["sol", "sol", "chuva", "chuva", "sol", "sol"])
+    # No meio da segunda hora: a mudança é a da terceira, 1 hora depois
+    assert proxima_mudanca(HORAS, categorias, INICIO + 3600 + 1800) == {
+        "time_local": hora_local(int(HORAS[2])), "horas": 1, "de": "sol", "para": "chuva"}
+    assert proxima_mudanca(HORAS, categorias, INICIO + 2 * 3600)["para"] == "sol"
+    # Antes do início da série conta a partir da primeira hora
+    assert proxima_mudanca(HORAS, categorias, INICIO - 3600)["horas"] == 2
+    assert proxima_mudanca(HORAS, categorias, INICIO + 4 * 3600) is None
+    assert proxima_mudanca(HORAS[:0], categorias[:0], INICIO) is None
+
+
+def test_varias_previsoes_pontuadas_de_uma_vez_na_ordem():
+    previsoes = [_previsao([0, 0, 0, 0, 0, 0]), _previsao([0, 1, 1, 0, 0, 0])]
+    resultados = pontuar_linhas_do_tempo(previsoes, mode="regras", agora=INICIO)
+
+    assert len(resultados) == 2
+    for previsao, (atual, linha) in zip(previsoes, resultados):
+        esperadas = classify_by_rules(matriz_linha_do_tempo(previsao))
+        assert atual == esperadas[0]
+        assert linha["categoria"] == esperadas[1:].tolist()
+        assert linha["time_local"] == [hora_local(int(h)) for h in HORAS]
+        assert linha["versao_modelo"] == "regras"
+        assert linha["probabilidade"] is None
+        assert linha["proxima_mudanca"] == proxima_mudanca(HORAS, esperadas[1:], INICIO)
+    assert resultados[0][1]["proxima_mudanca"] is None
+    assert resultados[1][1]["proxima_mudanca"]["para"] == "Severo (Alerta Vermelho)"
+    assert pontuar_linhas_do_tempo([]) == []
@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+
+from services.rules_service import (CATEGORIAS, RULE_VARIABLES, categorize_many, categorize_one, evaluate_rules,
+                                    evaluate_rules_one, thresholds)
+
+
+def _categorize_original(row):
+    # Regra escalar original do gerador do dataset (antes da tabela de limiares), como referência
+    crit = [
+        row["wind_speed_10m"] >= 20,
+        row["wind_gusts_10m"] >= 25,
+        row["precipitation"] >= 50,
+        row["snowfall"] >= 20,
+        (row["temperature_2m"] <= -20) or (row["temperature_2m"] >= 45),
+        row["relative_humidity_2m"] >= 95,
+        row["cloud_cover"] >= 90
+    ]
+    if sum(crit) >= 5:
+        return "Crítico (Emergência Imediata)"
+
+    severe = [
+        12 <= row["wind_speed_10m"] < 20,
+        15 <= row["wind_gusts_10m"] < 25,
+        30 <= row["precipitation"] < 50,
+        10 <= row["snowfall"] < 20,
+        (-20 <= row["temperature_2m"] < -10) or (40 < row["temperature_2m"] < 45),
+        90 <= row["relative_humidity_2m"] < 95,
+        75 <= row["cloud_cover"] < 90
+    ]
+    if sum(severe) >= 3:
+        return "Severo (Alerta Vermelho)"
+
+    moderate = [
+        6 <= row["wind_speed_10m"] < 12,
+        8 <= row["wind_gusts_10m"] < 15,
+        10 <= row["precipitation"] < 30,
+        5 <= row["snowfall"] < 10,
+        (-10 <= row["temperature_2m"] < -5) or (35 < row["temperature_2m"] <= 40),
+        80 <= row["relative_humidity_2m"] < 90,
+        50 <= row["cloud_cover"] < 75
+    ]
+    if sum(moderate) >= 3:
+        return "Moderado (Atenção Amarela)"
+
+    stable = [
+        2 <= row["wind_speed_10m"] < 6,
+        3 <= row["wind_gusts_10m"] < 8,
+        1 <= row["precipitation"] < 10,
+        1 <= row["snowfall"] < 5,
+        0 <= row["temperature_2m"] <= 35,
+        50 <= row["relative_humidity_2m"] < 80,
+        25 <= row["cloud_cover"] < 50
+    ]
+    if sum(stable) >= 3:
+        return "Estável (Suporte Disponível)"
+
+    return "Suave (Verde)"
+
+
+@pytest.fixture(scope="module")
+def colunas():
+    # Metade das linhas sorteadas em faixas largas, metade com cada variável em cima de um limiar
+    # (ou a um passo dele), para exercitar os limites abertos e fechados
+    rng = np.random.default_rng(42)
+    n = 20_000
+    colunas = {}
+    for variavel, limiares in thresholds().items():
+        limiares = np.asarray(limiares)
+        bordas = np.concatenate([limiares, np.nextafter(limiares, -np.inf), np.nextafter(limiares, np.inf)])
+        colunas[variavel] = np.concatenate([rng.uniform(limiares.min() - 10, limiares.max() + 10, n // 2),
+                                            rng.choice(bordas, n - n // 2)])
+    return colunas
+
+
+def _linhas(colunas):
+    return [dict(zip(colunas, valores)) for valores in zip(*colunas.values())]
+
+
+def test_categorize_many_igual_a_regra_escalar(colunas):
+    esperado = [_categorize_original(linha) for linha in _linhas(colunas)]
+    assert categorize_many(colunas).tolist() == esperado
+    assert [categorize_one(linha) for linha in _linhas(colunas)] == esperado
+    # Todas as categorias aparecem, inclusive a rara "Crítico"
+    assert set(esperado) == set(CATEGORIAS)
+
+
+def test_evaluate_rules_igual_ao_caminho_escalar(colunas):
+    labels, ambiguas = evaluate_rules(colunas)
+    escalar = [evaluate_rules_one(linha) for linha in _linhas(colunas)]
+    assert labels.tolist() == [label for label, _ in escalar]
+    assert ambiguas.tolist() == [ambigua for _, ambigua in escalar]
+    assert 0 < ambiguas.sum() < len(ambiguas)
+
+
+def test_evaluate_rules_sem_margem_nao_marca_ambiguas(colunas):
+    labels, ambiguas = evaluate_rules(colunas, fator=0)
+    assert labels.tolist() == categorize_many(colunas).tolist()
+    assert not ambiguas.any()
+    assert evaluate_rules({variavel: [] for variavel in RULE_VARIABLES})[0].shape == (0,)
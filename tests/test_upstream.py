@@ -0,0 +1,106 @@
+import threading
+import time
+
+import pytest
+
+from services import upstream
+from services.upstream import CircuitoAberto, Disjuntor
+
+
+def _disjuntor(pausa=0.05):
+    return Disjuntor("teste", lentidao=1.0, janela=4, minimo=2, taxa_falhas=0.5, pausa=pausa)
+
+
+def _abrir(disjuntor):
+    for _ in range(2):
+        disjuntor.registrar(0.01, False)
+    assert disjuntor.estado == "aberto"
+
+
+def test_abre_por_falhas_e_recusa():
+    disjuntor = _disjuntor(pausa=60)
+    _abrir(disjuntor)
+    with pytest.raises(CircuitoAberto):
+        disjuntor.permitir()
+
+
+def test_sonda_bem_sucedida_fecha():
+    disjuntor = _disjuntor()
+    _abrir(disjuntor)
+    time.sleep(0.06)
+    assert disjuntor.chamar(lambda: "ok") == "ok"
+    assert disjuntor.estado == "fechado"
+
+
+def test_resposta_atrasada_de_antes_da_abertura_nao_fecha():
+    disjuntor = _disjuntor()
+    inicio = time.monotonic()
+    _abrir(disjuntor)
+    disjuntor.registrar(0.01, True, inicio)
+    assert disjuntor.estado == "aberto"
+
+    # Meio aberto, com a sonda em andamento: só o resultado dela decide
+    time.sleep(0.06)
+    disjuntor.permitir()
+    disjuntor.registrar(0.01, True, inicio)
+    assert disjuntor.estado == "meio_aberto"
+    with pytest.raises(CircuitoAberto):
+        disjuntor.permitir()
+    disjuntor.registrar(0.01, True, time.monotonic())
+    assert disjuntor.estado == "fechado"
+
+
+def test_falha_atrasada_de_antes_do_fechamento_e_ignorada():
+    disjuntor = _disjuntor()
+    inicio = time.monotonic()
+    _abrir(disjuntor)
+    time.sleep(0.06)
+    disjuntor.chamar(lambda: "ok")
+    for _ in range(4):
+        disjuntor.registrar(0.01, False, inicio)
+    assert disjuntor.estado == "fechado"
+
+
+def test_sonda_com_falha_reabre():
+    disjuntor = _disjuntor(pausa=0.05)
+    _abrir(disjuntor)
+    time.sleep(0.06)
+    with pytest.raises(RuntimeError):
+        disjuntor.chamar(_falhar)
+    assert disjuntor.estado == "aberto"
+
+
+def _falhar():
+    raise RuntimeError("upstream fora do ar")
+
+
+def _disjuntor_com_hedge(monkeypatch):
+    monkeypatch.setattr(upstream, "HEDGE_ATIVO", True)
+    monkeypatch.setattr(upstream, "HEDGE_ATRASO_MIN_MS", 20)
+    disjuntor = _disjuntor()
+    for _ in range(disjuntor.minimo):
+        disjuntor.registrar(0.001, True)
+    return disjuntor
+
+
+def test_hedge_dispara_copia_e_vale_a_primeira_resposta(monkeypatch):
+    disjuntor = _disjuntor_com_hedge(monkeypatch)
+    chamadas = []
+
+    def lenta_na_primeira():
+        chamadas.append(threading.current_thread().name)
+        time.sleep(0.5 if len(chamadas) == 1 else 0.0)
+        return len(chamadas)
+
+    inicio = time.monotonic()
+    assert disjuntor.chamar(lenta_na_primeira, hedge=True) == 2
+    assert time.monotonic() - inicio < 0.4
+    assert disjuntor.stats()["hedges_vencedores"] == 1
+
+
+def test_sem_vaga_no_executor_roda_na_thread_de_quem_chamou(monkeypatch):
+    disjuntor = _disjuntor_com_hedge(monkeypatch)
+    monkeypatch.setattr(upstream, "_vagas_hedge", threading.BoundedSemaphore(1))
+    upstream._vagas_hedge.acquire()
+    assert disjuntor.chamar(lambda: threading.current_thread().name, hedge=True) == threading.current_thread().name
+    assert disjuntor.stats()["hedges_sem_vaga"] == 1
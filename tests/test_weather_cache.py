@@ -0,0 +1,53 @@
+from services.weather_cache import WeatherGridCache
+
+
+def _previsao(latitude, longitude):
+    return {"general": {"latitude": latitude, "longitude": longitude}, "current": {"temperature_2m": latitude}}
+
+
+def _buscar_por_celula(celulas, chamadas):
+    def buscar_muitos(coordenadas):
+        chamadas.extend(coordenadas)
+        return [_previsao(*celulas[coordenada]) for coordenada in coordenadas]
+    return buscar_muitos
+
+
+def test_coordenadas_na_mesma_caixa_de_0_1_grau_em_celulas_diferentes_nao_se_misturam():
+    cache = WeatherGridCache()
+    a, b = (-23.51, -46.61), (-23.58, -46.68)
+    chamadas = []
+    buscar = _buscar_por_celula({a: (-23.5, -46.625), b: (-23.625, -46.75)}, chamadas)
+
+    previsao_a, previsao_b = cache.obter_muitos([a, b], buscar)
+
+    assert previsao_a["general"] == {"latitude": -23.5, "longitude": -46.625}
+    assert previsao_b["general"] == {"latitude": -23.625, "longitude": -46.75}
+    assert cache.obter_muitos([b], buscar)[0]["general"]["latitude"] == -23.625
+    assert chamadas == [a, b]
+    assert cache.stats()["celulas"] == 2
+
+
+def test_apelidos_da_mesma_celula_compartilham_a_entrada():
+    cache = WeatherGridCache()
+    a, b = (-23.51, -46.61), (-23.53, -46.63)
+    chamadas = []
+    buscar = _buscar_por_celula({a: (-23.5, -46.625), b: (-23.5, -46.625)}, chamadas)
+
+    cache.obter_muitos([a], buscar)
+    cache.obter_muitos([b], buscar)
+    assert cache.obter_muitos([a, b], buscar)[1]["general"]["latitude"] == -23.5
+
+    stats = cache.stats()
+    assert (stats["celulas"], stats["apelidos"], stats["hits"], stats["misses"]) == (1, 2, 2, 2)
+
+
+def test_apelido_de_celula_removida_pelo_lru_volta_a_buscar():
+    cache = WeatherGridCache(max_celulas=1)
+    a, b = (-23.51, -46.61), (-22.91, -43.21)
+    chamadas = []
+    buscar = _buscar_por_celula({a: (-23.5, -46.625), b: (-22.875, -43.25)}, chamadas)
+
+    cache.obter_muitos([a], buscar)
+    cache.obter_muitos([b], buscar)
+    cache.obter_muitos([a], buscar)
+    assert chamadas == [a, b, a]
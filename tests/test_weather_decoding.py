@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from benchmarks.stub_open_meteo import codificar_resposta
+from services import weather_decoding
+from services.api_weather_service import VARIAVEIS_ATUAIS, _decodificar_respostas
+from services.weather_decoding import (_valores_atuais_rapido, _valores_atuais_sdk, decodificar_lote, ler_atuais,
+                                       ler_horarias, nome_canonico)
+
+HORARIAS = ["temperature_2m", "precipitation", "relativehumidity_2m", "windgusts_10m"]
+
+
+@pytest.fixture
+def respostas():
+    coordenadas = [(-23.55, -46.63), (-22.9, -43.2), (-3.1, -60.0)]
+    corpo = b"".join(codificar_resposta(lat, lon, VARIAVEIS_ATUAIS, HORARIAS, horas=48, agora=1_750_000_000)
+                     for lat, lon in coordenadas)
+    return _decodificar_respostas(corpo)
+
+
+@pytest.fixture
+def caminho_rapido(monkeypatch):
+    estado = {"ativo": True, "conferencias": 0}
+    monkeypatch.setattr(weather_decoding, "_caminho_rapido", estado)
+    return estado
+
+
+def test_caminho_rapido_igual_aos_acessores_do_sdk(respostas):
+    for resposta in respostas:
+        sdk = _valores_atuais_sdk(resposta.Current(), VARIAVEIS_ATUAIS)
+        assert _valores_atuais_rapido(resposta.Current(), VARIAVEIS_ATUAIS) == sdk
+        # Pedir em outra ordem (ou com os nomes antigos) lê as mesmas variáveis
+        invertidas = list(reversed(VARIAVEIS_ATUAIS))
+        assert _valores_atuais_rapido(resposta.Current(), invertidas) == sdk[::-1]
+
+
+def test_decodificar_lote_e_ler_atuais(respostas, caminho_rapido):
+    lote = decodificar_lote(respostas, VARIAVEIS_ATUAIS)
+    assert len(lote) == len(respostas)
+    for linha, resposta in zip(lote, respostas):
+        atuais = ler_atuais(resposta.Current(), VARIAVEIS_ATUAIS)
+        assert linha["time"] == resposta.Current().Time()
+        assert linha["latitude"] == np.float32(resposta.Latitude())
+        for nome in VARIAVEIS_ATUAIS:
+            assert linha[nome_canonico(nome)] == np.float32(atuais[nome_canonico(nome)])
+    assert caminho_rapido["ativo"] and caminho_rapido["conferencias"] > 0
+
+
+def test_caminho_rapido_divergente_e_desligado(respostas, caminho_rapido, monkeypatch):
+    monkeypatch.setattr(weather_decoding, "_valores_atuais_rapido", lambda bloco, nomes: [0.0] * len(nomes))
+    esperado = _valores_atuais_sdk(respostas[0].Current(), VARIAVEIS_ATUAIS)
+    lote = decodificar_lote(respostas[:1], VARIAVEIS_ATUAIS)
+    assert [lote[0][nome_canonico(nome)] for nome in VARIAVEIS_ATUAIS] == list(np.float32(esperado))
+    assert not caminho_rapido["ativo"]
+
+
+def test_ler_horarias_usa_values_as_numpy(respostas):
+    bloco = respostas[0].Hourly()
+    series = ler_horarias(bloco, HORARIAS)
+    assert len(series["time"]) == 48
+    for i, nome in enumerate(HORARIAS):
+        variavel = bloco.Variables(i)
+        assert series[nome_canonico(nome)].dtype == np.float32
+        assert series[nome_canonico(nome)].tolist() == [variavel.Values(j) for j in range(variavel.ValuesLength())]
+
+
+def test_variavel_ausente(respostas):
+    with pytest.raises(RuntimeError, match="visibility"):
+        decodificar_lote(respostas, VARIAVEIS_ATUAIS + ["visibility"])
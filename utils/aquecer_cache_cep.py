@@ -0,0 +1,81 @@
+"""
+Pré-carrega (warm-up) o cache CEP → coordenadas a partir de um CSV de CEPs, fora do horário de uso.
+
+Cada CEP ainda não cacheado passa pela busca completa (brazilcep + Nominatim) e o resultado,
+positivo ou negativo, fica gravado no SQLite usado pela API (CEP_CACHE_PATH).
+
+Uso (a partir da raiz do projeto):
+    python -m utils.aquecer_cache_cep ceps.csv --coluna cep
+
+O ritmo das chamadas ao Nominatim é controlado pelo agendador de geocodificação (NOMINATIM_TAXA).
+"""
+import argparse
+import csv
+import time
+
+from services.api_cep_service import buscar_localizacao_por_cep, estatisticas_geocodificacao
+from services.cep_cache import normalizar_cep, obter_cep_cache
+
+
+def _ler_ceps(caminho_csv: str, coluna: str) -> list:
+    """
+    Lê a coluna de CEPs do CSV (ou a primeira coluna, se 'coluna' não existir) sem duplicados.
+    """
+    with open(caminho_csv, newline="", encoding="utf-8") as f:
+        leitor = csv.reader(f)
+        cabecalho = next(leitor, [])
+        if coluna in cabecalho:
+            indice = cabecalho.index(coluna)
+            linhas = leitor
+        else:
+            # CSV sem cabeçalho: a primeira linha também é um CEP
+            indice = 0
+            linhas = [cabecalho, *leitor]
+        ceps = (normalizar_cep(linha[indice]) for linha in linhas if linha)
+        return list(dict.fromkeys(cep for cep in ceps if cep))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pré-carrega o cache de CEP a partir de um CSV.")
+    parser.add_argument("csv", help="Arquivo CSV com os CEPs.")
+    parser.add_argument("--coluna", default="cep", help="Nome da coluna com os CEPs (padrão: cep).")
+    parser.add_argument("--intervalo", type=float, default=0.0,
+                        help="Pausa extra entre CEPs não cacheados (o limite do Nominatim já é "
+                             "respeitado pelo agendador, ver NOMINATIM_TAXA).")
+    parser.add_argument("--forcar", action="store_true", help="Busca de novo mesmo CEPs já cacheados.")
+    args = parser.parse_args()
+
+    cache = obter_cep_cache()
+    ceps = _ler_ceps(args.csv, args.coluna)
+    print(f"{len(ceps)} CEPs distintos em {args.csv}")
+
+    resolvidos = falhas = ja_cacheados = 0
+    for i, cep in enumerate(ceps, start=1):
+        if not args.forcar and cache.buscar(cep)[0]:
+            ja_cacheados += 1
+            continue
+
+        if args.forcar:
+            # Descarta a entrada atual para forçar a busca nas APIs
+            cache.remover(cep)
+
+        try:
+            localizacao = buscar_localizacao_por_cep(cep)
+        except Exception as e:
+            print(f"[{i}/{len(ceps)}] {cep}: erro ({e})")
+            localizacao = None
+
+        if localizacao is None:
+            falhas += 1
+        else:
+            resolvidos += 1
+        if args.intervalo:
+            time.sleep(args.intervalo)
+
+    print(f"Resolvidos: {resolvidos} | Sem coordenadas: {falhas} | Já no cache: {ja_cacheados}")
+    print(f"Estatísticas do cache: {cache.stats()}")
+    print(f"Estatísticas da geocodificação: {estatisticas_geocodificacao()}")
+
+
+if __name__ == "__main__":
+    main()
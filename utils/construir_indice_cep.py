@@ -0,0 +1,34 @@
+"""
+Gera o índice offline CEP → centroide (services/cep_index.py) a partir de um CSV com as colunas:
+
+    cep_inicio,cep_fim,cidade,uf,latitude,longitude
+    01000000,01599999,São Paulo,SP,-23.5505,-46.6333
+
+(no lugar de cep_inicio/cep_fim pode vir uma coluna 'prefixo', ex.: "01310").
+
+Uso (a partir da raiz do projeto):
+    python -m utils.construir_indice_cep centroides_cep.csv --saida data/cep_indice
+"""
+import argparse
+import time
+
+from services.cep_index import CEP_INDICE_PATH, IndiceCep, construir_indice
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera o índice offline de CEP a partir de um CSV.")
+    parser.add_argument("csv", help="CSV com as faixas de CEP e os centroides.")
+    parser.add_argument("--saida", default=CEP_INDICE_PATH, help=f"Pasta do índice (padrão: {CEP_INDICE_PATH}).")
+    args = parser.parse_args()
+
+    inicio = time.perf_counter()
+    resumo = construir_indice(args.csv, args.saida)
+    print(f"Índice gerado em {args.saida}: {resumo['faixas']} faixas, {resumo['cidades']} cidades "
+          f"({time.perf_counter() - inicio:.1f} s)")
+
+    # Confere se o índice abre com memory-map
+    print(f"Estatísticas: {IndiceCep(args.saida).stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,30 @@
-import pandas as pd
-import numpy as np
+"""
+Gera o dataset sintético de treino (data/weather_dataset_with_rules.csv) com as regras de negócio.
+
+A geração é vetorizada: cada bloco de linhas é sorteado coluna a coluna com um np.random.Generator
+(com seed), e as regras crítico/severo/moderado/estável viram aritmética de máscaras booleanas.
+Cada classe é sorteada direto da sua região (sem rejeição), então a classe rara "Crítico" custa
+o mesmo que as outras. Os blocos são gravados à medida que ficam prontos (CSV ou Parquet), com
+memória limitada pelo tamanho do bloco.
+
+Uso (a partir da raiz do projeto; "python utils/gerador_csv.py" também funciona):
+    python -m utils.gerador_csv --linhas-por-classe 1000 --seed 42
+    python -m utils.gerador_csv --linhas-por-classe 10000000 --formato parquet --tamanho-chunk 1000000
+"""
+import argparse
+import itertools
 import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+if not __package__:
+    # Rodado como script (python utils/gerador_csv.py): a raiz do projeto entra no path para achar services/
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.rules_service import CATEGORIAS, categorize_many, thresholds  # noqa: E402
 
 # 1. Descobre a pasta raiz do projeto (um nível acima de utils/)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -8,14 +32,53 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 #    dirname(__file__) → ".../utils"
 #    dirname(dirname(__file__)) → pasta raiz do projeto
 
-# 2. Define o diretório de saída como "data/" dentro da raiz, e cria se não existir
+# 2. Define o diretório de saída como "data/" dentro da raiz
 output_dir = os.path.join(BASE_DIR, "data")
-os.makedirs(output_dir, exist_ok=True)
 
 # 3. Caminho completo para salvar o CSV
 csv_path = os.path.join(output_dir, "weather_dataset_with_rules.csv")
 
-# 4. Função que gera uma linha aleatória
+# Faixas (mín, máx) do sorteio uniforme de cada variável; "is_day" é 0.0 ou 1.0
+FAIXAS = {
+    "apparent_temperature": (-30, 50),
+    "cloud_cover": (0, 100),
+    "precipitation": (0, 60),
+    "pressure_msl": (900, 1050),
+    "rain": (0, 60),
+    "relative_humidity_2m": (0, 100),
+    "showers": (0, 60),
+    "snowfall": (0, 30),
+    "surface_pressure": (900, 1050),
+    "temperature_2m": (-30, 50),
+    "weather_code": (0, 100),
+    "wind_direction_10m": (0, 360),
+    "wind_gusts_10m": (0, 60),
+    "wind_speed_10m": (0, 60),
+    "elevation": (0, 2000),
+    "latitude": (-90, 90),
+    "longitude": (-180, 180),
+}
+
+COLUNAS_CONSTANTES = {
+    "timezone": "America/Sao_Paulo",
+    "timezone_abbreviation": "GMT-3",
+    "utc_offset_seconds": -10800
+}
+
+# Ordem das colunas no arquivo (a mesma de sempre)
+COLUNAS = [
+    "apparent_temperature", "cloud_cover", "is_day", "precipitation", "pressure_msl", "rain",
+    "relative_humidity_2m", "showers", "snowfall", "surface_pressure", "temperature_2m", "weather_code",
+    "wind_direction_10m", "wind_gusts_10m", "wind_speed_10m", "elevation", "latitude", "longitude",
+    "timezone", "timezone_abbreviation", "utc_offset_seconds"
+]
+
+# Limiares usados pelas regras em cada variável. Entre dois limiares consecutivos todas as
+# condições têm o mesmo valor, então cada variável se divide em poucas "células"
+LIMIARES_REGRAS = thresholds()
+
+
+# 4. Função que gera uma linha aleatória (versão escalar original, mantida como referência)
 def generate_random_row():
     return {
         "apparent_temperature": np.random.uniform(-30, 50),
@@ -41,7 +104,8 @@ def generate_random_row():
         "utc_offset_seconds": -10800
     }
 
-# 5. Regra de negócio revisada para categorizar
+
+# 5. Regra de negócio revisada para categorizar (versão escalar, uma linha por vez)
 def categorize(row):
     crit = [
         row["wind_speed_10m"] >= 20,
@@ -93,25 +157,209 @@ def categorize(row):
 
     return "Suave (Verde)"
 
-# 6. Geração balanceada (1000 amostras por categoria)
-n_each = 1000
-counts = {cat: 0 for cat in [
-    "Crítico (Emergência Imediata)",
-    "Severo (Alerta Vermelho)",
-    "Moderado (Atenção Amarela)",
-    "Estável (Suporte Disponível)",
-    "Suave (Verde)"
-]}
-rows = []
-
-while any(counts[c] < n_each for c in counts):
-    row = generate_random_row()
-    cat = categorize(row)
-    if counts[cat] < n_each:
-        row["previsao_condicao_climatica"] = cat
-        rows.append(row)
-        counts[cat] += 1
-
-df_final = pd.DataFrame(rows)
-df_final.to_csv(csv_path, index=False)
-print(f"CSV salvo em: {csv_path}")
+
+# 6. As mesmas regras sobre colunas inteiras (arrays numpy) vêm do motor de regras compartilhado
+#    com a API: categorize_many em services/rules_service.py
+
+
+# 7. Sorteio direto de cada classe
+class _RegioesPorClasse:
+    """
+    Cada variável usada pelas regras é dividida nas células entre os seus limiares; uma combinação
+    de células (uma por variável) sempre cai na mesma classe. As combinações são enumeradas uma
+    única vez (~125 mil), com a probabilidade de cada uma sob o sorteio uniforme original.
+
+    Para gerar n linhas de uma classe: sorteia n combinações daquela classe (proporcionalmente à
+    probabilidade) e depois cada variável uniformemente dentro da sua célula. Isso é exatamente o
+    sorteio uniforme condicionado à classe, sem rejeitar linhas.
+    """
+
+    def __init__(self):
+        self.variaveis = list(LIMIARES_REGRAS)
+        self.bordas = []
+        for nome in self.variaveis:
+            minimo, maximo = FAIXAS[nome]
+            self.bordas.append(np.array([minimo, *LIMIARES_REGRAS[nome], maximo], dtype=np.float64))
+
+        # Todas as combinações de células (uma linha por combinação, uma coluna por variável)
+        n_celulas = [len(b) - 1 for b in self.bordas]
+        combinacoes = np.array(list(itertools.product(*(range(n) for n in n_celulas))), dtype=np.int8)
+
+        # A classe de cada combinação é a de qualquer ponto dela (usa o centro das células)
+        centros = {nome: ((b[:-1] + b[1:]) / 2)[combinacoes[:, j]]
+                   for j, (nome, b) in enumerate(zip(self.variaveis, self.bordas))}
+        classes = categorize_many(centros)
+
+        probabilidade = np.ones(len(combinacoes))
+        for j, b in enumerate(self.bordas):
+            probabilidade *= (np.diff(b) / (b[-1] - b[0]))[combinacoes[:, j]]
+
+        self.por_classe = {}
+        for categoria in CATEGORIAS:
+            mascara = classes == categoria
+            p = probabilidade[mascara]
+            self.por_classe[categoria] = (combinacoes[mascara], p / p.sum())
+
+    def sortear(self, rng: np.random.Generator, categoria: str, n: int) -> dict:
+        """
+        Sorteia n valores de cada variável das regras, condicionados à categoria.
+        """
+        combinacoes, p = self.por_classe[categoria]
+        escolhidas = combinacoes[rng.choice(len(p), size=n, p=p)]
+        colunas = {}
+        for j, (nome, b) in enumerate(zip(self.variaveis, self.bordas)):
+            celula = escolhidas[:, j]
+            colunas[nome] = rng.uniform(b[celula], b[celula + 1])
+        return colunas
+
+
+_regioes = None
+
+
+def _obter_regioes() -> _RegioesPorClasse:
+    global _regioes
+    if _regioes is None:
+        _regioes = _RegioesPorClasse()
+    return _regioes
+
+
+def gerar_linhas_da_classe(rng: np.random.Generator, categoria: str, n: int) -> dict:
+    """
+    Gera n linhas (dict de colunas) da categoria: as variáveis das regras vêm do sorteio direto
+    da região da classe e as demais do sorteio uniforme de sempre.
+    """
+    colunas = {}
+    for nome, (minimo, maximo) in FAIXAS.items():
+        if nome not in LIMIARES_REGRAS:
+            colunas[nome] = rng.uniform(minimo, maximo, n)
+    colunas["is_day"] = rng.choice([0.0, 1.0], size=n)
+    colunas.update(_obter_regioes().sortear(rng, categoria, n))
+
+    # Valores exatamente em cima de um limiar (probabilidade ~0) podem mudar de classe:
+    # esses poucos são descartados e sorteados de novo
+    corretas = categorize_many(colunas) == categoria
+    if not corretas.all():
+        extras = gerar_linhas_da_classe(rng, categoria, int((~corretas).sum()))
+        colunas = {nome: np.concatenate([valores[corretas], extras[nome]]) for nome, valores in colunas.items()}
+    return colunas
+
+
+def gerar_chunk(rng: np.random.Generator, linhas_por_classe: int) -> pd.DataFrame:
+    """
+    Gera um bloco com 'linhas_por_classe' linhas de cada categoria, em ordem aleatória.
+    """
+    blocos = [gerar_linhas_da_classe(rng, categoria, linhas_por_classe) for categoria in CATEGORIAS]
+    ordem = rng.permutation(linhas_por_classe * len(CATEGORIAS))
+
+    dados = {}
+    for nome in COLUNAS:
+        if nome in COLUNAS_CONSTANTES:
+            dados[nome] = np.full(len(ordem), COLUNAS_CONSTANTES[nome])
+        else:
+            dados[nome] = np.concatenate([bloco[nome] for bloco in blocos])[ordem]
+    dados["previsao_condicao_climatica"] = np.repeat(np.array(CATEGORIAS, dtype=object), linhas_por_classe)[ordem]
+    return pd.DataFrame(dados)
+
+
+class _EscritorParquet:
+    def __init__(self, caminho: str):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise SystemExit("Saída Parquet requer o pacote 'pyarrow' (pip install pyarrow).") from e
+        self._pa = pa
+        self._pq = pq
+        self._caminho = caminho
+        self._writer = None
+
+    def escrever(self, df: pd.DataFrame):
+        tabela = self._pa.Table.from_pandas(df, preserve_index=False)
+        if self._writer is None:
+            self._writer = self._pq.ParquetWriter(self._caminho, tabela.schema)
+        self._writer.write_table(tabela)
+
+    def fechar(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+class _EscritorCsv:
+    """
+    Grava os blocos em sequência no mesmo CSV. Com o pyarrow instalado usa o writer de CSV dele
+    (~20x mais rápido que o DataFrame.to_csv para floats, com os mesmos valores ao reler).
+    """
+
+    def __init__(self, caminho: str):
+        self._caminho = caminho
+        self._arquivo = None
+        try:
+            import pyarrow as pa
+            import pyarrow.csv as pa_csv
+            self._pa, self._pa_csv = pa, pa_csv
+        except ImportError:
+            self._pa = self._pa_csv = None
+
+    def escrever(self, df: pd.DataFrame):
+        primeiro = self._arquivo is None
+        if primeiro:
+            self._arquivo = open(self._caminho, "wb")
+        if self._pa is None:
+            df.to_csv(self._arquivo, index=False, header=primeiro)
+        else:
+            opcoes = self._pa_csv.WriteOptions(include_header=primeiro, quoting_style="needed")
+            self._pa_csv.write_csv(self._pa.Table.from_pandas(df, preserve_index=False), self._arquivo, opcoes)
+
+    def fechar(self):
+        if self._arquivo is not None:
+            self._arquivo.close()
+
+
+def gerar_dataset(linhas_por_classe: int, caminho: str, seed=None, formato: str = "csv",
+                  tamanho_chunk: int = 1_000_000) -> int:
+    """
+    Gera 'linhas_por_classe' linhas de cada categoria e grava em 'caminho' em blocos de até
+    'tamanho_chunk' linhas (cada bloco é balanceado e embaralhado). Retorna o total de linhas.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(os.path.dirname(os.path.abspath(caminho)), exist_ok=True)
+    escritor = _EscritorParquet(caminho) if formato == "parquet" else _EscritorCsv(caminho)
+
+    por_chunk = max(1, tamanho_chunk // len(CATEGORIAS))
+    restantes = linhas_por_classe
+    total = 0
+    inicio = time.perf_counter()
+    try:
+        while restantes > 0:
+            n = min(por_chunk, restantes)
+            df = gerar_chunk(rng, n)
+            escritor.escrever(df)
+            restantes -= n
+            total += len(df)
+            decorrido = time.perf_counter() - inicio
+            print(f"{total} linhas gravadas ({total / decorrido:,.0f} linhas/s)")
+    finally:
+        escritor.fechar()
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera o dataset sintético de clima com as regras de negócio.")
+    parser.add_argument("--linhas-por-classe", type=int, default=1000,
+                        help="Linhas de cada uma das 5 categorias (padrão: 1000).")
+    parser.add_argument("--seed", type=int, default=None, help="Seed do gerador (padrão: aleatória).")
+    parser.add_argument("--formato", choices=["csv", "parquet"], default="csv")
+    parser.add_argument("--saida", default=None,
+                        help="Arquivo de saída (padrão: data/weather_dataset_with_rules.csv ou .parquet).")
+    parser.add_argument("--tamanho-chunk", type=int, default=1_000_000,
+                        help="Linhas geradas e gravadas por vez (limita a memória usada).")
+    args = parser.parse_args()
+
+    caminho = args.saida or (csv_path if args.formato == "csv" else os.path.splitext(csv_path)[0] + ".parquet")
+    gerar_dataset(args.linhas_por_classe, caminho, seed=args.seed, formato=args.formato,
+                  tamanho_chunk=args.tamanho_chunk)
+    print(f"Arquivo salvo em: {caminho}")
+
+
+if __name__ == "__main__":
+    main()
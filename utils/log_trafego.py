@@ -0,0 +1,252 @@
+"""
+Log de tráfego dos upstreams: arquivo só de acréscimo (append-only), comprimido, com índice.
+
+Formato:
+  - <log>: sequência de blocos; cada bloco é um cabeçalho struct "<II" (bytes comprimidos,
+    número de registros) seguido dos registros do bloco comprimidos juntos com zlib (registros
+    pequenos e parecidos — respostas da Open-Meteo, do Nominatim... — comprimem muito melhor em
+    bloco do que um a um). Cada registro é struct "<II" (tamanho do cabeçalho JSON, tamanho do
+    corpo) + cabeçalho JSON + corpo cru da resposta.
+  - <log>.idx: uma entrada struct "<16sQI" por registro: blake2b da chave da requisição
+    (chave_requisicao), posição do bloco no log e posição do registro dentro do bloco
+    descomprimido.
+
+O gravador junta os registros em memória e grava um bloco quando ele passa de BLOCO_BYTES, a
+cada INTERVALO_SEGUNDOS ou no fechamento; o índice é gravado depois do bloco. O leitor carrega o
+índice num dict e, se o log tem blocos além do que o índice cobre (ex.: processo interrompido
+entre as duas escritas), indexa o restante lendo os blocos.
+"""
+import hashlib
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import NamedTuple
+from urllib.parse import parse_qsl, urlsplit
+
+BLOCO_BYTES = 256 * 1024
+INTERVALO_SEGUNDOS = 1.0
+NIVEL_COMPRESSAO = 6
+BLOCOS_EM_CACHE = 64
+
+_CABECALHO_BLOCO = struct.Struct("<II")
+_CABECALHO_REGISTRO = struct.Struct("<II")
+_ENTRADA_INDICE = struct.Struct("<16sQI")
+
+
+class RegistroTrafego(NamedTuple):
+    upstream: str
+    metodo: str
+    url: str            # caminho + query, como chegou ao proxy
+    status: int
+    tipo: str           # Content-Type
+    cabecalhos: dict    # cabeçalhos da resposta que importam ao client (ex.: Retry-After)
+    inicio: float       # time.time() do início da chamada
+    duracao: float      # segundos até a resposta completa
+    corpo: bytes
+
+
+def chave_requisicao(upstream: str, metodo: str, url: str) -> bytes:
+    """
+    Chave de busca de uma requisição: upstream, método, caminho e parâmetros da query com os
+    nomes em ordem e os valores separados por vírgula abertos ("current=a,b" e
+    "current=a&current=b" dão a mesma chave — o client síncrono e o assíncrono da Open-Meteo
+    montam a query de formas diferentes).
+    """
+    partes = urlsplit(url)
+    parametros = {}
+    for nome, valor in parse_qsl(partes.query, keep_blank_values=True):
+        parametros.setdefault(nome, []).extend(valor.split(","))
+    normalizada = json.dumps([upstream, metodo.upper(), partes.path.rstrip("/"), sorted(parametros.items())],
+                             ensure_ascii=False, separators=(",", ":"))
+    return hashlib.blake2b(normalizada.encode("utf-8"), digest_size=16).digest()
+
+
+def _codificar(registro: RegistroTrafego) -> bytes:
+    cabecalho = json.dumps({
+        "upstream": registro.upstream, "metodo": registro.metodo, "url": registro.url, "status": registro.status,
+        "tipo": registro.tipo, "cabecalhos": registro.cabecalhos, "inicio": registro.inicio,
+        "duracao": registro.duracao,
+    }, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return _CABECALHO_REGISTRO.pack(len(cabecalho), len(registro.corpo)) + cabecalho + registro.corpo
+
+
+def _decodificar(dados: bytes, posicao: int) -> tuple:
+    """
+    (RegistroTrafego, posição do próximo registro) do registro que começa em 'posicao'.
+    """
+    tamanho_cabecalho, tamanho_corpo = _CABECALHO_REGISTRO.unpack_from(dados, posicao)
+    inicio = posicao + _CABECALHO_REGISTRO.size
+    cabecalho = json.loads(dados[inicio:inicio + tamanho_cabecalho])
+    corpo = dados[inicio + tamanho_cabecalho:inicio + tamanho_cabecalho + tamanho_corpo]
+    return RegistroTrafego(corpo=bytes(corpo), **cabecalho), inicio + tamanho_cabecalho + tamanho_corpo
+
+
+class GravadorTrafego:
+    """
+    Acrescenta registros ao log e ao índice (ver a descrição do módulo). Seguro entre threads.
+    """
+
+    def __init__(self, caminho: str, bloco_bytes: int = BLOCO_BYTES, intervalo: float = INTERVALO_SEGUNDOS):
+        self.caminho = caminho
+        self.bloco_bytes = bloco_bytes
+        self.intervalo = intervalo
+
+        pasta = os.path.dirname(os.path.abspath(caminho))
+        os.makedirs(pasta, exist_ok=True)
+        self._log = open(caminho, "ab")
+        self._indice = open(caminho + ".idx", "ab")
+        self._pendentes = []        # (chave, registro codificado)
+        self._bytes_pendentes = 0
+        self._desde = None          # quando o registro pendente mais antigo chegou
+        self._lock = threading.Lock()
+        self._stats = {"registros": 0, "blocos": 0, "bytes_brutos": 0, "bytes_gravados": 0}
+
+    def gravar(self, registro: RegistroTrafego):
+        codificado = _codificar(registro)
+        with self._lock:
+            self._pendentes.append((chave_requisicao(registro.upstream, registro.metodo, registro.url), codificado))
+            self._bytes_pendentes += len(codificado)
+            self._desde = self._desde or time.monotonic()
+            if self._bytes_pendentes >= self.bloco_bytes or time.monotonic() - self._desde >= self.intervalo:
+                self._gravar_bloco()
+
+    def descarregar(self):
+        """
+        Grava os registros pendentes num bloco (chamado periodicamente e no fechamento).
+        """
+        with self._lock:
+            self._gravar_bloco()
+
+    def _gravar_bloco(self):
+        # Chamado com self._lock adquirido
+        if not self._pendentes or self._log.closed:
+            return
+        bruto = b"".join(codificado for _, codificado in self._pendentes)
+        comprimido = zlib.compress(bruto, NIVEL_COMPRESSAO)
+        posicao_bloco = self._log.seek(0, os.SEEK_END)
+        self._log.write(_CABECALHO_BLOCO.pack(len(comprimido), len(self._pendentes)) + comprimido)
+        self._log.flush()
+
+        entradas, posicao = [], 0
+        for chave, codificado in self._pendentes:
+            entradas.append(_ENTRADA_INDICE.pack(chave, posicao_bloco, posicao))
+            posicao += len(codificado)
+        self._indice.write(b"".join(entradas))
+        self._indice.flush()
+
+        self._stats["registros"] += len(self._pendentes)
+        self._stats["blocos"] += 1
+        self._stats["bytes_brutos"] += len(bruto)
+        self._stats["bytes_gravados"] += _CABECALHO_BLOCO.size + len(comprimido)
+        self._pendentes, self._bytes_pendentes, self._desde = [], 0, None
+
+    def fechar(self):
+        with self._lock:
+            self._gravar_bloco()
+            self._log.close()
+            self._indice.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats, pendentes=len(self._pendentes))
+
+
+class LeitorTrafego:
+    """
+    Busca no log pela chave da requisição. Cada chave pode ter várias respostas gravadas (a
+    mesma URL consultada em momentos diferentes); proxima() as devolve em ordem, recomeçando
+    do início quando acabam. Blocos descomprimidos ficam num LRU de BLOCOS_EM_CACHE.
+    """
+
+    def __init__(self, caminho: str):
+        self.caminho = caminho
+        self._fd = os.open(caminho, os.O_RDONLY)
+        self._posicoes = {}         # chave → [(posição do bloco, posição no bloco), ...]
+        self._proximas = {}         # chave → índice da próxima resposta a servir
+        self._blocos = OrderedDict()
+        self._lock = threading.Lock()
+        self._carregar_indice()
+
+    def _carregar_indice(self):
+        fim_indexado = 0
+        caminho_indice = self.caminho + ".idx"
+        if os.path.exists(caminho_indice):
+            with open(caminho_indice, "rb") as f:
+                dados = f.read()
+            # Uma entrada cortada no fim (escrita interrompida) é descartada
+            dados = dados[:len(dados) - len(dados) % _ENTRADA_INDICE.size]
+            for chave, bloco, posicao in _ENTRADA_INDICE.iter_unpack(dados):
+                self._posicoes.setdefault(chave, []).append((bloco, posicao))
+                fim_indexado = max(fim_indexado, bloco)
+            if self._posicoes:
+                tamanho, _ = _CABECALHO_BLOCO.unpack(os.pread(self._fd, _CABECALHO_BLOCO.size, fim_indexado))
+                fim_indexado += _CABECALHO_BLOCO.size + tamanho
+        self._indexar_a_partir_de(fim_indexado)
+
+    def _indexar_a_partir_de(self, posicao_bloco: int):
+        # Blocos que o índice não cobre: lidos e indexados aqui (não altera o .idx)
+        tamanho_log = os.fstat(self._fd).st_size
+        while posicao_bloco + _CABECALHO_BLOCO.size <= tamanho_log:
+            tamanho, n = _CABECALHO_BLOCO.unpack(os.pread(self._fd, _CABECALHO_BLOCO.size, posicao_bloco))
+            if posicao_bloco + _CABECALHO_BLOCO.size + tamanho > tamanho_log:
+                break   # bloco cortado no fim do arquivo
+            dados, posicao = self._bloco(posicao_bloco), 0
+            for _ in range(n):
+                registro, seguinte = _decodificar(dados, posicao)
+                chave = chave_requisicao(registro.upstream, registro.metodo, registro.url)
+                self._posicoes.setdefault(chave, []).append((posicao_bloco, posicao))
+                posicao = seguinte
+            posicao_bloco += _CABECALHO_BLOCO.size + tamanho
+
+    def _bloco(self, posicao_bloco: int) -> bytes:
+        with self._lock:
+            dados = self._blocos.get(posicao_bloco)
+            if dados is not None:
+                self._blocos.move_to_end(posicao_bloco)
+                return dados
+        tamanho, _ = _CABECALHO_BLOCO.unpack(os.pread(self._fd, _CABECALHO_BLOCO.size, posicao_bloco))
+        dados = zlib.decompress(os.pread(self._fd, tamanho, posicao_bloco + _CABECALHO_BLOCO.size))
+        with self._lock:
+            self._blocos[posicao_bloco] = dados
+            while len(self._blocos) > BLOCOS_EM_CACHE:
+                self._blocos.popitem(last=False)
+        return dados
+
+    def proxima(self, upstream: str, metodo: str, url: str):
+        """
+        Próxima resposta gravada para a requisição, ou None se ela nunca foi gravada.
+        """
+        chave = chave_requisicao(upstream, metodo, url)
+        posicoes = self._posicoes.get(chave)
+        if not posicoes:
+            return None
+        with self._lock:
+            i = self._proximas.get(chave, 0)
+            self._proximas[chave] = (i + 1) % len(posicoes)
+        bloco, posicao = posicoes[i]
+        return _decodificar(self._bloco(bloco), posicao)[0]
+
+    def registros(self):
+        """
+        Todos os registros, na ordem em que foram gravados.
+        """
+        posicao_bloco, tamanho_log = 0, os.fstat(self._fd).st_size
+        while posicao_bloco + _CABECALHO_BLOCO.size <= tamanho_log:
+            tamanho, n = _CABECALHO_BLOCO.unpack(os.pread(self._fd, _CABECALHO_BLOCO.size, posicao_bloco))
+            if posicao_bloco + _CABECALHO_BLOCO.size + tamanho > tamanho_log:
+                return
+            dados, posicao = self._bloco(posicao_bloco), 0
+            for _ in range(n):
+                registro, posicao = _decodificar(dados, posicao)
+                yield registro
+            posicao_bloco += _CABECALHO_BLOCO.size + tamanho
+
+    def __len__(self) -> int:
+        return sum(len(posicoes) for posicoes in self._posicoes.values())
+
+    def fechar(self):
+        os.close(self._fd)
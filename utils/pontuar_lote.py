@@ -0,0 +1,91 @@
+"""
+Pontuação em lote offline (services/batch_scoring.py): roda o modelo sobre um CSV ou Parquet
+no esquema de FEATURE_COLS (dumps de observações com dezenas de milhões de linhas) e grava a
+categoria e as probabilidades de cada linha em partes Parquet ou CSV numa pasta de saída, um
+bloco por vez em cada processo.
+
+A pasta de saída guarda o plano dos blocos e cada bloco concluído: rodar o mesmo comando de novo
+depois de uma interrupção continua do último bloco concluído. --juntar grava, no fim, as partes
+num único arquivo ao lado da pasta.
+
+Uso (a partir da raiz do projeto):
+    python -m utils.pontuar_lote
+    python -m utils.pontuar_lote observacoes.parquet --saida data/pontuacao/observacoes --processos 4
+    python -m utils.pontuar_lote observacoes.csv --formato csv --manter estacao data_hora --juntar
+"""
+import argparse
+import os
+import sys
+
+from services.batch_scoring import FORMATOS, PONTUACAO_PATH, juntar_partes, pontuar_arquivo
+from services.model_service import CSV_PATH, PREDICTION_MODES
+
+
+def _mostrar_bloco(resultado: dict, andamento: dict):
+    print(f"[{andamento['blocos']}/{andamento['total']}] bloco {resultado['bloco']:>5}: "
+          f"{resultado['linhas']:,} linhas em {resultado['segundos']:.2f} s | "
+          f"{andamento['linhas']:,} linhas a {andamento['linhas_s']:,.0f} linhas/s | "
+          f"RSS pico: {andamento['rss_pico_mb']:.0f} MB (principal), "
+          f"{andamento['rss_pico_worker_mb']:.0f} MB (worker)", flush=True)
+
+
+def _mostrar_relatorio(relatorio: dict):
+    blocos = relatorio["blocos"]
+    print("\n=== Pontuação ===")
+    print(f"linhas: {relatorio['linhas']:,} em {blocos['total']} blocos "
+          f"({blocos['executados']} executados, {blocos['retomados']} retomados)")
+    if relatorio["linhas_executadas"]:
+        print(f"{relatorio['linhas_executadas']:,} linhas em {relatorio['segundos']:.2f} s: "
+              f"{relatorio['linhas_s']:,.0f} linhas/s | {relatorio['processos']} processos x "
+              f"{relatorio['threads']} threads")
+        print(f"RSS pico: {relatorio['rss_pico_mb']:.0f} MB (principal), "
+              f"{relatorio['rss_pico_worker_mb']:.0f} MB (maior worker)")
+    if relatorio["modelo"]:
+        print(f"modelo: {relatorio['modelo']['versao'] or 'arquivo'} (sha256 {relatorio['modelo']['sha256'][:12]})")
+    print("categorias:")
+    for categoria, linhas in relatorio["categorias"].items():
+        print(f"  {categoria:<40} {linhas:>12,} ({linhas / max(relatorio['linhas'], 1):.1%})")
+    print(f"saída: {relatorio['pasta']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pontua um CSV/Parquet com o modelo, em blocos e em paralelo.")
+    parser.add_argument("entrada", nargs="?", default=CSV_PATH, help="CSV ou Parquet de entrada (padrão: o CSV do projeto).")
+    parser.add_argument("--saida", default=None,
+                        help=f"Pasta das partes da saída (padrão: {PONTUACAO_PATH}/<nome da entrada>).")
+    parser.add_argument("--formato", choices=FORMATOS, default="parquet", help="Formato das partes (padrão: parquet).")
+    parser.add_argument("--modo", choices=PREDICTION_MODES, default=None,
+                        help="Modo de predição (padrão: MODO_PREDICAO). No modo 'regras' não há probabilidades.")
+    parser.add_argument("--versao", default=None, help="Versão do registro de modelos (padrão: a ativa).")
+    parser.add_argument("--modelo", default=None, help="Arquivo de modelo nativo, no lugar de uma versão do registro.")
+    parser.add_argument("--processos", type=int, default=None, help="Blocos em paralelo (padrão: núcleos / threads).")
+    parser.add_argument("--threads", type=int, default=1, help="Threads do LightGBM por processo (padrão: 1).")
+    parser.add_argument("--tamanho-chunk", type=int, default=500_000, help="Linhas por bloco (padrão: 500000).")
+    parser.add_argument("--manter", nargs="*", default=[], help="Colunas da entrada copiadas para a saída (ex.: ids).")
+    parser.add_argument("--juntar", action="store_true", help="Junta as partes num único arquivo no fim.")
+    parser.add_argument("--recomecar", action="store_true", help="Descarta a pontuação salva na pasta de saída.")
+    args = parser.parse_args()
+
+    nome = os.path.splitext(os.path.basename(args.entrada))[0]
+    pasta = args.saida or os.path.join(PONTUACAO_PATH, nome)
+    try:
+        relatorio = pontuar_arquivo(
+            args.entrada, pasta, formato=args.formato, modo=args.modo, versao=args.versao,
+            caminho_modelo=args.modelo, processos=args.processos, threads=args.threads,
+            tamanho_chunk=args.tamanho_chunk, manter=args.manter, recomecar=args.recomecar,
+            ao_concluir_bloco=_mostrar_bloco,
+        )
+    except KeyboardInterrupt:
+        sys.exit(f"\nInterrompido. Os blocos concluídos estão em {pasta}; rode o mesmo comando para continuar.")
+    except (ValueError, RuntimeError, FileNotFoundError) as e:
+        sys.exit(str(e))
+    _mostrar_relatorio(relatorio)
+
+    if args.juntar:
+        destino = f"{pasta.rstrip(os.sep)}.{args.formato}"
+        linhas = juntar_partes(pasta, destino)
+        print(f"{linhas:,} linhas juntadas em {destino}")
+
+
+if __name__ == "__main__":
+    main()
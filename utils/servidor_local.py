@@ -0,0 +1,36 @@
+"""
+Base dos servidores HTTP locais usados nos testes de carga: os upstreams simulados
+(benchmarks/stub_open_meteo.py, benchmarks/stub_upstreams.py) e os proxies de gravação e
+servidores de reprodução de tráfego (utils/trafego_upstreams.py).
+"""
+import threading
+from collections import Counter
+from http.server import ThreadingHTTPServer
+
+
+class ServidorLocal(ThreadingHTTPServer):
+    """
+    Servidor HTTP em 127.0.0.1 ('porta' 0 = porta livre qualquer) que atende cada conexão numa
+    thread daemon. Guarda contadores por chave em 'stats' (ver contar).
+    """
+    daemon_threads = True
+
+    def __init__(self, handler, porta: int = 0):
+        super().__init__(("127.0.0.1", porta), handler)
+        self._lock = threading.Lock()
+        self.stats = Counter()
+
+    @property
+    def endereco(self) -> str:
+        return f"127.0.0.1:{self.server_address[1]}"
+
+    def contar(self, chave: str):
+        with self._lock:
+            self.stats[chave] += 1
+
+    def iniciar(self):
+        """
+        Sobe o servidor numa thread daemon e devolve o próprio servidor.
+        """
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
@@ -0,0 +1,262 @@
+"""
+Gravação e reprodução do tráfego dos upstreams (OpenCEP/brazilcep, Nominatim e Open-Meteo).
+
+  gravar      sobe um proxy local por upstream, que repassa as requisições ao upstream real e
+              grava cada requisição + resposta + duração no log de tráfego (utils/log_trafego.py);
+  reproduzir  sobe servidores locais que respondem com o que foi gravado, esperando a duração
+              gravada dividida por --velocidade (0: sem espera), sem rede;
+  info        resume um log (registros por upstream, período, compressão, latências).
+
+Os dois primeiros imprimem as variáveis de ambiente que apontam a API para os servidores locais
+(OPENCEP_URL, NOMINATIM_DOMAIN/NOMINATIM_SCHEME, OPEN_METEO_URL) — as mesmas usadas com os
+upstreams simulados de benchmarks/stub_upstreams.py —, então as chamadas de api_cep_service e
+api_weather_service (síncronas e assíncronas) passam por eles sem mudança no código.
+
+Na reprodução, cada requisição é procurada pela chave (upstream, método, caminho, parâmetros);
+a mesma URL gravada várias vezes devolve as respostas em ordem. Requisições que não estão no
+log recebem 502 e são contadas como faltas. Para reproduzir um arquivo de tráfego contra a API
+inteira, ver benchmarks/bench_replay.py.
+
+Uso (a partir da raiz do projeto):
+    python -m utils.trafego_upstreams gravar --log trafego/upstreams.log
+    python -m utils.trafego_upstreams reproduzir --log trafego/upstreams.log --velocidade 10
+    python -m utils.trafego_upstreams info --log trafego/upstreams.log
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+from http.server import BaseHTTPRequestHandler
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.log_trafego import INTERVALO_SEGUNDOS, GravadorTrafego, LeitorTrafego, RegistroTrafego
+from utils.servidor_local import ServidorLocal
+
+# Upstreams reais (o OpenCEP e a Open-Meteo pelo host; o caminho vem da requisição)
+DESTINOS = {
+    "brazilcep": "https://opencep.com",
+    "nominatim": "https://nominatim.openstreetmap.org",
+    "open_meteo": "https://api.open-meteo.com",
+}
+PROXY_TIMEOUT = 30
+# Cabeçalhos repassados ao upstream (o Nominatim exige User-Agent) e devolvidos ao client
+_CABECALHOS_REQUISICAO = ("User-Agent", "Accept")
+_CABECALHOS_RESPOSTA = ("Retry-After",)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        status, tipo, cabecalhos, corpo = self.server.atender(self)
+        self.send_response(status)
+        self.send_header("Content-Type", tipo)
+        self.send_header("Content-Length", str(len(corpo)))
+        for nome, valor in cabecalhos.items():
+            self.send_header(nome, valor)
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, *args):
+        pass
+
+
+class _ServidorUpstream(ServidorLocal):
+
+    def __init__(self, nome: str, porta: int = 0):
+        super().__init__(_Handler, porta)
+        self.nome = nome
+
+    def atender(self, handler) -> tuple:
+        raise NotImplementedError
+
+
+class ProxyGravacao(_ServidorUpstream):
+    """
+    Repassa as requisições ao upstream 'destino' e grava cada uma no log (inclusive as que falham,
+    para que a reprodução também reproduza os erros).
+    """
+
+    def __init__(self, nome: str, destino: str, gravador: GravadorTrafego, porta: int = 0):
+        super().__init__(nome, porta)
+        self.destino = destino.rstrip("/")
+        self.gravador = gravador
+        self._sessao = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=64)
+        self._sessao.mount("http://", adapter)
+        self._sessao.mount("https://", adapter)
+
+    def atender(self, handler) -> tuple:
+        cabecalhos_requisicao = {nome: handler.headers[nome] for nome in _CABECALHOS_REQUISICAO if handler.headers[nome]}
+        inicio, relogio = time.time(), time.perf_counter()
+        try:
+            resposta = self._sessao.get(self.destino + handler.path, headers=cabecalhos_requisicao,
+                                        timeout=PROXY_TIMEOUT)
+            status, tipo, corpo = resposta.status_code, resposta.headers.get("Content-Type", ""), resposta.content
+            cabecalhos = {nome: resposta.headers[nome] for nome in _CABECALHOS_RESPOSTA if nome in resposta.headers}
+        except requests.RequestException as e:
+            status, tipo, corpo, cabecalhos = 502, "text/plain", f"Falha no upstream: {e}".encode("utf-8"), {}
+        duracao = time.perf_counter() - relogio
+        self.gravador.gravar(RegistroTrafego(self.nome, "GET", handler.path, status, tipo, cabecalhos,
+                                             inicio, duracao, corpo))
+        self.contar("gravadas")
+        return status, tipo, cabecalhos, corpo
+
+
+class ServidorReproducao(_ServidorUpstream):
+    """
+    Responde com as respostas gravadas do upstream 'nome', depois de esperar a duração gravada
+    dividida por 'velocidade' (0: responde na hora).
+    """
+
+    def __init__(self, nome: str, leitor: LeitorTrafego, velocidade: float = 1.0, porta: int = 0):
+        super().__init__(nome, porta)
+        self.leitor = leitor
+        self.velocidade = velocidade
+
+    def atender(self, handler) -> tuple:
+        registro = self.leitor.proxima(self.nome, "GET", handler.path)
+        if registro is None:
+            self.contar("faltas")
+            corpo = json.dumps({"erro": "requisição não gravada", "url": handler.path}).encode("utf-8")
+            return 502, "application/json", {}, corpo
+        self.contar("acertos")
+        if self.velocidade > 0:
+            time.sleep(registro.duracao / self.velocidade)
+        return registro.status, registro.tipo, registro.cabecalhos, registro.corpo
+
+
+def _env(servidores: dict) -> dict:
+    """
+    Variáveis de ambiente que apontam a API para os servidores locais.
+    """
+    return {
+        "OPENCEP_URL": f"http://{servidores['brazilcep'].endereco}/v1/{{}}",
+        "NOMINATIM_DOMAIN": servidores["nominatim"].endereco,
+        "NOMINATIM_SCHEME": "http",
+        "OPEN_METEO_URL": f"http://{servidores['open_meteo'].endereco}/v1/forecast",
+    }
+
+
+def _portas(porta_base: int) -> dict:
+    return {nome: porta_base + i if porta_base else 0 for i, nome in enumerate(DESTINOS)}
+
+
+def iniciar_gravacao(caminho: str, destinos: dict = None, porta_base: int = 0) -> dict:
+    """
+    Sobe os três proxies de gravação (destinos: DESTINOS, ou outros como os upstreams simulados)
+    e devolve {"servidores", "env", "gravador"}. Uma thread descarrega o gravador a cada
+    INTERVALO_SEGUNDOS; chame gravador.fechar() no fim.
+    """
+    destinos = {**DESTINOS, **(destinos or {})}
+    gravador = GravadorTrafego(caminho)
+    portas = _portas(porta_base)
+    servidores = {nome: ProxyGravacao(nome, destinos[nome], gravador, portas[nome]).iniciar() for nome in DESTINOS}
+
+    def descarregar():
+        while True:
+            time.sleep(INTERVALO_SEGUNDOS)
+            gravador.descarregar()
+
+    threading.Thread(target=descarregar, name="descarregar-trafego", daemon=True).start()
+    return {"servidores": servidores, "env": _env(servidores), "gravador": gravador}
+
+
+def iniciar_reproducao(caminho: str, velocidade: float = 1.0, porta_base: int = 0) -> dict:
+    """
+    Sobe os três servidores de reprodução do log e devolve {"servidores", "env", "leitor"}.
+    """
+    leitor = LeitorTrafego(caminho)
+    portas = _portas(porta_base)
+    servidores = {nome: ServidorReproducao(nome, leitor, velocidade, portas[nome]).iniciar() for nome in DESTINOS}
+    return {"servidores": servidores, "env": _env(servidores), "leitor": leitor}
+
+
+def resumir_log(caminho: str) -> dict:
+    """
+    Registros, período, bytes e latências (p50/p99 em ms) por upstream de um log.
+    """
+    leitor = LeitorTrafego(caminho)
+    por_upstream = defaultdict(lambda: {"registros": 0, "status": Counter(), "duracoes": [], "bytes_corpo": 0})
+    inicio, fim = float("inf"), float("-inf")
+    for registro in leitor.registros():
+        resumo = por_upstream[registro.upstream]
+        resumo["registros"] += 1
+        resumo["status"][str(registro.status)] += 1
+        resumo["duracoes"].append(registro.duracao)
+        resumo["bytes_corpo"] += len(registro.corpo)
+        inicio, fim = min(inicio, registro.inicio), max(fim, registro.inicio + registro.duracao)
+    leitor.fechar()
+
+    upstreams = {}
+    for nome, resumo in sorted(por_upstream.items()):
+        ms = np.asarray(resumo.pop("duracoes")) * 1000
+        upstreams[nome] = dict(resumo, status=dict(resumo["status"]), p50_ms=float(np.percentile(ms, 50)),
+                               p99_ms=float(np.percentile(ms, 99)))
+    return {
+        "registros": sum(resumo["registros"] for resumo in upstreams.values()),
+        "periodo_segundos": max(fim - inicio, 0.0) if upstreams else 0.0,
+        "bytes_log": os.path.getsize(caminho),
+        "bytes_indice": os.path.getsize(caminho + ".idx") if os.path.exists(caminho + ".idx") else 0,
+        "upstreams": upstreams,
+    }
+
+
+def _servir_ate_interromper(iniciados: dict, titulo: str):
+    print(f"{titulo}. Aponte a API para os servidores locais com:")
+    for nome, valor in iniciados["env"].items():
+        print(f"  export {nome}='{valor}'")
+    print("Ctrl+C para encerrar.")
+    try:
+        while True:
+            time.sleep(5)
+            stats = {nome: dict(servidor.stats) for nome, servidor in iniciados["servidores"].items()}
+            print(json.dumps(stats, ensure_ascii=False))
+    except KeyboardInterrupt:
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Grava e reproduz o tráfego dos upstreams da API.")
+    comandos = parser.add_subparsers(dest="comando", required=True)
+
+    gravar = comandos.add_parser("gravar", help="Proxies que gravam as chamadas aos upstreams reais.")
+    gravar.add_argument("--log", required=True, help="Arquivo do log (o índice fica em <log>.idx).")
+    gravar.add_argument("--porta-base", type=int, default=0,
+                        help="Portas fixas: brazilcep, nominatim e open_meteo em N, N+1, N+2 (padrão: livres).")
+    for nome in DESTINOS:
+        gravar.add_argument(f"--destino-{nome.replace('_', '-')}", dest=f"destino_{nome}", default=DESTINOS[nome])
+
+    reproduzir = comandos.add_parser("reproduzir", help="Servidores que respondem com o tráfego gravado.")
+    reproduzir.add_argument("--log", required=True)
+    reproduzir.add_argument("--velocidade", type=float, default=1.0,
+                            help="Divide as durações gravadas (10 = 10x mais rápido; 0 = sem espera).")
+    reproduzir.add_argument("--porta-base", type=int, default=0)
+
+    info = comandos.add_parser("info", help="Resumo de um log.")
+    info.add_argument("--log", required=True)
+    args = parser.parse_args()
+
+    if args.comando == "gravar":
+        destinos = {nome: getattr(args, f"destino_{nome}") for nome in DESTINOS}
+        iniciados = iniciar_gravacao(args.log, destinos, args.porta_base)
+        try:
+            _servir_ate_interromper(iniciados, f"Gravando em {args.log}")
+        finally:
+            iniciados["gravador"].fechar()
+            print(json.dumps(iniciados["gravador"].stats()))
+    elif args.comando == "reproduzir":
+        iniciados = iniciar_reproducao(args.log, args.velocidade, args.porta_base)
+        _servir_ate_interromper(iniciados, f"Reproduzindo {len(iniciados['leitor'])} respostas de {args.log} "
+                                           f"(velocidade {args.velocidade:g})")
+    else:
+        print(json.dumps(resumir_log(args.log), indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Treino offline do modelo com validação cruzada k-fold e busca de hiperparâmetros em paralelo
+(services/model_training.py). O melhor modelo é publicado como versão nova no registro de
+modelos (data/modelos), pronto para ser ativado pelo /admin/modelos ou com --ativar.
+
+A pasta de trabalho (--pasta) guarda o Dataset binário do LightGBM, os folds e cada trial
+concluído: rodar o mesmo comando de novo depois de uma interrupção continua a busca de onde
+parou (e aumentar --trials só roda os trials novos).
+
+Uso (a partir da raiz do projeto):
+    python -m utils.treinar_modelo
+    python -m utils.treinar_modelo data/weather_dataset_with_rules.parquet --trials 50 --processos 4 --threads 2
+    python -m utils.treinar_modelo --trials 30 --ativar
+"""
+import argparse
+import sys
+
+from services.model_service import CSV_PATH, MODELS_DIR
+from services.model_training import TREINO_PATH, treinar_com_busca
+
+
+def _mostrar_trial(resultado: dict, concluidos: int, total: int):
+    print(f"[{concluidos}/{total}] trial {resultado['trial']:>3}: logloss {resultado['multi_logloss']:.4f} | "
+          f"acurácia {resultado['acuracia']:.2%} | {resultado['iteracoes']} iterações | "
+          f"{resultado['segundos']:.1f} s", flush=True)
+
+
+def _mostrar_relatorio(relatorio: dict):
+    dados, trials, melhor = relatorio["dados"], relatorio["trials"], relatorio["melhor"]
+    print("\n=== Tempos ===")
+    for etapa, segundos in relatorio["etapas_s"].items():
+        print(f"{etapa:>14}: {segundos:8.2f} s")
+    if dados["reaproveitado"]:
+        print(f"dados: {dados['linhas']} linhas (Dataset binário reaproveitado)")
+    else:
+        print(f"dados: {dados['linhas']} linhas (leitura {dados['leitura_s']:.2f} s, "
+              f"Dataset binário {dados['dataset_s']:.2f} s)")
+    print(f"trials: {trials['executados']} executados, {trials['retomados']} retomados | "
+          f"{trials['processos']} processos x {trials['threads_por_trial']} threads")
+    if trials["executados"]:
+        print(f"        média {trials['media_trial_s']:.2f} s por trial | paralelismo efetivo {trials['paralelismo']:.2f}x")
+
+    print("\n=== Melhor trial ===")
+    print(f"trial {melhor['trial']}: logloss {melhor['multi_logloss']:.4f} | acurácia {melhor['acuracia']:.2%} | "
+          f"{melhor['iteracoes']} iterações")
+    print(f"parâmetros: {melhor['params'] or 'padrão do LightGBM'}")
+    print(f"modelo: {relatorio['modelo']}")
+    if relatorio["versao"]:
+        print(f"publicado como {relatorio['versao']}{' (ativa)' if relatorio['ativada'] else ''}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Treina o modelo com validação cruzada e busca de hiperparâmetros.")
+    parser.add_argument("dados", nargs="?", default=CSV_PATH, help="CSV ou Parquet de treino (padrão: o CSV do projeto).")
+    parser.add_argument("--pasta", default=TREINO_PATH, help=f"Pasta de trabalho (padrão: {TREINO_PATH}).")
+    parser.add_argument("--trials", type=int, default=20, help="Total de trials da busca (padrão: 20).")
+    parser.add_argument("--folds", type=int, default=5, help="Folds da validação cruzada (padrão: 5).")
+    parser.add_argument("--processos", type=int, default=None, help="Trials em paralelo (padrão: núcleos / threads).")
+    parser.add_argument("--threads", type=int, default=1, help="Threads do LightGBM por trial (padrão: 1).")
+    parser.add_argument("--seed", type=int, default=42, help="Seed dos folds e do sorteio dos parâmetros.")
+    parser.add_argument("--max-rodadas", type=int, default=1000, help="Máximo de rodadas de boosting por fold.")
+    parser.add_argument("--parada", type=int, default=20, help="Rodadas sem melhora até o early stopping.")
+    parser.add_argument("--max-bin", type=int, default=255, help="Bins por feature do Dataset do LightGBM.")
+    parser.add_argument("--tamanho-chunk", type=int, default=1_000_000, help="Linhas lidas por vez do arquivo de treino.")
+    parser.add_argument("--modelos", default=MODELS_DIR, help=f"Registro de modelos (padrão: {MODELS_DIR}).")
+    parser.add_argument("--sem-publicar", action="store_true", help="Não publica o melhor modelo no registro.")
+    parser.add_argument("--ativar", action="store_true", help="Ativa a versão publicada (a API segue o ponteiro).")
+    parser.add_argument("--recomecar", action="store_true", help="Descarta a busca salva na pasta de trabalho.")
+    args = parser.parse_args()
+
+    try:
+        relatorio = treinar_com_busca(
+            args.dados, pasta=args.pasta, trials=args.trials, n_folds=args.folds, processos=args.processos,
+            threads=args.threads, semente=args.seed, max_rodadas=args.max_rodadas, parada=args.parada,
+            max_bin=args.max_bin, tamanho_chunk=args.tamanho_chunk, pasta_modelos=args.modelos,
+            publicar=not args.sem_publicar, ativar=args.ativar, recomecar=args.recomecar,
+            ao_concluir_trial=_mostrar_trial,
+        )
+    except KeyboardInterrupt:
+        sys.exit(f"\nInterrompido. Os trials concluídos estão em {args.pasta}; rode o mesmo comando para continuar.")
+    except ValueError as e:
+        sys.exit(str(e))
+    _mostrar_relatorio(relatorio)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Varredura de risco de uma região (services/risk_raster.py): monta a grade da caixa na
+resolução pedida, busca o clima das células na Open-Meteo em lotes multi-localização e pontua
+a grade inteira numa única chamada ao modelo. O resultado vai para um .npz com as categorias
+(índices em "classes"), as probabilidades, as features e a hora dos dados de cada célula.
+
+Se o arquivo de saída já tem uma varredura da mesma grade, a nova é incremental: só as células
+com dados vencidos são buscadas e só as que mudaram são repontuadas (--completa refaz tudo).
+Com --intervalo, repete a varredura a cada N segundos.
+
+Uso (a partir da raiz do projeto):
+    python -m utils.varrer_regiao --caixa -25.4 -19.7 -53.2 -44.1 --resolucao 0.1 --saida data/risco/sp.npz
+    python -m utils.varrer_regiao --caixa -25.4 -19.7 -53.2 -44.1 --saida data/risco/sp.npz --intervalo 900
+
+Leitura:
+    dados = np.load("data/risco/sp.npz")
+    dados["categorias"]     # (linhas, colunas), -1 sem dados; dados["classes"][i] é o nome
+    dados["probabilidades"] # (linhas, colunas, classes)
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+from services.model_service import PREDICTION_MODES, model_version_path
+from services.risk_raster import (RESOLUCAO_PADRAO, RISCO_PATH, RISCO_REGIAO_CONCORRENCIA, carregar_varredura,
+                                  salvar_varredura, varrer)
+
+
+def _mostrar_resumo(varredura, resumo: dict, caminho: str):
+    linhas, colunas = varredura.categorias.shape
+    print(f"{resumo['celulas']:,} células ({linhas} x {colunas}) em {resumo['segundos']:.2f} s | "
+          f"buscadas {resumo['buscadas']:,} | falhas {resumo['falhas']:,} | repontuadas {resumo['repontuadas']:,} | "
+          f"sem dados {resumo['sem_dados']:,} | modelo {varredura.versao}")
+    indices, contagens = np.unique(varredura.categorias, return_counts=True)
+    for indice, celulas in zip(indices.tolist(), contagens.tolist()):
+        nome = "sem dados" if indice < 0 else varredura.classes[indice]
+        print(f"  {nome:<40} {celulas:>10,} ({celulas / resumo['celulas']:.1%})")
+    print(f"salvo em {caminho}", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Varre a categoria de risco de uma região numa grade regular.")
+    parser.add_argument("--caixa", type=float, nargs=4, required=True, metavar=("LAT_MIN", "LAT_MAX", "LON_MIN", "LON_MAX"),
+                        help="Caixa da região em graus.")
+    parser.add_argument("--resolucao", type=float, default=RESOLUCAO_PADRAO,
+                        help=f"Lado das células em graus (padrão: {RESOLUCAO_PADRAO}).")
+    parser.add_argument("--saida", default=RISCO_PATH, help=f"Arquivo .npz da varredura (padrão: {RISCO_PATH}).")
+    parser.add_argument("--modo", choices=PREDICTION_MODES, default=None, help="Modo de predição (padrão: MODO_PREDICAO).")
+    parser.add_argument("--concorrencia", type=int, default=RISCO_REGIAO_CONCORRENCIA,
+                        help=f"Requisições simultâneas à Open-Meteo (padrão: {RISCO_REGIAO_CONCORRENCIA}).")
+    parser.add_argument("--completa", action="store_true", help="Ignora a varredura anterior em --saida.")
+    parser.add_argument("--intervalo", type=float, default=None, help="Repete a varredura a cada N segundos.")
+    args = parser.parse_args()
+
+    anterior = None
+    if not args.completa and os.path.exists(args.saida):
+        try:
+            anterior = carregar_varredura(args.saida)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Varredura anterior em {args.saida} ignorada: {e}", file=sys.stderr)
+
+    try:
+        while True:
+            try:
+                # A versão a comparar com a da varredura anterior é a ativa no registro (o modelo
+                # deste processo só carrega na primeira predição)
+                anterior, resumo = varrer(*args.caixa, resolucao=args.resolucao, anterior=anterior, mode=args.modo,
+                                          concorrencia=args.concorrencia,
+                                          versao_ativa=lambda: model_version_path()[0])
+            except ValueError as e:
+                sys.exit(str(e))
+            salvar_varredura(args.saida, anterior)
+            _mostrar_resumo(anterior, resumo, args.saida)
+            if args.intervalo is None:
+                break
+            time.sleep(args.intervalo)
+    except KeyboardInterrupt:
+        sys.exit("\nInterrompido.")
+
+
+if __name__ == "__main__":
+    main()